@@ -1,86 +1,322 @@
 # autopr/ai_service.py
 import os
-import openai
 import re  # Import re for regex operations
 import json
+import threading
 
-# Initialize OpenAI client. API key is read from environment variable OPENAI_API_KEY by default.
-# It's good practice to handle potential missing key if you want to provide a graceful fallback or error.
-# For this iteration, we assume the key is set if this module is used.
-try:
-    client = openai.OpenAI()
-except openai.OpenAIError as e:
-    # This might happen if OPENAI_API_KEY is not set or other configuration issues.
-    print(f"OpenAI SDK Initialization Error: {e}")
-    print("Please ensure your OPENAI_API_KEY environment variable is set correctly.")
-    client = None  # Set client to None so calls can check
+from .cache import get_cached, make_cache_key, set_cached
+from .commit_log import CommitRecord, format_commits
+from .scheduler import RequestScheduler, estimate_request_tokens
 
+# Models used for each kind of suggestion.
+COMMIT_MESSAGE_MODEL = "gpt-4-turbo"
+PR_DESCRIPTION_MODEL = "gpt-4-turbo-preview"
+PR_REVIEW_MODEL = "gpt-4-turbo-preview"
 
-def get_commit_message_suggestion(diff: str) -> str:
+# Limits on the issue and diffstat context added to the PR description prompt.
+MAX_ISSUE_BODY_CHARS = 2000
+MAX_DIFFSTAT_LINES = 40
+
+# How long warm_client waits for the API; the process waits for it before exiting.
+WARM_UP_TIMEOUT_SECONDS = 5.0
+
+# Bump these whenever the corresponding prompt changes so stale cached answers are not reused.
+COMMIT_MESSAGE_PROMPT_VERSION = "1"
+PR_DESCRIPTION_PROMPT_VERSION = "3"
+PR_REVIEW_PROMPT_VERSION = "1"
+
+# The OpenAI client is created on the first AI call rather than at import time.
+# Importing the SDK pulls in httpx and pydantic, which commands like `ls` and `workon`
+# never need. `client` stays _UNINITIALIZED until then, and None if creation failed.
+_UNINITIALIZED = object()
+client = _UNINITIALIZED
+
+# Shared by every AI call of the command, sync or async. See scheduler.py.
+_scheduler = None
+
+# The client and the scheduler are first asked for from several threads at once
+# (warm_client, batch review workers), and each must only be created once.
+_init_lock = threading.Lock()
+
+
+def _get_client():
+    """Returns the shared OpenAI client, creating it on first use.
+
+    The API key is read from the OPENAI_API_KEY environment variable by default.
+    Returns None if the client could not be created.
+    """
+    global client
+    with _init_lock:
+        if client is _UNINITIALIZED:
+            import openai
+
+            try:
+                # Retries are handled by the scheduler, which also knows about our rate limits.
+                client = openai.OpenAI(max_retries=0)
+            except openai.OpenAIError as e:
+                # This might happen if OPENAI_API_KEY is not set or other configuration issues.
+                print(f"OpenAI SDK Initialization Error: {e}")
+                print(
+                    "Please ensure your OPENAI_API_KEY environment variable is set correctly."
+                )
+                client = None  # Set client to None so calls can check
+        return client
+
+
+def warm_client(model: str = PR_DESCRIPTION_MODEL) -> None:
+    """Creates the OpenAI client and opens its connection ahead of the first AI call.
+
+    Importing the SDK, building the client and the TLS handshake with the API take a
+    noticeable moment; commands run this in the background while they gather their
+    input. The connection is opened by looking up model, which is free and leaves
+    the connection in the client's pool for the completion that follows. Errors are
+    ignored: that completion reports them.
+    """
+    ai_client = _get_client()
+    if ai_client is None:
+        return
+    try:
+        ai_client.with_options(timeout=WARM_UP_TIMEOUT_SECONDS).models.retrieve(model)
+    except Exception:
+        pass
+
+
+def get_scheduler() -> RequestScheduler:
+    """Returns the request scheduler shared by all AI calls, creating it on first use."""
+    global _scheduler
+    with _init_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler.from_env()
+        return _scheduler
+
+
+def reset_ai_deadline() -> None:
+    """Gives the AI calls that follow a fresh deadline (see RequestScheduler)."""
+    get_scheduler().reset_deadline()
+
+
+def _create_completion(openai_client, request: dict, **kwargs):
+    """Creates a chat completion through the shared scheduler."""
+    return get_scheduler().call(
+        lambda: openai_client.chat.completions.create(**request, **kwargs),
+        estimate_request_tokens(request),
+    )
+
+
+def _print_token(text: str) -> None:
+    print(text, end="", flush=True)
+
+
+class _MarkdownFenceStream:
+    """Incremental version of the markdown cleanup applied to final suggestions.
+
+    Text is passed to emit as soon as it is known not to be part of a surrounding
+    ```lang ... ``` fence or `...` backticks. A trailing run of backticks and whitespace
+    is held back until more text arrives, or dropped by finish() if it closes a fence.
+    """
+
+    def __init__(self, emit):
+        self._emit = emit
+        self._head = ""
+        self._started = False
+        self._fenced = False
+        self._pending = ""
+
+    def _open(self, text: str) -> str | None:
+        """Consumes the opening fence, if any. Returns None while still undecided."""
+        self._head += text
+        stripped = self._head.lstrip()
+        if not stripped:
+            return None
+        if stripped.startswith("```"):
+            newline = stripped.find("\n")
+            after = stripped[3:] if newline == -1 else stripped[newline + 1 :]
+            if newline == -1 and re.fullmatch(r"[a-zA-Z0-9_\-]*", after):
+                return None  # Still reading what may be a language specifier
+            self._fenced = True
+            return after.lstrip(" ") if newline == -1 else after
+        if stripped.startswith("`"):
+            if len(stripped) < 3 and stripped == "`" * len(stripped):
+                return None  # Could still become a ``` fence
+            self._fenced = True
+            return stripped[1:]
+        return stripped
+
+    def feed(self, text: str) -> None:
+        if not self._started:
+            text = self._open(text)
+            if text is None:
+                return
+            self._started = True
+        self._pending += text
+        held = len(self._pending) - len(self._pending.rstrip("` \t\n"))
+        ready = self._pending[: len(self._pending) - held]
+        self._pending = self._pending[len(ready) :]
+        if ready:
+            self._emit(ready)
+
+    def finish(self) -> None:
+        if not self._started:
+            return  # Only whitespace or backticks were received
+        tail = self._pending.rstrip()
+        if self._fenced:
+            tail = tail.rstrip("`").rstrip()
+        if tail:
+            self._emit(tail)
+
+
+class _PrDescriptionStream:
+    """Streams a PR title line and body, cleaned the same way as _parse_pr_description."""
+
+    def __init__(self, emit):
+        self._emit = emit
+        self._in_title = True
+        self._title_started = False
+        self._body = _MarkdownFenceStream(emit)
+
+    def feed(self, text: str) -> None:
+        if self._in_title:
+            title, newline, text = text.partition("\n")
+            title = title.replace('"', "").replace("`", "")
+            if not self._title_started:
+                title = title.lstrip()
+                self._title_started = bool(title)
+            if title:
+                self._emit(title)
+            if not newline:
+                return
+            self._in_title = False
+            self._emit("\n")
+        if text:
+            self._body.feed(text)
+
+    def finish(self) -> None:
+        self._body.finish()
+
+
+def _stream_completion(openai_client, request: dict, on_token) -> str:
+    """Runs a streaming chat completion, calling on_token for each piece of text.
+
+    Returns the full, uncleaned response text.
+    """
+    response = _create_completion(openai_client, request, stream=True)
+    parts = []
+    for chunk in response:
+        if not chunk.choices:
+            continue
+        text = chunk.choices[0].delta.content
+        if text:
+            parts.append(text)
+            on_token(text)
+    return "".join(parts)
+
+
+def _commit_message_request(diff: str) -> dict:
+    """Builds the chat completion arguments for a commit message suggestion."""
+    prompt_message = (
+        f"Generate a sthraightforward, conventional one-line commit message (max 72 chars for the subject line) that best reflects a resume of all the changes"
+        f"for the following git diff (read carefully):\n\n```diff\n{diff}\n```\n\n"
+        f"The commit message should follow standard conventions, it's very important to start with a type "
+        f"(e.g., feat:, fix:, docs:, style:, refactor:, test:, chore:). You can ignore version updates if they are not relevant to the changes. "
+        f"Make sure to return just the plain text message in english characters and no symbols."
+    )
+
+    return dict(
+        model=COMMIT_MESSAGE_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that generates commit messages.",
+            },
+            {"role": "user", "content": prompt_message},
+        ],
+        max_tokens=100,
+        temperature=0.7,  # creativity vs. determinism
+    )
+
+
+def _clean_commit_message(content: str) -> str:
+    """Strips markdown code markers the model sometimes wraps the commit message in."""
+    suggestion = content.strip()
+    # Regex to remove triple backticks (and optional language specifier) or single backticks
+    # that surround the entire string. Also handles optional leading/trailing whitespace around them.
+    # Pattern: ^\s* (?: (?:```(?:\w+)?\n(.*?)```) | (?:`(.*?)`) ) \s* $
+    # This was getting too complex, let's simplify the approach for now.
+
+    # Iteratively strip common markdown code block markers
+    # Order matters: longer sequences first
+    cleaned_suggestion = suggestion
+    # Case 1: ```lang\nCODE\n```
+    match = re.match(
+        r"^\s*```[a-zA-Z]*\n(.*?)\n```\s*$", cleaned_suggestion, re.DOTALL
+    )
+    if match:
+        cleaned_suggestion = match.group(1).strip()
+    else:
+        # Case 2: ```CODE``` (no lang, no newlines inside)
+        match = re.match(r"^\s*```(.*?)```\s*$", cleaned_suggestion, re.DOTALL)
+        if match:
+            cleaned_suggestion = match.group(1).strip()
+
+    # Case 3: `CODE` (single backticks)
+    # This should only apply if triple backticks didn't match,
+    # or to clean up remnants if the AI puts single inside triple for some reason.
+    # However, to avoid stripping intended inline backticks, only strip if they are the *very* start and end
+    # of what's left.
+    if cleaned_suggestion.startswith("`") and cleaned_suggestion.endswith("`"):
+        # Check if these are the *only* backticks or if they genuinely surround the whole content
+        temp_stripped = cleaned_suggestion[1:-1]
+        if (
+            "`" not in temp_stripped
+        ):  # If no more backticks inside, it was a simple `code`
+            cleaned_suggestion = temp_stripped.strip()
+        # else: it might be `code` with `inner` backticks, which is complex, leave as is for now.
+
+    return cleaned_suggestion
+
+
+def get_commit_message_suggestion(diff: str, stream: bool = False, on_token=None) -> str:
     """
     Gets a commit message suggestion from OpenAI based on the provided diff.
+
+    With stream=True the message is passed to on_token (printed by default) as it is
+    generated, with surrounding markdown code markers stripped on the fly. The cleaned
+    full message is returned either way.
     """
-    if not client:
-        return "[OpenAI client not initialized. Check API key.]"
     if not diff:
         return "[No diff provided to generate commit message.]"
 
-    try:
-        prompt_message = (
-            f"Generate a sthraightforward, conventional one-line commit message (max 72 chars for the subject line) that best reflects a resume of all the changes"
-            f"for the following git diff (read carefully):\n\n```diff\n{diff}\n```\n\n"
-            f"The commit message should follow standard conventions, it's very important to start with a type "
-            f"(e.g., feat:, fix:, docs:, style:, refactor:, test:, chore:). You can ignore version updates if they are not relevant to the changes. "
-            f"Make sure to return just the plain text message in english characters and no symbols."
-        )
+    cache_key = make_cache_key(
+        "commit_message", diff, COMMIT_MESSAGE_MODEL, COMMIT_MESSAGE_PROMPT_VERSION
+    )
+    cached = get_cached(cache_key)
+    if cached is not None:
+        if stream:
+            (on_token or _print_token)(cached)
+        return cached
+
+    openai_client = _get_client()
+    if not openai_client:
+        return "[OpenAI client not initialized. Check API key.]"
+    import openai  # Needed for the except clauses below, cheap once _get_client() ran
 
-        response = client.chat.completions.create(
-            model="gpt-4-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that generates commit messages.",
-                },
-                {"role": "user", "content": prompt_message},
-            ],
-            max_tokens=100,
-            temperature=0.7,  # creativity vs. determinism
-        )
-        suggestion = response.choices[0].message.content.strip()
-        # Regex to remove triple backticks (and optional language specifier) or single backticks
-        # that surround the entire string. Also handles optional leading/trailing whitespace around them.
-        # Pattern: ^\s* (?: (?:```(?:\w+)?\n(.*?)```) | (?:`(.*?)`) ) \s* $
-        # This was getting too complex, let's simplify the approach for now.
-
-        # Iteratively strip common markdown code block markers
-        # Order matters: longer sequences first
-        cleaned_suggestion = suggestion
-        # Case 1: ```lang\nCODE\n```
-        match = re.match(
-            r"^\s*```[a-zA-Z]*\n(.*?)\n```\s*$", cleaned_suggestion, re.DOTALL
-        )
-        if match:
-            cleaned_suggestion = match.group(1).strip()
+    try:
+        if stream:
+            cleaner = _MarkdownFenceStream(on_token or _print_token)
+            content = _stream_completion(
+                openai_client, _commit_message_request(diff), cleaner.feed
+            )
+            cleaner.finish()
         else:
-            # Case 2: ```CODE``` (no lang, no newlines inside)
-            match = re.match(r"^\s*```(.*?)```\s*$", cleaned_suggestion, re.DOTALL)
-            if match:
-                cleaned_suggestion = match.group(1).strip()
-
-        # Case 3: `CODE` (single backticks)
-        # This should only apply if triple backticks didn't match,
-        # or to clean up remnants if the AI puts single inside triple for some reason.
-        # However, to avoid stripping intended inline backticks, only strip if they are the *very* start and end
-        # of what's left.
-        if cleaned_suggestion.startswith("`") and cleaned_suggestion.endswith("`"):
-            # Check if these are the *only* backticks or if they genuinely surround the whole content
-            temp_stripped = cleaned_suggestion[1:-1]
-            if (
-                "`" not in temp_stripped
-            ):  # If no more backticks inside, it was a simple `code`
-                cleaned_suggestion = temp_stripped.strip()
-            # else: it might be `code` with `inner` backticks, which is complex, leave as is for now.
-
+            response = _create_completion(openai_client, _commit_message_request(diff))
+            content = response.choices[0].message.content
+        cleaned_suggestion = _clean_commit_message(content)
+        set_cached(
+            cache_key,
+            cleaned_suggestion,
+            kind="commit_message",
+            model=COMMIT_MESSAGE_MODEL,
+        )
         return cleaned_suggestion
     except openai.APIError as e:
         print(f"OpenAI API Error: {e}")
@@ -90,73 +326,153 @@ def get_commit_message_suggestion(diff: str) -> str:
         return "[Error generating commit message]"
 
 
-def get_pr_description_suggestion(commit_messages: list[str]) -> tuple[str, str]:
-    """Generates a PR title and body suggestion based on commit messages using OpenAI.
+def _pr_description_request(
+    commits_str: str, issue: dict | None = None, diffstat: str | None = None
+) -> dict:
+    """Builds the chat completion arguments for a PR title and body suggestion.
 
-    Args:
-        commit_messages: A list of commit messages.
-
-    Returns:
-        A tuple containing the suggested PR title and body.
-        Returns ("[Error retrieving PR description]", "") on failure.
+    commits_str is the commit list from commit_log.format_commits. issue (in
+    get_issue_details format) and diffstat (`git diff --stat` output) are added to
+    the prompt when given.
     """
-    if not client:
-        return "[OpenAI client not initialized]", "Ensure OPENAI_API_KEY is set."
-    if not commit_messages:
-        return (
-            "[No commit messages provided]",
-            "Cannot generate PR description without commit messages.",
-        )
 
-    commits_str = "\n".join(f"- {msg}" for msg in commit_messages)
+    context = ""
+    if issue:
+        context += f"The branch works on Issue #{issue['number']}: {issue.get('title', '')}\n"
+        issue_body = (issue.get("body") or "").strip()
+        if issue_body:
+            context += f"Issue description:\n{issue_body[:MAX_ISSUE_BODY_CHARS]}\n"
+        context += "\n"
+    if diffstat:
+        stat_lines = diffstat.splitlines()
+        if len(stat_lines) > MAX_DIFFSTAT_LINES:
+            # Keep the summary line ("N files changed, ...") at the end.
+            stat_lines = stat_lines[: MAX_DIFFSTAT_LINES - 1] + ["...", stat_lines[-1]]
+        context += "Files changed:\n" + "\n".join(stat_lines) + "\n\n"
 
     prompt = (
-        f"Given the following commit messages from a feature branch:\n"
+        f"Given the following commits from a feature branch (newest first):\n"
         f"{commits_str}\n\n"
+        f"{context}"
         f"Please analyse them and generate a concise and informative Pull Request title and a concise and effective body.\n"
         f"The title should be on the very first line, followed by a single newline character, and then the body.\n"
         f"The body should summarize the changes and their purpose. Do not include the commit messages themselves in the body unless they add specific context not otherwise covered by a summary."
         f"it's very important to be concise and direct to the point, summarizing how the changes affect the codebase."
         f"Do not use markdown for the title. The body might use markdown for formatting if appropriate (e.g. bullet points)."
     )
+    if issue:
+        prompt += f" End the body with a line 'Closes #{issue['number']}' if the changes resolve the issue."
+
+    return dict(
+        model=PR_DESCRIPTION_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are an expert at writing Pull Request descriptions.",
+            },
+            {"role": "user", "content": prompt},
+        ],
+    )
 
-    try:
-        completion = client.chat.completions.create(
-            model="gpt-4-turbo-preview",  # Or your preferred model
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert at writing Pull Request descriptions.",
-                },
-                {"role": "user", "content": prompt},
-            ],
+
+def _parse_pr_description(response_content: str) -> tuple[str, str]:
+    """Splits the model output into a cleaned-up PR title and body."""
+    parts = response_content.split("\n", 1)
+    title = parts[0].strip()
+    body = parts[1].strip() if len(parts) > 1 else ""
+
+    # Clean title (simple cleaning)
+    title = title.replace('"', "").replace("`", "")
+
+    # Clean body (strips surrounding triple backticks and optional language specifier, or single backticks)
+    # Regex to find content within triple backticks, accounting for optional language specifier
+    # e.g., ```python\ncode\n``` or ```\ncode\n```
+    # The regex matches: optional whitespace, ```, optional language, newline, CAPTURED CONTENT, newline, ```, optional whitespace
+    # re.DOTALL allows . to match newlines, crucial for multi-line content.
+    match = re.match(r"^\s*```(?:[a-zA-Z0-9_\-]+)?\n(.*?)\n```\s*$", body, re.DOTALL)
+    if match:
+        body = match.group(1).strip()
+    # Fallback for body wrapped in simple triple backticks on a single line (e.g., ```body```) or if the above complex regex didn't catch it
+    elif body.startswith("```") and body.endswith("```"):
+        body = body[3:-3].strip()
+    # Also handle single backticks for body as a final fallback
+    elif body.startswith("`") and body.endswith("`"):
+        body = body[1:-1].strip()
+
+    return title, body
+
+
+def _pr_description_cache_payload(
+    commits_str: str, issue: dict | None, diffstat: str | None
+) -> dict:
+    return {
+        "commits": commits_str,
+        "issue": [issue["number"], issue.get("title"), issue.get("body")] if issue else None,
+        "diffstat": diffstat or None,
+    }
+
+
+def get_pr_description_suggestion(
+    commits: list[CommitRecord] | list[str],
+    stream: bool = False,
+    on_token=None,
+    issue: dict | None = None,
+    diffstat: str | None = None,
+) -> tuple[str, str]:
+    """Generates a PR title and body suggestion based on the branch's commits using OpenAI.
+
+    Args:
+        commits: The commits of the branch (see get_branch_commits), or their
+            subjects. They are fitted into the AUTOPR_PR_COMMITS_TOKEN_BUDGET.
+        stream: If True, pass the title line and body to on_token as they are generated.
+        on_token: Called with each piece of streamed text. Prints it by default.
+        issue: The issue the branch works on, in get_issue_details format, if known.
+        diffstat: `git diff --stat` output for the branch, if known.
+
+    Returns:
+        A tuple containing the suggested PR title and body.
+        Returns ("[Error retrieving PR description]", "") on failure.
+    """
+    if not commits:
+        return (
+            "[No commit messages provided]",
+            "Cannot generate PR description without commit messages.",
         )
-        response_content = completion.choices[0].message.content
-        if response_content:
-            parts = response_content.split("\n", 1)
-            title = parts[0].strip()
-            body = parts[1].strip() if len(parts) > 1 else ""
 
-            # Clean title (simple cleaning)
-            title = title.replace('"', "").replace("`", "")
+    commits_str = format_commits(commits)
+    cache_key = make_cache_key(
+        "pr_description",
+        _pr_description_cache_payload(commits_str, issue, diffstat),
+        PR_DESCRIPTION_MODEL,
+        PR_DESCRIPTION_PROMPT_VERSION,
+    )
+    cached = get_cached(cache_key)
+    if cached is not None:
+        if stream:
+            (on_token or _print_token)(f"{cached[0]}\n{cached[1]}")
+        return cached[0], cached[1]
+
+    openai_client = _get_client()
+    if not openai_client:
+        return "[OpenAI client not initialized]", "Ensure OPENAI_API_KEY is set."
 
-            # Clean body (strips surrounding triple backticks and optional language specifier, or single backticks)
-            # Regex to find content within triple backticks, accounting for optional language specifier
-            # e.g., ```python\ncode\n``` or ```\ncode\n```
-            # The regex matches: optional whitespace, ```, optional language, newline, CAPTURED CONTENT, newline, ```, optional whitespace
-            # re.DOTALL allows . to match newlines, crucial for multi-line content.
-            match = re.match(
-                r"^\s*```(?:[a-zA-Z0-9_\-]+)?\n(.*?)\n```\s*$", body, re.DOTALL
+    try:
+        request = _pr_description_request(commits_str, issue, diffstat)
+        if stream:
+            cleaner = _PrDescriptionStream(on_token or _print_token)
+            response_content = _stream_completion(openai_client, request, cleaner.feed)
+            cleaner.finish()
+        else:
+            completion = _create_completion(openai_client, request)
+            response_content = completion.choices[0].message.content
+        if response_content:
+            title, body = _parse_pr_description(response_content)
+            set_cached(
+                cache_key,
+                [title, body],
+                kind="pr_description",
+                model=PR_DESCRIPTION_MODEL,
             )
-            if match:
-                body = match.group(1).strip()
-            # Fallback for body wrapped in simple triple backticks on a single line (e.g., ```body```) or if the above complex regex didn't catch it
-            elif body.startswith("```") and body.endswith("```"):
-                body = body[3:-3].strip()
-            # Also handle single backticks for body as a final fallback
-            elif body.startswith("`") and body.endswith("`"):
-                body = body[1:-1].strip()
-
             return title, body
         else:
             return "[AI returned empty response]", ""
@@ -165,27 +481,10 @@ def get_pr_description_suggestion(commit_messages: list[str]) -> tuple[str, str]
         return "[Error retrieving PR description]", ""
 
 
-def get_pr_review_suggestions(pr_changes: str) -> list[dict[str, str | int]]:
-    """
-    Analyzes PR changes and generates review suggestions.
-
-    Args:
-        pr_changes: The diff of the PR changes.
-
-    Returns:
-        A list of dictionaries containing review suggestions, each with:
-        - path: The path to the file being commented on
-        - line: The line number to comment on
-        - suggestion: The review suggestion text
-    """
-    if not client:
-        return [{"path": "error", "line": 0, "suggestion": "[OpenAI client not initialized. Check API key.]"}]
-    if not pr_changes:
-        return [{"path": "error", "line": 0, "suggestion": "[No PR changes provided to generate review.]"}]
-
-    try:
-        # Construct the prompt for the AI
-        prompt = f"""You are a code reviewer. Analyze the following PR changes and provide specific, actionable suggestions for improvement.
+def _pr_review_request(pr_changes: str) -> dict:
+    """Builds the chat completion arguments for a PR review."""
+    # Construct the prompt for the AI
+    prompt = f"""You are a code reviewer. Analyze the following PR changes and provide specific, actionable suggestions for improvement.
 For each suggestion, provide:
 1. The file path (string)
 2. The line number to comment on (integer)
@@ -208,105 +507,150 @@ PR Changes:
 
 Suggestions:"""
 
-        # Get response from OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a code reviewer providing specific, actionable suggestions for PR changes. Return only valid JSON, an array of objects.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.5, # Lower temperature for more focused and deterministic suggestions
-            max_tokens=1500, # Increased max_tokens to allow for more comprehensive reviews
-            response_format={ "type": "json_object" } # Ensure response is JSON
-        )
+    return dict(
+        model=PR_REVIEW_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a code reviewer providing specific, actionable suggestions for PR changes. Return only valid JSON, an array of objects.",
+            },
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.5, # Lower temperature for more focused and deterministic suggestions
+        max_tokens=1500, # Increased max_tokens to allow for more comprehensive reviews
+        response_format={ "type": "json_object" } # Ensure response is JSON
+    )
 
-        # Extract and parse the response
-        suggestions_text = response.choices[0].message.content.strip()
-        
-        # The response_format={ "type": "json_object" } should ensure it's a json object.
-        # The prompt asks for a JSON array, which could be a value within the object.
-        # Let's assume the AI returns something like: {"suggestions": [...]} or just the array.
-
-        parsed_output = json.loads(suggestions_text)
-
-        if isinstance(parsed_output, list):
-            suggestions = parsed_output
-        elif isinstance(parsed_output, dict):
-            if "suggestions" in parsed_output and isinstance(parsed_output["suggestions"], list):
-                suggestions = parsed_output["suggestions"]
-            # Check if the dict itself IS a single suggestion object
-            elif all(key in parsed_output for key in ["path", "line", "suggestion"]):
-                # Validate the types for this single suggestion before wrapping
-                if (
-                    isinstance(parsed_output.get("path"), str) and
-                    (isinstance(parsed_output.get("line"), int) or (isinstance(parsed_output.get("line"), str) and parsed_output.get("line").isdigit())) and
-                    isinstance(parsed_output.get("suggestion"), str)
-                ):
-                    # Convert line to int if it's a digit string
-                    if isinstance(parsed_output["line"], str):
-                         parsed_output["line"] = int(parsed_output["line"])
-                    suggestions = [parsed_output]  # Wrap the single suggestion in a list
-                else:
-                    print(f"Error: AI response was a single dictionary, but with incorrect field types: {parsed_output}")
-                    return [{"path": "error", "line": 0, "suggestion": "[AI response format error: single suggestion type mismatch]"}]
+
+def _parse_review_suggestions(suggestions_text: str) -> list[dict[str, str | int]]:
+    """Parses and validates the JSON review suggestions returned by the model.
+
+    Raises json.JSONDecodeError if the text is not valid JSON. Format problems are
+    reported as a single error placeholder suggestion.
+    """
+    # The response_format={ "type": "json_object" } should ensure it's a json object.
+    # The prompt asks for a JSON array, which could be a value within the object.
+    # Let's assume the AI returns something like: {"suggestions": [...]} or just the array.
+
+    parsed_output = json.loads(suggestions_text)
+
+    if isinstance(parsed_output, list):
+        suggestions = parsed_output
+    elif isinstance(parsed_output, dict):
+        if "suggestions" in parsed_output and isinstance(parsed_output["suggestions"], list):
+            suggestions = parsed_output["suggestions"]
+        # Check if the dict itself IS a single suggestion object
+        elif all(key in parsed_output for key in ["path", "line", "suggestion"]):
+            # Validate the types for this single suggestion before wrapping
+            if (
+                isinstance(parsed_output.get("path"), str) and
+                (isinstance(parsed_output.get("line"), int) or (isinstance(parsed_output.get("line"), str) and parsed_output.get("line").isdigit())) and
+                isinstance(parsed_output.get("suggestion"), str)
+            ):
+                # Convert line to int if it's a digit string
+                if isinstance(parsed_output["line"], str):
+                     parsed_output["line"] = int(parsed_output["line"])
+                suggestions = [parsed_output]  # Wrap the single suggestion in a list
             else:
-                print(f"Error: AI response dictionary is not a list of suggestions, a wrapped list, nor a single valid suggestion object. Got: {parsed_output}")
-                return [{"path": "error", "line": 0, "suggestion": "[AI response format error: unexpected dict structure]"}]
+                print(f"Error: AI response was a single dictionary, but with incorrect field types: {parsed_output}")
+                return [{"path": "error", "line": 0, "suggestion": "[AI response format error: single suggestion type mismatch]"}]
         else:
-            print(f"Error: AI response was not a list or dictionary. Got: {type(parsed_output)}")
-            # The print statement for raw response in case of unexpected dict was here, but this else is for non-dict/list.
-            # The raw dict print is now implicitly handled above if it doesn't match structures.
-            return [{"path": "error", "line": 0, "suggestion": "[AI response format error: not list or dict]"}]
+            print(f"Error: AI response dictionary is not a list of suggestions, a wrapped list, nor a single valid suggestion object. Got: {parsed_output}")
+            return [{"path": "error", "line": 0, "suggestion": "[AI response format error: unexpected dict structure]"}]
+    else:
+        print(f"Error: AI response was not a list or dictionary. Got: {type(parsed_output)}")
+        # The print statement for raw response in case of unexpected dict was here, but this else is for non-dict/list.
+        # The raw dict print is now implicitly handled above if it doesn't match structures.
+        return [{"path": "error", "line": 0, "suggestion": "[AI response format error: not list or dict]"}]
+
+
+    # Validate the suggestions format (now 'suggestions' should always be a list here)
+    if not isinstance(suggestions, list):
+        print("Error: AI response was not a list of suggestions")
+        return [{"path": "error", "line": 0, "suggestion": "[AI response format error: not a list]"}]
+
+    valid_suggestions = []
+    for suggestion in suggestions:
+        if not isinstance(suggestion, dict):
+            print(f"Warning: Skipping suggestion, not a dict: {suggestion}")
+            continue
+
+        # Check for required fields
+        if not all(key in suggestion for key in ["path", "line", "suggestion"]):
+            print(f"Warning: Skipping suggestion, missing required keys: {suggestion}")
+            continue
+
+        # Validate types
+        if not isinstance(suggestion["path"], str):
+            print(f"Warning: Skipping suggestion, 'path' is not a string: {suggestion}")
+            continue
+        if not isinstance(suggestion["line"], int):
+             # Attempt to convert if it's a string representation of an int
+            if isinstance(suggestion["line"], str) and suggestion["line"].isdigit():
+                suggestion["line"] = int(suggestion["line"])
+            else:
+                print(f"Warning: Skipping suggestion, 'line' is not an int: {suggestion}")
+                continue
+        if not isinstance(suggestion["suggestion"], str):
+            print(f"Warning: Skipping suggestion, 'suggestion' is not a string: {suggestion}")
+            continue
+        
+        # Basic check for diff hunk markers in suggestion path (sometimes AI includes them)
+        if "diff --git" in suggestion["path"]:
+            print(f"Warning: Correcting suspicious path in suggestion: {suggestion['path']}")
+            # Attempt to extract a more reasonable path, e.g., the 'b/' path
+            match = re.search(r'b/([^ ]+)', suggestion['path'])
+            if match:
+                suggestion['path'] = match.group(1)
+            else:
+                # Fallback or further refinement needed if this simple regex isn't enough
+                print(f"Warning: Could not reliably clean path: {suggestion['path']}")
 
 
-        # Validate the suggestions format (now 'suggestions' should always be a list here)
-        if not isinstance(suggestions, list):
-            print("Error: AI response was not a list of suggestions")
-            return [{"path": "error", "line": 0, "suggestion": "[AI response format error: not a list]"}]
+        valid_suggestions.append(suggestion)
 
-        valid_suggestions = []
-        for suggestion in suggestions:
-            if not isinstance(suggestion, dict):
-                print(f"Warning: Skipping suggestion, not a dict: {suggestion}")
-                continue
+    return valid_suggestions
 
-            # Check for required fields
-            if not all(key in suggestion for key in ["path", "line", "suggestion"]):
-                print(f"Warning: Skipping suggestion, missing required keys: {suggestion}")
-                continue
 
-            # Validate types
-            if not isinstance(suggestion["path"], str):
-                print(f"Warning: Skipping suggestion, 'path' is not a string: {suggestion}")
-                continue
-            if not isinstance(suggestion["line"], int):
-                 # Attempt to convert if it's a string representation of an int
-                if isinstance(suggestion["line"], str) and suggestion["line"].isdigit():
-                    suggestion["line"] = int(suggestion["line"])
-                else:
-                    print(f"Warning: Skipping suggestion, 'line' is not an int: {suggestion}")
-                    continue
-            if not isinstance(suggestion["suggestion"], str):
-                print(f"Warning: Skipping suggestion, 'suggestion' is not a string: {suggestion}")
-                continue
-            
-            # Basic check for diff hunk markers in suggestion path (sometimes AI includes them)
-            if "diff --git" in suggestion["path"]:
-                print(f"Warning: Correcting suspicious path in suggestion: {suggestion['path']}")
-                # Attempt to extract a more reasonable path, e.g., the 'b/' path
-                match = re.search(r'b/([^ ]+)', suggestion['path'])
-                if match:
-                    suggestion['path'] = match.group(1)
-                else:
-                    # Fallback or further refinement needed if this simple regex isn't enough
-                    print(f"Warning: Could not reliably clean path: {suggestion['path']}")
+def get_pr_review_suggestions(pr_changes: str) -> list[dict[str, str | int]]:
+    """
+    Analyzes PR changes and generates review suggestions.
+
+    Args:
+        pr_changes: The diff of the PR changes.
+
+    Returns:
+        A list of dictionaries containing review suggestions, each with:
+        - path: The path to the file being commented on
+        - line: The line number to comment on
+        - suggestion: The review suggestion text
+    """
+    if not pr_changes:
+        return [{"path": "error", "line": 0, "suggestion": "[No PR changes provided to generate review.]"}]
 
+    cache_key = make_cache_key(
+        "pr_review", pr_changes, PR_REVIEW_MODEL, PR_REVIEW_PROMPT_VERSION
+    )
+    cached = get_cached(cache_key)
+    if cached is not None:
+        return cached
 
-            valid_suggestions.append(suggestion)
+    openai_client = _get_client()
+    if not openai_client:
+        return [{"path": "error", "line": 0, "suggestion": "[OpenAI client not initialized. Check API key.]"}]
+    import openai  # Needed for the except clauses below, cheap once _get_client() ran
+
+    try:
+        response = _create_completion(openai_client, _pr_review_request(pr_changes))
 
+        # Extract and parse the response
+        suggestions_text = response.choices[0].message.content.strip()
+        valid_suggestions = _parse_review_suggestions(suggestions_text)
+
+        if not any(s.get("path") == "error" for s in valid_suggestions):
+            set_cached(
+                cache_key, valid_suggestions, kind="pr_review", model=PR_REVIEW_MODEL
+            )
         return valid_suggestions
 
     except json.JSONDecodeError as e:
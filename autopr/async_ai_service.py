@@ -0,0 +1,249 @@
+# autopr/async_ai_service.py
+# Coroutine versions of the ai_service suggestion functions. They share prompts, response
+# parsing and the on-disk cache with ai_service but run on the SDK's AsyncOpenAI client.
+# Importing asyncio is not free, so only code paths that fan out import this module.
+import asyncio
+import json
+import weakref
+
+from .ai_service import (
+    COMMIT_MESSAGE_MODEL,
+    COMMIT_MESSAGE_PROMPT_VERSION,
+    PR_DESCRIPTION_MODEL,
+    PR_DESCRIPTION_PROMPT_VERSION,
+    PR_REVIEW_MODEL,
+    PR_REVIEW_PROMPT_VERSION,
+    _clean_commit_message,
+    _commit_message_request,
+    _parse_pr_description,
+    _parse_review_suggestions,
+    _pr_description_cache_payload,
+    _pr_description_request,
+    _pr_review_request,
+    get_scheduler,
+)
+from .cache import get_cached, make_cache_key, set_cached
+from .commit_log import CommitRecord, format_commits
+from .scheduler import estimate_request_tokens
+
+# Default number of AI requests allowed in flight at once.
+DEFAULT_MAX_CONCURRENCY = 8
+
+# The async client's connection pool belongs to the event loop it was first used on,
+# so one client is kept per loop.
+_clients = weakref.WeakKeyDictionary()
+
+
+def _get_async_client():
+    """Returns the AsyncOpenAI client for the running event loop, or None if it cannot be created."""
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        import openai
+
+        try:
+            _clients[loop] = openai.AsyncOpenAI(max_retries=0)
+        except openai.OpenAIError as e:
+            print(f"OpenAI SDK Initialization Error: {e}")
+            print(
+                "Please ensure your OPENAI_API_KEY environment variable is set correctly."
+            )
+            _clients[loop] = None
+    return _clients[loop]
+
+
+async def _create_completion(async_client, request: dict):
+    """Creates a chat completion through the scheduler shared with ai_service."""
+    return await get_scheduler().call_async(
+        lambda: async_client.chat.completions.create(**request),
+        estimate_request_tokens(request),
+    )
+
+
+async def close_async_client():
+    """Closes the client of the running event loop, if one was created."""
+    async_client = _clients.pop(asyncio.get_running_loop(), None)
+    if async_client is not None:
+        await async_client.close()
+
+
+async def get_commit_message_suggestion_async(diff: str) -> str:
+    """Coroutine version of ai_service.get_commit_message_suggestion."""
+    if not diff:
+        return "[No diff provided to generate commit message.]"
+
+    cache_key = make_cache_key(
+        "commit_message", diff, COMMIT_MESSAGE_MODEL, COMMIT_MESSAGE_PROMPT_VERSION
+    )
+    cached = get_cached(cache_key)
+    if cached is not None:
+        return cached
+
+    async_client = _get_async_client()
+    if not async_client:
+        return "[OpenAI client not initialized. Check API key.]"
+    import openai
+
+    try:
+        response = await _create_completion(async_client, _commit_message_request(diff))
+        cleaned_suggestion = _clean_commit_message(response.choices[0].message.content)
+        set_cached(
+            cache_key,
+            cleaned_suggestion,
+            kind="commit_message",
+            model=COMMIT_MESSAGE_MODEL,
+        )
+        return cleaned_suggestion
+    except openai.APIError as e:
+        print(f"OpenAI API Error: {e}")
+        return "[Error communicating with OpenAI API]"
+    except Exception as e:
+        print(
+            f"An unexpected error occurred in get_commit_message_suggestion_async: {e}"
+        )
+        return "[Error generating commit message]"
+
+
+async def get_pr_description_suggestion_async(
+    commits: list[CommitRecord] | list[str],
+    issue: dict | None = None,
+    diffstat: str | None = None,
+) -> tuple[str, str]:
+    """Coroutine version of ai_service.get_pr_description_suggestion."""
+    if not commits:
+        return (
+            "[No commit messages provided]",
+            "Cannot generate PR description without commit messages.",
+        )
+
+    commits_str = format_commits(commits)
+    cache_key = make_cache_key(
+        "pr_description",
+        _pr_description_cache_payload(commits_str, issue, diffstat),
+        PR_DESCRIPTION_MODEL,
+        PR_DESCRIPTION_PROMPT_VERSION,
+    )
+    cached = get_cached(cache_key)
+    if cached is not None:
+        return cached[0], cached[1]
+
+    async_client = _get_async_client()
+    if not async_client:
+        return "[OpenAI client not initialized]", "Ensure OPENAI_API_KEY is set."
+
+    try:
+        completion = await _create_completion(
+            async_client, _pr_description_request(commits_str, issue, diffstat)
+        )
+        response_content = completion.choices[0].message.content
+        if not response_content:
+            return "[AI returned empty response]", ""
+        title, body = _parse_pr_description(response_content)
+        set_cached(
+            cache_key, [title, body], kind="pr_description", model=PR_DESCRIPTION_MODEL
+        )
+        return title, body
+    except Exception as e:
+        print(f"Error calling OpenAI API for PR description: {e}")
+        return "[Error retrieving PR description]", ""
+
+
+async def get_pr_review_suggestions_async(
+    pr_changes: str,
+) -> list[dict[str, str | int]]:
+    """Coroutine version of ai_service.get_pr_review_suggestions."""
+    if not pr_changes:
+        return [
+            {
+                "path": "error",
+                "line": 0,
+                "suggestion": "[No PR changes provided to generate review.]",
+            }
+        ]
+
+    cache_key = make_cache_key(
+        "pr_review", pr_changes, PR_REVIEW_MODEL, PR_REVIEW_PROMPT_VERSION
+    )
+    cached = get_cached(cache_key)
+    if cached is not None:
+        return cached
+
+    async_client = _get_async_client()
+    if not async_client:
+        return [
+            {
+                "path": "error",
+                "line": 0,
+                "suggestion": "[OpenAI client not initialized. Check API key.]",
+            }
+        ]
+    import openai
+
+    suggestions_text = ""
+    try:
+        response = await _create_completion(
+            async_client, _pr_review_request(pr_changes)
+        )
+        suggestions_text = response.choices[0].message.content.strip()
+        valid_suggestions = _parse_review_suggestions(suggestions_text)
+
+        if not any(s.get("path") == "error" for s in valid_suggestions):
+            set_cached(
+                cache_key, valid_suggestions, kind="pr_review", model=PR_REVIEW_MODEL
+            )
+        return valid_suggestions
+    except json.JSONDecodeError as e:
+        print(f"Error parsing AI response as JSON: {e}")
+        print(f"Raw response was: {suggestions_text}")
+        return [{"path": "error", "line": 0, "suggestion": "[AI JSON parsing error]"}]
+    except openai.APIError as e:
+        print(f"OpenAI API Error in get_pr_review_suggestions_async: {e}")
+        return [{"path": "error", "line": 0, "suggestion": f"[OpenAI API Error: {e}]"}]
+    except Exception as e:
+        print(f"Error generating PR review suggestions: {e}")
+        return [
+            {
+                "path": "error",
+                "line": 0,
+                "suggestion": f"[Unexpected error in review generation: {e}]",
+            }
+        ]
+
+
+class BoundedExecutor:
+    """Runs coroutines with at most max_concurrency of them in flight at once.
+
+    Must be created and used inside a running event loop.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def submit(self, coro_func, *args, **kwargs):
+        """Awaits coro_func(*args, **kwargs) once a slot is free."""
+        async with self._semaphore:
+            return await coro_func(*args, **kwargs)
+
+    async def map(self, coro_func, items) -> list:
+        """Runs coro_func over items concurrently and returns the results in order."""
+        return await asyncio.gather(*(self.submit(coro_func, item) for item in items))
+
+
+def run_bounded(
+    coro_func, items, max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+) -> list:
+    """Blocking entry point: runs coro_func over items on a new event loop.
+
+    At most max_concurrency calls are in flight at once. Results are returned in the
+    order of items.
+    """
+
+    async def _run():
+        try:
+            return await BoundedExecutor(max_concurrency).map(coro_func, list(items))
+        finally:
+            await close_async_client()
+
+    return asyncio.run(_run())
@@ -0,0 +1,208 @@
+# autopr/cache.py
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Default size cap for the on-disk cache. Least recently used entries are evicted
+# once the cache grows past this. Can be overridden with AUTOPR_CACHE_MAX_BYTES.
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+# Pruning scans the whole cache, so set_cached() only does it on the first write to
+# a cache directory, then once PRUNE_EVERY_WRITES entries or PRUNE_BYTES_FRACTION of
+# the size cap have been written since the last prune.
+PRUNE_EVERY_WRITES = 64
+PRUNE_BYTES_FRACTION = 0.1
+
+_prune_lock = threading.Lock()
+# cache directory -> (entries, bytes) written since it was last pruned
+_written_since_prune: dict[str, tuple[int, int]] = {}
+
+
+def get_cache_dir() -> str:
+    """Returns the directory used for the on-disk AI suggestion cache."""
+    override = os.environ.get("AUTOPR_CACHE_DIR")
+    if override:
+        return override
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "autopr")
+
+
+def get_max_bytes() -> int:
+    """Returns the configured cache size cap in bytes."""
+    value = os.environ.get("AUTOPR_CACHE_MAX_BYTES")
+    if value:
+        try:
+            return max(0, int(value))
+        except ValueError:
+            print(f"Warning: Ignoring invalid AUTOPR_CACHE_MAX_BYTES value: {value}")
+    return DEFAULT_MAX_BYTES
+
+
+def is_cache_enabled() -> bool:
+    """The cache is on unless AUTOPR_NO_CACHE is set to a truthy value."""
+    return os.environ.get("AUTOPR_NO_CACHE", "").lower() not in ("1", "true", "yes")
+
+
+def make_cache_key(kind: str, payload, model: str, prompt_version: str) -> str:
+    """Builds a content-addressed key from the request input, model and prompt version."""
+    material = json.dumps(
+        [kind, model, prompt_version, payload], sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> str:
+    # Fan out into sub-directories so a large cache does not end up in one flat folder.
+    return os.path.join(get_cache_dir(), key[:2], f"{key}.json")
+
+
+def _iter_entries():
+    """Yields (path, size, mtime) for every entry currently in the cache."""
+    cache_dir = get_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return
+    for bucket in os.scandir(cache_dir):
+        if not bucket.is_dir():
+            continue
+        for entry in os.scandir(bucket.path):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Removed concurrently by another autopr process
+            yield entry.path, stat.st_size, stat.st_mtime
+
+
+def get_cached(key: str):
+    """Returns the cached value for key, or None on a miss.
+
+    A hit refreshes the entry's mtime, which is what LRU eviction orders by.
+    """
+    if not is_cache_enabled():
+        return None
+    path = _entry_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path, None)
+        return entry["value"]
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, KeyError, TypeError, OSError):
+        # Corrupt or truncated entry, drop it so it gets regenerated.
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+
+def _is_prune_due(written: int, max_bytes: int) -> bool:
+    """Counts a write of written bytes and tells whether the cache should be pruned now."""
+    cache_dir = get_cache_dir()
+    with _prune_lock:
+        if cache_dir not in _written_since_prune:
+            return True
+        entries, size = _written_since_prune[cache_dir]
+        entries, size = entries + 1, size + written
+        _written_since_prune[cache_dir] = (entries, size)
+        return entries >= PRUNE_EVERY_WRITES or size > max_bytes * PRUNE_BYTES_FRACTION
+
+
+def set_cached(key: str, value, kind: str = "", model: str = "") -> None:
+    """Stores value under key and now and then evicts old entries to keep within the size cap."""
+    if not is_cache_enabled():
+        return
+    path = _entry_path(key)
+    entry = {"kind": kind, "model": model, "created": time.time(), "value": value}
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry. Its
+        # name is unique, so threads and processes storing the same key do not clash.
+        with tempfile.NamedTemporaryFile(
+            "w",
+            encoding="utf-8",
+            dir=os.path.dirname(path),
+            suffix=".tmp",
+            delete=False,
+        ) as f:
+            tmp_path = f.name
+            json.dump(entry, f, ensure_ascii=False)
+            written = f.tell()
+        os.replace(tmp_path, path)
+        tmp_path = None
+        max_bytes = get_max_bytes()
+        if _is_prune_due(written, max_bytes):
+            prune_cache(max_bytes)
+    except OSError as e:
+        print(f"Warning: Could not write to AI suggestion cache: {e}")
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def prune_cache(max_bytes: int | None = None) -> tuple[int, int]:
+    """Evicts least recently used entries until the cache fits in max_bytes.
+
+    Returns:
+        A tuple (entries_removed, bytes_freed).
+    """
+    if max_bytes is None:
+        max_bytes = get_max_bytes()
+    with _prune_lock:
+        _written_since_prune[get_cache_dir()] = (0, 0)
+    entries = list(_iter_entries())
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    freed = 0
+    if total <= max_bytes:
+        return removed, freed
+
+    entries.sort(key=lambda item: item[2])  # Oldest access first
+    for path, size, _ in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        freed += size
+        removed += 1
+    return removed, freed
+
+
+def clear_cache() -> int:
+    """Removes every cache entry. Returns the number of entries removed."""
+    removed = 0
+    for path, _, _ in list(_iter_entries()):
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def get_cache_stats() -> dict:
+    """Returns a summary of the cache contents."""
+    entries = list(_iter_entries())
+    mtimes = [mtime for _, _, mtime in entries]
+    return {
+        "path": get_cache_dir(),
+        "entries": len(entries),
+        "size_bytes": sum(size for _, size, _ in entries),
+        "max_bytes": get_max_bytes(),
+        "oldest": min(mtimes) if mtimes else None,
+        "newest": max(mtimes) if mtimes else None,
+        "enabled": is_cache_enabled(),
+    }
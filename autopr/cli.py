@@ -1,54 +1,83 @@
 import argparse
+import contextlib
+import io
+import sys
+import threading
+from dataclasses import dataclass
 
-# Functions imported from other modules within the autopr package
-from .git_utils import get_repo_from_git_config
-from .github_service import (
-    list_issues,
-    start_work_on_issue,
-    get_staged_diff,
-    git_commit,
-    get_current_issue_number,
-    get_issue_details,
-    get_commit_messages_for_branch,
-    create_pr_gh,
-    get_pr_changes,
-    post_pr_review_comment,
-)
-
-# Import the actual create_pr from github_service if we rename the cli handler
-# from .github_service import create_pr as service_create_pr
-
-from .ai_service import (
-    get_commit_message_suggestion,
-    get_pr_description_suggestion,
-    get_pr_review_suggestions,
-)
+# The handlers import what they use from the rest of the package when they run,
+# so a command only loads the modules it needs.
+
+# Files listed when the staged diff is too large to print.
+MAX_LISTED_FILES = 50
+
+
+def _print_filter_note(filtered) -> None:
+    if filtered.was_filtered:
+        print(
+            f"Note: Left out {filtered.dropped_files} binary, generated, vendored or ignored file(s) "
+            f"and {filtered.dropped_hunks} whitespace-only hunk(s) (~{filtered.saved_tokens} tokens). "
+            f"Set AUTOPR_NO_DIFF_FILTER=1 to send everything."
+        )
+
+
+def _print_stat_summary(plan) -> None:
+    """Lists the staged files, for a diff too large to print in full."""
+    print(
+        f"Staged changes: {len(plan.stats)} file(s), +{plan.added} -{plan.removed} lines "
+        f"(diff loaded for {len(plan.fetch)} of them):\n"
+    )
+    for stat in plan.stats[:MAX_LISTED_FILES]:
+        counts = "binary" if stat.is_binary else f"+{stat.added} -{stat.removed}"
+        print(f"  {counts:>14}  {stat.path}")
+    if len(plan.stats) > MAX_LISTED_FILES:
+        print(f"  ... and {len(plan.stats) - MAX_LISTED_FILES} more file(s)")
 
 
 # Placeholder function for commit logic
-def handle_commit_command():  # Handles the 'commit' command logic, including AI suggestions.
-    print("Handling commit command...")
-    staged_diff = get_staged_diff()
-    if staged_diff:
-        diff_len = len(staged_diff)
-        if diff_len > 450000:
-            print(
-                f"Error: Diff is too large ({diff_len} characters). Maximum allowed is 450,000 characters."
-            )
-            print("Please break down your changes into smaller commits.")
-            return
-        elif diff_len > 400000:
-            print(
-                f"Warning: Diff is very large ({diff_len} characters). AI suggestion quality may be affected."
-            )
-            print(
-                "Consider breaking down your changes into smaller commits for better results."
-            )
+def handle_commit_command(token_budget: int | None = None, stream: bool = False):  # Handles the 'commit' command logic, including AI suggestions.
+    from .ai_service import get_commit_message_suggestion, reset_ai_deadline
+    from .diff_spool import prepare_diff
+    from .diff_triage import plan_diff
+    from .github_service import get_staged_diff, get_staged_numstat, git_commit
 
-        print("Staged Diffs:\n")
-        print(staged_diff)
+    print("Handling commit command...")
+    reset_ai_deadline()
+    # The cheap `--numstat` comes first and decides which files are worth fetching,
+    # so a commit touching thousands of files only loads the patches the AI can use.
+    stats = get_staged_numstat()
+    plan = plan_diff(stats, token_budget) if stats else None
+    staged_diff = None
+    if plan and plan.fetch:
+        staged_diff = get_staged_diff(paths=None if plan.complete else plan.paths)
+    if plan and (staged_diff or not plan.fetch):
+        # The diff may be huge, so it is filtered, budgeted and printed a piece at a
+        # time; only the text sent to the AI is kept once the spool is closed.
+        with staged_diff or contextlib.nullcontext():
+            filtered, budgeted = prepare_diff(staged_diff, token_budget, plan)
+            _print_filter_note(filtered)
+            # Large diffs are trimmed to the token budget instead of being rejected.
+            if budgeted.was_trimmed:
+                print(
+                    f"Note: Diff is large (~{budgeted.total_tokens} tokens). Sending the most relevant "
+                    f"~{budgeted.sent_tokens} tokens to the AI and summarizing {budgeted.omitted_hunks} omitted hunk(s)."
+                )
+
+            if plan.complete:
+                print("Staged Diffs:\n")
+                for chunk in staged_diff.iter_text():
+                    print(chunk, end="")
+                print()
+            else:
+                _print_stat_summary(plan)
         print("\nAttempting to get AI suggestion for commit message...")
-        suggestion = get_commit_message_suggestion(staged_diff)
+        if stream:
+            # Show the message as it is generated instead of waiting for the whole response.
+            print("\nSuggested commit message:")
+            suggestion = get_commit_message_suggestion(budgeted.text, stream=True)
+            print()
+        else:
+            suggestion = get_commit_message_suggestion(budgeted.text)
 
         # Check for error messages from AI service
         if (
@@ -60,7 +89,8 @@ def handle_commit_command():  # Handles the 'commit' command logic, including AI
             print("Please commit manually using git.")
             return
 
-        print(f"\nSuggested commit message:\n{suggestion}")
+        if not stream:
+            print(f"\nSuggested commit message:\n{suggestion}")
 
         confirmation = input(
             "\nDo you want to commit with this message? (y/n): "
@@ -80,22 +110,109 @@ def handle_commit_command():  # Handles the 'commit' command logic, including AI
         print("No changes staged for commit.")
 
 
-def handle_review_command(pr_number: int):
-    """
-    Handles the 'review' command logic, including fetching PR changes and posting review comments.
+def _get_review_changes(pr_number: int, head_sha: str | None, full: bool) -> tuple[str, str] | None:
+    """Returns the diff to review and the PR's whole diff.
+
+    If the PR was reviewed before, only what the new commits changed in the PR's
+    own files and hunks is reviewed. Returns None when there is nothing new to review.
     """
+    from .diff_utils import index_diff_lines, restrict_diff
+    from .github_service import get_pr_changes, get_pr_changes_since
+    from .review_state import get_last_reviewed_sha
+
+    last_sha = None if full else get_last_reviewed_sha(pr_number)
+    if last_sha and head_sha:
+        if last_sha == head_sha:
+            print(
+                f"PR #{pr_number} has no new commits since its last review at {head_sha[:7]}. "
+                f"Use --full to review the whole PR again."
+            )
+            return None
+        print(f"Fetching changes pushed to PR #{pr_number} since {last_sha[:7]}...")
+        changes = get_pr_changes_since(pr_number, last_sha, head_sha)
+        if changes is not None:
+            if not changes:
+                print(f"PR #{pr_number} has no new changes since its last review.")
+                return None
+            pr_changes = get_pr_changes(pr_number)
+            if not pr_changes:
+                return "", ""
+            changes = restrict_diff(changes, index_diff_lines(pr_changes))
+            if not changes:
+                print(f"PR #{pr_number} has no new changes to its own files since its last review.")
+                return None
+            return changes, pr_changes
+        print("Falling back to reviewing the whole PR.")
+
     print(f"Fetching changes for PR #{pr_number}...")
     pr_changes = get_pr_changes(pr_number)
+    return pr_changes, pr_changes
+
+
+@dataclass
+class ReviewResult:
+    """Outcome of reviewing one PR."""
+
+    pr_number: int
+    status: str
+    suggestions: int = 0
+    posted: int = 0
+    failed: int = 0
+
+
+def _record_review(pr_number: int, head_sha: str | None) -> None:
+    from .review_state import record_reviewed_sha
+
+    if head_sha:
+        record_reviewed_sha(pr_number, head_sha)
+
+
+def handle_review_command(pr_number: int, full: bool = False) -> ReviewResult:
+    """
+    Handles the 'review' command logic, including fetching PR changes and posting review comments.
+
+    A PR that was reviewed before only has the commits pushed since then reviewed,
+    unless full is True or the branch was rewritten. Returns what happened, for the
+    summary of batch reviews.
+    """
+    from .ai_service import reset_ai_deadline
+    from .diff_filter import filter_diff
+    from .diff_utils import index_diff_lines
+    from .github_service import (
+        get_pr_head_commit_sha,
+        get_pr_review_comments,
+        post_pr_review,
+        prefetch_pr_context,
+    )
+    from .review_engine import anchor_suggestions, drop_existing_comments, review_diff
+
+    # Each PR of a batch review gets the whole deadline for its AI calls.
+    reset_ai_deadline()
+    # One request for the PR's metadata; the lookups below are then answered from it.
+    context = prefetch_pr_context(pr_number)
+    if context:
+        print(
+            f"PR #{pr_number}: {context.title} ({context.changed_files} file(s), "
+            f"+{context.additions} -{context.deletions})"
+        )
+    head_sha = get_pr_head_commit_sha(pr_number)
+    changes = _get_review_changes(pr_number, head_sha, full)
+    if changes is None:
+        return ReviewResult(pr_number, "up to date")
+    pr_changes, whole_pr_changes = changes
     if not pr_changes:
         print(f"Could not fetch PR changes for PR #{pr_number}. Please check the PR number, network connection, and 'gh' auth status.")
-        return
+        return ReviewResult(pr_number, "fetch failed")
+
+    filtered = filter_diff(pr_changes)
+    _print_filter_note(filtered)
 
     print("\nAnalyzing changes and generating review suggestions...")
-    suggestions = get_pr_review_suggestions(pr_changes)
+    suggestions = review_diff(filtered.text)
     
     if not suggestions:
         print("No suggestions were generated by the AI. This could be due to an API issue, an error, or the AI found no specific suggestions to make.")
-        return
+        return ReviewResult(pr_number, "no suggestions")
     
     # Filter out error placeholder suggestions if any
     actual_suggestions = [s for s in suggestions if s.get("path") != "error"]
@@ -106,17 +223,19 @@ def handle_review_command(pr_number: int):
             print(f"AI Service Error: {err_s.get('suggestion', 'Unknown error from AI service.')}")
         if not actual_suggestions:
             print("No valid suggestions were generated due to AI service errors.")
-            return # Stop if only errors were returned
+            return ReviewResult(pr_number, "AI error") # Stop if only errors were returned
 
     if not actual_suggestions:
         print("No actionable suggestions were generated by the AI.")
-        return
+        _record_review(pr_number, head_sha)
+        return ReviewResult(pr_number, "no suggestions")
 
     print(f"\nGenerated {len(actual_suggestions)} actionable suggestion(s) for review.")
     print("\nPosting review comments...")
 
     success_count = 0
     failure_count = 0
+    comments = []
     for suggestion in actual_suggestions:
         try:
             path = suggestion["path"]
@@ -128,56 +247,237 @@ def handle_review_command(pr_number: int):
                 failure_count +=1
                 continue
 
-            if post_pr_review_comment(pr_number, body, path, line):
-                success_count += 1
-                # print(f"Successfully posted comment on {path}:{line}") # Already printed by post_pr_review_comment
-            else:
-                print(f"Failed to post comment on {path}:{line} (see details above).")
-                failure_count +=1
+            comments.append({"path": path, "line": line, "body": body})
         except KeyError as e:
             print(f"Error processing suggestion format: missing key {e} in {suggestion}")
             failure_count +=1
             continue
         except Exception as e:
-            print(f"Unexpected error while processing and posting a suggestion: {e}")
+            print(f"Unexpected error while processing a suggestion: {e}")
             failure_count +=1
             continue
 
+    # GitHub rejects comments on lines outside the PR's diff, so move or drop those first.
+    diff_index = index_diff_lines(whole_pr_changes)
+    comments, corrected, dropped = anchor_suggestions(comments, diff_index)
+    if corrected or dropped:
+        print(
+            f"Moved {corrected} suggestion(s) onto the nearest line of the diff; "
+            f"skipped {dropped} that did not match any changed lines."
+        )
+
+    # Re-running a review would post the same comments again, so skip what is already there.
+    if comments:
+        existing = (
+            context.review_threads
+            if context and context.review_threads is not None
+            else get_pr_review_comments(pr_number)
+        )
+        comments, duplicates = drop_existing_comments(comments, existing or [])
+        if duplicates:
+            print(f"Skipped {duplicates} suggestion(s) already posted on the PR.")
+
+    # All comments go out as one review (see post_pr_review).
+    posted_flags = (
+        post_pr_review(pr_number, comments, commit_sha=head_sha, diff_index=diff_index) if comments else []
+    )
+    for comment, posted in zip(comments, posted_flags):
+        if posted:
+            success_count += 1
+        else:
+            print(f"Failed to post comment on {comment['path']}:{comment['line']} (see details above).")
+            failure_count +=1
+
     print("\nReview complete.")
     if success_count > 0:
         print(f"Successfully posted {success_count} comment(s).")
     if failure_count > 0:
         print(f"Failed to post {failure_count} comment(s).")
+    if not error_placeholders and not failure_count:
+        # Only a complete review moves the starting point of the next one.
+        _record_review(pr_number, head_sha)
     if not actual_suggestions: # Should be caught earlier, but as a safeguard
         print("No suggestions were attempted.")
+    return ReviewResult(
+        pr_number,
+        "partial" if error_placeholders or failure_count else "reviewed",
+        suggestions=len(actual_suggestions),
+        posted=success_count,
+        failed=failure_count,
+    )
 
 
-def handle_pr_create_command(base_branch: str, repo_path: str = "."):
-    print(f"Initiating PR creation process against base branch: {base_branch}")
+# Number of PRs reviewed at the same time by `autopr review` with several PRs.
+DEFAULT_REVIEW_JOBS = 8
 
-    commit_messages = get_commit_messages_for_branch(base_branch)
-    if commit_messages is None:
+
+class _PerThreadOutput:
+    """Stands in for sys.stdout while PRs are reviewed in parallel.
+
+    Each worker's output is buffered and written out in one piece when its PR is done,
+    so the logs of different PRs do not interleave. Other threads write straight through.
+    """
+
+    def __init__(self, target):
+        self._target = target
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is not None:
+            return buffer.write(text)
+        with self._lock:
+            return self._target.write(text)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self._target.flush()
+
+    def begin(self):
+        self._local.buffer = io.StringIO()
+
+    def end(self, header: str):
+        text = self._local.buffer.getvalue()
+        self._local.buffer = None
+        with self._lock:
+            self._target.write(header + text)
+            self._target.flush()
+
+
+def _print_review_summary(results: list[ReviewResult]) -> None:
+    print("\nReview summary:")
+    print(f"{'PR':<8} {'Status':<16} {'Suggestions':>11} {'Posted':>7} {'Failed':>7}")
+    for result in results:
         print(
-            f"Error: Could not retrieve commit messages for the current branch against base '{base_branch}'."
+            f"{'#' + str(result.pr_number):<8} {result.status:<16} "
+            f"{result.suggestions:>11} {result.posted:>7} {result.failed:>7}"
         )
-        return
-    if not commit_messages:
+    print(
+        f"{'Total':<8} {len(results):<16} {sum(r.suggestions for r in results):>11} "
+        f"{sum(r.posted for r in results):>7} {sum(r.failed for r in results):>7}"
+    )
+
+
+def handle_batch_review_command(
+    pr_numbers: list[int], full: bool = False, jobs: int = DEFAULT_REVIEW_JOBS
+) -> list[ReviewResult]:
+    """Reviews several PRs with a pool of jobs workers and prints a summary table.
+
+    Each worker runs the whole single-PR review (gh fetches, model calls and comment
+    posting), so the slow steps of different PRs overlap.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    pr_numbers = list(dict.fromkeys(pr_numbers))  # Drop duplicates, keep order
+    if not pr_numbers:
+        print("No PRs to review.")
+        return []
+    jobs = max(1, min(jobs, len(pr_numbers)))
+    print(f"Reviewing {len(pr_numbers)} PR(s), {jobs} at a time...")
+
+    output = _PerThreadOutput(sys.stdout)
+
+    def review_one(pr_number: int) -> ReviewResult:
+        output.begin()
+        try:
+            return handle_review_command(pr_number, full=full)
+        except Exception as e:
+            print(f"Unexpected error while reviewing PR #{pr_number}: {e}")
+            return ReviewResult(pr_number, "error")
+        finally:
+            output.end(f"\n===== PR #{pr_number} =====\n")
+
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(review_one, pr_numbers))
+    finally:
+        sys.stdout = output._target
+
+    _print_review_summary(results)
+    return results
+
+
+def handle_pr_create_command(base_branch: str, repo_path: str = ".", stream: bool = False):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from .ai_service import get_pr_description_suggestion, reset_ai_deadline
+    from .ai_service import warm_client as warm_ai_client
+    from .git_utils import get_current_branch
+    from .github_service import (
+        create_pr_gh,
+        get_branch_commits,
+        get_branch_overview,
+        get_current_issue_number,
+        get_issue_details,
+        prefetch_repo_context,
+    )
+
+    print(f"Initiating PR creation process against base branch: {base_branch}")
+    reset_ai_deadline()
+
+    # The commits, the issue, the diffstat and the merge base do not depend on each
+    # other, so they are fetched at the same time while the connection to OpenAI is opened.
+    branch = get_current_branch(repo_path)
+    issue_number = get_current_issue_number(repo_path, quiet=True)
+    pool = ThreadPoolExecutor(max_workers=4)
+    try:
+        commits_future = pool.submit(get_branch_commits, base_branch)
+        context_future = pool.submit(prefetch_repo_context, branch, issue_number)
+        overview_future = pool.submit(get_branch_overview, base_branch)
+        pool.submit(warm_ai_client)
+        commits = commits_future.result()
+        if commits is None:
+            print(
+                f"Error: Could not retrieve commit messages for the current branch against base '{base_branch}'."
+            )
+            return
+        if not commits:
+            print(
+                "No new commit messages found on this branch compared to base. Cannot generate PR description."
+            )
+            return
+        context = context_future.result()
+        merge_base, diffstat = overview_future.result()
+    finally:
+        # Do not wait for the connection to OpenAI if it is not going to be used.
+        pool.shutdown(wait=False)
+
+    print(f"Retrieved {len(commits)} commit(s).")
+    if merge_base and diffstat:
+        print(f"Changes since {merge_base[:7]} on {base_branch}: {diffstat.splitlines()[-1].strip()}")
+
+    if context and context.existing_pr:
         print(
-            "No new commit messages found on this branch compared to base. Cannot generate PR description."
+            f"A pull request already exists for branch '{branch}': "
+            f"#{context.existing_pr['number']} {context.existing_pr['url']}"
         )
         return
-
-    print(f"Retrieved {len(commit_messages)} commit message(s).")
+    issue = context.issue if context else None
+    if context is None and issue_number is not None:
+        # GitHub could not be reached; the local issue store may still know the issue.
+        issue = get_issue_details(issue_number, offline=True)
+    if issue:
+        print(f"Working on issue #{issue['number']}: {issue['title']}")
 
     print("\nAttempting to generate PR title and body using AI...")
-    pr_title_suggestion, pr_body_suggestion = get_pr_description_suggestion(
-        commit_messages
-    )
+    if stream:
+        # The title is the first line of the streamed text, followed by the body.
+        print("\n--- Suggested PR Title and Body ---")
+        pr_title_suggestion, pr_body_suggestion = get_pr_description_suggestion(
+            commits, stream=True, issue=issue, diffstat=diffstat
+        )
+        print()
+    else:
+        pr_title_suggestion, pr_body_suggestion = get_pr_description_suggestion(
+            commits, issue=issue, diffstat=diffstat
+        )
 
-    print("\n--- Suggested PR Title ---")
-    print(pr_title_suggestion)
-    print("\n--- Suggested PR Body ---")
-    print(pr_body_suggestion)
+        print("\n--- Suggested PR Title ---")
+        print(pr_title_suggestion)
+        print("\n--- Suggested PR Body ---")
+        print(pr_body_suggestion)
 
     confirmation = input("Do you want to create this PR? (y/n): ").lower()
     if confirmation == "y":
@@ -204,8 +504,63 @@ def handle_pr_create_command(base_branch: str, repo_path: str = "."):
         print("PR creation aborted by user.")
 
 
+def _format_bytes(num_bytes: int) -> str:
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{int(size)} B" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def handle_cache_command(action: str, max_bytes: int | None = None):
+    """
+    Handles the 'cache' command: shows stats for, prunes or clears the AI suggestion cache.
+    """
+    import time
+
+    from .cache import clear_cache, get_cache_stats, prune_cache
+
+    if action == "stats":
+        stats = get_cache_stats()
+        print(f"Cache directory: {stats['path']}")
+        print(f"Enabled: {'yes' if stats['enabled'] else 'no (AUTOPR_NO_CACHE is set)'}")
+        print(f"Entries: {stats['entries']}")
+        print(
+            f"Size: {_format_bytes(stats['size_bytes'])} of {_format_bytes(stats['max_bytes'])}"
+        )
+        if stats["oldest"] is not None:
+            print(f"Least recently used: {time.ctime(stats['oldest'])}")
+            print(f"Most recently used: {time.ctime(stats['newest'])}")
+    elif action == "prune":
+        removed, freed = prune_cache(max_bytes)
+        print(f"Pruned {removed} cache entries, freed {_format_bytes(freed)}.")
+    elif action == "clear":
+        removed = clear_cache()
+        print(f"Cleared {removed} cache entries.")
+
+
+def _add_issue_store_arguments(parser) -> None:
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use the local issue store; do not contact GitHub.",
+    )
+    group.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Rebuild the local issue store from GitHub instead of updating it.",
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(description="AutoPR CLI")
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="After the command, report how long each git and GitHub call took.",
+    )
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # Subparser for the 'pr' command (renamed from 'create')
@@ -224,6 +579,11 @@ def main():
         default="main",
         help="The target base branch for the PR. Defaults to 'main'.",
     )  # Now optional, defaults to main
+    pr_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print the suggested title and body as they are generated.",
+    )
 
     # Subparser for the 'ls' command
     list_parser = subparsers.add_parser(
@@ -236,6 +596,25 @@ def main():
         required=False,
         help="Include all issues (open and closed). Default is open issues only.",
     )
+    list_parser.add_argument(
+        "-l",
+        "--label",
+        action="append",
+        dest="labels",
+        help="Only issues with this label. Repeat to require several labels.",
+    )
+    list_parser.add_argument("--assignee", help="Only issues assigned to this user.")
+    list_parser.add_argument("--author", help="Only issues opened by this user.")
+    list_parser.add_argument(
+        "-S", "--search", help="Only issues matching this search text."
+    )
+    list_parser.add_argument(
+        "-L", "--limit", type=int, help="Show at most this many issues."
+    )
+    list_parser.add_argument(
+        "--json", action="store_true", help="Print the issues as a JSON array."
+    )
+    _add_issue_store_arguments(list_parser)
 
     # Subparser for the 'workon' command
     workon_parser = subparsers.add_parser(
@@ -244,50 +623,168 @@ def main():
     workon_parser.add_argument(
         "issue_number", type=int, help="The number of the GitHub issue to work on."
     )
+    _add_issue_store_arguments(workon_parser)
 
     # Subparser for the 'commit' command
     commit_parser = subparsers.add_parser(
         "commit", help="Process staged changes for a commit."
     )
-    # No arguments for commit in MVP
+    commit_parser.add_argument(
+        "--token-budget",
+        type=int,
+        required=False,
+        default=None,
+        help="Maximum number of diff tokens to send to the AI. Defaults to AUTOPR_COMMIT_TOKEN_BUDGET or 16000.",
+    )
+    commit_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print the suggested commit message as it is generated.",
+    )
 
     # Subparser for the 'review' command
     review_parser = subparsers.add_parser(
         "review",
-        help="Review a PR and post AI-generated suggestions as comments.",
+        help="Review one or more PRs and post AI-generated suggestions as comments.",
+    )
+    review_parser.add_argument(
+        "pr_numbers",
+        type=int,
+        nargs="*",
+        metavar="pr_number",
+        help="The number(s) of the PR(s) to review.",
+    )
+    review_parser.add_argument(
+        "--all-open",
+        action="store_true",
+        help="Review every open PR in the repository.",
     )
     review_parser.add_argument(
-        "pr_number",
+        "--label",
+        required=False,
+        help="With --all-open, only review open PRs that have this label.",
+    )
+    review_parser.add_argument(
+        "--jobs",
         type=int,
-        help="The number of the PR to review.",
+        default=DEFAULT_REVIEW_JOBS,
+        help=f"Number of PRs reviewed at the same time. Defaults to {DEFAULT_REVIEW_JOBS}.",
+    )
+    review_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Review the whole PR, even if it was reviewed before.",
+    )
+
+    # Subparser for the 'cache' command
+    cache_parser = subparsers.add_parser(
+        "cache", help="Inspect or clean the on-disk cache of AI suggestions."
+    )
+    cache_parser.add_argument(
+        "action",
+        choices=["stats", "prune", "clear"],
+        help="'stats' shows cache usage, 'prune' evicts least recently used entries, 'clear' removes everything.",
+    )
+    cache_parser.add_argument(
+        "--max-bytes",
+        type=int,
+        required=False,
+        default=None,
+        help="Size to prune the cache down to. Defaults to AUTOPR_CACHE_MAX_BYTES or 50 MB.",
     )
 
     args = parser.parse_args()
 
+    if args.command == "review":
+        if not args.pr_numbers and not args.all_open:
+            review_parser.error("give at least one PR number or --all-open")
+        if args.label and not args.all_open:
+            review_parser.error("--label can only be used with --all-open")
+        if args.jobs < 1:
+            review_parser.error("--jobs must be at least 1")
+    if args.command == "ls" and args.limit is not None and args.limit < 1:
+        list_parser.error("--limit must be at least 1")
+
+    if not args.timings:
+        _run_command(args)
+        return
+    import time
+
+    from .runner import format_timings, reset_timings
+
+    reset_timings()
+    started = time.perf_counter()
+    try:
+        _run_command(args)
+    finally:
+        # stderr, so the report does not get mixed into output such as `ls --json`.
+        print(format_timings(time.perf_counter() - started), file=sys.stderr)
+
+
+def _run_command(args) -> None:
+    """Runs the command parsed by main()."""
+    from .git_utils import get_repo_from_git_config
+    from .github_service import list_issues, list_open_prs, start_work_on_issue
+
+    if args.command == "cache":
+        # The cache is not tied to a repository, so skip repository detection.
+        handle_cache_command(args.action, max_bytes=args.max_bytes)
+        return
+
     repo_full_path = "."  # Default to current directory, can be refined if needed
+    json_output = args.command == "ls" and args.json  # Keep JSON output parseable
     try:
         repo_name = get_repo_from_git_config()
-        print(f"Detected repository: {repo_name}")
+        if not json_output:
+            print(f"Detected repository: {repo_name}")
         # Potentially derive repo_full_path if get_repo_from_git_config can provide it or we add a helper
     except Exception as e:
-        print(f"Error detecting repository: {e}")
+        print(f"Error detecting repository: {e}", file=sys.stderr if json_output else None)
+        if json_output:
+            print("[]")
         if args.command in ["ls", "pr"]:  # Renamed from create to pr
             return
         pass
 
     if args.command == "pr":  # Renamed from create to pr
         # The old create_pr(args.title) is removed in favor of the new handler
-        handle_pr_create_command(base_branch=args.base, repo_path=repo_full_path)
+        handle_pr_create_command(
+            base_branch=args.base, repo_path=repo_full_path, stream=args.stream
+        )
     elif args.command == "workon":
         start_work_on_issue(
-            args.issue_number, repo_path=repo_full_path
+            args.issue_number,
+            repo_path=repo_full_path,
+            offline=args.offline,
+            refresh=args.refresh,
         )  # Assuming start_work_on_issue can take repo_path
     elif args.command == "ls":
-        list_issues(show_all_issues=args.all)
+        list_issues(
+            show_all_issues=args.all,
+            offline=args.offline,
+            refresh=args.refresh,
+            labels=args.labels,
+            assignee=args.assignee,
+            author=args.author,
+            search=args.search,
+            limit=args.limit,
+            as_json=args.json,
+        )
     elif args.command == "commit":
-        handle_commit_command()  # repo_path could be passed if needed by get_staged_diff
+        handle_commit_command(
+            token_budget=args.token_budget, stream=args.stream
+        )  # repo_path could be passed if needed by get_staged_diff
     elif args.command == "review":
-        handle_review_command(args.pr_number)
+        pr_numbers = args.pr_numbers
+        if args.all_open:
+            open_prs = list_open_prs(label=args.label)
+            if open_prs is None:
+                return
+            pr_numbers = pr_numbers + open_prs
+        if len(pr_numbers) == 1 and not args.all_open:
+            handle_review_command(pr_numbers[0], full=args.full)
+        else:
+            handle_batch_review_command(pr_numbers, full=args.full, jobs=args.jobs)
 
 
 # main() is the designated entry point for the CLI, called by setup.py.
@@ -0,0 +1,213 @@
+# autopr/commit_log.py
+# Reads the commits of a branch from one `git log -z --numstat` process: subject,
+# body, author and the files each commit changed. The output is parsed as it
+# streams, one NUL-separated field at a time, and every commit is kept only in a
+# compact form (long bodies and long file lists are cut), so a branch with hundreds
+# of commits costs one process and little memory. format_commits() then fits them
+# into a token budget for the PR description prompt.
+import os
+from dataclasses import dataclass, field
+
+from .diff_utils import FileStat, estimate_tokens
+
+DEFAULT_PR_COMMITS_TOKEN_BUDGET = 2000
+
+# What is kept of each commit.
+MAX_BODY_CHARS = 1000
+MAX_FILES_PER_COMMIT = 20
+# Files listed per commit in the prompt.
+MAX_LISTED_FILES = 8
+
+# Each commit starts with a record separator, so it cannot be taken for a file of
+# the commit before it. The body is followed by a NUL, then the --numstat records.
+LOG_FORMAT = "%x1e%H%x00%an%x00%s%x00%b%x00"
+_RECORD_START = "\x1e"
+
+
+def get_pr_commits_token_budget() -> int:
+    """Returns the configured token budget for the commits in the PR description prompt."""
+    value = os.environ.get("AUTOPR_PR_COMMITS_TOKEN_BUDGET")
+    if value:
+        try:
+            return max(1, int(value))
+        except ValueError:
+            print(
+                f"Warning: Ignoring invalid AUTOPR_PR_COMMITS_TOKEN_BUDGET value: {value}"
+            )
+    return DEFAULT_PR_COMMITS_TOKEN_BUDGET
+
+
+def log_command(revision_range: str) -> list[str]:
+    return [
+        "git",
+        "log",
+        "-z",
+        "--no-color",
+        f"--format={LOG_FORMAT}",
+        "--numstat",
+        revision_range,
+    ]
+
+
+@dataclass
+class CommitRecord:
+    """One commit of a branch, as much of it as the PR description needs."""
+
+    sha: str
+    subject: str
+    body: str = ""
+    author: str = ""
+    # At most MAX_FILES_PER_COMMIT files; the totals below count all of them.
+    files: list[FileStat] = field(default_factory=list)
+    file_count: int = 0
+    added: int = 0
+    removed: int = 0
+
+    def add_file(self, stat: FileStat) -> None:
+        self.file_count += 1
+        self.added += stat.added
+        self.removed += stat.removed
+        if len(self.files) < MAX_FILES_PER_COMMIT:
+            self.files.append(stat)
+
+
+class CommitLogParser:
+    """Parses `git log -z --format=LOG_FORMAT --numstat` output fed in chunks.
+
+    feed() the bytes as they arrive and close() at the end; the finished commits
+    are in `commits`, newest first like git prints them.
+    """
+
+    def __init__(self):
+        self.commits: list[CommitRecord] = []
+        self._pending = b""
+        self._header: list[str] | None = None
+        # (added, removed) of a rename whose paths are still to come, and its old path
+        self._rename: tuple[tuple[str, str], str | None] | None = None
+
+    def feed(self, chunk: bytes) -> None:
+        fields = (self._pending + chunk).split(b"\0")
+        self._pending = fields.pop()
+        for raw in fields:
+            self._field(raw.decode("utf-8", errors="replace"))
+
+    def close(self) -> list[CommitRecord]:
+        if self._pending:
+            self._field(self._pending.decode("utf-8", errors="replace"))
+            self._pending = b""
+        return self.commits
+
+    def _field(self, value: str) -> None:
+        if self._header is not None:
+            self._header.append(value)
+            if len(self._header) == 4:
+                sha, author, subject, body = self._header
+                self._header = None
+                body = body.strip()
+                if len(body) > MAX_BODY_CHARS:
+                    body = body[:MAX_BODY_CHARS].rstrip() + " [...]"
+                self.commits.append(CommitRecord(sha, subject.strip(), body, author))
+            return
+        if self._rename is not None:
+            counts, old_path = self._rename
+            if old_path is None:
+                self._rename = (counts, value)
+            else:
+                self._rename = None
+                self._add_stat(counts, value, old_path)
+            return
+        value = value.lstrip("\n")
+        if value.startswith(_RECORD_START):
+            self._header = [value[len(_RECORD_START) :]]
+        elif value and self.commits:
+            added, _, rest = value.partition("\t")
+            removed, _, path = rest.partition("\t")
+            if not path:
+                self._rename = ((added, removed), None)
+            else:
+                self._add_stat((added, removed), path, None)
+
+    def _add_stat(
+        self, counts: tuple[str, str], path: str, old_path: str | None
+    ) -> None:
+        added, removed = counts
+        is_binary = added == "-"
+        try:
+            stat = FileStat(
+                path,
+                0 if is_binary else int(added),
+                0 if is_binary else int(removed),
+                old_path,
+                is_binary,
+            )
+        except ValueError:
+            return  # Not a --numstat record
+        self.commits[-1].add_file(stat)
+
+
+def parse_commit_log(output: bytes) -> list[CommitRecord]:
+    parser = CommitLogParser()
+    parser.feed(output)
+    return parser.close()
+
+
+def _subject_line(commit: CommitRecord) -> str:
+    details = ", ".join(part for part in (commit.sha[:7], commit.author) if part)
+    return f"- {commit.subject} ({details})" if details else f"- {commit.subject}"
+
+
+def _body_lines(commit: CommitRecord) -> str:
+    return "\n".join(f"  {line}".rstrip() for line in commit.body.splitlines())
+
+
+def _files_line(commit: CommitRecord) -> str:
+    if not commit.file_count:
+        return ""
+    listed = []
+    for stat in commit.files[:MAX_LISTED_FILES]:
+        path = f"{stat.old_path} => {stat.path}" if stat.old_path else stat.path
+        listed.append(
+            f"{path} (binary)"
+            if stat.is_binary
+            else f"{path} +{stat.added} -{stat.removed}"
+        )
+    more = commit.file_count - len(listed)
+    if more > 0:
+        listed.append(f"{more} more")
+    return f"  Files (+{commit.added} -{commit.removed}): " + ", ".join(listed)
+
+
+def format_commits(
+    commits: list[CommitRecord | str], max_tokens: int | None = None
+) -> str:
+    """Lists commits for the PR description prompt within about max_tokens.
+
+    Every commit gets its subject line first. Bodies are added next, then the
+    changed files, each commit in turn while they still fit. If the subjects alone
+    do not fit, the oldest commits are left out and counted instead. Plain strings
+    are taken as subjects.
+    """
+    if max_tokens is None:
+        max_tokens = get_pr_commits_token_budget()
+    commits = [CommitRecord("", c) if isinstance(c, str) else c for c in commits]
+    entries = [[_subject_line(commit)] for commit in commits]
+
+    used = 0
+    for kept, entry in enumerate(entries):
+        cost = estimate_tokens(entry[0]) + 1
+        if used + cost > max_tokens:
+            lines = [entry[0] for entry in entries[:kept]]
+            lines.append(f"- ... and {len(entries) - kept} earlier commit(s)")
+            return "\n".join(lines)
+        used += cost
+
+    for part in (_body_lines, _files_line):
+        for commit, entry in zip(commits, entries):
+            text = part(commit)
+            if not text:
+                continue
+            cost = estimate_tokens(text) + 1
+            if used + cost <= max_tokens:
+                entry.append(text)
+                used += cost
+    return "\n".join(line for entry in entries for line in entry)
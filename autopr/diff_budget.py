@@ -0,0 +1,307 @@
+# autopr/diff_budget.py
+import fnmatch
+import os
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+
+from .diff_utils import (
+    CHARS_PER_TOKEN,
+    FileDiff,
+    estimate_tokens,
+    hunk_head,
+    parse_diff,
+)
+
+# Default number of diff tokens sent to the model for a commit message. Override with
+# AUTOPR_COMMIT_TOKEN_BUDGET or `autopr commit --token-budget`.
+DEFAULT_COMMIT_TOKEN_BUDGET = 16000
+
+# Share of the budget kept free for the summary of omitted hunks.
+SUMMARY_RESERVE_RATIO = 0.1
+MAX_SUMMARY_LINES = 40
+# Smallest part of the budget worth filling with the start of a hunk that does not fit.
+MIN_HUNK_HEAD_TOKENS = 100
+
+# Lower rank means more valuable to the model. Hunks are kept in rank order.
+CATEGORY_RANKS = {
+    "source": 0,
+    "test": 1,
+    "config": 2,
+    "docs": 3,
+    "generated": 8,
+    "vendored": 8,
+    "lockfile": 9,
+    "binary": 9,
+}
+
+LOCKFILE_NAMES = {
+    "package-lock.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+    "poetry.lock",
+    "Pipfile.lock",
+    "Cargo.lock",
+    "Gemfile.lock",
+    "composer.lock",
+    "go.sum",
+    "uv.lock",
+}
+GENERATED_PATTERNS = [
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "*_pb2.py",
+    "*.pb.go",
+    "*.generated.*",
+    "*.snap",
+    "*/__snapshots__/*",
+    "dist/*",
+    "build/*",
+]
+VENDORED_PATTERNS = [
+    "vendor/*",
+    "*/vendor/*",
+    "third_party/*",
+    "*/third_party/*",
+    "node_modules/*",
+    "*/node_modules/*",
+]
+DOCS_EXTENSIONS = {".md", ".rst", ".txt", ".adoc"}
+CONFIG_EXTENSIONS = {".json", ".yaml", ".yml", ".toml", ".ini", ".cfg", ".xml", ".lock"}
+
+
+def get_commit_token_budget() -> int:
+    """Returns the configured token budget for commit message diffs."""
+    value = os.environ.get("AUTOPR_COMMIT_TOKEN_BUDGET")
+    if value:
+        try:
+            return max(1, int(value))
+        except ValueError:
+            print(
+                f"Warning: Ignoring invalid AUTOPR_COMMIT_TOKEN_BUDGET value: {value}"
+            )
+    return DEFAULT_COMMIT_TOKEN_BUDGET
+
+
+def _matches_any(path: str, patterns: list[str]) -> bool:
+    return any(fnmatch.fnmatch(path, pattern) for pattern in patterns)
+
+
+def classify_path(path: str) -> str:
+    """Classifies a changed file so hunks can be ranked by how useful they are to the model."""
+    name = os.path.basename(path)
+    if name in LOCKFILE_NAMES:
+        return "lockfile"
+    if _matches_any(path, VENDORED_PATTERNS):
+        return "vendored"
+    if _matches_any(path, GENERATED_PATTERNS):
+        return "generated"
+    parts = path.lower().split("/")
+    if (
+        name.startswith("test_")
+        or name.endswith(
+            ("_test.py", "_test.go", ".test.js", ".test.ts", ".spec.js", ".spec.ts")
+        )
+        or "tests" in parts[:-1]
+        or "test" in parts[:-1]
+    ):
+        return "test"
+    extension = os.path.splitext(name)[1].lower()
+    if extension in DOCS_EXTENSIONS or "docs" in parts[:-1]:
+        return "docs"
+    if extension in CONFIG_EXTENSIONS:
+        return "config"
+    return "source"
+
+
+def _file_category(file_diff) -> str:
+    return "binary" if file_diff.is_binary else classify_path(file_diff.path)
+
+
+@dataclass
+class BudgetedDiff:
+    """The part of a diff that fits the token budget, plus what was left out."""
+
+    text: str
+    total_tokens: int
+    sent_tokens: int
+    omitted_hunks: int = 0
+    summary_lines: list[str] = field(default_factory=list)
+
+    @property
+    def was_trimmed(self) -> bool:
+        return self.omitted_hunks > 0
+
+
+def budget_diff(diff: str, max_tokens: int | None = None) -> BudgetedDiff:
+    """Fits a diff into max_tokens, keeping the most valuable hunks.
+
+    Hunks are ranked by file category (source code first, generated and vendored
+    files last) and then by how many changed lines they carry per token. The selected
+    hunks are emitted in their original order, followed by a one-line summary per file
+    for whatever did not fit. The best-ranked hunk that does not fit is cut short at a
+    line boundary to fill the space left over. A diff that already fits is returned
+    unchanged.
+    """
+    if max_tokens is None:
+        max_tokens = get_commit_token_budget()
+    total_tokens = estimate_tokens(diff)
+    if total_tokens <= max_tokens:
+        return BudgetedDiff(diff, total_tokens, total_tokens)
+
+    files = parse_diff(diff)
+    if not files:
+        # Not something we can split up, so keep the start of it.
+        return truncated_diff(diff[: max_tokens * CHARS_PER_TOKEN], total_tokens)
+    return budget_files(lambda: files, max_tokens, total_tokens)
+
+
+def truncated_diff(head: str, total_tokens: int) -> BudgetedDiff:
+    """A BudgetedDiff that is just the start of a diff that could not be split up."""
+    return BudgetedDiff(
+        head,
+        total_tokens,
+        estimate_tokens(head),
+        omitted_hunks=1,
+        summary_lines=["(diff truncated to fit the token budget)"],
+    )
+
+
+def budget_files(
+    get_files: Callable[[], Iterable[FileDiff]],
+    max_tokens: int | None = None,
+    total_tokens: int | None = None,
+    omitted_files: list[str] | None = None,
+    omitted_tokens: int = 0,
+) -> BudgetedDiff | None:
+    """budget_diff for a diff that is parsed one file at a time (see DiffSpool).
+
+    get_files() is called twice, and must yield the same files both times: once to
+    rank the hunks, once to emit the selected ones. Only one file needs to be in
+    memory at a time. total_tokens is worked out from the files if not given.
+
+    omitted_files are summary lines for files that were left out before budgeting
+    (see diff_triage), and omitted_tokens their estimated size. Returns None if
+    there is nothing at all.
+    """
+    if max_tokens is None:
+        max_tokens = get_commit_token_budget()
+
+    # (rank, -density, file_index, hunk_index, tokens) for every hunk. Files without
+    # hunks (binary files, renames, mode changes) are a single header-only candidate.
+    candidates = []
+    header_tokens = []
+    chars = 0
+    for file_index, file_diff in enumerate(get_files()):
+        rank = CATEGORY_RANKS[_file_category(file_diff)]
+        header_tokens.append(estimate_tokens(file_diff.header) + 1)
+        chars += len(file_diff.header) + 1
+        if not file_diff.hunks:
+            candidates.append((rank, 0.0, file_index, -1, 0))
+        for hunk_index, hunk in enumerate(file_diff.hunks):
+            size = hunk.size  # Truncated hunks are too large to ever be selected.
+            chars += size + 1
+            tokens = (size + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN + 1
+            density = (hunk.added + hunk.removed) / tokens
+            candidates.append((rank, -density, file_index, hunk_index, tokens))
+    if not header_tokens and not omitted_files:
+        return None
+    if total_tokens is None:
+        # What estimate_tokens() would say about the files joined by newlines
+        total_tokens = (
+            max(chars - 1 + CHARS_PER_TOKEN - 1, 0) // CHARS_PER_TOKEN + omitted_tokens
+        )
+        if total_tokens <= max_tokens and not omitted_files:
+            text = "\n".join(file_diff.text for file_diff in get_files())
+            return BudgetedDiff(text, total_tokens, total_tokens)
+    candidates.sort()
+
+    content_budget = max_tokens - int(max_tokens * SUMMARY_RESERVE_RATIO)
+    used = 0
+    selected: dict[int, set[int]] = {}
+    for _, _, file_index, hunk_index, tokens in candidates:
+        header_cost = 0
+        if file_index not in selected:
+            header_cost = header_tokens[file_index]
+        if used + header_cost + tokens > content_budget:
+            continue
+        selected.setdefault(file_index, set()).add(hunk_index)
+        used += header_cost + tokens
+
+    # What is left goes to the start of the best-ranked hunk that did not fit, so a
+    # single huge hunk is cut short instead of left out. Generated, vendored and lock
+    # files are not worth it.
+    head = None  # ((file_index, hunk_index), tokens) of that hunk
+    for rank, _, file_index, hunk_index, _ in candidates:
+        if rank > CATEGORY_RANKS["docs"]:
+            break
+        if hunk_index < 0 or hunk_index in selected.get(file_index, ()):
+            continue
+        header_cost = 0 if file_index in selected else header_tokens[file_index]
+        room = content_budget - used - header_cost
+        if room >= MIN_HUNK_HEAD_TOKENS:
+            head = ((file_index, hunk_index), room)
+            selected.setdefault(file_index, set()).add(hunk_index)
+        break
+
+    parts = []
+    summary_lines = []
+    omitted_hunks = 0
+    for file_index, file_diff in enumerate(get_files()):
+        kept = selected.get(file_index, set())
+        cut = None  # (hunk, the start of it that is sent)
+        if kept:
+            parts.append(file_diff.header)
+            for i, hunk in enumerate(file_diff.hunks):
+                if i not in kept:
+                    continue
+                if head is not None and head[0] == (file_index, i):
+                    cut = (hunk, hunk_head(hunk, head[1]))
+                    parts.append(cut[1].text)
+                else:
+                    parts.append(hunk.text)
+            if not file_diff.hunks:
+                continue
+        skipped = [hunk for i, hunk in enumerate(file_diff.hunks) if i not in kept]
+        if kept and not skipped and cut is None:
+            continue
+        omitted_hunks += max(len(skipped), 1) if not kept else len(skipped)
+        added = sum(hunk.added for hunk in skipped)
+        removed = sum(hunk.removed for hunk in skipped)
+        if not kept:
+            what = "omitted"
+        else:
+            notes = []
+            if skipped:
+                notes.append(f"{len(skipped)} of {len(file_diff.hunks)} hunks omitted")
+            if cut is not None:
+                hunk, start = cut
+                omitted_hunks += 1
+                added += hunk.added - start.added
+                removed += hunk.removed - start.removed
+                notes.append(f"hunk at line {hunk.new_start} cut short")
+            what = ", ".join(notes)
+        summary_lines.append(
+            f"{file_diff.path} ({_file_category(file_diff)}): {what}, +{added} -{removed} lines"
+        )
+
+    if omitted_files:
+        summary_lines.extend(omitted_files)
+        omitted_hunks += len(omitted_files)
+    if len(summary_lines) > MAX_SUMMARY_LINES:
+        extra = len(summary_lines) - MAX_SUMMARY_LINES
+        summary_lines = summary_lines[:MAX_SUMMARY_LINES] + [
+            f"... and {extra} more files"
+        ]
+    if summary_lines:
+        parts.append("# Changes omitted to fit the token budget:")
+        parts.extend(f"# - {line}" for line in summary_lines)
+
+    text = "\n".join(parts)
+    return BudgetedDiff(
+        text,
+        total_tokens,
+        estimate_tokens(text),
+        omitted_hunks=omitted_hunks,
+        summary_lines=summary_lines,
+    )
@@ -0,0 +1,303 @@
+# autopr/diff_filter.py
+import fnmatch
+import os
+import re
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+
+from .diff_budget import classify_path
+from .diff_utils import CHARS_PER_TOKEN, FileDiff, estimate_tokens, parse_diff
+from .repo_discovery import find_repository
+
+# Files in these categories (see diff_budget.classify_path) never reach the model.
+DEFAULT_DROPPED_CATEGORIES = {"lockfile", "generated", "vendored"}
+
+# Per-repository glob patterns, one per line. '!pattern' keeps files that would
+# otherwise be dropped.
+IGNORE_FILE_NAME = ".autoprignore"
+
+# Markers that tools put near the top of files they generate (as linguist does).
+GENERATED_MARKERS = re.compile(
+    r"@generated|do not edit|code generated by|auto-?generated|generated by the protocol buffer compiler",
+    re.IGNORECASE,
+)
+# Only the first lines of a new file are checked for a generated marker.
+GENERATED_MARKER_LINES = 5
+
+# Indentation is syntax in these files, so only trailing whitespace and blank lines
+# count as whitespace-only changes there.
+INDENTATION_SENSITIVE_EXTENSIONS = {
+    ".py",
+    ".yaml",
+    ".yml",
+    ".mk",
+    ".haml",
+    ".pug",
+    ".coffee",
+}
+INDENTATION_SENSITIVE_NAMES = {"Makefile", "GNUmakefile"}
+
+STUB_PREFIX = "# autopr:"
+
+
+@dataclass
+class FilterRules:
+    """Which files to drop, loaded from .autoprignore and .gitattributes."""
+
+    # (pattern, drop) pairs in file order; the last matching pattern wins.
+    patterns: list[tuple[str, bool]]
+
+    def decision(self, path: str) -> bool | None:
+        """Returns True to drop, False to keep, None if no pattern matches path."""
+        result = None
+        for pattern, drop in self.patterns:
+            if _glob_matches(path, pattern):
+                result = drop
+        return result
+
+
+def _glob_matches(path: str, pattern: str) -> bool:
+    # gitignore-style: patterns without a slash match the file name in any directory,
+    # a trailing slash matches everything under a directory.
+    pattern = pattern.lstrip("/")
+    if pattern.endswith("/"):
+        return path.startswith(pattern) or f"/{pattern}" in f"/{path}"
+    if "/" not in pattern:
+        return fnmatch.fnmatch(os.path.basename(path), pattern)
+    return fnmatch.fnmatch(path, pattern)
+
+
+def _read_lines(path: str) -> list[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f]
+    except OSError:
+        return []
+
+
+def load_filter_rules(repo_path: str | None = None) -> FilterRules:
+    """Reads the filter patterns of the repository at repo_path.
+
+    repo_path defaults to the top of the working tree autopr runs in, since the
+    paths of a diff are relative to it whatever the current directory.
+    .gitattributes entries with linguist-generated or linguist-vendored mark files to
+    drop ('-linguist-generated' or '=false' keeps them). .autoprignore patterns come
+    after them and therefore take precedence.
+    """
+    if repo_path is None:
+        repository = find_repository()
+        repo_path = repository.worktree if repository else "."
+    patterns = []
+    for line in _read_lines(os.path.join(repo_path, ".gitattributes")):
+        if not line or line.startswith("#"):
+            continue
+        pattern, *attributes = line.split()
+        for attribute in attributes:
+            name, _, value = attribute.partition("=")
+            if name.lstrip("-!") not in ("linguist-generated", "linguist-vendored"):
+                continue
+            drop = not name.startswith(("-", "!")) and value.lower() not in (
+                "false",
+                "0",
+            )
+            patterns.append((pattern, drop))
+
+    for line in _read_lines(os.path.join(repo_path, IGNORE_FILE_NAME)):
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("!"):
+            patterns.append((line[1:], False))
+        else:
+            patterns.append((line, True))
+    return FilterRules(patterns)
+
+
+def is_filter_enabled() -> bool:
+    return os.environ.get("AUTOPR_NO_DIFF_FILTER", "") not in ("1", "true", "yes")
+
+
+def _has_generated_marker(file_diff) -> bool:
+    for hunk in file_diff.hunks:
+        if hunk.new_start > 1:
+            continue
+        head = [line[1:] for line in hunk.lines if line.startswith(("+", " "))]
+        if any(
+            GENERATED_MARKERS.search(line) for line in head[:GENERATED_MARKER_LINES]
+        ):
+            return True
+    return False
+
+
+def path_drop_reason(path: str, is_binary: bool, rules: FilterRules) -> str | None:
+    """Like _drop_reason, from what is known without the file's hunks.
+
+    Returns "" for a file an ignore pattern keeps, whatever its content.
+    """
+    decision = rules.decision(path)
+    if decision is not None:
+        return "matched an ignore pattern" if decision else ""
+    if is_binary:
+        return "binary"
+    category = classify_path(path)
+    if category in DEFAULT_DROPPED_CATEGORIES:
+        return category
+    return None
+
+
+def _drop_reason(file_diff, rules: FilterRules) -> str | None:
+    """Returns why a whole file should be left out of the prompt, or None to keep it."""
+    reason = path_drop_reason(file_diff.path, file_diff.is_binary, rules)
+    if reason is not None:
+        return reason or None
+    if _has_generated_marker(file_diff):
+        return "generated"
+    return None
+
+
+def stub_line(path: str, reason: str, added: int, removed: int) -> str:
+    """The line that stands in for a dropped file."""
+    return f"{STUB_PREFIX} {path} omitted ({reason}, +{added} -{removed} lines)"
+
+
+def _is_indentation_sensitive(path: str) -> bool:
+    name = os.path.basename(path)
+    return (
+        name in INDENTATION_SENSITIVE_NAMES
+        or os.path.splitext(name)[1].lower() in INDENTATION_SENSITIVE_EXTENSIONS
+    )
+
+
+def is_whitespace_only(hunk, keep_indentation: bool = False) -> bool:
+    """True if a hunk changes nothing but whitespace, including blank lines.
+
+    With keep_indentation, changes to leading or inner whitespace are real changes.
+    """
+    if (not hunk.added and not hunk.removed) or hunk.is_truncated:
+        return False
+    removed = [line[1:] for line in hunk.lines if line.startswith("-")]
+    added = [line[1:] for line in hunk.lines if line.startswith("+")]
+    if keep_indentation:
+        return [line.rstrip() for line in removed if line.strip()] == [
+            line.rstrip() for line in added if line.strip()
+        ]
+    return re.sub(r"\s+", "", "".join(removed)) == re.sub(r"\s+", "", "".join(added))
+
+
+@dataclass
+class FilteredDiff:
+    """A diff with low-value content replaced by one-line stubs."""
+
+    text: str
+    dropped_files: int = 0
+    dropped_hunks: int = 0
+    saved_tokens: int = 0
+
+    @property
+    def was_filtered(self) -> bool:
+        return self.dropped_files > 0 or self.dropped_hunks > 0
+
+
+def filter_file(file_diff: FileDiff, rules: FilterRules) -> tuple[FileDiff, bool, int]:
+    """Filters one file of a diff.
+
+    Returns (the file as it should be sent, whether the whole file was replaced by
+    a stub, how many whitespace-only hunks were dropped).
+    """
+    reason = _drop_reason(file_diff, rules)
+    if reason:
+        stub = stub_line(file_diff.path, reason, file_diff.added, file_diff.removed)
+        return (
+            FileDiff(
+                file_diff.path,
+                file_diff.old_path,
+                header_lines=[file_diff.header_lines[0], stub],
+                is_binary=file_diff.is_binary,
+            ),
+            True,
+            0,
+        )
+
+    keep_indentation = _is_indentation_sensitive(file_diff.path)
+    kept = [
+        hunk
+        for hunk in file_diff.hunks
+        if not is_whitespace_only(hunk, keep_indentation)
+    ]
+    skipped = len(file_diff.hunks) - len(kept)
+    if not skipped:
+        return file_diff, False, 0
+    stub = f"{STUB_PREFIX} {skipped} whitespace-only hunk(s) omitted"
+    return (
+        FileDiff(
+            file_diff.path,
+            file_diff.old_path,
+            header_lines=file_diff.header_lines + [stub],
+            hunks=kept,
+            is_binary=file_diff.is_binary,
+        ),
+        False,
+        skipped,
+    )
+
+
+def _size_tokens(size: int) -> int:
+    return (size + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def filter_files(
+    files: Iterable[FileDiff], totals: FilteredDiff, rules: FilterRules | None = None
+) -> Iterator[FileDiff]:
+    """filter_diff for a diff that is parsed one file at a time (see DiffSpool).
+
+    Yields the files as they should be sent and adds up what was dropped in totals,
+    whose text is left alone.
+    """
+    if not is_filter_enabled():
+        yield from files
+        return
+    if rules is None:
+        rules = load_filter_rules()
+    for file_diff in files:
+        filtered, dropped, skipped = filter_file(file_diff, rules)
+        if filtered is not file_diff:
+            totals.dropped_files += dropped
+            totals.dropped_hunks += skipped
+            totals.saved_tokens += max(
+                _size_tokens(file_diff.size) - _size_tokens(filtered.size), 0
+            )
+        yield filtered
+
+
+def filter_diff(diff: str, rules: FilterRules | None = None) -> FilteredDiff:
+    """Drops binary, vendored, generated and ignored files and whitespace-only hunks.
+
+    Every dropped file keeps its 'diff --git' line followed by a stub such as
+    '# autopr: yarn.lock omitted (lockfile, +120 -80 lines)', so the model still
+    knows the file changed. Whitespace-only hunks are summarized by a stub in their
+    file header; the remaining hunks keep their line numbers. A diff with nothing
+    to drop is returned unchanged.
+    """
+    if not diff or not is_filter_enabled():
+        return FilteredDiff(diff)
+    if rules is None:
+        rules = load_filter_rules()
+
+    parts = []
+    dropped_files = 0
+    dropped_hunks = 0
+    for file_diff in parse_diff(diff):
+        filtered, dropped, skipped = filter_file(file_diff, rules)
+        dropped_files += dropped
+        dropped_hunks += skipped
+        parts.append(filtered.text)
+
+    if not dropped_files and not dropped_hunks:
+        return FilteredDiff(diff)
+
+    text = "\n".join(parts)
+    return FilteredDiff(
+        text,
+        dropped_files=dropped_files,
+        dropped_hunks=dropped_hunks,
+        saved_tokens=max(estimate_tokens(diff) - estimate_tokens(text), 0),
+    )
@@ -0,0 +1,242 @@
+# autopr/diff_spool.py
+# Holds a diff that may be far too large to keep as one string (generated code, data
+# fixtures). Output is written in as it streams from git; past a limit it goes to a
+# temporary file instead, which is then read back through mmap. Readers walk it one
+# line or one file at a time, so the diff is never copied into a single str.
+import codecs
+import os
+import re
+from collections.abc import Iterator
+
+from .diff_budget import (
+    BudgetedDiff,
+    budget_files,
+    get_commit_token_budget,
+    truncated_diff,
+)
+from .diff_filter import (
+    FilteredDiff,
+    filter_files,
+    is_filter_enabled,
+    load_filter_rules,
+)
+from .diff_triage import DiffPlan, estimate_file_tokens
+from .diff_utils import CHARS_PER_TOKEN, FileDiff, estimate_tokens, iter_file_diffs
+
+# Bytes of diff kept in memory before it is spilled to a temporary file. Override
+# with AUTOPR_DIFF_MEMORY_LIMIT.
+DEFAULT_MEMORY_LIMIT = 8 * 1024 * 1024
+# Bytes decoded at a time by iter_text().
+TEXT_CHUNK_BYTES = 1024 * 1024
+
+_NON_SPACE = re.compile(rb"\S")
+
+
+def get_memory_limit() -> int:
+    value = os.environ.get("AUTOPR_DIFF_MEMORY_LIMIT")
+    if value:
+        try:
+            limit = int(value)
+            if limit >= 0:
+                return limit
+        except ValueError:
+            pass
+        print(f"Warning: Ignoring invalid AUTOPR_DIFF_MEMORY_LIMIT value: {value}")
+    return DEFAULT_MEMORY_LIMIT
+
+
+class DiffSpool:
+    """A diff written in chunks and read back by line, by file or in text chunks.
+
+    write() the output as it arrives, then finish() before reading. Leading and
+    trailing whitespace is ignored by every reader, as str.strip() would. Close
+    it (or use it as a context manager) to remove the temporary file.
+    """
+
+    def __init__(self, memory_limit: int | None = None):
+        self.memory_limit = get_memory_limit() if memory_limit is None else memory_limit
+        self.size = 0
+        self._buffer = bytearray()
+        self._file = None
+        self._map = None
+        self._span = (0, 0)
+
+    @classmethod
+    def from_text(cls, text: str, memory_limit: int | None = None) -> "DiffSpool":
+        spool = cls(memory_limit)
+        spool.write(text.encode("utf-8"))
+        spool.finish()
+        return spool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __bool__(self) -> bool:
+        return self._span[1] > self._span[0]
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    @property
+    def content_size(self) -> int:
+        """Bytes of the diff, leaving out leading and trailing whitespace."""
+        return self._span[1] - self._span[0]
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self._file is None and len(self._buffer) + len(chunk) > self.memory_limit:
+            import tempfile
+
+            self._file = tempfile.TemporaryFile(prefix="autopr-diff-")
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buffer += chunk
+
+    def finish(self) -> None:
+        """Ends writing: maps a spilled diff into memory and finds where its content is."""
+        if self._file is not None and self.size:
+            import mmap
+
+            self._file.flush()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._data()
+        match = _NON_SPACE.search(data)
+        if match is None:
+            self._span = (0, 0)
+            return
+        end = len(data)
+        # Step back over trailing whitespace a block at a time, not byte by byte.
+        while True:
+            block = data[max(end - 4096, 0) : end]
+            stripped = block.rstrip()
+            end -= len(block) - len(stripped)
+            if stripped:
+                break
+        self._span = (match.start(), end)
+
+    def _data(self):
+        return self._map if self._map is not None else self._buffer
+
+    def iter_lines(self) -> Iterator[str]:
+        """Yields the lines of the diff, without their line endings."""
+        data = self._data()
+        pos, end = self._span
+        while pos < end:
+            newline = data.find(b"\n", pos, end)
+            if newline < 0:
+                newline = end
+            yield data[pos:newline].decode("utf-8", errors="replace").removesuffix("\r")
+            pos = newline + 1
+
+    def iter_files(self, max_hunk_chars: int | None = None) -> Iterator[FileDiff]:
+        """Yields the files of the diff one at a time (see diff_utils.iter_file_diffs)."""
+        return iter_file_diffs(self.iter_lines(), max_hunk_chars)
+
+    def iter_text(self, chunk_bytes: int | None = None) -> Iterator[str]:
+        """Yields the diff as text in pieces of about chunk_bytes, for printing."""
+        chunk_bytes = chunk_bytes or TEXT_CHUNK_BYTES
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        data = self._data()
+        pos, end = self._span
+        while pos < end:
+            piece = data[pos : min(pos + chunk_bytes, end)]
+            pos += len(piece)
+            text = decoder.decode(piece, final=pos >= end)
+            if text:
+                yield text
+
+    def text(self, max_bytes: int | None = None) -> str:
+        """The diff as one string, or only its first max_bytes bytes."""
+        start, end = self._span
+        if max_bytes is not None:
+            end = min(end, start + max_bytes)
+        return self._data()[start:end].decode("utf-8", errors="replace")
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._buffer = bytearray()
+        self._span = (0, 0)
+
+
+def _with_stubs(
+    files: Iterator[FileDiff], plan: DiffPlan, totals: FilteredDiff
+) -> Iterator[FileDiff]:
+    """Puts the stubs of the files the plan dropped in between the fetched files."""
+    positions = plan.positions()
+    stubs = plan.stub_files()
+    totals.dropped_files += len(stubs)
+    for (stat, _), (_, stub) in zip(plan.dropped, stubs):
+        totals.saved_tokens += max(
+            estimate_file_tokens(stat) - estimate_tokens(stub.text), 0
+        )
+    next_stub = 0
+    for file_diff in files:
+        position = positions.get(file_diff.path, len(positions))
+        while next_stub < len(stubs) and stubs[next_stub][0] < position:
+            yield stubs[next_stub][1]
+            next_stub += 1
+        yield file_diff
+    for _, stub in stubs[next_stub:]:
+        yield stub
+
+
+def prepare_diff(
+    spool: DiffSpool | None, max_tokens: int | None = None, plan: DiffPlan | None = None
+) -> tuple[FilteredDiff, BudgetedDiff]:
+    """Filters a spooled diff (see diff_filter) and fits it into max_tokens (see diff_budget).
+
+    Works through the diff one file at a time, and hunks too large to ever fit are
+    only counted, so little more than the text sent to the model is held in memory.
+    The FilteredDiff only carries the counts; its text is left empty.
+
+    If the spool only holds the files a plan (see diff_triage) fetched, the files
+    the plan dropped or deferred are added as stubs and summary lines. spool may be
+    None if the plan fetched nothing.
+    """
+    if max_tokens is None:
+        max_tokens = get_commit_token_budget()
+    filtered = FilteredDiff("")
+    rules = load_filter_rules() if is_filter_enabled() else None
+
+    def get_files():
+        # Each pass over the files counts what was dropped again.
+        filtered.dropped_files = filtered.dropped_hunks = filtered.saved_tokens = 0
+        fetched = spool.iter_files(max_tokens * CHARS_PER_TOKEN) if spool else iter(())
+        files = filter_files(fetched, filtered, rules)
+        if plan is not None and plan.dropped:
+            files = _with_stubs(files, plan, filtered)
+        return files
+
+    omitted_files = plan.deferred_summary() if plan is not None else None
+    omitted_tokens = plan.deferred_tokens if plan is not None else 0
+    budgeted = budget_files(
+        get_files,
+        max_tokens,
+        omitted_files=omitted_files,
+        omitted_tokens=omitted_tokens,
+    )
+    if budgeted is None:
+        if not spool:
+            return filtered, BudgetedDiff("", 0, 0)
+        # Not something we can split up, so keep (the start of) it as is.
+        total_tokens = (spool.content_size + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        if total_tokens <= max_tokens:
+            text = spool.text()
+            budgeted = BudgetedDiff(text, total_tokens, total_tokens)
+        else:
+            budgeted = truncated_diff(
+                spool.text(max_tokens * CHARS_PER_TOKEN), total_tokens
+            )
+    return filtered, budgeted
@@ -0,0 +1,149 @@
+# autopr/diff_triage.py
+# Decides which files of a diff are worth fetching, from `git diff --numstat` alone.
+# Files the filter drops by their path (lockfiles, vendored or binary files, ignore
+# patterns) become stubs without being fetched, and once the likely size of the
+# fetched files is well over the token budget the rest are only summarized. So a
+# commit touching thousands of files does not load patches the model never sees.
+from dataclasses import dataclass, field
+
+from .diff_budget import CATEGORY_RANKS, classify_path, get_commit_token_budget
+from .diff_filter import (
+    FilterRules,
+    is_filter_enabled,
+    load_filter_rules,
+    path_drop_reason,
+    stub_line,
+)
+from .diff_utils import CHARS_PER_TOKEN, FileDiff, FileStat
+
+# Rough size of a diff per changed line, counting its share of context lines and
+# hunk headers. Only used to decide what to fetch; the budget itself is applied to
+# the fetched text.
+ESTIMATED_CHARS_PER_CHANGED_LINE = 40
+ESTIMATED_CHARS_PER_FILE_HEADER = 100
+# Files are fetched until their estimated size reaches this many times the budget,
+# so estimates that are too high still leave the budget enough to choose from.
+FETCH_HEADROOM = 2.0
+
+
+def estimate_file_tokens(stat: FileStat) -> int:
+    chars = ESTIMATED_CHARS_PER_FILE_HEADER + ESTIMATED_CHARS_PER_CHANGED_LINE * (
+        stat.added + stat.removed
+    )
+    return (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _category(stat: FileStat) -> str:
+    return "binary" if stat.is_binary else classify_path(stat.path)
+
+
+@dataclass
+class DiffPlan:
+    """Which files of a diff to fetch, and what stands in for the others."""
+
+    stats: list[FileStat]
+    fetch: list[FileStat] = field(default_factory=list)
+    # (stat, reason) of files the filter drops by path
+    dropped: list[tuple[FileStat, str]] = field(default_factory=list)
+    # Files left out because the fetched ones are already well over the budget
+    deferred: list[FileStat] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        """True if every file is fetched, so a plain `git diff` will do."""
+        return not self.dropped and not self.deferred
+
+    @property
+    def paths(self) -> list[str]:
+        """The pathspecs that fetch the planned files, renames included."""
+        paths = []
+        for stat in self.fetch:
+            if stat.old_path:
+                paths.append(stat.old_path)
+            paths.append(stat.path)
+        return paths
+
+    @property
+    def added(self) -> int:
+        return sum(stat.added for stat in self.stats)
+
+    @property
+    def removed(self) -> int:
+        return sum(stat.removed for stat in self.stats)
+
+    def positions(self) -> dict[str, int]:
+        """{path: its position in the diff}"""
+        return {stat.path: i for i, stat in enumerate(self.stats)}
+
+    def stub_files(self) -> list[tuple[int, FileDiff]]:
+        """(position in the diff, stub) for every dropped file, in diff order."""
+        positions = self.positions()
+        stubs = []
+        for stat, reason in self.dropped:
+            header = f"diff --git a/{stat.old_path or stat.path} b/{stat.path}"
+            stub = FileDiff(
+                stat.path,
+                stat.old_path,
+                header_lines=[
+                    header,
+                    stub_line(stat.path, reason, stat.added, stat.removed),
+                ],
+                is_binary=stat.is_binary,
+            )
+            stubs.append((positions[stat.path], stub))
+        return sorted(stubs, key=lambda item: item[0])
+
+    def deferred_summary(self) -> list[str]:
+        """Budget summary lines (see diff_budget) for the files that were not fetched."""
+        return [
+            f"{stat.path} ({_category(stat)}): omitted, +{stat.added} -{stat.removed} lines"
+            for stat in self.deferred
+        ]
+
+    @property
+    def deferred_tokens(self) -> int:
+        return sum(estimate_file_tokens(stat) for stat in self.deferred)
+
+
+def plan_diff(
+    stats: list[FileStat],
+    max_tokens: int | None = None,
+    rules: FilterRules | None = None,
+) -> DiffPlan:
+    """Splits the files of a diff into those to fetch, drop or only summarize.
+
+    The files to fetch are picked like diff_budget picks hunks: source code first,
+    and within a category the smaller files first, so more files get a look. At
+    least one file is fetched whenever any is left after dropping.
+    """
+    if max_tokens is None:
+        max_tokens = get_commit_token_budget()
+    plan = DiffPlan(stats)
+    candidates = []
+    filtering = is_filter_enabled()
+    if filtering and rules is None:
+        rules = load_filter_rules()
+    for i, stat in enumerate(stats):
+        reason = (
+            path_drop_reason(stat.path, stat.is_binary, rules) if filtering else None
+        )
+        if reason:
+            plan.dropped.append((stat, reason))
+            continue
+        candidates.append(
+            (CATEGORY_RANKS[_category(stat)], estimate_file_tokens(stat), i, stat)
+        )
+
+    fetch_limit = max_tokens * FETCH_HEADROOM
+    used = 0
+    fetched = set()
+    for _, tokens, i, stat in sorted(candidates, key=lambda c: c[:3]):
+        # The top-ranked file is always fetched, however large: its hunks are then
+        # fitted into the budget like those of any other diff.
+        if fetched and used + tokens > fetch_limit:
+            continue
+        fetched.add(i)
+        used += tokens
+    for _, _, i, stat in candidates:
+        (plan.fetch if i in fetched else plan.deferred).append(stat)
+    return plan
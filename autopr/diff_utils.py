@@ -0,0 +1,362 @@
+# autopr/diff_utils.py
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+
+# Rough characters-per-token ratio for code and diffs with OpenAI tokenizers.
+# Good enough for budgeting without pulling in a tokenizer dependency.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for a piece of text."""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+@dataclass
+class Hunk:
+    """A single @@ hunk of a unified diff."""
+
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    section: str = ""  # Text after the closing @@, usually the enclosing function
+    lines: list[str] = field(default_factory=list)
+    # What the lines dropped from a truncated hunk held (see iter_file_diffs).
+    skipped_added: int = 0
+    skipped_removed: int = 0
+    skipped_chars: int = 0
+
+    @property
+    def header(self) -> str:
+        return (
+            f"@@ -{self.old_start},{self.old_count} "
+            f"+{self.new_start},{self.new_count} @@{self.section}"
+        )
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header] + self.lines)
+
+    @property
+    def is_truncated(self) -> bool:
+        return self.skipped_chars > 0
+
+    @property
+    def size(self) -> int:
+        """Length of the text, counting the lines a truncated hunk dropped."""
+        return len(self.text) + self.skipped_chars
+
+    @property
+    def added(self) -> int:
+        return (
+            sum(1 for line in self.lines if line.startswith("+")) + self.skipped_added
+        )
+
+    @property
+    def removed(self) -> int:
+        return (
+            sum(1 for line in self.lines if line.startswith("-")) + self.skipped_removed
+        )
+
+    def skip_line(self, line: str) -> None:
+        """Counts a line of a truncated hunk instead of keeping it."""
+        self.skipped_chars += len(line) + 1
+        if line.startswith("+"):
+            self.skipped_added += 1
+        elif line.startswith("-"):
+            self.skipped_removed += 1
+
+
+@dataclass
+class FileDiff:
+    """All hunks for one file of a unified diff, plus its header lines."""
+
+    path: str
+    old_path: str | None = None
+    header_lines: list[str] = field(default_factory=list)
+    hunks: list[Hunk] = field(default_factory=list)
+    is_binary: bool = False
+
+    @property
+    def header(self) -> str:
+        return "\n".join(self.header_lines)
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header] + [hunk.text for hunk in self.hunks])
+
+    @property
+    def size(self) -> int:
+        """Length of the text, counting the lines truncated hunks dropped."""
+        return len(self.header) + sum(hunk.size + 1 for hunk in self.hunks)
+
+    @property
+    def added(self) -> int:
+        return sum(hunk.added for hunk in self.hunks)
+
+    @property
+    def removed(self) -> int:
+        return sum(hunk.removed for hunk in self.hunks)
+
+
+@dataclass
+class FileStat:
+    """One file of `git diff --numstat`: what changed, without the hunks."""
+
+    path: str
+    added: int
+    removed: int
+    old_path: str | None = None  # Set for renames and copies
+    is_binary: bool = False
+
+
+def parse_numstat(output: str) -> list[FileStat]:
+    """Parses `git diff --numstat -z` output.
+
+    Records are 'added<TAB>removed<TAB>path<NUL>', or for a rename
+    'added<TAB>removed<TAB><NUL>old<NUL>new<NUL>'. Binary files have '-' counts.
+    """
+    stats = []
+    fields = output.split("\0")
+    i = 0
+    while i < len(fields):
+        record = fields[i]
+        i += 1
+        if not record.strip():
+            continue
+        added, removed, path = record.split("\t", 2)
+        old_path = None
+        if not path:
+            old_path, path = fields[i], fields[i + 1]
+            i += 2
+        is_binary = added == "-"
+        stats.append(
+            FileStat(
+                path,
+                0 if is_binary else int(added),
+                0 if is_binary else int(removed),
+                old_path,
+                is_binary,
+            )
+        )
+    return stats
+
+
+def _path_from_diff_git_line(line: str) -> tuple[str | None, str]:
+    # "diff --git a/old/path b/new/path"
+    match = re.match(r"^diff --git a/(.*) b/(.*)$", line)
+    if match:
+        return match.group(1), match.group(2)
+    return None, line[len("diff --git ") :]
+
+
+def iter_file_diffs(lines, max_hunk_chars: int | None = None) -> Iterator[FileDiff]:
+    """Parses the lines of a unified git diff into FileDiffs, one file at a time.
+
+    Each file is yielded once the next one starts, so only one file is held in
+    memory. Lines before the first 'diff --git' header are ignored.
+
+    A hunk whose text grows past max_hunk_chars is truncated: the lines that fit
+    in max_hunk_chars are kept, and the rest are only counted (see Hunk.size).
+    That keeps a huge new file from being held line by line.
+    """
+    current_file: FileDiff | None = None
+    current_hunk: Hunk | None = None
+    hunk_chars = 0
+
+    for line in lines:
+        if line.startswith("diff --git "):
+            if current_file is not None:
+                yield current_file
+            old_path, new_path = _path_from_diff_git_line(line)
+            current_file = FileDiff(
+                path=new_path, old_path=old_path, header_lines=[line]
+            )
+            current_hunk = None
+            continue
+        if current_file is None:
+            continue
+
+        if current_hunk is None or line.startswith("@@"):
+            match = HUNK_HEADER_RE.match(line)
+            if match:
+                current_hunk = Hunk(
+                    old_start=int(match.group(1)),
+                    old_count=int(match.group(2) or 1),
+                    new_start=int(match.group(3)),
+                    new_count=int(match.group(4) or 1),
+                    section=match.group(5),
+                )
+                current_file.hunks.append(current_hunk)
+                hunk_chars = len(line)
+                continue
+
+            current_file.header_lines.append(line)
+            if line.startswith("+++ ") and line != "+++ /dev/null":
+                current_file.path = line[4:].removeprefix("b/")
+            elif line.startswith("--- ") and line != "--- /dev/null":
+                current_file.old_path = line[4:].removeprefix("a/")
+            elif line.startswith("Binary files ") or line == "GIT binary patch":
+                current_file.is_binary = True
+            continue
+
+        if current_hunk.is_truncated:
+            current_hunk.skip_line(line)
+            continue
+        hunk_chars += len(line) + 1
+        if max_hunk_chars is not None and hunk_chars > max_hunk_chars:
+            current_hunk.skip_line(line)
+            continue
+        current_hunk.lines.append(line)
+
+    if current_file is not None:
+        yield current_file
+
+
+def parse_diff(diff: str) -> list[FileDiff]:
+    """Parses a unified git diff into per-file, per-hunk structures.
+
+    Lines before the first 'diff --git' header are ignored.
+    """
+    return list(iter_file_diffs(diff.splitlines()))
+
+
+def split_hunk(hunk: Hunk, max_tokens: int) -> list[Hunk]:
+    """Splits a hunk that is too large into smaller hunks with correct line numbers.
+
+    The pieces are split on line boundaries, so a single line larger than
+    max_tokens still ends up as its own (oversized) piece.
+    """
+    if estimate_tokens(hunk.text) <= max_tokens:
+        return [hunk]
+    return list(_iter_hunk_pieces(hunk, max_tokens))
+
+
+def hunk_head(hunk: Hunk, max_tokens: int) -> Hunk:
+    """Returns the start of a hunk that fits in max_tokens, at least one line.
+
+    Its header only counts the lines it keeps, so the line numbers stay correct.
+    """
+    return next(_iter_hunk_pieces(hunk, max_tokens), hunk)
+
+
+def _iter_hunk_pieces(hunk: Hunk, max_tokens: int) -> Iterator[Hunk]:
+    old_line, new_line = hunk.old_start, hunk.new_start
+    piece = Hunk(old_line, 0, new_line, 0, hunk.section)
+    piece_tokens = estimate_tokens(piece.header)
+
+    for line in hunk.lines:
+        line_tokens = estimate_tokens(line) + 1
+        if piece.lines and piece_tokens + line_tokens > max_tokens:
+            yield piece
+            piece = Hunk(old_line, 0, new_line, 0, hunk.section)
+            piece_tokens = estimate_tokens(piece.header)
+
+        piece.lines.append(line)
+        piece_tokens += line_tokens
+        if line.startswith("-"):
+            piece.old_count += 1
+            old_line += 1
+        elif line.startswith("+"):
+            piece.new_count += 1
+            new_line += 1
+        elif not line.startswith("\\"):  # "\ No newline at end of file"
+            piece.old_count += 1
+            piece.new_count += 1
+            old_line += 1
+            new_line += 1
+
+    if piece.lines:
+        yield piece
+
+
+def commentable_lines(file_diff: FileDiff) -> list[int]:
+    """Right-side line numbers of a file that GitHub accepts review comments on.
+
+    Those are the added and context lines of its hunks, in ascending order.
+    """
+    lines = []
+    for hunk in file_diff.hunks:
+        new_line = hunk.new_start
+        for line in hunk.lines:
+            if line.startswith("-") or line.startswith("\\"):
+                continue
+            lines.append(new_line)
+            new_line += 1
+    return lines
+
+
+@dataclass
+class DiffLineIndex:
+    """For each file of a diff, the right-side lines review comments can be attached to."""
+
+    lines: dict[str, list[int]] = field(default_factory=dict)
+
+    def resolve_path(self, path: str) -> str | None:
+        """Matches a path as the model wrote it to a file of the diff.
+
+        'a/' or 'b/' prefixes and leading './' or '/' are ignored, and a partial path
+        matches the one file it is a suffix of.
+        """
+        if path in self.lines:
+            return path
+        cleaned = re.sub(r"^(?:[ab]/|\./|/)+", "", path)
+        if cleaned in self.lines:
+            return cleaned
+        matches = [p for p in self.lines if p.endswith(f"/{cleaned}")]
+        return matches[0] if len(matches) == 1 else None
+
+    def nearest_line(self, path: str, line: int, max_distance: int) -> int | None:
+        """Returns line if it is commentable, else the closest commentable line of
+        the file within max_distance lines (the earlier one on a tie), else None."""
+        import bisect
+
+        candidates = self.lines.get(path) or []
+        i = bisect.bisect_left(candidates, line)
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(candidates):
+                distance = abs(candidates[j] - line)
+                if distance <= max_distance and (
+                    best is None or distance < abs(best - line)
+                ):
+                    best = candidates[j]
+        return best
+
+
+def index_diff_lines(diff: str) -> DiffLineIndex:
+    """Parses a diff once into a DiffLineIndex."""
+    return DiffLineIndex({f.path: commentable_lines(f) for f in parse_diff(diff or "")})
+
+
+def restrict_diff(diff: str, index: DiffLineIndex) -> str:
+    """Keeps the files and hunks of diff that touch lines of the index.
+
+    Used to trim the diff between two commits of a PR down to the PR's own
+    changes. A file the index has no commentable lines for (deleted or binary)
+    is kept whole if it is in the index.
+    """
+    kept = []
+    for file_diff in parse_diff(diff or ""):
+        if file_diff.path not in index.lines:
+            continue
+        lines = index.lines[file_diff.path]
+        if lines:
+            file_diff.hunks = [
+                hunk
+                for hunk in file_diff.hunks
+                if any(
+                    hunk.new_start <= line < hunk.new_start + max(hunk.new_count, 1)
+                    for line in lines
+                )
+            ]
+            if not file_diff.hunks:
+                continue
+        kept.append(file_diff.text)
+    return "\n".join(kept)
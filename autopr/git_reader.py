@@ -0,0 +1,337 @@
+# autopr/git_reader.py
+# Reads objects from the repository through long-lived `git cat-file --batch` and
+# `--batch-check` processes instead of starting a git process per lookup. Requests
+# are written to their stdin one per line and answers read back from stdout, so
+# hundreds of lookups cost one process start. Blob contents are kept in a small LRU
+# cache keyed on their object id, which never goes stale.
+#
+# The processes are managed like runner's: starting one and each lookup hold one of
+# runner's process slots, and a lookup that takes longer than runner's command
+# timeout kills the process.
+import atexit
+import re
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from . import runner
+
+DEFAULT_BLOB_CACHE_BYTES = 32 * 1024 * 1024
+# Blobs larger than this share of the cache are returned but not cached.
+MAX_CACHED_BLOB_SHARE = 4
+
+_OBJECT_ID = re.compile(r"^(?:[0-9a-f]{40}|[0-9a-f]{64})$")
+
+
+class GitReadError(Exception):
+    """Raised when a cat-file process cannot be started, dies mid-answer or times out."""
+
+
+@dataclass
+class ObjectInfo:
+    oid: str
+    type: str  # "blob", "tree", "commit" or "tag"
+    size: int
+
+
+@dataclass
+class TreeEntry:
+    mode: str
+    type: str
+    oid: str
+    name: str
+
+
+@dataclass
+class CommitInfo:
+    oid: str
+    tree: str
+    parents: list[str] = field(default_factory=list)
+    author: str = ""
+    committer: str = ""
+    message: str = ""
+
+
+class _CatFile:
+    """One `git cat-file` process, restarted if it exits. Callers hold its lock."""
+
+    def __init__(self, repo_path: str, mode: str, timeout: float | None = None):
+        self.repo_path = repo_path
+        self.mode = mode
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self._process = None
+
+    def _start(self):
+        cmd = ["git", "cat-file", self.mode]
+        started = time.perf_counter()
+        try:
+            self._process = subprocess.Popen(
+                cmd,
+                cwd=self.repo_path,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            runner.record_timing(
+                " ".join(cmd), time.perf_counter() - started, "not found"
+            )
+            raise GitReadError(f"Could not start {' '.join(cmd)}: {e}") from e
+        runner.record_timing(" ".join(cmd), time.perf_counter() - started, "started")
+
+    def request(
+        self, name: str, read_content: bool
+    ) -> tuple[ObjectInfo, bytes | None] | None:
+        """Asks for one object. Returns None if it does not exist."""
+        timeout = self.timeout if self.timeout is not None else runner.default_timeout()
+        with runner.process_slot():
+            for attempt in range(2):
+                if self._process is not None and self._process.poll() is not None:
+                    self.close()  # Exited since the last lookup
+                if self._process is None:
+                    self._start()
+                process = self._process
+                timed_out = threading.Event()
+
+                def kill():
+                    timed_out.set()
+                    process.kill()
+
+                # A blocked read returns once the process is killed.
+                timer = threading.Timer(timeout, kill)
+                timer.start()
+                try:
+                    return self._ask(name, read_content)
+                except (BrokenPipeError, OSError, ValueError) as e:
+                    self.close()
+                    if timed_out.is_set():
+                        raise GitReadError(
+                            f"git cat-file {self.mode} timed out after {timeout:g}s reading {name}"
+                        ) from e
+                    if attempt:
+                        raise GitReadError(
+                            f"git cat-file {self.mode} failed: {e}"
+                        ) from e
+                finally:
+                    timer.cancel()
+        return None
+
+    def _ask(
+        self, name: str, read_content: bool
+    ) -> tuple[ObjectInfo, bytes | None] | None:
+        self._process.stdin.write(name.encode("utf-8") + b"\n")
+        self._process.stdin.flush()
+        header = self._process.stdout.readline()
+        if not header:
+            raise BrokenPipeError("cat-file exited")
+        parts = header.decode("utf-8", errors="replace").split()
+        if len(parts) != 3:
+            return None  # "<name> missing" or "<name> ambiguous"
+        info = ObjectInfo(parts[0], parts[1], int(parts[2]))
+        if not read_content:
+            return info, None
+        data = self._process.stdout.read(info.size + 1)  # Content and a newline
+        if len(data) != info.size + 1:
+            raise BrokenPipeError("cat-file exited mid-object")
+        return info, data[:-1]
+
+    def close(self) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()  # cat-file exits at end of input
+            process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        finally:
+            process.stdout.close()
+
+
+class GitObjectReader:
+    """Looks up blobs, trees and commits of one repository over persistent pipes.
+
+    Object names are anything `git cat-file` accepts: an object id, "HEAD",
+    "<commit>:<path>", ... Lookups are thread-safe. A lookup taking longer than
+    timeout seconds (runner's command timeout by default) raises GitReadError.
+    Call close() when done, or use get_reader(), whose readers are closed when the
+    program exits.
+    """
+
+    def __init__(
+        self,
+        repo_path: str = ".",
+        blob_cache_bytes: int = DEFAULT_BLOB_CACHE_BYTES,
+        timeout: float | None = None,
+    ):
+        self.repo_path = repo_path
+        self._batch = _CatFile(repo_path, "--batch", timeout)
+        self._check = _CatFile(repo_path, "--batch-check", timeout)
+        self._blob_cache: OrderedDict[str, bytes] = OrderedDict()
+        self._blob_cache_bytes = 0
+        self._blob_cache_limit = blob_cache_bytes
+        self._cache_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        for cat_file in (self._batch, self._check):
+            with cat_file.lock:
+                cat_file.close()
+
+    @staticmethod
+    def _check_name(name: str) -> None:
+        if not name or "\n" in name:
+            raise ValueError(f"Invalid object name: {name!r}")
+
+    def info(self, name: str) -> ObjectInfo | None:
+        """Returns the id, type and size of an object, or None if it does not exist."""
+        self._check_name(name)
+        with self._check.lock:
+            answer = self._check.request(name, read_content=False)
+        return answer[0] if answer else None
+
+    def read(self, name: str) -> tuple[ObjectInfo, bytes] | None:
+        """Returns an object's info and raw content, or None if it does not exist."""
+        self._check_name(name)
+        with self._batch.lock:
+            return self._batch.request(name, read_content=True)
+
+    def _cached_blob(self, oid: str) -> bytes | None:
+        with self._cache_lock:
+            data = self._blob_cache.get(oid)
+            if data is not None:
+                self._blob_cache.move_to_end(oid)
+            return data
+
+    def _cache_blob(self, oid: str, data: bytes) -> None:
+        if len(data) * MAX_CACHED_BLOB_SHARE > self._blob_cache_limit:
+            return
+        with self._cache_lock:
+            if oid in self._blob_cache:
+                return
+            self._blob_cache[oid] = data
+            self._blob_cache_bytes += len(data)
+            while self._blob_cache_bytes > self._blob_cache_limit:
+                _, evicted = self._blob_cache.popitem(last=False)
+                self._blob_cache_bytes -= len(evicted)
+
+    def read_blob(self, name: str) -> bytes | None:
+        """Returns a blob's content, or None if name is missing or not a blob.
+
+        Names that are not object ids are resolved with --batch-check first, so a
+        cached blob is not sent through the pipe again.
+        """
+        oid = name if _OBJECT_ID.match(name) else None
+        if oid is None:
+            info = self.info(name)
+            if info is None or info.type != "blob":
+                return None
+            oid = info.oid
+        data = self._cached_blob(oid)
+        if data is not None:
+            return data
+        answer = self.read(oid)
+        if answer is None or answer[0].type != "blob":
+            return None
+        self._cache_blob(oid, answer[1])
+        return answer[1]
+
+    def read_file(self, rev: str, path: str) -> bytes | None:
+        """Returns the content of path at rev (a commit or tree), or None if it is not there."""
+        return self.read_blob(f"{rev}:{path}")
+
+    def _read_peeled(
+        self, name: str, object_type: str
+    ) -> tuple[ObjectInfo, bytes] | None:
+        """Reads name, following tags (and commits, for a tree) to an object of object_type."""
+        answer = self.read(name)
+        if (
+            answer is not None
+            and answer[0].type != object_type
+            and answer[0].type in ("tag", "commit")
+        ):
+            # Peel by object id: "<commit>:<path>^{tree}" would name a different path.
+            answer = self.read(f"{answer[0].oid}^{{{object_type}}}")
+        if answer is None or answer[0].type != object_type:
+            return None
+        return answer
+
+    def read_tree(self, name: str) -> list[TreeEntry] | None:
+        """Returns the entries of a tree (or of a commit's tree), or None if there is none."""
+        answer = self._read_peeled(name, "tree")
+        if answer is None:
+            return None
+        info, data = answer
+        oid_bytes = len(info.oid) // 2
+        entries = []
+        pos = 0
+        while pos < len(data):
+            space = data.index(b" ", pos)
+            nul = data.index(b"\0", space)
+            mode = data[pos:space].decode("ascii")
+            oid = data[nul + 1 : nul + 1 + oid_bytes].hex()
+            if mode == "40000":
+                kind = "tree"
+            elif mode == "160000":
+                kind = "commit"  # A submodule
+            else:
+                kind = "blob"
+            entry_name = data[space + 1 : nul].decode("utf-8", errors="surrogateescape")
+            entries.append(TreeEntry(mode, kind, oid, entry_name))
+            pos = nul + 1 + oid_bytes
+        return entries
+
+    def read_commit(self, name: str) -> CommitInfo | None:
+        """Returns a parsed commit, or None if name is not a commit."""
+        answer = self._read_peeled(name, "commit")
+        if answer is None:
+            return None
+        info, data = answer
+        text = data.decode("utf-8", errors="replace")
+        headers, _, message = text.partition("\n\n")
+        commit = CommitInfo(oid=info.oid, tree="", message=message)
+        for line in headers.splitlines():
+            key, _, value = line.partition(" ")
+            if key == "tree":
+                commit.tree = value
+            elif key == "parent":
+                commit.parents.append(value)
+            elif key == "author":
+                commit.author = value
+            elif key == "committer":
+                commit.committer = value
+        return commit
+
+
+_readers: dict[str, GitObjectReader] = {}
+_readers_lock = threading.Lock()
+
+
+def get_reader(repo_path: str = ".") -> GitObjectReader:
+    """Returns the shared reader for a repository, starting its processes on first use."""
+    with _readers_lock:
+        reader = _readers.get(repo_path)
+        if reader is None:
+            reader = _readers[repo_path] = GitObjectReader(repo_path)
+        return reader
+
+
+def close_readers() -> None:
+    """Stops the processes of every shared reader."""
+    with _readers_lock:
+        readers = list(_readers.values())
+        _readers.clear()
+    for reader in readers:
+        reader.close()
+
+
+atexit.register(close_readers)
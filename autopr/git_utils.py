@@ -1,27 +1,29 @@
-import configparser
 import os
 
+from .repo_discovery import find_repository, get_remote_repo
 
-def get_repo_from_git_config():
-    """Get the repository name from the .git/config file."""
-    config = configparser.ConfigParser()
-    git_config_path = os.path.join(".git", "config")
-    if not os.path.exists(git_config_path):
-        raise FileNotFoundError("No .git/config found in the current directory.")
 
-    config.read(git_config_path)
+def get_repo_from_git_config(start: str = "."):
+    """Get the repository name ('owner/repo') from the git config of the repository containing start.
 
-    if 'remote "origin"' in config:
-        url = config['remote "origin"']["url"]
-        # Extract the owner/repo part from the URL
-        if url.startswith("git@"):
-            # SSH URL format: git@github.com:owner/repo.git
-            repo = url.split(":")[1].rstrip(".git")
-        elif url.startswith("https://"):
-            # HTTPS URL format: https://github.com/owner/repo.git
-            repo = url.split("/")[-2] + "/" + url.split("/")[-1].rstrip(".git")
-        else:
-            raise ValueError("Unsupported URL format.")
-        return repo
-    else:
-        raise ValueError("No 'origin' remote found in the .git/config.")
+    Works from subdirectories, worktrees and submodules; see repo_discovery.
+    """
+    return get_remote_repo(start)
+
+
+def get_current_branch(repo_path: str = ".") -> str | None:
+    """Get the checked-out branch from the repository's HEAD, or None if HEAD is detached.
+
+    repo_path may be anywhere inside the working tree, including a linked worktree.
+    """
+    repository = find_repository(repo_path)
+    if repository is None:
+        return None
+    try:
+        with open(os.path.join(repository.git_dir, "HEAD"), "r") as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+    if head.startswith("ref: refs/heads/"):
+        return head[len("ref: refs/heads/") :]
+    return None
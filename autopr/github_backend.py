@@ -0,0 +1,541 @@
+# autopr/github_backend.py
+# How github_service talks to GitHub. GhCliBackend runs the gh CLI, exactly as autopr
+# always has. HttpBackend calls the REST API in-process over kept-alive connections,
+# which saves a process start, an auth lookup and a TLS handshake on every call.
+# Choose with AUTOPR_GITHUB_BACKEND=gh (default) or AUTOPR_GITHUB_BACKEND=http.
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+
+from . import runner
+
+DEFAULT_API_URL = "https://api.github.com"
+API_VERSION = "2022-11-28"
+JSON_MEDIA_TYPE = "application/vnd.github+json"
+DIFF_MEDIA_TYPE = "application/vnd.github.v3.diff"
+DEFAULT_TIMEOUT_SECONDS = 30
+TOKEN_LOOKUP_TIMEOUT_SECONDS = 10
+PAGE_SIZE = 100
+
+
+class GitHubAPIError(Exception):
+    """An error response (or no response) from the GitHub API."""
+
+    def __init__(self, status: int | None, message: str):
+        super().__init__(f"HTTP {status}: {message}" if status else message)
+        self.status = status
+        self.message = message
+
+
+@dataclass
+class ApiPage:
+    """One page of a paginated GET."""
+
+    status: int
+    etag: str | None
+    # Path of the following page (as accepted by get_page), None on the last page
+    next_path: str | None
+    # Parsed JSON body, None when the page was not modified (status 304)
+    data: object = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+
+def _next_page_path(link_header: str | None) -> str | None:
+    """Extracts the rel="next" target of a Link header as a path relative to the API root."""
+    from urllib.parse import urlsplit
+
+    for part in (link_header or "").split(","):
+        match = re.match(r'\s*<([^>]+)>\s*;\s*rel="next"', part)
+        if match:
+            url = urlsplit(match.group(1))
+            path = url.path
+            if path.startswith("/api/v3/"):
+                path = path[len("/api/v3") :]
+            return path.lstrip("/") + (f"?{url.query}" if url.query else "")
+    return None
+
+
+def _parse_included_response(output: str) -> tuple[int, dict, str]:
+    """Splits `gh api --include` output into (status, headers, body)."""
+    head, _, body = output.replace("\r\n", "\n").partition("\n\n")
+    lines = head.splitlines()
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, body
+
+
+def _raise_for_status(status: int, text: str) -> None:
+    if status >= 400:
+        try:
+            message = json.loads(text).get("message", text)
+        except (ValueError, AttributeError):
+            message = text
+        raise GitHubAPIError(status, message.strip())
+
+
+class GitHubBackend:
+    """Operations github_service needs from GitHub.
+
+    Failures are raised: subprocess and JSON errors from GhCliBackend, GitHubAPIError
+    from HttpBackend. github_service turns them into messages and return values.
+    """
+
+    name = ""
+
+    def repo_details(self) -> tuple[str, str]:
+        """Returns (owner, repo) of the current repository."""
+        raise NotImplementedError
+
+    def pr_head_sha(self, pr_number: int) -> str | None:
+        raise NotImplementedError
+
+    def pr_diff(self, pr_number: int) -> str:
+        raise NotImplementedError
+
+    def list_open_prs(self, label: str | None = None) -> list[int]:
+        raise NotImplementedError
+
+    def compare_status(
+        self, owner: str, repo: str, base: str, head: str
+    ) -> tuple[str, int]:
+        """Returns 'ahead', 'behind', 'diverged' or 'identical', and how many of the
+        commits from base to head are merge commits."""
+        raise NotImplementedError
+
+    def compare_diff(self, owner: str, repo: str, base: str, head: str) -> str:
+        raise NotImplementedError
+
+    def submit_review(
+        self, owner: str, repo: str, pr_number: int, payload: dict
+    ) -> None:
+        raise NotImplementedError
+
+    def get_page(self, path: str, etag: str | None = None) -> ApiPage:
+        """GETs one page of a REST list endpoint.
+
+        With etag, the request is conditional: an unchanged page comes back as a 304
+        with no data, which GitHub does not count against the rate limit.
+        """
+        raise NotImplementedError
+
+    def graphql(self, query: str, variables: dict) -> dict:
+        """Runs a GraphQL query and returns its 'data'.
+
+        String variables "{owner}" and "{repo}" stand for the current repository, as
+        they do in `gh api`.
+        """
+        raise NotImplementedError
+
+
+class GhCliBackend(GitHubBackend):
+    """Runs the gh CLI for every call."""
+
+    name = "gh"
+
+    def _run(self, cmd: list[str], **kwargs) -> str:
+        return runner.run(cmd, check=True, **kwargs).stdout
+
+    def repo_details(self) -> tuple[str, str]:
+        data = json.loads(self._run(["gh", "repo", "view", "--json", "owner,name"]))
+        # Owner can be a dict for organizations, so access 'login' field
+        owner_login = (
+            data["owner"]["login"] if isinstance(data["owner"], dict) else data["owner"]
+        )
+        return owner_login, data["name"]
+
+    def pr_head_sha(self, pr_number: int) -> str | None:
+        data = json.loads(
+            self._run(["gh", "pr", "view", str(pr_number), "--json", "headRefOid"])
+        )
+        return data.get("headRefOid")
+
+    def pr_diff(self, pr_number: int) -> str:
+        return self._run(["gh", "pr", "diff", str(pr_number)])
+
+    def list_open_prs(self, label: str | None = None) -> list[int]:
+        cmd = [
+            "gh",
+            "pr",
+            "list",
+            "--state",
+            "open",
+            "--json",
+            "number",
+            "--limit",
+            "1000",
+        ]
+        if label:
+            cmd.extend(["--label", label])
+        return [pr["number"] for pr in json.loads(self._run(cmd) or "[]")]
+
+    def compare_status(
+        self, owner: str, repo: str, base: str, head: str
+    ) -> tuple[str, int]:
+        api_path = f"repos/{owner}/{repo}/compare/{base}...{head}"
+        jq = '.status + " " + ([.commits[] | select(.parents | length > 1)] | length | tostring)'
+        status, merges = self._run(["gh", "api", api_path, "--jq", jq]).split()
+        return status, int(merges)
+
+    def compare_diff(self, owner: str, repo: str, base: str, head: str) -> str:
+        api_path = f"repos/{owner}/{repo}/compare/{base}...{head}"
+        return self._run(["gh", "api", api_path, "-H", f"Accept: {DIFF_MEDIA_TYPE}"])
+
+    def submit_review(
+        self, owner: str, repo: str, pr_number: int, payload: dict
+    ) -> None:
+        api_path = f"repos/{owner}/{repo}/pulls/{pr_number}/reviews"
+        self._run(
+            ["gh", "api", api_path, "-X", "POST", "--input", "-"],
+            input=json.dumps(payload),
+        )
+
+    def get_page(self, path: str, etag: str | None = None) -> ApiPage:
+        cmd = ["gh", "api", "--include", path]
+        if etag:
+            cmd.extend(["-H", f"If-None-Match: {etag}"])
+        try:
+            output = self._run(cmd)
+        except subprocess.CalledProcessError as e:
+            # Depending on the version, gh may exit non-zero on a 304.
+            if (
+                not (e.stdout or "").startswith("HTTP/")
+                or _parse_included_response(e.stdout)[0] != 304
+            ):
+                raise
+            output = e.stdout
+        status, headers, body = _parse_included_response(output)
+        return ApiPage(
+            status,
+            headers.get("etag"),
+            _next_page_path(headers.get("link")),
+            json.loads(body) if status != 304 and body.strip() else None,
+        )
+
+    def graphql(self, query: str, variables: dict) -> dict:
+        cmd = ["gh", "api", "graphql", "-f", f"query={query}"]
+        for name, value in variables.items():
+            if isinstance(value, bool):
+                cmd.extend(["-F", f"{name}={str(value).lower()}"])
+            elif isinstance(value, int) or value in ("{owner}", "{repo}"):
+                # -F converts numbers and fills in the placeholders.
+                cmd.extend(["-F", f"{name}={value}"])
+            else:
+                cmd.extend(["-f", f"{name}={value}"])
+        return json.loads(self._run(cmd))["data"]
+
+
+def _gh_config_dir() -> str:
+    if os.environ.get("GH_CONFIG_DIR"):
+        return os.environ["GH_CONFIG_DIR"]
+    if os.environ.get("XDG_CONFIG_HOME"):
+        return os.path.join(os.environ["XDG_CONFIG_HOME"], "gh")
+    if os.name == "nt" and os.environ.get("APPDATA"):
+        return os.path.join(os.environ["APPDATA"], "GitHub CLI")
+    return os.path.join(os.path.expanduser("~"), ".config", "gh")
+
+
+def _token_from_hosts_file(host: str) -> str | None:
+    """Reads host's oauth_token from gh's hosts.yml without needing a YAML parser."""
+    try:
+        with open(os.path.join(_gh_config_dir(), "hosts.yml"), "r") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    in_host = False
+    for line in lines:
+        if line and not line[0].isspace():
+            in_host = line.rstrip().rstrip(":").strip("\"'") == host
+            continue
+        if in_host:
+            match = re.match(r"^\s+oauth_token:\s*[\"']?([^\"'\s]+)", line)
+            if match:
+                return match.group(1)
+    return None
+
+
+def get_github_token(host: str = "github.com") -> str | None:
+    """Finds a token the way gh does: environment, then gh's config, then gh's keyring."""
+    if host == "github.com":
+        names = ("GH_TOKEN", "GITHUB_TOKEN")
+    else:
+        names = ("GH_ENTERPRISE_TOKEN", "GITHUB_ENTERPRISE_TOKEN")
+    for name in names:
+        if os.environ.get(name):
+            return os.environ[name]
+    token = _token_from_hosts_file(host)
+    if token:
+        return token
+    try:
+        # Recent gh versions keep the token in the system keyring.
+        result = runner.run(
+            ["gh", "auth", "token", "--hostname", host],
+            check=True,
+            timeout=TOKEN_LOOKUP_TIMEOUT_SECONDS,
+        )
+        return result.stdout.strip() or None
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+class HttpBackend(GitHubBackend):
+    """Calls the GitHub REST API directly, reusing one keep-alive connection per thread."""
+
+    name = "http"
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        token: str | None = None,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    ):
+        from urllib.parse import urlsplit
+
+        host = os.environ.get("GH_HOST", "github.com")
+        if base_url is None:
+            base_url = (
+                DEFAULT_API_URL if host == "github.com" else f"https://{host}/api/v3"
+            )
+        url = urlsplit(base_url)
+        self._scheme = url.scheme
+        self._netloc = url.netloc
+        self._prefix = url.path.rstrip("/")
+        # GitHub Enterprise serves GraphQL at /api/graphql, next to /api/v3.
+        if self._prefix.endswith("/api/v3"):
+            self._graphql_path = self._prefix[: -len("/v3")] + "/graphql"
+        else:
+            self._graphql_path = self._prefix + "/graphql"
+        self._host = host
+        self._token = token
+        self._timeout = timeout
+        self._local = threading.local()
+        self._repo = None
+
+    def _get_token(self) -> str:
+        if self._token is None:
+            self._token = get_github_token(self._host)
+            if not self._token:
+                raise GitHubAPIError(
+                    None, "No GitHub token found. Set GH_TOKEN or run 'gh auth login'."
+                )
+        return self._token
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            import http.client
+
+            if self._scheme == "http":
+                connection = http.client.HTTPConnection(
+                    self._netloc, timeout=self._timeout
+                )
+            else:
+                connection = http.client.HTTPSConnection(
+                    self._netloc, timeout=self._timeout
+                )
+            self._local.connection = connection
+        return connection
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def request(
+        self, method: str, path: str, body=None, accept: str = JSON_MEDIA_TYPE
+    ) -> str:
+        """Sends one API request and returns the response body as text.
+
+        path is relative to the API root unless it starts with '/'.
+        """
+        status, _, text = self._send(method, path, body, {"Accept": accept})
+        _raise_for_status(status, text)
+        return text
+
+    def _send(
+        self, method: str, path: str, body=None, extra_headers: dict | None = None
+    ):
+        """Sends a request over this thread's connection. Returns (status, headers, text)."""
+        import http.client
+
+        headers = {
+            "Accept": JSON_MEDIA_TYPE,
+            "Authorization": f"Bearer {self._get_token()}",
+            "User-Agent": "autopr",
+            "X-GitHub-Api-Version": API_VERSION,
+            **(extra_headers or {}),
+        }
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        url = path if path.startswith("/") else f"{self._prefix}/{path}"
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            for attempt in range(2):
+                connection = self._connection()
+                try:
+                    connection.request(method, url, data, headers)
+                    response = connection.getresponse()
+                    text = response.read().decode("utf-8", errors="replace")
+                    break
+                except (http.client.HTTPException, ConnectionError, TimeoutError) as e:
+                    # The server may have closed an idle keep-alive connection; retry once on a new one.
+                    self.close()
+                    if attempt:
+                        raise GitHubAPIError(
+                            None, f"Could not reach GitHub: {e}"
+                        ) from e
+                except OSError as e:
+                    self.close()
+                    raise GitHubAPIError(None, f"Could not reach GitHub: {e}") from e
+            outcome = f"HTTP {response.status}"
+        finally:
+            runner.record_timing(
+                f"{method} {url}", time.perf_counter() - started, outcome
+            )
+        return response.status, {k.lower(): v for k, v in response.getheaders()}, text
+
+    def get_page(self, path: str, etag: str | None = None) -> ApiPage:
+        status, headers, text = self._send(
+            "GET", path, extra_headers={"If-None-Match": etag} if etag else None
+        )
+        if status == 304:
+            return ApiPage(status, headers.get("etag", etag), None)
+        _raise_for_status(status, text)
+        return ApiPage(
+            status,
+            headers.get("etag"),
+            _next_page_path(headers.get("link")),
+            json.loads(text) if text else None,
+        )
+
+    def request_json(self, method: str, path: str, body=None):
+        text = self.request(method, path, body)
+        return json.loads(text) if text else None
+
+    def repo_details(self) -> tuple[str, str]:
+        if self._repo is None:
+            from .git_utils import get_repo_from_git_config
+
+            # The origin remote already names the repository, no request needed.
+            owner, _, repo = get_repo_from_git_config().partition("/")
+            self._repo = (owner, repo)
+        return self._repo
+
+    def pr_head_sha(self, pr_number: int) -> str | None:
+        owner, repo = self.repo_details()
+        data = self.request_json("GET", f"repos/{owner}/{repo}/pulls/{pr_number}")
+        return (data.get("head") or {}).get("sha")
+
+    def pr_diff(self, pr_number: int) -> str:
+        owner, repo = self.repo_details()
+        return self.request(
+            "GET", f"repos/{owner}/{repo}/pulls/{pr_number}", accept=DIFF_MEDIA_TYPE
+        )
+
+    def list_open_prs(self, label: str | None = None) -> list[int]:
+        from urllib.parse import quote
+
+        owner, repo = self.repo_details()
+        # The issues endpoint can filter by label and lists PRs too.
+        query = f"state=open&per_page={PAGE_SIZE}"
+        if label:
+            query += f"&labels={quote(label)}"
+        numbers = []
+        page = 1
+        while True:
+            items = (
+                self.request_json(
+                    "GET", f"repos/{owner}/{repo}/issues?{query}&page={page}"
+                )
+                or []
+            )
+            numbers.extend(item["number"] for item in items if "pull_request" in item)
+            if len(items) < PAGE_SIZE:
+                return numbers
+            page += 1
+
+    def compare_status(
+        self, owner: str, repo: str, base: str, head: str
+    ) -> tuple[str, int]:
+        data = self.request_json("GET", f"repos/{owner}/{repo}/compare/{base}...{head}")
+        merges = sum(
+            1
+            for commit in data.get("commits") or []
+            if len(commit.get("parents") or []) > 1
+        )
+        return data.get("status", ""), merges
+
+    def compare_diff(self, owner: str, repo: str, base: str, head: str) -> str:
+        return self.request(
+            "GET",
+            f"repos/{owner}/{repo}/compare/{base}...{head}",
+            accept=DIFF_MEDIA_TYPE,
+        )
+
+    def submit_review(
+        self, owner: str, repo: str, pr_number: int, payload: dict
+    ) -> None:
+        self.request("POST", f"repos/{owner}/{repo}/pulls/{pr_number}/reviews", payload)
+
+    def graphql(self, query: str, variables: dict) -> dict:
+        if "{owner}" in variables.values() or "{repo}" in variables.values():
+            owner, repo = self.repo_details()
+            placeholders = {"{owner}": owner, "{repo}": repo}
+            variables = {
+                name: (
+                    placeholders.get(value, value) if isinstance(value, str) else value
+                )
+                for name, value in variables.items()
+            }
+        response = json.loads(
+            self.request(
+                "POST", self._graphql_path, {"query": query, "variables": variables}
+            )
+        )
+        if response.get("errors"):
+            messages = "; ".join(
+                error.get("message", "") for error in response["errors"]
+            )
+            raise GitHubAPIError(None, f"GraphQL: {messages}")
+        return response["data"]
+
+
+BACKENDS = {"gh": GhCliBackend, "http": HttpBackend}
+
+_backend = None
+# Batch review workers ask for the backend at the same time; they must share one.
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> GitHubBackend:
+    """Returns the backend selected by AUTOPR_GITHUB_BACKEND, creating it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = os.environ.get("AUTOPR_GITHUB_BACKEND", "gh").strip().lower() or "gh"
+            if name not in BACKENDS:
+                print(f"Warning: Unknown AUTOPR_GITHUB_BACKEND '{name}', using 'gh'.")
+                name = "gh"
+            _backend = BACKENDS[name]()
+        return _backend
+
+
+def set_backend(backend: GitHubBackend | None) -> None:
+    """Replaces the backend in use. None goes back to AUTOPR_GITHUB_BACKEND."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -1,25 +1,233 @@
 import subprocess
+import sys
 import json
+import threading
 import re
 import os
+import time
+from dataclasses import dataclass, field
 
+from . import runner
+from .commit_log import CommitLogParser, CommitRecord, log_command
+from .diff_spool import DiffSpool
+from .diff_utils import DiffLineIndex, FileStat, parse_numstat
+from .repo_discovery import find_repository, get_push_remote_repo
+from .github_backend import GitHubAPIError, get_backend
+from .issue_store import (
+    PAGE_SIZE as ISSUE_PAGE_SIZE,
+    get_issue,
+    issue_from_api,
+    iter_stored_issues,
+    last_synced_at,
+    open_store as open_issue_store,
+    sync_issues,
+)
 
-def list_issues(show_all_issues: bool = False):
-    print("Listing Issues...")
+# Longer than runner's default: commit hooks may run linters or tests, and
+# `gh pr create` may push the branch before creating the PR.
+COMMIT_TIMEOUT_SECONDS = 600.0
+PR_CREATE_TIMEOUT_SECONDS = 300.0
+# Paths passed to one `git diff` call, keeping the command line well under OS limits.
+PATHS_PER_DIFF_CALL = 200
+
+
+def _sync_issue_store(conn, full: bool = False, err=None) -> bool:
+    """Updates the local issue store from GitHub. Returns False (after saying why) on failure.
+
+    Problems are printed to err, stdout by default.
+    """
+    repo_details = _get_repo_details()
+    if not repo_details:
+        return False
+    owner, repo = repo_details
     try:
-        cmd = ["gh", "issue", "list"]
-        if show_all_issues:
-            cmd.extend(["--state", "all"])
-
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        if result.stdout.strip():
-            print("Issues:")
-            print(result.stdout)
-        else:
-            print("No issues found for the current filters.")
+        sync_issues(conn, owner, repo, full=full)
+        return True
     except subprocess.CalledProcessError as e:
-        print("Failed to fetch issues.")
-        print(e.output)
+        print(f"Could not update the local issue store: {(e.stderr or '').strip()}", file=err)
+    except GitHubAPIError as e:
+        print(f"Could not update the local issue store: {e}", file=err)
+    except FileNotFoundError:
+        print("Error: 'gh' command not found. Please ensure it is installed and in your PATH.", file=err)
+    except Exception as e:
+        print(f"Unexpected error while updating the local issue store: {e}", file=err)
+    return False
+
+
+def _format_issue_line(issue: dict) -> str:
+    # Same columns as `gh issue list` prints when its output is not a terminal.
+    labels = ", ".join(label["name"] for label in issue["labels"])
+    return f"{issue['number']}\t{issue['state'].upper()}\t{issue['title']}\t{labels}\t{issue['updated_at']}"
+
+
+def _issue_search_query(owner, repo, state, labels, assignee, author, search) -> str:
+    terms = [f"repo:{owner}/{repo}", "is:issue"]
+    if state:
+        terms.append(f"state:{state}")
+    terms.extend(f'label:"{label}"' for label in labels or [])
+    if assignee:
+        terms.append(f"assignee:{assignee}")
+    if author:
+        terms.append(f"author:{author}")
+    terms.append(search)
+    return " ".join(terms)
+
+
+def iter_issue_pages(
+    state: str | None = "open",
+    labels: list[str] | None = None,
+    assignee: str | None = None,
+    author: str | None = None,
+    search: str | None = None,
+    limit: int | None = None,
+):
+    """
+    Yields pages of issues from GitHub as they arrive, newest first.
+
+    The filters are sent with the request (search uses the search API), so only
+    matching issues are downloaded, and no more pages than limit needs. Issues are
+    in the format of the local issue store. Backend errors propagate.
+    """
+    from urllib.parse import quote, urlencode
+
+    repo_details = _get_repo_details()
+    if not repo_details:
+        raise GitHubAPIError(None, "Could not retrieve repository details.")
+    owner, repo = repo_details
+    per_page = min(limit or ISSUE_PAGE_SIZE, ISSUE_PAGE_SIZE)
+    if search:
+        query = _issue_search_query(owner, repo, state, labels, assignee, author, search)
+        path = f"search/issues?{urlencode({'q': query, 'per_page': per_page}, quote_via=quote)}"
+    else:
+        params = {"state": state or "all", "per_page": per_page}
+        if labels:
+            params["labels"] = ",".join(labels)
+        if assignee:
+            params["assignee"] = assignee
+        if author:
+            params["creator"] = author
+        path = f"repos/{owner}/{repo}/issues?{urlencode(params, quote_via=quote)}"
+
+    backend = get_backend()
+    remaining = limit
+    while path:
+        page = backend.get_page(path)
+        items = page.data["items"] if search else page.data
+        # The issues endpoint lists pull requests too.
+        issues = [issue_from_api(item) for item in items or [] if "pull_request" not in item]
+        if remaining is not None:
+            issues = issues[:remaining]
+            remaining -= len(issues)
+        if issues:
+            yield issues
+        if remaining == 0:
+            return
+        path = page.next_path
+
+
+def _print_issue_pages(pages, as_json: bool = False) -> int:
+    """Prints each page as soon as it arrives. Returns the number of issues printed.
+
+    The JSON array is closed even if reading the pages fails part way, so the
+    output stays valid JSON.
+    """
+    count = 0
+    try:
+        for page in pages:
+            if as_json:
+                # A JSON array, written an issue at a time.
+                for issue in page:
+                    print("[" if count == 0 else ",", json.dumps(issue), sep="", flush=True)
+                    count += 1
+            else:
+                if count == 0:
+                    print("Issues:")
+                print("\n".join(_format_issue_line(issue) for issue in page), flush=True)
+                count += len(page)
+    finally:
+        if as_json:
+            print("]" if count else "[]", flush=True)
+    if not as_json and count == 0:
+        print("No issues found for the current filters.")
+    return count
+
+
+def _warm_issue_store(full: bool, err=None) -> None:
+    conn = open_issue_store()
+    if conn is not None:
+        try:
+            _sync_issue_store(conn, full=full, err=err)
+        finally:
+            conn.close()
+
+
+def list_issues(
+    show_all_issues: bool = False,
+    offline: bool = False,
+    refresh: bool = False,
+    labels: list[str] | None = None,
+    assignee: str | None = None,
+    author: str | None = None,
+    search: str | None = None,
+    limit: int | None = None,
+    as_json: bool = False,
+):
+    """Lists issues matching the filters, printing them page by page.
+
+    Once the local issue store has been synced, it is updated and the issues are
+    read from it; offline skips the update. Otherwise (first run, or refresh) the
+    issues are streamed from GitHub while the store is built in the background.
+    With as_json, stdout only gets the JSON array (empty if the issues could not be
+    read) and everything else goes to stderr.
+    """
+    err = sys.stderr if as_json else None
+    if not as_json:
+        print("Listing Issues...")
+    filters = {
+        "state": None if show_all_issues else "open",
+        "labels": labels,
+        "assignee": assignee,
+        "author": author,
+        "search": search,
+        "limit": limit,
+    }
+    warming = None
+    conn = open_issue_store()
+    try:
+        if conn is None and offline:
+            print("No local issue store found. Run `autopr ls` without --offline first.", file=err)
+            if as_json:
+                print("[]")
+            return
+        if conn is not None:
+            synced = last_synced_at(conn) is not None
+            if offline and not synced:
+                print("The local issue store is empty. Run `autopr ls` without --offline first.", file=err)
+                if as_json:
+                    print("[]")
+                return
+            if synced and not refresh:
+                if not offline:
+                    _sync_issue_store(conn, err=err)  # On failure the stored copy is still shown
+                _print_issue_pages(iter_stored_issues(conn, **filters), as_json)
+                return
+            warming = threading.Thread(target=_warm_issue_store, args=(refresh, err), daemon=True)
+            warming.start()
+
+        try:
+            _print_issue_pages(iter_issue_pages(**filters), as_json)
+        except subprocess.CalledProcessError as e:
+            print("Failed to fetch issues.", file=err)
+            print(e.stderr or e.output, file=err)
+        except GitHubAPIError as e:
+            print(f"Failed to fetch issues: {e}", file=err)
+        except FileNotFoundError:
+            print("Error: 'gh' command not found. Please ensure it is installed and in your PATH.", file=err)
+    finally:
+        if warming is not None:
+            warming.join()
+        if conn is not None:
+            conn.close()
 
 
 def _sanitize_branch_name(name):
@@ -36,41 +244,65 @@ def _sanitize_branch_name(name):
     return name[:50]
 
 
-def get_staged_diff() -> str | None:
-    """Gets the staged git diff.
-    Returns the diff string or None if error or no diff.
+def get_staged_numstat() -> list[FileStat] | None:
+    """Gets the files of the staged diff with their added and removed line counts.
+
+    Much cheaper than the diff itself for large commits. Returns None on error.
     """
     try:
-        # Ensure we are in a git repository, otherwise `git diff` might act unexpectedly or error.
-        # A simple check could be to see if `.git` exists or `git rev-parse --is-inside-work-tree`
-        # For now, assume `handle_commit_command` is called in a context where being in a git repo is expected.
-
-        result = subprocess.run(
-            ["git", "diff", "--staged"],
-            capture_output=True,
-            text=True,
-            check=False,  # Don't raise an exception for non-zero exit if there are no staged changes (it might return 1)
-        )
-        # `git diff --staged` can return exit code 1 if there are differences, 0 if none.
-        # We are interested in the stdout (the diff itself).
-        # An error (like not being in a git repo) might result in a different exit code and stderr output.
+        result = runner.run(["git", "diff", "--staged", "--numstat", "-z"])
         if result.stderr:
-            # This could capture git errors like "not a git repository"
-            print(f"Error getting staged diff: {result.stderr.strip()}")
-            return None  # Or handle more gracefully
+            print(f"Error getting staged changes: {result.stderr.strip()}")
+            return None
+        return parse_numstat(result.stdout)
+    except FileNotFoundError:
+        print(
+            "Error: git command not found. Please ensure git is installed and in your PATH."
+        )
+        return None
+    except (subprocess.SubprocessError, ValueError, IndexError) as e:
+        print(f"An unexpected error occurred while getting staged changes: {e}")
+        return None
 
-        return (
-            result.stdout.strip()
-        )  # .strip() to remove leading/trailing whitespace, including newlines if diff is empty
 
+def get_staged_diff(memory_limit: int | None = None, paths: list[str] | None = None) -> DiffSpool | None:
+    """Gets the staged git diff, streamed from git into a DiffSpool.
+
+    The diff is never held as one string: past memory_limit bytes (see
+    diff_spool.get_memory_limit) it is written to a temporary file. With paths,
+    only the diff of those files is fetched, in batches of PATHS_PER_DIFF_CALL.
+    Returns None if there is no diff or on error. Close the returned spool when done.
+    """
+    if paths is None:
+        commands = [["git", "diff", "--staged"]]
+    else:
+        # --numstat paths are relative to the top of the worktree, not the current
+        # directory, and are taken literally, so names with * or ? are not globs.
+        pathspecs = [f":(top,literal){path}" for path in paths]
+        commands = [
+            ["git", "diff", "--staged", "--", *pathspecs[i : i + PATHS_PER_DIFF_CALL]]
+            for i in range(0, len(pathspecs), PATHS_PER_DIFF_CALL)
+        ]
+    spool = DiffSpool(memory_limit)
+    try:
+        for cmd in commands:
+            result = runner.stream(cmd, spool.write)
+            # An error (like not being in a git repository) is reported on stderr.
+            if result.stderr:
+                print(f"Error getting staged diff: {result.stderr.strip()}")
+                break
+        else:
+            spool.finish()
+            if spool:
+                return spool
     except FileNotFoundError:  # If git command is not found
         print(
             "Error: git command not found. Please ensure git is installed and in your PATH."
         )
-        return None
     except Exception as e:
         print(f"An unexpected error occurred while getting staged diff: {e}")
-        return None
+    spool.close()
+    return None
 
 
 def git_commit(message: str) -> tuple[bool, str]:
@@ -79,11 +311,10 @@ def git_commit(message: str) -> tuple[bool, str]:
     """
     try:
         # Using check=False to manually handle success/failure based on returncode
-        result = subprocess.run(
+        result = runner.run(
             ["git", "commit", "-m", message],
-            capture_output=True,
-            text=True,
             check=False,
+            timeout=COMMIT_TIMEOUT_SECONDS,
         )
         if result.returncode == 0:
             return True, result.stdout.strip()
@@ -105,16 +336,26 @@ def git_commit(message: str) -> tuple[bool, str]:
         return False, f"An unexpected error occurred during git commit: {e}"
 
 
-def get_current_issue_number(repo_path: str = ".") -> int | None:
-    """Reads the current issue number from .git/.autopr_current_issue."""
-    context_file_path = os.path.join(repo_path, ".git", ".autopr_current_issue")
+def get_current_issue_number(repo_path: str = ".", quiet: bool = False) -> int | None:
+    """Reads the current issue number from .autopr_current_issue in the git directory.
+
+    Each worktree has its own. With quiet, a missing file (no `autopr workon` yet)
+    is not reported.
+    """
+    repository = find_repository(repo_path)
+    if repository is None:
+        if not quiet:
+            print(f"Not in a git repository: {os.path.abspath(repo_path)}")
+        return None
+    context_file_path = os.path.join(repository.git_dir, ".autopr_current_issue")
     try:
         if os.path.exists(context_file_path):
             with open(context_file_path, "r") as f:
                 content = f.read().strip()
                 return int(content)
         else:
-            print(f"Context file not found: {context_file_path}")
+            if not quiet:
+                print(f"Context file not found: {context_file_path}")
             return None
     except ValueError:
         print(f"Error: Invalid content in {context_file_path}. Expected an integer.")
@@ -124,8 +365,37 @@ def get_current_issue_number(repo_path: str = ".") -> int | None:
         return None
 
 
-def get_issue_details(issue_number: int) -> dict | None:
-    """Fetches issue details (number, title, body, labels) using gh CLI."""
+def _get_stored_issue(issue_number: int, offline: bool) -> dict | None:
+    """Looks the issue up in the local issue store, if one has been synced."""
+    conn = open_issue_store(create=False)
+    if conn is None:
+        return None
+    try:
+        if last_synced_at(conn) is None:
+            return None
+        if not offline:
+            _sync_issue_store(conn)  # On failure the stored copy is still good enough
+        return get_issue(conn, issue_number)
+    finally:
+        conn.close()
+
+
+def get_issue_details(
+    issue_number: int, offline: bool = False, refresh: bool = False
+) -> dict | None:
+    """Fetches issue details (number, title, body, labels) using gh CLI.
+
+    Issues in the local issue store (see `autopr ls`) are read from there. offline
+    only reads the store; refresh always asks GitHub.
+    """
+    if not refresh:
+        if issue_number in _issue_details_cache:
+            return _issue_details_cache[issue_number]  # Already fetched by a prefetch
+        issue_data = _get_stored_issue(issue_number, offline)
+        if issue_data or offline:
+            if not issue_data:
+                print(f"Issue #{issue_number} is not in the local issue store.")
+            return issue_data
     print(f"Fetching details for issue #{issue_number}...")
     try:
         gh_issue_cmd = [
@@ -136,9 +406,7 @@ def get_issue_details(issue_number: int) -> dict | None:
             "--json",
             "number,title,body,labels",  # Added body and labels
         ]
-        result = subprocess.run(
-            gh_issue_cmd, capture_output=True, text=True, check=True
-        )
+        result = runner.run(gh_issue_cmd, check=True)
         issue_data = json.loads(result.stdout)
         # Ensure essential fields are present or provide defaults if appropriate for your use case
         # For PR generation, title and body are quite important.
@@ -161,53 +429,74 @@ def get_issue_details(issue_number: int) -> dict | None:
         return None
 
 
-def get_commit_messages_for_branch(base_branch: str) -> list[str] | None:
-    """Gets commit messages (subjects only) from current branch since divergence from base_branch."""
-    print(
-        f"Fetching commit messages for current branch against base '{base_branch}'..."
-    )
+def get_branch_commits(base_branch: str) -> list[CommitRecord] | None:
+    """Gets the commits of the current branch since it left base_branch, newest first.
+
+    Subjects, bodies, authors and changed files all come from one `git log` process,
+    parsed as it streams (see commit_log). Returns None on error.
+    """
+    print(f"Fetching commits for current branch against base '{base_branch}'...")
+    # The range <base_branch>..HEAD means commits in HEAD that are not in <base_branch>
+    parser = CommitLogParser()
     try:
-        # git log main..HEAD --pretty=format:%s
-        # The range <base_branch>..HEAD means commits in HEAD that are not in <base_branch>
-        cmd = ["git", "log", f"{base_branch}..HEAD", "--pretty=format:%s"]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        if result.stdout:
-            commit_messages = result.stdout.strip().split("\n")
-            return commit_messages
-        else:
-            return (
-                []
-            )  # No commits found, or an empty list if the command ran but no output
-    except subprocess.CalledProcessError as e:
-        print(f"Error getting commit messages:")
-        print(f"Command '{' '.join(e.cmd)}' failed with exit code {e.returncode}")
-        if e.stdout:
-            print(f"Stdout:\n{e.stdout}")
-        if e.stderr:
-            print(f"Stderr:\n{e.stderr}")
+        result = runner.stream(log_command(f"{base_branch}..HEAD"), parser.feed)
+    except FileNotFoundError:
+        print("Error: git command not found.")
+        return None
+    except Exception as e:
+        print(f"An unexpected error occurred while fetching commits: {e}")
+        return None
+    if result.returncode != 0:
+        print("Error getting commit messages:")
+        print(f"Command '{' '.join(result.args)}' failed with exit code {result.returncode}")
+        stderr = result.stderr or ""
+        if stderr:
+            print(f"Stderr:\n{stderr}")
         # Check if the error is because the base_branch doesn't exist or is not an ancestor
-        if (
-            "unknown revision" in e.stderr.lower()
-            or "not a valid object name" in e.stderr.lower()
-        ):
+        if "unknown revision" in stderr.lower() or "not a valid object name" in stderr.lower():
             print(
                 f"Hint: Ensure '{base_branch}' is a valid branch and an ancestor of the current branch."
             )
         return None
-    except FileNotFoundError:
+    return parser.close()
+
+
+def get_branch_overview(base_branch: str) -> tuple[str | None, str | None]:
+    """Returns where the current branch left base_branch and the `git diff --stat` of
+    its changes since then, each None on error.
+
+    The two git commands do not depend on each other and run at the same time.
+    """
+    merge_base, diffstat = runner.run_concurrently(
+        [["git", "merge-base", base_branch, "HEAD"], ["git", "diff", "--stat", f"{base_branch}...HEAD"]],
+        check=True,
+    )
+    if isinstance(merge_base, FileNotFoundError) or isinstance(diffstat, FileNotFoundError):
         print("Error: git command not found.")
-        return None
-    except Exception as e:
-        print(f"An unexpected error occurred while fetching commit messages: {e}")
-        return None
+        return None, None
+    if isinstance(merge_base, Exception):
+        error = (getattr(merge_base, "stderr", None) or str(merge_base)).strip()
+        print(f"Could not find where the branch left '{base_branch}': {error}")
+        merge_base = None
+    else:
+        merge_base = merge_base.stdout.strip() or None
+    if isinstance(diffstat, Exception):
+        error = (getattr(diffstat, "stderr", None) or str(diffstat)).strip()
+        print(f"Could not get the changed files against '{base_branch}': {error}")
+        diffstat = None
+    else:
+        diffstat = diffstat.stdout.rstrip()
+    return merge_base, diffstat
 
 
-def start_work_on_issue(issue_number: int, repo_path: str = "."):
+def start_work_on_issue(
+    issue_number: int, repo_path: str = ".", offline: bool = False, refresh: bool = False
+):
     """Fetches issue details, creates a new branch, and stores issue context."""
     print(f"Starting work on issue #{issue_number}...")
     try:
         # Fetch issue details (using the new more detailed function for consistency, though only title is used here)
-        issue_data = get_issue_details(issue_number)
+        issue_data = get_issue_details(issue_number, offline=offline, refresh=refresh)
         if not issue_data:
             # get_issue_details already prints errors, so just return
             return
@@ -222,17 +511,17 @@ def start_work_on_issue(issue_number: int, repo_path: str = "."):
         # if the script's CWD is set correctly by the user or a higher level function.
         # For now, let's keep subprocess calls as they are, assuming they operate in current CWD.
         git_checkout_cmd = ["git", "checkout", "-b", branch_name]
-        subprocess.run(git_checkout_cmd, check=True, capture_output=True, text=True)
+        runner.run(git_checkout_cmd, check=True)
 
         # Store issue context
-        git_dir_path = os.path.join(repo_path, ".git")
-        if not os.path.isdir(git_dir_path):
+        repository = find_repository(repo_path)
+        if repository is None:
             print(
-                f"Error: .git directory not found at {git_dir_path}. Are you in a git repository?"
+                f"Error: No git repository found at {os.path.abspath(repo_path)} or its parents."
             )
             return
 
-        context_file_path = os.path.join(git_dir_path, ".autopr_current_issue")
+        context_file_path = os.path.join(repository.git_dir, ".autopr_current_issue")
         with open(context_file_path, "w") as f:
             f.write(str(issue_number))
         print(
@@ -290,13 +579,14 @@ def create_pr_gh(title: str, body: str, base_branch: str) -> tuple[bool, str]:
         # An alternative for empty body: gh pr create --title "title" --body "" --base base --fill
         # But for now, we pass the body as is. If it's empty, it's an empty body PR.
 
-        process = subprocess.run(
+        # stdin is closed, so gh fails instead of waiting at a prompt or in an editor.
+        process = runner.run(
             command,
-            capture_output=True,
-            text=True,
             check=False,  # We'll check success based on returncode
+            timeout=PR_CREATE_TIMEOUT_SECONDS,
         )
         if process.returncode == 0:
+            invalidate_pr_head_sha()  # gh may have pushed the branch
             return True, process.stdout
         else:
             error_message = f"Error creating PR: {process.stderr.strip()}"
@@ -317,6 +607,24 @@ def create_pr_gh(title: str, body: str, base_branch: str) -> tuple[bool, str]:
         )
 
 
+def list_open_prs(label: str | None = None) -> list[int] | None:
+    """Returns the numbers of the repository's open PRs, optionally only those with a label."""
+    try:
+        return sorted(get_backend().list_open_prs(label))
+    except subprocess.CalledProcessError as e:
+        print(f"Error listing open PRs: {e.stderr}")
+        return None
+    except GitHubAPIError as e:
+        print(f"Error listing open PRs: {e}")
+        return None
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print("Error parsing the list of open PRs from gh.")
+        return None
+    except FileNotFoundError:
+        print("Error: 'gh' command not found. Please ensure it is installed and in your PATH.")
+        return None
+
+
 def get_pr_changes(pr_number: int) -> str:
     """
     Fetches the changes (diff) for a given PR number using 'gh pr diff'.
@@ -329,9 +637,7 @@ def get_pr_changes(pr_number: int) -> str:
     """
     print(f"Fetching changes for PR #{pr_number}...")
     try:
-        cmd = ["gh", "pr", "diff", str(pr_number)]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return result.stdout.strip()
+        return get_backend().pr_diff(pr_number).strip()
     except subprocess.CalledProcessError as e:
         print(f"Error fetching PR changes for PR #{pr_number} via gh:")
         print(f"Command '{' '.join(e.cmd)}' failed with exit code {e.returncode}")
@@ -340,6 +646,9 @@ def get_pr_changes(pr_number: int) -> str:
         if e.stderr:
             print(f"Stderr:\n{e.stderr}")
         return ""
+    except GitHubAPIError as e:
+        print(f"Error fetching PR changes for PR #{pr_number}: {e}")
+        return ""
     except FileNotFoundError:
         print("Error: 'gh' command not found. Please ensure it is installed and in your PATH.")
         return ""
@@ -348,19 +657,211 @@ def get_pr_changes(pr_number: int) -> str:
         return ""
 
 
+def get_pr_changes_since(pr_number: int, base_sha: str, head_sha: str) -> str | None:
+    """
+    Fetches the diff between two commits of a PR, for reviewing only what was pushed since base_sha.
+
+    Args:
+        pr_number: The number of the PR (used in messages only).
+        base_sha: The head commit the PR was last reviewed at.
+        head_sha: The current head commit of the PR.
+
+    Returns:
+        The diff string ("" if nothing changed), or None if head_sha does not build on
+        base_sha (for example after a force-push), the commits in between include a
+        merge, or the comparison failed.
+    """
+    repo_details = _get_repo_details()
+    if not repo_details:
+        return None
+    owner, repo = repo_details
+    backend = get_backend()
+    try:
+        status, merges = backend.compare_status(owner, repo, base_sha, head_sha)
+        if status == "identical":
+            return ""
+        if status != "ahead":
+            # "diverged" or "behind": the old head is no longer part of the branch.
+            print(f"PR #{pr_number} was rewritten since its last review ({status}).")
+            return None
+        if merges:
+            # The compare diff would include everything the merges brought in from the base branch.
+            print(f"PR #{pr_number} has {merges} merge commit(s) since its last review.")
+            return None
+
+        return backend.compare_diff(owner, repo, base_sha, head_sha).strip()
+    except (subprocess.CalledProcessError, GitHubAPIError) as e:
+        # The old head may have been garbage collected after a force-push.
+        detail = e.stderr if isinstance(e, subprocess.CalledProcessError) else e
+        print(f"Could not compare {base_sha[:7]}...{head_sha[:7]} for PR #{pr_number}: {detail}")
+        return None
+    except FileNotFoundError:
+        print("Error: 'gh' command not found for get_pr_changes_since.")
+        return None
+    except Exception as e:
+        print(f"Unexpected error in get_pr_changes_since for PR #{pr_number}: {e}")
+        return None
+
+
+def get_pr_review_comments(pr_number: int) -> list[dict] | None:
+    """
+    Fetches the review comments already on a PR, for not posting them twice.
+
+    Returns a list of {'path', 'line', 'body'} (line is None for outdated comments),
+    or None if the comments could not be fetched.
+    """
+    repo_details = _get_repo_details()
+    if not repo_details:
+        return None
+    owner, repo = repo_details
+    backend = get_backend()
+    path = f"repos/{owner}/{repo}/pulls/{pr_number}/comments?per_page={ISSUE_PAGE_SIZE}"
+    comments = []
+    try:
+        while path:
+            page = backend.get_page(path)
+            for item in page.data or []:
+                comments.append(
+                    {"path": item["path"], "line": item.get("line"), "body": item.get("body") or ""}
+                )
+            path = page.next_path
+    except (subprocess.CalledProcessError, GitHubAPIError) as e:
+        detail = e.stderr if isinstance(e, subprocess.CalledProcessError) else e
+        print(f"Could not fetch existing review comments of PR #{pr_number}: {detail}")
+        return None
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print(f"Error parsing the existing review comments of PR #{pr_number}.")
+        return None
+    except FileNotFoundError:
+        print("Error: 'gh' command not found for get_pr_review_comments.")
+        return None
+    return comments
+
+
+# Lookups that do not change during a command are memoized. Repository details are
+# also kept on disk in the git directory, keyed on the state of its config file
+# (where remotes live).
+# PR head SHAs are only kept briefly, and dropped as soon as a remote-tracking ref
+# changes, which is what a push (or fetch) does.
+REPO_DETAILS_CACHE_FILE = ".autopr_repo_details.json"
+PR_HEAD_SHA_TTL_SECONDS = 30.0
+
+_repo_details_cache: dict[tuple, tuple[str, str]] = {}
+_pr_head_sha_cache: dict[int, tuple[str, float, tuple]] = {}
+# Only filled by prefetches, which get issue details along with other data.
+_issue_details_cache: dict[int, dict] = {}
+
+
+def clear_lookup_caches() -> None:
+    """Forgets memoized repository details, PR head SHAs and issue details (the disk copy is kept)."""
+    _repo_details_cache.clear()
+    _pr_head_sha_cache.clear()
+    _issue_details_cache.clear()
+
+
+def invalidate_pr_head_sha(pr_number: int | None = None) -> None:
+    """Drops the memoized head SHA of one PR, or of all PRs. Call after pushing."""
+    if pr_number is None:
+        _pr_head_sha_cache.clear()
+    else:
+        _pr_head_sha_cache.pop(pr_number, None)
+
+
+def _file_stamp(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _remote_refs_stamp(repo_path: str = ".") -> tuple:
+    """Changes whenever a remote-tracking ref is updated."""
+    repository = find_repository(repo_path)
+    if repository is None:
+        return (0, None)
+    git_dir = repository.common_dir  # Refs are shared by all worktrees
+    latest = 0
+    for root, _, files in os.walk(os.path.join(git_dir, "refs", "remotes")):
+        for name in files:
+            stamp = _file_stamp(os.path.join(root, name))
+            if stamp:
+                latest = max(latest, stamp[0])
+    return (latest, _file_stamp(os.path.join(git_dir, "packed-refs")))
+
+
+def _repo_details_cache_path(repository) -> str:
+    return os.path.join(repository.common_dir, REPO_DETAILS_CACHE_FILE)
+
+
+def _read_repo_details_from_disk(repository, config_stamp: tuple) -> tuple[str, str] | None:
+    try:
+        with open(_repo_details_cache_path(repository), "r") as f:
+            data = json.load(f)
+        if tuple(data["config_stamp"]) == config_stamp:
+            return data["owner"], data["name"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _write_repo_details_to_disk(repository, config_stamp: tuple, details: tuple[str, str]) -> None:
+    data = {"config_stamp": list(config_stamp), "owner": details[0], "name": details[1]}
+    try:
+        with open(_repo_details_cache_path(repository), "w") as f:
+            json.dump(data, f)
+    except OSError:
+        pass  # Only an optimization
+
+
+def _config_key():
+    """(repository, memo key) for the repository's config, or (None, None) outside one."""
+    repository = find_repository()
+    config_stamp = _file_stamp(repository.config_path) if repository else None
+    if config_stamp is None:
+        return None, None
+    return repository, (repository.common_dir, config_stamp)
+
+
 def _get_repo_details() -> tuple[str, str] | None:
-    """Fetches repository owner and name using gh repo view."""
+    """Returns repository owner and name, memoized until the git config changes."""
+    repository, key = _config_key()
+    if repository is None:
+        # Not in a repository, so there is nothing to key the cache on.
+        return _fetch_repo_details()
+    config_stamp = key[1]
+    details = _repo_details_cache.get(key)
+    if details is None:
+        details = _read_repo_details_from_disk(repository, config_stamp)
+        if details is None:
+            details = _fetch_repo_details()
+            if details is None:
+                return None  # Failures are not cached
+            _write_repo_details_to_disk(repository, config_stamp, details)
+        _repo_details_cache[key] = details
+    return details
+
+
+def _remember_repo_details(details: tuple[str, str]) -> None:
+    """Stores repository details learned elsewhere, as _get_repo_details would have."""
+    repository, key = _config_key()
+    if repository is None:
+        return
+    if _repo_details_cache.get(key) != details:
+        _repo_details_cache[key] = details
+        _write_repo_details_to_disk(repository, key[1], details)
+
+
+def _fetch_repo_details() -> tuple[str, str] | None:
+    """Fetches repository owner and name from the GitHub backend (gh repo view by default)."""
     try:
-        cmd = ["gh", "repo", "view", "--json", "owner,name"]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-        # Owner can be a dict for organizations, so access 'login' field
-        owner_login = data["owner"]["login"] if isinstance(data["owner"], dict) else data["owner"]
-        repo_name = data["name"]
-        return owner_login, repo_name
+        return get_backend().repo_details()
     except subprocess.CalledProcessError as e:
         print(f"Error fetching repository details: {e.stderr}")
         return None
+    except GitHubAPIError as e:
+        print(f"Error fetching repository details: {e}")
+        return None
     except json.JSONDecodeError:
         print("Error parsing repository details from gh.")
         return None
@@ -372,81 +873,347 @@ def _get_repo_details() -> tuple[str, str] | None:
         return None
 
 
-def _get_pr_head_commit_sha(pr_number: int) -> str | None:
+def get_pr_head_commit_sha(pr_number: int) -> str | None:
+    """Returns the head commit SHA of a PR, memoized for a short time and until the next push."""
+    now = time.monotonic()
+    refs_stamp = _remote_refs_stamp()
+    cached = _pr_head_sha_cache.get(pr_number)
+    if cached:
+        sha, fetched_at, stamp = cached
+        if now - fetched_at < PR_HEAD_SHA_TTL_SECONDS and stamp == refs_stamp:
+            return sha
+    sha = _fetch_pr_head_commit_sha(pr_number)
+    if sha:
+        _pr_head_sha_cache[pr_number] = (sha, now, refs_stamp)
+    else:
+        _pr_head_sha_cache.pop(pr_number, None)
+    return sha
+
+
+def _fetch_pr_head_commit_sha(pr_number: int) -> str | None:
     """Fetches the head commit SHA for a given PR number."""
     try:
-        cmd = ["gh", "pr", "view", str(pr_number), "--json", "headRefOid"]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-        return data.get("headRefOid")
+        return get_backend().pr_head_sha(pr_number)
     except subprocess.CalledProcessError as e:
         print(f"Error fetching PR head commit SHA for PR #{pr_number}: {e.stderr}")
         return None
+    except GitHubAPIError as e:
+        print(f"Error fetching PR head commit SHA for PR #{pr_number}: {e}")
+        return None
     except json.JSONDecodeError:
         print(f"Error parsing PR head commit SHA for PR #{pr_number}.")
         return None
     except FileNotFoundError:
-        print("Error: 'gh' command not found for _get_pr_head_commit_sha.")
+        print("Error: 'gh' command not found for get_pr_head_commit_sha.")
         return None
     except Exception as e:
-        print(f"Unexpected error in _get_pr_head_commit_sha for PR #{pr_number}: {e}")
+        print(f"Unexpected error in get_pr_head_commit_sha for PR #{pr_number}: {e}")
+        return None
+
+
+# One GraphQL request gets what a review or `autopr pr` would otherwise ask gh for
+# one call at a time. The answers are stored in the lookup caches above, so the
+# usual functions (_get_repo_details, get_pr_head_commit_sha, get_issue_details)
+# return them without another round trip.
+_ISSUE_FIELDS = "number title body labels(first: 20) { nodes { name } }"
+
+PR_CONTEXT_QUERY = f"""
+query($owner: String!, $name: String!, $number: Int!) {{
+  repository(owner: $owner, name: $name) {{
+    owner {{ login }}
+    name
+    pullRequest(number: $number) {{
+      title
+      headRefName
+      headRefOid
+      baseRefName
+      baseRefOid
+      additions
+      deletions
+      changedFiles
+      files(first: 100) {{ nodes {{ path additions deletions }} }}
+      closingIssuesReferences(first: 10) {{ nodes {{ {_ISSUE_FIELDS} }} }}
+      reviewThreads(first: 100) {{
+        nodes {{ path line isResolved isOutdated comments(first: 1) {{ nodes {{ body }} }} }}
+        pageInfo {{ hasNextPage }}
+      }}
+    }}
+  }}
+}}
+"""
+
+REPO_CONTEXT_QUERY = f"""
+query($owner: String!, $name: String!, $branch: String!, $issue: Int!, $withIssue: Boolean!) {{
+  repository(owner: $owner, name: $name) {{
+    owner {{ login }}
+    name
+    pullRequests(headRefName: $branch, states: OPEN, first: 20) {{
+      nodes {{ number url headRepositoryOwner {{ login }} headRepository {{ name }} }}
+    }}
+    issue(number: $issue) @include(if: $withIssue) {{ {_ISSUE_FIELDS} }}
+  }}
+}}
+"""
+
+
+@dataclass
+class PrContext:
+    """What a review needs to know about a PR, fetched in one request."""
+
+    number: int
+    owner: str
+    repo: str
+    title: str
+    head_sha: str
+    base_sha: str
+    head_ref: str
+    base_ref: str
+    additions: int = 0
+    deletions: int = 0
+    changed_files: int = 0
+    # {'path', 'additions', 'deletions'} for the first 100 files
+    files: list[dict] = field(default_factory=list)
+    # Issues the PR closes, in get_issue_details format
+    linked_issues: list[dict] = field(default_factory=list)
+    # {'path', 'line', 'body', 'is_resolved', 'is_outdated'}; body is the first comment.
+    # None if the PR has more threads than one request returns; use get_pr_review_comments.
+    review_threads: list[dict] | None = field(default_factory=list)
+
+
+@dataclass
+class RepoContext:
+    """What `autopr pr` needs to know before creating a PR, fetched in one request."""
+
+    owner: str
+    repo: str
+    # {'number', 'url'} of an open PR from the current branch of the repository it is
+    # pushed to, if there is one
+    existing_pr: dict | None = None
+    # The issue being worked on, in get_issue_details format
+    issue: dict | None = None
+
+
+def _issue_from_graphql(node: dict) -> dict:
+    return {
+        "number": node["number"],
+        "title": node["title"],
+        "body": node.get("body") or "",
+        "labels": [{"name": label["name"]} for label in (node.get("labels") or {}).get("nodes", [])],
+    }
+
+
+def _run_prefetch(query: str, variables: dict, what: str) -> dict | None:
+    """Runs a prefetch query. Failures are reported and return None, so callers can
+    fall back to the individual lookups."""
+    try:
+        return get_backend().graphql(query, variables)["repository"]
+    except subprocess.CalledProcessError as e:
+        print(f"Could not prefetch {what}: {(e.stderr or '').strip()}")
+    except GitHubAPIError as e:
+        print(f"Could not prefetch {what}: {e}")
+    except FileNotFoundError:
+        print("Error: 'gh' command not found. Please ensure it is installed and in your PATH.")
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print(f"Could not parse the prefetched {what}.")
+    return None
+
+
+def prefetch_pr_context(pr_number: int) -> PrContext | None:
+    """
+    Fetches a PR's repository, head and base commits, changed files, linked issues
+    and review threads in a single GraphQL request.
+
+    Returns None if the request failed; the regular lookups then fetch what is needed.
+    """
+    repository = _run_prefetch(
+        PR_CONTEXT_QUERY,
+        {"owner": "{owner}", "name": "{repo}", "number": pr_number},
+        f"details of PR #{pr_number}",
+    )
+    if not repository or not repository.get("pullRequest"):
+        return None
+    try:
+        pr = repository["pullRequest"]
+        context = PrContext(
+            number=pr_number,
+            owner=repository["owner"]["login"],
+            repo=repository["name"],
+            title=pr["title"],
+            head_sha=pr["headRefOid"],
+            base_sha=pr["baseRefOid"],
+            head_ref=pr["headRefName"],
+            base_ref=pr["baseRefName"],
+            additions=pr.get("additions") or 0,
+            deletions=pr.get("deletions") or 0,
+            changed_files=pr.get("changedFiles") or 0,
+            files=[
+                {"path": f["path"], "additions": f["additions"], "deletions": f["deletions"]}
+                for f in (pr.get("files") or {}).get("nodes", [])
+            ],
+            linked_issues=[
+                _issue_from_graphql(issue)
+                for issue in (pr.get("closingIssuesReferences") or {}).get("nodes", [])
+            ],
+            review_threads=[
+                {
+                    "path": thread["path"],
+                    "line": thread.get("line"),
+                    "body": (thread["comments"]["nodes"] or [{}])[0].get("body", ""),
+                    "is_resolved": thread.get("isResolved", False),
+                    "is_outdated": thread.get("isOutdated", False),
+                }
+                for thread in (pr.get("reviewThreads") or {}).get("nodes", [])
+            ],
+        )
+    except (KeyError, TypeError, IndexError):
+        print(f"Could not parse the prefetched details of PR #{pr_number}.")
         return None
 
+    if ((pr.get("reviewThreads") or {}).get("pageInfo") or {}).get("hasNextPage"):
+        # Only the first 100 threads came back. The REST listing pages through all
+        # the comments, rather than missing some and posting duplicates.
+        context.review_threads = None
+
+    _remember_repo_details((context.owner, context.repo))
+    _pr_head_sha_cache[pr_number] = (context.head_sha, time.monotonic(), _remote_refs_stamp())
+    for issue in context.linked_issues:
+        _issue_details_cache[issue["number"]] = issue
+    return context
+
 
-def post_pr_review_comment(pr_number: int, body: str, path: str, line: int) -> bool:
+def prefetch_repo_context(branch: str | None, issue_number: int | None = None) -> RepoContext | None:
     """
-    Posts a review comment on a specific line of a PR using 'gh api'.
-    
-    Args:
-        pr_number: The number of the PR to comment on.
-        body: The comment text.
-        path: The path to the file being commented on.
-        line: The line number to comment on.
-        
-    Returns:
-        True if the comment was posted successfully, False otherwise.
+    Fetches the repository, any open PR from branch and the details of issue_number
+    in a single GraphQL request.
+
+    Only a PR whose head is branch of the repository branch is pushed to counts:
+    forks often have branches of the same name.
+
+    Returns None if the request failed.
     """
-    print(f"Attempting to post review comment on PR #{pr_number}, file {path}:{line}")
-    repo_details = _get_repo_details()
-    if not repo_details:
-        print("Failed to post comment: Could not retrieve repository details.")
-        return False
-    owner, repo = repo_details
+    repository = _run_prefetch(
+        REPO_CONTEXT_QUERY,
+        {
+            "owner": "{owner}",
+            "name": "{repo}",
+            "branch": branch or "",
+            "issue": issue_number or 0,
+            "withIssue": issue_number is not None,
+        },
+        "repository details",
+    )
+    if not repository:
+        return None
+    try:
+        context = RepoContext(
+            owner=repository["owner"]["login"],
+            repo=repository["name"],
+            issue=_issue_from_graphql(repository["issue"]) if repository.get("issue") else None,
+        )
+        head_repo = f"{context.owner}/{context.repo}"
+        if branch:
+            try:
+                head_repo = get_push_remote_repo(branch)
+            except (FileNotFoundError, ValueError):
+                pass  # No usable remote; count PRs from the repository itself.
+        for pr in (repository.get("pullRequests") or {}).get("nodes", []) if branch else []:
+            owner = (pr.get("headRepositoryOwner") or {}).get("login")
+            name = (pr.get("headRepository") or {}).get("name")
+            if f"{owner}/{name}".lower() == head_repo.lower():
+                context.existing_pr = {"number": pr["number"], "url": pr["url"]}
+                break
+    except (KeyError, TypeError):
+        print("Could not parse the prefetched repository details.")
+        return None
 
-    commit_sha = _get_pr_head_commit_sha(pr_number)
-    if not commit_sha:
-        print(f"Failed to post comment: Could not retrieve head commit SHA for PR #{pr_number}.")
-        return False
+    _remember_repo_details((context.owner, context.repo))
+    if context.issue:
+        _issue_details_cache[context.issue["number"]] = context.issue
+    return context
 
-    api_path = f"repos/{owner}/{repo}/pulls/{pr_number}/comments"
-    # Construct fields for the gh api command.
-    # Using -f for simple key=value and --input for JSON body if it gets complex.
-    # For now, -f should work.
-    fields = [
-        "-f", f"body={body}",
-        "-f", f"commit_id={commit_sha}",
-        "-f", f"path={path}",
-        "-F", f"line={line}" # Use -F for integer to avoid issues with gh parsing
-    ]
-    
-    cmd = ["gh", "api", api_path, "-X", "POST"] + fields
-    
+
+def _submit_review(
+    pr_number: int, owner: str, repo: str, commit_sha: str, comments: list[dict]
+) -> bool:
+    """POSTs one review holding all comments. Returns True if GitHub accepted it."""
+    payload = {
+        "commit_id": commit_sha,
+        "event": "COMMENT",
+        "comments": [
+            {"path": c["path"], "line": c["line"], "side": "RIGHT", "body": c["body"]}
+            for c in comments
+        ],
+    }
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        # Successful API call usually returns JSON data of the created comment
-        print(f"Successfully posted comment on PR #{pr_number} to {path}:{line}. Response: {result.stdout[:100]}...")
+        get_backend().submit_review(owner, repo, pr_number, payload)
         return True
     except subprocess.CalledProcessError as e:
-        print(f"Error posting review comment via gh api for PR #{pr_number}:")
-        print(f"Command '{' '.join(e.cmd)}' failed with exit code {e.returncode}")
-        if e.stdout:
-            print(f"Stdout:\n{e.stdout}")
-        if e.stderr:
-            print(f"Stderr:\n{e.stderr}")
+        # 422 means GitHub could not place at least one of the comments (e.g. a line outside the diff).
+        print(f"GitHub did not accept a review of {len(comments)} comment(s) on PR #{pr_number}: {(e.stderr or '').strip()}")
+        return False
+    except GitHubAPIError as e:
+        print(f"GitHub did not accept a review of {len(comments)} comment(s) on PR #{pr_number}: {e}")
         return False
     except FileNotFoundError:
         print("Error: 'gh' command not found. Please ensure it is installed and in your PATH.")
         return False
     except Exception as e:
-        print(f"An unexpected error occurred while posting review comment: {e}")
+        print(f"An unexpected error occurred while posting the review: {e}")
         return False
+
+
+def post_pr_review(
+    pr_number: int,
+    comments: list[dict],
+    commit_sha: str | None = None,
+    diff_index: DiffLineIndex | None = None,
+) -> list[bool]:
+    """
+    Posts all comments as a single GitHub review, so they appear to the PR author at once.
+
+    GitHub rejects the whole review if one comment is on a line outside the diff, so
+    with diff_index (see diff_utils.index_diff_lines) such comments are left out
+    before posting. Exactly one review is posted: if GitHub rejects it anyway,
+    nothing is posted. Comments are not retried one by one: each would reach the
+    author as a notification of its own, and the diff_index check already leaves
+    out the comments GitHub would reject.
+
+    Args:
+        pr_number: The number of the PR to review.
+        comments: Dicts with 'path', 'line' and 'body'.
+        commit_sha: The PR head commit, looked up with gh if not given.
+        diff_index: The lines of the PR's diff that can be commented on.
+
+    Returns:
+        One bool per comment, True if it was posted.
+    """
+    if not comments:
+        return []
+    results = [False] * len(comments)
+    postable = list(range(len(comments)))
+    if diff_index is not None:
+        postable = [
+            i for i in postable
+            if diff_index.nearest_line(comments[i]["path"], comments[i]["line"], 0) == comments[i]["line"]
+        ]
+        skipped = len(comments) - len(postable)
+        if skipped:
+            print(f"Leaving out {skipped} comment(s) on lines outside the diff of PR #{pr_number}.")
+        if not postable:
+            return results
+    repo_details = _get_repo_details()
+    if not repo_details:
+        print("Failed to post review: Could not retrieve repository details.")
+        return results
+    owner, repo = repo_details
+    commit_sha = commit_sha or get_pr_head_commit_sha(pr_number)
+    if not commit_sha:
+        print(f"Failed to post review: Could not retrieve head commit SHA for PR #{pr_number}.")
+        return results
+
+    print(f"Posting {len(postable)} comment(s) as one review on PR #{pr_number}...")
+    if _submit_review(pr_number, owner, repo, commit_sha, [comments[i] for i in postable]):
+        for i in postable:
+            results[i] = True
+        print(f"Successfully posted a review with {len(postable)} comment(s) on PR #{pr_number}.")
+    return results
@@ -0,0 +1,224 @@
+# autopr/issue_store.py
+# Keeps a copy of the repository's issues in SQLite in its git directory (shared by
+# all worktrees, see repo_discovery), so `autopr ls` and issue lookups do not
+# download every issue again. The copy is brought up to date with the issues
+# updated since the last sync (GitHub's since= parameter), and the first page of
+# that query is requested conditionally with its ETag: when nothing changed,
+# GitHub answers 304 without counting it against the rate limit.
+import json
+import os
+
+from .github_backend import get_backend
+from .repo_discovery import find_repository
+
+STORE_FILE_NAME = ".autopr_issues.sqlite3"
+PAGE_SIZE = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    number INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL DEFAULT '',
+    state TEXT NOT NULL,
+    labels TEXT NOT NULL DEFAULT '[]',
+    author TEXT,
+    assignees TEXT NOT NULL DEFAULT '[]',
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS issues_state ON issues (state, number);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _store_path(repo_path: str = ".") -> str | None:
+    repository = find_repository(repo_path)
+    if repository is None:
+        return None
+    return os.path.join(repository.common_dir, STORE_FILE_NAME)
+
+
+def open_store(repo_path: str = ".", create: bool = True):
+    """Opens the issue store of the repository at repo_path.
+
+    Returns None outside a git repository, if the store does not exist and create
+    is False, or if SQLite fails.
+    """
+    import sqlite3
+
+    path = _store_path(repo_path)
+    if path is None or (not create and not os.path.exists(path)):
+        return None
+    try:
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_SCHEMA)
+        return conn
+    except sqlite3.Error as e:
+        print(f"Warning: Could not open the issue store: {e}")
+        return None
+
+
+def _get_meta(conn, key: str) -> str | None:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+def _set_meta(conn, key: str, value: str | None) -> None:
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def last_synced_at(conn) -> str | None:
+    """The updated_at of the newest issue seen by the last sync, or None if never synced."""
+    return _get_meta(conn, "synced_at")
+
+
+def issue_from_api(item: dict) -> dict:
+    """Converts a REST API issue to the format the store returns."""
+    return {
+        "number": item["number"],
+        "title": item.get("title") or "",
+        "body": item.get("body") or "",
+        "state": (item.get("state") or "open").lower(),
+        "labels": [{"name": label["name"]} for label in item.get("labels") or []],
+        "author": (item.get("user") or {}).get("login"),
+        "assignees": [a["login"] for a in item.get("assignees") or []],
+        "updated_at": item.get("updated_at") or "",
+    }
+
+
+def _row_from_api(item: dict) -> tuple:
+    issue = issue_from_api(item)
+    return (
+        issue["number"],
+        issue["title"],
+        issue["body"],
+        issue["state"],
+        json.dumps(issue["labels"]),
+        issue["author"],
+        json.dumps(issue["assignees"]),
+        issue["updated_at"],
+    )
+
+
+def _upsert_rows(conn, rows: list[tuple]) -> None:
+    conn.executemany(
+        "INSERT OR REPLACE INTO issues "
+        "(number, title, body, state, labels, author, assignees, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def sync_issues(conn, owner: str, repo: str, full: bool = False) -> int:
+    """Brings the store up to date with GitHub. Returns how many issues were updated.
+
+    With full, the store is rebuilt from scratch (which also forgets deleted and
+    transferred issues). Backend errors propagate; the store is left unchanged then.
+    """
+    since = None if full else last_synced_at(conn)
+    path = f"repos/{owner}/{repo}/issues?state=all&sort=updated&direction=asc&per_page={PAGE_SIZE}"
+    if since:
+        path += f"&since={since}"
+    # An ETag only applies to the exact URL it was returned for.
+    etag = _get_meta(conn, "etag") if path == _get_meta(conn, "etag_path") else None
+
+    backend = get_backend()
+    page = backend.get_page(path, etag)
+    if page.not_modified:
+        return 0
+
+    first_etag = page.etag
+    rows = []
+    newest = since
+    while True:
+        for item in page.data or []:
+            if item.get("updated_at") and (
+                newest is None or item["updated_at"] > newest
+            ):
+                newest = item["updated_at"]
+            if "pull_request" not in item:  # The issues endpoint lists PRs too
+                rows.append(_row_from_api(item))
+        if not page.next_path:
+            break
+        page = backend.get_page(page.next_path)
+
+    with conn:
+        if full:
+            conn.execute("DELETE FROM issues")
+        _upsert_rows(conn, rows)
+        # since= is inclusive, so the newest issue is fetched again next time; that
+        # is what makes the next query (and its ETag) stable while nothing changes.
+        _set_meta(conn, "synced_at", newest)
+        _set_meta(conn, "etag_path", path if first_etag else None)
+        _set_meta(conn, "etag", first_etag)
+    return len(rows)
+
+
+def _issue_from_row(row) -> dict:
+    return {
+        "number": row["number"],
+        "title": row["title"],
+        "body": row["body"],
+        "state": row["state"],
+        "labels": json.loads(row["labels"]),
+        "author": row["author"],
+        "assignees": json.loads(row["assignees"]),
+        "updated_at": row["updated_at"],
+    }
+
+
+def iter_stored_issues(
+    conn,
+    state: str | None = "open",
+    labels: list[str] | None = None,
+    assignee: str | None = None,
+    author: str | None = None,
+    search: str | None = None,
+    limit: int | None = None,
+    page_size: int = PAGE_SIZE,
+):
+    """Yields pages of stored issues matching the filters, newest first.
+
+    The filters become the WHERE clause, so SQLite only reads matching rows. Every
+    label must match; search matches each word against the title or body.
+    """
+    where = []
+    params = []
+    if state:
+        where.append("state = ?")
+        params.append(state)
+    for label in labels or []:
+        where.append(
+            "EXISTS (SELECT 1 FROM json_each(issues.labels) WHERE json_extract(value, '$.name') = ?)"
+        )
+        params.append(label)
+    if assignee:
+        where.append(
+            "EXISTS (SELECT 1 FROM json_each(issues.assignees) WHERE value = ?)"
+        )
+        params.append(assignee)
+    if author:
+        where.append("author = ?")
+        params.append(author)
+    for word in (search or "").split():
+        where.append("(title LIKE ? OR body LIKE ?)")
+        params.extend([f"%{word}%"] * 2)
+    sql = "SELECT * FROM issues"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY number DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(page_size)
+        if not rows:
+            return
+        yield [_issue_from_row(row) for row in rows]
+
+
+def get_issue(conn, number: int) -> dict | None:
+    row = conn.execute("SELECT * FROM issues WHERE number = ?", (number,)).fetchone()
+    return _issue_from_row(row) if row else None
@@ -0,0 +1,267 @@
+# autopr/repo_discovery.py
+# Finds the repository autopr runs in and the GitHub repository it pushes to, the
+# way git does: by walking up from the current directory to the first `.git`. That
+# `.git` may be a directory, or a file pointing elsewhere (`gitdir: ...`) as in
+# worktrees and submodules; worktrees keep their config in the main repository
+# (`commondir`). The config is read with git's own syntax, including `include.path`,
+# and the result is memoized until one of the config files changes.
+import os
+import re
+from dataclasses import dataclass
+
+# Nested include.path directives followed before giving up, as git does.
+MAX_INCLUDE_DEPTH = 10
+
+# user@host:owner/repo.git
+_SCP_LIKE_URL = re.compile(r"^(?:[^@/]+@)?[^:/]+:(?!//)(?P<path>.+)$")
+_SECTION = re.compile(
+    r'^\[\s*(?P<name>[A-Za-z0-9.-]+)\s*(?:"(?P<sub>(?:[^"\\]|\\.)*)")?\s*\]'
+)
+_REMOTE_URL_KEY = re.compile(r"^remote\.(?P<name>.+)\.url$")
+
+
+@dataclass(frozen=True)
+class Repository:
+    # The top-level directory of the working tree
+    worktree: str
+    # This worktree's git directory (HEAD and the index live here)
+    git_dir: str
+    # The git directory shared by all worktrees (config, refs and objects live here)
+    common_dir: str
+
+    @property
+    def config_path(self) -> str:
+        return os.path.join(self.common_dir, "config")
+
+
+def _read_gitdir_file(path: str) -> str | None:
+    """Returns the directory a `.git` file points to, or None if it is not one."""
+    try:
+        with open(path, "r") as f:
+            content = f.read().strip()
+    except OSError:
+        return None
+    if not content.startswith("gitdir:"):
+        return None
+    target = content[len("gitdir:") :].strip()
+    return os.path.normpath(os.path.join(os.path.dirname(path), target))
+
+
+def _common_dir(git_dir: str) -> str:
+    try:
+        with open(os.path.join(git_dir, "commondir"), "r") as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except OSError:
+        return git_dir
+
+
+def find_repository(start: str = ".") -> Repository | None:
+    """Finds the repository containing start, or None if there is none.
+
+    Honours GIT_DIR (and GIT_WORK_TREE) like git does.
+    """
+    if os.environ.get("GIT_DIR"):
+        git_dir = os.path.abspath(os.environ["GIT_DIR"])
+        worktree = os.path.abspath(os.environ.get("GIT_WORK_TREE") or start)
+        return Repository(worktree, git_dir, _common_dir(git_dir))
+
+    directory = os.path.abspath(start)
+    while True:
+        candidate = os.path.join(directory, ".git")
+        if os.path.isdir(candidate):
+            return Repository(directory, candidate, _common_dir(candidate))
+        if os.path.isfile(candidate):
+            git_dir = _read_gitdir_file(candidate)
+            if git_dir and os.path.isdir(git_dir):
+                return Repository(directory, git_dir, _common_dir(git_dir))
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def _unquote(raw: str) -> str:
+    """Parses a config value: quotes, escapes and trailing comments."""
+    value = []
+    in_quotes = False
+    pending_space = ""
+    i = 0
+    while i < len(raw):
+        char = raw[i]
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == "\\" and i + 1 < len(raw):
+            i += 1
+            value.append(
+                pending_space + {"n": "\n", "t": "\t", "b": "\b"}.get(raw[i], raw[i])
+            )
+            pending_space = ""
+        elif char in "#;" and not in_quotes:
+            break
+        elif char.isspace() and not in_quotes:
+            if value:
+                pending_space += char
+        else:
+            value.append(pending_space + char)
+            pending_space = ""
+        i += 1
+    return "".join(value)
+
+
+def read_config(
+    path: str, _depth: int = 0, _files: list | None = None
+) -> tuple[list[tuple[str, str]], list[str]]:
+    """Reads a git config file and the files it includes.
+
+    Returns ([(key, value)] in file order, with keys as git prints them, e.g.
+    'remote.origin.url'; [every file that was looked at]). Missing files are
+    listed too, so creating one can be noticed. includeIf is not evaluated.
+    """
+    files = _files if _files is not None else []
+    files.append(path)
+    entries: list[tuple[str, str]] = []
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return entries, files
+
+    section = ""
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        i += 1
+        if not line or line[0] in "#;":
+            continue
+        if line.startswith("["):
+            match = _SECTION.match(line)
+            if not match:
+                section = ""
+                continue
+            # [section "subsection"]; the subsection is case-sensitive. The old-style
+            # [section.subsection] is lowercased as a whole, as git does.
+            section = match.group("name").lower()
+            if match.group("sub") is not None:
+                section += "." + re.sub(r"\\(.)", r"\1", match.group("sub"))
+            continue
+        # A value ending in a backslash continues on the next line.
+        while line.endswith("\\") and not line.endswith("\\\\") and i < len(lines):
+            line = line[:-1] + lines[i].strip()
+            i += 1
+        name, has_value, raw_value = line.partition("=")
+        value = _unquote(raw_value.strip()) if has_value else "true"
+        key = f"{section}.{name.strip().lower()}"
+        entries.append((key, value))
+        if key == "include.path" and _depth < MAX_INCLUDE_DEPTH:
+            include = os.path.expanduser(value)
+            if not os.path.isabs(include):
+                include = os.path.join(os.path.dirname(path), include)
+            included, _ = read_config(include, _depth + 1, files)
+            entries.extend(included)
+    return entries, files
+
+
+def parse_remote_url(url: str) -> str:
+    """Returns 'owner/repo' for a GitHub remote URL (HTTPS, SSH or scp-like)."""
+    url = url.strip()
+    if "://" in url:
+        scheme, _, rest = url.partition("://")
+        if scheme.lower() not in ("https", "http", "ssh", "git", "git+ssh", "ssh+git"):
+            raise ValueError("Unsupported URL format.")
+        path = rest.partition("/")[2]
+    else:
+        match = _SCP_LIKE_URL.match(url)
+        if not match:
+            raise ValueError("Unsupported URL format.")
+        path = match.group("path")
+    parts = [part for part in path.split("/") if part]
+    if len(parts) < 2:
+        raise ValueError("Unsupported URL format.")
+    return f"{parts[-2]}/{parts[-1].removesuffix('.git')}"
+
+
+def _stamp(paths: list[str]) -> tuple:
+    stamps = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamps.append((path, None, None))
+    return tuple(stamps)
+
+
+# config path -> (stamp of the config files read, [(remote name, url)])
+_remotes_cache: dict[str, tuple[tuple, list[tuple[str, str]]]] = {}
+
+
+def get_remotes(repository: Repository) -> list[tuple[str, str]]:
+    """Returns [(name, url)] of the repository's remotes, in config order.
+
+    Memoized until the config file, or a file it includes, changes.
+    """
+    path = repository.config_path
+    cached = _remotes_cache.get(path)
+    if cached and _stamp([stamp[0] for stamp in cached[0]]) == cached[0]:
+        return cached[1]
+    entries, files = read_config(path)
+    remotes = {}
+    for key, value in entries:
+        match = _REMOTE_URL_KEY.match(key)
+        if match and match.group("name") not in remotes:
+            remotes[match.group("name")] = value
+    result = list(remotes.items())
+    _remotes_cache[path] = (_stamp(files), result)
+    return result
+
+
+def clear_cache() -> None:
+    _remotes_cache.clear()
+
+
+def get_remote_repo(start: str = ".", remote: str | None = None) -> str:
+    """Returns 'owner/repo' of the repository containing start.
+
+    Uses the given remote, else 'origin', else the first remote in the config.
+    Raises FileNotFoundError outside a repository and ValueError if there is no
+    usable remote.
+    """
+    repository = find_repository(start)
+    if repository is None:
+        raise FileNotFoundError(
+            f"No git repository found in {os.path.abspath(start)} or its parents."
+        )
+    remotes = dict(get_remotes(repository))
+    if not remotes:
+        raise ValueError(f"No remote found in {repository.config_path}.")
+    if remote is not None:
+        if remote not in remotes:
+            raise ValueError(f"No '{remote}' remote found in {repository.config_path}.")
+        return parse_remote_url(remotes[remote])
+    if "origin" in remotes:
+        return parse_remote_url(remotes["origin"])
+    return parse_remote_url(next(iter(remotes.values())))
+
+
+def get_push_remote_repo(branch: str, start: str = ".") -> str:
+    """Returns 'owner/repo' of the remote branch is pushed to.
+
+    That is branch.<branch>.pushRemote, else remote.pushDefault, else
+    branch.<branch>.remote, as git push picks it; without any of them, the
+    remote get_remote_repo() uses. Raises like get_remote_repo().
+    """
+    repository = find_repository(start)
+    if repository is None:
+        raise FileNotFoundError(
+            f"No git repository found in {os.path.abspath(start)} or its parents."
+        )
+    config = dict(read_config(repository.config_path)[0])
+    remotes = dict(get_remotes(repository))
+    for key in (
+        f"branch.{branch}.pushremote",
+        "remote.pushdefault",
+        f"branch.{branch}.remote",
+    ):
+        if config.get(key) in remotes:
+            return get_remote_repo(start, config[key])
+    return get_remote_repo(start)
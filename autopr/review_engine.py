@@ -0,0 +1,206 @@
+# autopr/review_engine.py
+import difflib
+import hashlib
+import re
+
+from .ai_service import get_pr_review_suggestions
+from .diff_utils import DiffLineIndex, estimate_tokens, parse_diff, split_hunk
+
+# Upper bound on the size of the diff sent in a single review request.
+DEFAULT_CHUNK_TOKENS = 6000
+# Number of chunks reviewed at the same time.
+DEFAULT_MAX_WORKERS = 4
+
+
+def split_diff_into_chunks(
+    diff: str, max_tokens: int = DEFAULT_CHUNK_TOKENS
+) -> list[str]:
+    """Splits a unified diff into self-contained chunks of at most ~max_tokens.
+
+    Each chunk is a valid diff on its own: every hunk is preceded by its file header.
+    Small files are packed together, large files are split between hunks, and hunks
+    that are still too large are split into smaller hunks.
+    """
+    chunks: list[str] = []
+    current_parts: list[str] = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current_parts, current_tokens
+        if current_parts:
+            chunks.append("\n".join(current_parts))
+        current_parts = []
+        current_tokens = 0
+
+    for file_diff in parse_diff(diff):
+        header = file_diff.header
+        header_tokens = estimate_tokens(header) + 1
+        file_tokens = estimate_tokens(file_diff.text)
+
+        if file_tokens <= max_tokens:
+            # The whole file fits, keep it in one piece.
+            if current_tokens + file_tokens > max_tokens:
+                flush()
+            current_parts.append(file_diff.text)
+            current_tokens += file_tokens
+            continue
+
+        # The file is too large: start a fresh chunk and repeat the header for each piece.
+        flush()
+        hunk_budget = max(max_tokens - header_tokens, 1)
+        piece_parts = [header]
+        piece_tokens = header_tokens
+        for hunk in file_diff.hunks:
+            for piece in split_hunk(hunk, hunk_budget):
+                piece_text = piece.text
+                tokens = estimate_tokens(piece_text) + 1
+                if len(piece_parts) > 1 and piece_tokens + tokens > max_tokens:
+                    chunks.append("\n".join(piece_parts))
+                    piece_parts = [header]
+                    piece_tokens = header_tokens
+                piece_parts.append(piece_text)
+                piece_tokens += tokens
+        if len(piece_parts) > 1:
+            chunks.append("\n".join(piece_parts))
+
+    flush()
+    return chunks
+
+
+def _normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def merge_suggestions(results: list[list[dict]]) -> list[dict]:
+    """Merges per-chunk review results, dropping duplicates while keeping order.
+
+    Two suggestions are duplicates if they target the same path and line with the same
+    text, ignoring case and whitespace. Error placeholders are deduplicated the same way.
+    """
+    merged = []
+    seen = set()
+    for suggestions in results:
+        for suggestion in suggestions or []:
+            key = (
+                suggestion.get("path"),
+                suggestion.get("line"),
+                _normalize_text(str(suggestion.get("suggestion", ""))),
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(suggestion)
+    return merged
+
+
+# Suggestions further than this from any line of the diff are dropped rather than moved.
+MAX_REANCHOR_DISTANCE = 10
+
+
+def anchor_suggestions(
+    comments: list[dict],
+    index: DiffLineIndex,
+    max_distance: int = MAX_REANCHOR_DISTANCE,
+) -> tuple[list[dict], int, int]:
+    """Moves review comments onto lines of the diff, where GitHub accepts them.
+
+    A comment on a line outside the diff goes to the nearest line of the same
+    file's hunks; a path is matched loosely (see DiffLineIndex.resolve_path).
+    Comments with no file or line close enough are dropped.
+
+    Returns (comments to post, number corrected, number dropped).
+    """
+    anchored = []
+    corrected = 0
+    dropped = 0
+    for comment in comments:
+        path = index.resolve_path(comment["path"])
+        line = index.nearest_line(path, comment["line"], max_distance) if path else None
+        if line is None:
+            dropped += 1
+            continue
+        if (path, line) != (comment["path"], comment["line"]):
+            corrected += 1
+            comment = {**comment, "path": path, "line": line}
+        anchored.append(comment)
+    return anchored, corrected, dropped
+
+
+# How alike (difflib ratio of the normalized texts) a suggestion and a comment on the
+# same line must be for the suggestion to count as already posted.
+DUPLICATE_SIMILARITY = 0.85
+
+
+def _body_hash(text: str) -> str:
+    return hashlib.sha1(_normalize_text(text).encode()).hexdigest()
+
+
+def _similar(a: str, b: str, threshold: float) -> bool:
+    matcher = difflib.SequenceMatcher(None, a, b)
+    # The quick upper bounds rule out most pairs without the full comparison.
+    return (
+        matcher.real_quick_ratio() >= threshold
+        and matcher.quick_ratio() >= threshold
+        and matcher.ratio() >= threshold
+    )
+
+
+def drop_existing_comments(
+    comments: list[dict], existing: list[dict], threshold: float = DUPLICATE_SIMILARITY
+) -> tuple[list[dict], int]:
+    """Drops review comments that are already on the PR.
+
+    A comment is already there if an existing comment on the same path and line has
+    the same text, ignoring case and whitespace, or text at least threshold similar
+    (so a reworded re-run of the same review is caught too). Existing comments
+    without a line (outdated ones) are ignored.
+
+    Returns (comments to post, number dropped).
+    """
+    hashes = set()
+    bodies_by_line: dict[tuple, list[str]] = {}
+    for comment in existing:
+        if not comment.get("path") or not comment.get("line"):
+            continue
+        key = (comment["path"], comment["line"])
+        hashes.add((*key, _body_hash(comment.get("body") or "")))
+        bodies_by_line.setdefault(key, []).append(
+            _normalize_text(comment.get("body") or "")
+        )
+
+    kept = []
+    for comment in comments:
+        key = (comment["path"], comment["line"])
+        if (*key, _body_hash(comment["body"])) in hashes:
+            continue
+        body = _normalize_text(comment["body"])
+        if any(
+            _similar(body, other, threshold) for other in bodies_by_line.get(key, [])
+        ):
+            continue
+        kept.append(comment)
+    return kept, len(comments) - len(kept)
+
+
+def review_diff(
+    diff: str,
+    max_chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> list[dict[str, str | int]]:
+    """Reviews a PR diff chunk by chunk, concurrently, and merges the suggestions.
+
+    Returns the same list of {'path', 'line', 'suggestion'} dicts as
+    get_pr_review_suggestions, including its error placeholders.
+    """
+    chunks = split_diff_into_chunks(diff, max_chunk_tokens) if diff else []
+    if len(chunks) <= 1:
+        # Small diffs (and diffs we could not parse) go out unchanged as a single request.
+        return get_pr_review_suggestions(diff)
+
+    print(
+        f"Diff is large, reviewing it as {len(chunks)} chunks ({min(max_workers, len(chunks))} at a time)..."
+    )
+    from .async_ai_service import get_pr_review_suggestions_async, run_bounded
+
+    results = run_bounded(get_pr_review_suggestions_async, chunks, max_workers)
+    return merge_suggestions(results)
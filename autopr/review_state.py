@@ -0,0 +1,62 @@
+# autopr/review_state.py
+# Remembers the head commit each PR was last reviewed at, so `autopr review` can look
+# only at what was pushed since. Stored in the repository's git directory, shared by
+# all its worktrees (see repo_discovery).
+import json
+import os
+import threading
+import time
+
+from .repo_discovery import find_repository
+
+STATE_FILE_NAME = ".autopr_review_state.json"
+
+# Batch reviews record PRs from several threads; updates must not overwrite each other.
+_lock = threading.Lock()
+
+
+def _state_path(repo_path: str = ".") -> str | None:
+    repository = find_repository(repo_path)
+    if repository is None:
+        return None
+    return os.path.join(repository.common_dir, STATE_FILE_NAME)
+
+
+def load_review_state(repo_path: str = ".") -> dict:
+    """Returns {pr_number (str): {'head_sha': ..., 'reviewed_at': ...}}."""
+    path = _state_path(repo_path)
+    if path is None:
+        return {}
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def get_last_reviewed_sha(pr_number: int, repo_path: str = ".") -> str | None:
+    """Returns the head SHA the PR was last reviewed at, or None if it never was."""
+    entry = load_review_state(repo_path).get(str(pr_number))
+    if isinstance(entry, dict):
+        return entry.get("head_sha")
+    return None
+
+
+def record_reviewed_sha(pr_number: int, head_sha: str, repo_path: str = ".") -> bool:
+    """Records that the PR has been reviewed up to head_sha. Returns False on failure."""
+    path = _state_path(repo_path)
+    if path is None:
+        return False
+    with _lock:
+        state = load_review_state(repo_path)
+        state[str(pr_number)] = {"head_sha": head_sha, "reviewed_at": int(time.time())}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            print(f"Warning: Could not save review state: {e}")
+            return False
@@ -0,0 +1,267 @@
+# autopr/runner.py
+# Every git and gh process autopr starts goes through run(). It closes stdin (so a
+# prompt or an editor fails fast instead of waiting for input), enforces a timeout,
+# caps how many processes run at the same time across threads, and records how long
+# each call took and how it ended, for `autopr --timings`.
+import os
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+
+# Seconds a git or gh call may take. Override with AUTOPR_COMMAND_TIMEOUT.
+DEFAULT_COMMAND_TIMEOUT = 60.0
+# Processes that may run at the same time. Override with AUTOPR_MAX_PROCESSES.
+DEFAULT_MAX_PROCESSES = 8
+# Longest label kept for a call in the timings report.
+MAX_LABEL_LENGTH = 72
+# Most bytes of output handed over at a time by stream().
+STREAM_CHUNK_BYTES = 1024 * 1024
+
+
+class CommandTimeout(subprocess.CalledProcessError):
+    """Raised when a command runs past its timeout. The process has been killed.
+
+    It is a CalledProcessError, so callers that already handle failed commands
+    report a timeout the same way.
+    """
+
+    def __init__(self, cmd, timeout: float, output=None, stderr=None):
+        super().__init__(-1, cmd, output, stderr or f"Timed out after {timeout:g}s")
+        self.timeout = timeout
+
+    def __str__(self):
+        return f"Command '{_label(self.cmd)}' timed out after {self.timeout:g} seconds"
+
+
+@dataclass
+class CallTiming:
+    label: str
+    seconds: float
+    # "exit 0", "HTTP 200", "timeout", "not found", ...
+    outcome: str
+
+
+_timings: list[CallTiming] = []
+_timings_lock = threading.Lock()
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _env_number(name: str, default, cast):
+    value = os.environ.get(name)
+    if value:
+        try:
+            number = cast(value)
+            if number > 0:
+                return number
+        except ValueError:
+            pass
+        print(f"Warning: Ignoring invalid {name} value: {value}")
+    return default
+
+
+def default_timeout() -> float:
+    return _env_number("AUTOPR_COMMAND_TIMEOUT", DEFAULT_COMMAND_TIMEOUT, float)
+
+
+def _get_slots() -> threading.BoundedSemaphore:
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(
+                _env_number("AUTOPR_MAX_PROCESSES", DEFAULT_MAX_PROCESSES, int)
+            )
+        return _slots
+
+
+def process_slot() -> threading.BoundedSemaphore:
+    """One of the AUTOPR_MAX_PROCESSES slots, for `with`; for processes not started by run().
+
+    Hold it while such a process does work, so it counts against the same cap.
+    """
+    return _get_slots()
+
+
+def _label(cmd) -> str:
+    label = (
+        " ".join(str(part) for part in cmd)
+        if isinstance(cmd, (list, tuple))
+        else str(cmd)
+    )
+    label = " ".join(label.split())  # Multi-line arguments such as commit messages
+    return (
+        label
+        if len(label) <= MAX_LABEL_LENGTH
+        else label[: MAX_LABEL_LENGTH - 3] + "..."
+    )
+
+
+def record_timing(label: str, seconds: float, outcome: str) -> None:
+    """Adds a call to the timings report; for work that does not go through run()."""
+    with _timings_lock:
+        _timings.append(CallTiming(_label(label), seconds, outcome))
+
+
+def get_timings() -> list[CallTiming]:
+    with _timings_lock:
+        return list(_timings)
+
+
+def reset_timings() -> None:
+    with _timings_lock:
+        _timings.clear()
+
+
+def run(
+    cmd: list[str],
+    *,
+    check: bool = False,
+    timeout: float | None = None,
+    capture_output: bool = True,
+    text: bool = True,
+    **kwargs,
+) -> subprocess.CompletedProcess:
+    """Runs a command like subprocess.run, with stdin closed and a timeout.
+
+    timeout defaults to default_timeout(). stdin is only left open when input is
+    given. Raises CommandTimeout (a CalledProcessError) if the command takes too
+    long, and otherwise raises what subprocess.run raises.
+    """
+    if timeout is None:
+        timeout = default_timeout()
+    if "input" not in kwargs:
+        kwargs.setdefault("stdin", subprocess.DEVNULL)
+
+    with _get_slots():
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = subprocess.run(
+                cmd,
+                capture_output=capture_output,
+                text=text,
+                check=check,
+                timeout=timeout,
+                **kwargs,
+            )
+            outcome = f"exit {result.returncode}"
+            return result
+        except subprocess.TimeoutExpired as e:
+            outcome = "timeout"
+            raise CommandTimeout(cmd, timeout, e.output, e.stderr) from e
+        except subprocess.CalledProcessError as e:
+            outcome = f"exit {e.returncode}"
+            raise
+        except FileNotFoundError:
+            outcome = "not found"
+            raise
+        finally:
+            record_timing(_label(cmd), time.perf_counter() - started, outcome)
+
+
+def stream(
+    cmd: list[str], on_chunk, *, timeout: float | None = None, **kwargs
+) -> subprocess.CompletedProcess:
+    """Runs a command and passes its stdout to on_chunk, as bytes, while it runs.
+
+    For output too large to hold in memory: nothing but the current chunk is kept.
+    stderr is collected in a temporary file and returned as text (stdout is None).
+    Applies the same timeout, process cap and timings as run(), but does not raise
+    for a non-zero exit status.
+    """
+    import tempfile
+
+    if timeout is None:
+        timeout = default_timeout()
+
+    with _get_slots():
+        started = time.perf_counter()
+        outcome = "error"
+        timed_out = threading.Event()
+        try:
+            with tempfile.TemporaryFile() as stderr:
+                try:
+                    process = subprocess.Popen(
+                        cmd,
+                        stdin=subprocess.DEVNULL,
+                        stdout=subprocess.PIPE,
+                        stderr=stderr,
+                        **kwargs,
+                    )
+                except FileNotFoundError:
+                    outcome = "not found"
+                    raise
+
+                def kill():
+                    if process.poll() is None:
+                        timed_out.set()
+                        process.kill()
+
+                timer = threading.Timer(timeout, kill)
+                timer.start()
+                try:
+                    with process.stdout:
+                        while chunk := process.stdout.read1(STREAM_CHUNK_BYTES):
+                            on_chunk(chunk)
+                    returncode = process.wait()
+                finally:
+                    timer.cancel()
+                    if process.poll() is None:  # on_chunk raised
+                        process.kill()
+                        process.wait()
+
+                stderr.seek(0)
+                error_text = stderr.read().decode("utf-8", errors="replace")
+            if timed_out.is_set():
+                outcome = "timeout"
+                raise CommandTimeout(cmd, timeout, None, error_text or None)
+            outcome = f"exit {returncode}"
+            return subprocess.CompletedProcess(cmd, returncode, None, error_text)
+        finally:
+            record_timing(_label(cmd), time.perf_counter() - started, outcome)
+
+
+def run_concurrently(
+    commands: list[list[str]], max_workers: int | None = None, **kwargs
+) -> list:
+    """Runs several commands at the same time, each as run(cmd, **kwargs) would.
+
+    Returns one entry per command, in order: its CompletedProcess, or the exception
+    it raised. The process cap of run() still applies.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not commands:
+        return []
+
+    def run_one(cmd):
+        try:
+            return run(cmd, **kwargs)
+        except (subprocess.SubprocessError, OSError) as e:
+            return e
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers or min(len(commands), DEFAULT_MAX_PROCESSES)
+    ) as pool:
+        return list(pool.map(run_one, commands))
+
+
+def format_timings(total_seconds: float | None = None) -> str:
+    """The timings report: one line per call in the order they finished, then totals."""
+    timings = get_timings()
+    lines = []
+    if total_seconds is None:
+        lines.append("Timings:")
+    else:
+        lines.append(f"Timings (wall time {total_seconds:.2f}s):")
+    for timing in timings:
+        lines.append(f"  {timing.seconds:7.3f}s  {timing.outcome:<10} {timing.label}")
+    busy = sum(timing.seconds for timing in timings)
+    lines.append(f"  {busy:7.3f}s  in {len(timings)} git/GitHub call(s)")
+    if total_seconds is not None:
+        # Calls can overlap, so this is only a lower bound when they ran concurrently.
+        lines.append(
+            f"  {max(total_seconds - busy, 0.0):7.3f}s  elsewhere (AI requests, local work)"
+        )
+    return "\n".join(lines)
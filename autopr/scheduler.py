@@ -0,0 +1,254 @@
+# autopr/scheduler.py
+# Smooths OpenAI traffic instead of failing on the first 429 or 5xx. Every AI call goes
+# through one RequestScheduler, which waits for room in a requests-per-minute and a
+# tokens-per-minute budget, retries transient errors with exponential backoff and jitter
+# (honouring Retry-After), and gives up once the command's deadline has passed.
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+
+from .diff_utils import estimate_tokens
+
+# Defaults match a modest OpenAI usage tier. Override with the environment variables below.
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 30000
+# Total time a single command may spend waiting on and retrying AI calls.
+DEFAULT_DEADLINE_SECONDS = 120.0
+DEFAULT_MAX_RETRIES = 6
+BASE_RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors.
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an AI call cannot be made or retried before the command deadline."""
+
+
+def _env_number(name: str, default, cast):
+    value = os.environ.get(name)
+    if value:
+        try:
+            number = cast(value)
+            if number > 0:
+                return number
+        except ValueError:
+            pass
+        print(f"Warning: Ignoring invalid {name} value: {value}")
+    return default
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at capacity per minute.
+
+    reserve() never blocks: it takes the tokens right away, letting the bucket go into
+    debt, and returns how long the caller must wait before the reservation is honoured.
+    This keeps the bucket usable from threads and event loops alike.
+    """
+
+    def __init__(self, per_minute: float, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Takes amount tokens and returns the number of seconds to wait before using them."""
+        # A single request larger than the whole bucket would otherwise never fit.
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Gives back tokens taken by a reservation that will not be used."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns True for errors that are likely to go away if the request is repeated."""
+    import openai
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.RateLimitError):
+        # Running out of credits is reported as a 429 too, but waiting will not fix it.
+        return getattr(error, "code", None) != "insufficient_quota"
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def get_retry_after(error: Exception) -> float | None:
+    """Returns the delay requested by the server's Retry-After headers, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value:
+            return max(float(value) / 1000.0, 0.0)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            import email.utils  # HTTP-date form, rare enough to not import at startup
+
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(retry_at.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def estimate_request_tokens(request: dict) -> int:
+    """Estimates the tokens a chat completion request counts against the TPM limit."""
+    prompt_tokens = estimate_tokens(json.dumps(request.get("messages", [])))
+    return prompt_tokens + request.get("max_tokens", 0)
+
+
+class RequestScheduler:
+    """Rate limits and retries AI requests against a per-command deadline.
+
+    The deadline starts with the first request after reset_deadline(), so callers
+    scope it to one command (or one PR of a batch review). It only bounds time
+    spent waiting: a call that does not have to wait is never refused.
+
+    The deadline belongs to the context reset_deadline() was called in, so each
+    thread of a batch review has its own; asyncio tasks started from that context
+    share it.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        deadline_seconds: float = DEFAULT_DEADLINE_SECONDS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute, clock)
+        self.token_bucket = TokenBucket(tokens_per_minute, clock)
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        # Holds a one-item list, [deadline or None], so tasks copying the context share it.
+        self._deadline = contextvars.ContextVar("autopr_ai_deadline", default=None)
+        self._shared_deadline = [None]  # For callers that never reset the deadline
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RequestScheduler":
+        """Builds a scheduler from AUTOPR_OPENAI_RPM, AUTOPR_OPENAI_TPM and AUTOPR_AI_DEADLINE."""
+        return cls(
+            requests_per_minute=_env_number(
+                "AUTOPR_OPENAI_RPM", DEFAULT_REQUESTS_PER_MINUTE, int
+            ),
+            tokens_per_minute=_env_number(
+                "AUTOPR_OPENAI_TPM", DEFAULT_TOKENS_PER_MINUTE, int
+            ),
+            deadline_seconds=_env_number(
+                "AUTOPR_AI_DEADLINE", DEFAULT_DEADLINE_SECONDS, float
+            ),
+        )
+
+    def reset_deadline(self) -> None:
+        """Starts a new deadline with the next request made from the current context."""
+        self._deadline.set([None])
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline, starting the deadline if needed."""
+        deadline = self._deadline.get() or self._shared_deadline
+        with self._lock:
+            if deadline[0] is None:
+                deadline[0] = self._clock() + self.deadline_seconds
+            return deadline[0] - self._clock()
+
+    def _admission_delay(self, estimated_tokens: int) -> float:
+        remaining = self.remaining()  # Starts the deadline with the first request
+        delay = max(
+            self.request_bucket.reserve(1),
+            self.token_bucket.reserve(estimated_tokens),
+        )
+        if delay > 0 and delay > remaining:
+            # The request is not made, so leave its share of the budget to others.
+            self.request_bucket.refund(1)
+            self.token_bucket.refund(estimated_tokens)
+            raise DeadlineExceeded(
+                f"Rate limit wait of {delay:.1f}s would exceed the {self.deadline_seconds:.0f}s deadline"
+            )
+        return delay
+
+    def _backoff_delay(self, error: Exception, attempt: int) -> float | None:
+        """Returns how long to wait before retrying, or None if the error should be raised."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = get_retry_after(error)
+        if delay is None:
+            # Exponential backoff with full jitter.
+            delay = random.uniform(
+                0, min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2**attempt)
+            )
+        if delay > 0 and delay > self.remaining():
+            return None
+        print(
+            f"OpenAI request failed ({error.__class__.__name__}), retrying in {delay:.1f}s "
+            f"(attempt {attempt + 2} of {self.max_retries + 1})..."
+        )
+        return delay
+
+    def call(self, func, estimated_tokens: int = 0):
+        """Calls func() once the rate limits allow it, retrying transient errors.
+
+        The last error is re-raised when retries run out or the deadline would be missed.
+        """
+        attempt = 0
+        while True:
+            delay = self._admission_delay(estimated_tokens)
+            if delay:
+                self._sleep(delay)
+            try:
+                return func()
+            except Exception as e:
+                delay = self._backoff_delay(e, attempt)
+                if delay is None:
+                    raise
+                self._sleep(delay)
+                attempt += 1
+
+    async def call_async(self, coro_func, estimated_tokens: int = 0):
+        """Coroutine version of call(): awaits coro_func() under the same limits."""
+        import asyncio
+
+        attempt = 0
+        while True:
+            delay = self._admission_delay(estimated_tokens)
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                return await coro_func()
+            except Exception as e:
+                delay = self._backoff_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
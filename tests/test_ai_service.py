@@ -3,13 +3,142 @@ from unittest.mock import patch, Mock, MagicMock
 import openai  # Import openai for its error classes
 import os  # Keep os if OPENAI_API_KEY is checked directly, otherwise remove if not used elsewhere.
 import re  # Keep for regex in cleaning, or remove if cleaning logic changes.
-
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from autopr import ai_service
+from autopr.commit_log import CommitRecord
+from autopr.diff_utils import FileStat
+from autopr.scheduler import RequestScheduler
 from autopr.ai_service import (
     get_commit_message_suggestion,
     get_pr_description_suggestion,
     get_pr_review_suggestions,
 )  # Import new function
 
+# Most tests here reuse the same inputs with different mocked responses, so the
+# on-disk suggestion cache is disabled for the module. TestSuggestionCache turns it back on.
+_cache_env_patcher = patch.dict(os.environ, {"AUTOPR_NO_CACHE": "1"})
+# Keep the shared rate limiter from slowing down tests that make many calls.
+_scheduler_patcher = patch(
+    "autopr.ai_service._scheduler",
+    RequestScheduler(requests_per_minute=10**9, tokens_per_minute=10**12),
+)
+
+
+def setUpModule():
+    _cache_env_patcher.start()
+    _scheduler_patcher.start()
+
+
+def tearDownModule():
+    _cache_env_patcher.stop()
+    _scheduler_patcher.stop()
+
+
+class TestLazyClient(unittest.TestCase):
+    @patch("autopr.ai_service.client", ai_service._UNINITIALIZED)
+    @patch("openai.OpenAI")
+    def test_client_created_once_on_first_use(self, mock_openai_cls):
+        first = ai_service._get_client()
+        second = ai_service._get_client()
+        self.assertIs(first, mock_openai_cls.return_value)
+        self.assertIs(second, first)
+        mock_openai_cls.assert_called_once_with(max_retries=0)
+
+    @patch("autopr.ai_service.client", ai_service._UNINITIALIZED)
+    @patch("openai.OpenAI")
+    @patch("builtins.print")
+    def test_client_creation_failure(self, mock_print, mock_openai_cls):
+        mock_openai_cls.side_effect = openai.OpenAIError("Missing credentials")
+        self.assertIsNone(ai_service._get_client())
+        self.assertIsNone(ai_service._get_client())
+        mock_openai_cls.assert_called_once_with(max_retries=0)
+        mock_print.assert_any_call("OpenAI SDK Initialization Error: Missing credentials")
+
+    @patch("autopr.ai_service.client", ai_service._UNINITIALIZED)
+    @patch("openai.OpenAI")
+    def test_client_not_created_for_empty_input(self, mock_openai_cls):
+        get_commit_message_suggestion("")
+        mock_openai_cls.assert_not_called()
+
+
+class _FakeOpenAI(ThreadingHTTPServer):
+    """A local stand-in for the OpenAI API that records request paths and connections."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _FakeOpenAIHandler)
+        self.paths = []
+        self.connections = 0
+
+    def get_request(self):
+        self.connections += 1
+        return super().get_request()
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.server.paths.append(self.path)
+        if self.path.startswith("/v1/models/"):
+            payload = {"id": self.path.rsplit("/", 1)[1], "object": "model", "created": 0, "owned_by": "openai"}
+        else:
+            payload = {
+                "id": "c1", "object": "chat.completion", "created": 0, "model": "m",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+            }
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class TestWarmClient(unittest.TestCase):
+    def test_opens_the_connection_the_first_call_reuses(self):
+        server = _FakeOpenAI()
+        threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        real_client = openai.OpenAI(
+            api_key="k", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", max_retries=0
+        )
+        self.addCleanup(real_client.close)
+
+        with patch("autopr.ai_service.client", real_client):
+            ai_service.warm_client()
+            real_client.chat.completions.create(model="m", messages=[{"role": "user", "content": "hi"}])
+
+        self.assertEqual(server.paths, [f"/v1/models/{ai_service.PR_DESCRIPTION_MODEL}", "/v1/chat/completions"])
+        self.assertEqual(server.connections, 1)
+
+    @patch("autopr.ai_service.client")
+    def test_errors_are_ignored(self, mock_client):
+        mock_client.with_options.return_value.models.retrieve.side_effect = openai.APIConnectionError(
+            request=Mock()
+        )
+        ai_service.warm_client()
+        mock_client.with_options.assert_called_once_with(timeout=ai_service.WARM_UP_TIMEOUT_SECONDS)
+
+    @patch("autopr.ai_service.client", None)
+    def test_nothing_to_warm_without_a_client(self):
+        ai_service.warm_client()
+
 
 class TestGetCommitMessageSuggestion(unittest.TestCase):
 
@@ -187,6 +316,43 @@ class TestGetPrDescriptionSuggestion(unittest.TestCase):
             "Issue #", called_kwargs["messages"][1]["content"]
         )  # Ensure issue details are not in prompt
 
+    @patch("autopr.ai_service.client")
+    def test_issue_and_diffstat_added_to_prompt(self, mock_openai_client):
+        mock_completion_choice = MagicMock()
+        mock_completion_choice.message.content = "Title\nBody"
+        mock_openai_client.chat.completions.create.return_value = MagicMock(
+            choices=[mock_completion_choice]
+        )
+        issue = {"number": 12, "title": "Login fails", "body": "Steps to reproduce..."}
+        diffstat = "\n".join(f" f{i}.py | 1 +" for i in range(60)) + "\n 60 files changed"
+
+        get_pr_description_suggestion(["fix: login"], issue=issue, diffstat=diffstat)
+
+        prompt = mock_openai_client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        self.assertIn("Issue #12: Login fails", prompt)
+        self.assertIn("Steps to reproduce...", prompt)
+        self.assertIn("Closes #12", prompt)
+        self.assertIn(" f0.py | 1 +", prompt)
+        self.assertNotIn(" f59.py | 1 +", prompt)
+        self.assertIn(" 60 files changed", prompt)
+
+    @patch("autopr.ai_service.client")
+    def test_commit_bodies_and_files_added_to_prompt(self, mock_openai_client):
+        mock_completion_choice = MagicMock()
+        mock_completion_choice.message.content = "Title\nBody"
+        mock_openai_client.chat.completions.create.return_value = MagicMock(
+            choices=[mock_completion_choice]
+        )
+        commit = CommitRecord("abcdef1234", "fix: login", "Tokens expired too early.", "Ada")
+        commit.add_file(FileStat("auth.py", 4, 2))
+
+        get_pr_description_suggestion([commit])
+
+        prompt = mock_openai_client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        self.assertIn("- fix: login (abcdef1, Ada)", prompt)
+        self.assertIn("  Tokens expired too early.", prompt)
+        self.assertIn("auth.py +4 -2", prompt)
+
     @patch("autopr.ai_service.client")
     def test_get_pr_description_no_commit_messages(self, mock_openai_client):
         title, body = get_pr_description_suggestion([])
@@ -481,5 +647,156 @@ class TestGetPrReviewSuggestions(unittest.TestCase):
         self.assertEqual(len(suggestions), 0) # Empty list is valid
 
 
+def _stream_chunks(*pieces):
+    """Builds streamed completion chunks as returned by create(..., stream=True)."""
+    return [
+        MagicMock(choices=[MagicMock(delta=MagicMock(content=piece))])
+        for piece in pieces
+    ]
+
+
+class TestStreamingSuggestions(unittest.TestCase):
+    @patch("autopr.ai_service.client")
+    def test_commit_message_streamed_without_fences(self, mock_openai_client):
+        mock_openai_client.chat.completions.create.return_value = _stream_chunks(
+            "``", "`text\nfeat: add", " streaming", None, "\n``", "`"
+        )
+        received = []
+
+        suggestion = get_commit_message_suggestion(
+            "some diff", stream=True, on_token=received.append
+        )
+
+        self.assertEqual(suggestion, "feat: add streaming")
+        self.assertEqual("".join(received), "feat: add streaming")
+        self.assertTrue(mock_openai_client.chat.completions.create.call_args[1]["stream"])
+
+    @patch("autopr.ai_service.client")
+    def test_commit_message_stream_keeps_inner_backticks(self, mock_openai_client):
+        mock_openai_client.chat.completions.create.return_value = _stream_chunks(
+            "fix: handle `None` in ", "`parse`"
+        )
+        received = []
+
+        suggestion = get_commit_message_suggestion(
+            "some diff", stream=True, on_token=received.append
+        )
+
+        self.assertEqual("".join(received), "fix: handle `None` in `parse`")
+        self.assertEqual(suggestion, "fix: handle `None` in `parse`")
+
+    @patch("builtins.print")
+    @patch("autopr.ai_service.client")
+    def test_commit_message_stream_api_error(self, mock_openai_client, mock_print):
+        mock_openai_client.chat.completions.create.side_effect = openai.APIError(
+            "API connection error", request=None, body=None
+        )
+
+        suggestion = get_commit_message_suggestion("some diff", stream=True)
+
+        self.assertEqual(suggestion, "[Error communicating with OpenAI API]")
+
+    @patch("autopr.ai_service.client")
+    def test_pr_description_streamed(self, mock_openai_client):
+        mock_openai_client.chat.completions.create.return_value = _stream_chunks(
+            '"AI PR', ' Title"\n', "```markdown\n- Adds", " X\n", "```"
+        )
+        received = []
+
+        title, body = get_pr_description_suggestion(
+            ["feat: implement X"], stream=True, on_token=received.append
+        )
+
+        self.assertEqual((title, body), ("AI PR Title", "- Adds X"))
+        self.assertEqual("".join(received), "AI PR Title\n- Adds X")
+
+
+class TestSuggestionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        env_patcher = patch.dict(
+            os.environ, {"AUTOPR_NO_CACHE": "", "AUTOPR_CACHE_DIR": self.tmp_dir.name}
+        )
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    @patch("autopr.ai_service.client")
+    def test_commit_message_cached_on_second_call(self, mock_openai_client):
+        mock_completion = Mock(message=Mock(content="feat: cached message"))
+        mock_openai_client.chat.completions.create.return_value = Mock(
+            choices=[mock_completion]
+        )
+
+        first = get_commit_message_suggestion("diff to cache")
+        second = get_commit_message_suggestion("diff to cache")
+
+        self.assertEqual(first, "feat: cached message")
+        self.assertEqual(second, "feat: cached message")
+        mock_openai_client.chat.completions.create.assert_called_once()
+
+    @patch("autopr.ai_service.client")
+    def test_different_input_is_a_cache_miss(self, mock_openai_client):
+        mock_completion = Mock(message=Mock(content="feat: message"))
+        mock_openai_client.chat.completions.create.return_value = Mock(
+            choices=[mock_completion]
+        )
+
+        get_commit_message_suggestion("first diff")
+        get_commit_message_suggestion("second diff")
+
+        self.assertEqual(mock_openai_client.chat.completions.create.call_count, 2)
+
+    @patch("autopr.ai_service.client")
+    def test_issue_is_part_of_cache_key(self, mock_openai_client):
+        mock_completion_choice = MagicMock()
+        mock_completion_choice.message.content = "Title\nBody"
+        mock_openai_client.chat.completions.create.return_value = MagicMock(
+            choices=[mock_completion_choice]
+        )
+
+        get_pr_description_suggestion(["feat: one"])
+        get_pr_description_suggestion(["feat: one"], issue={"number": 1, "title": "t"})
+
+        self.assertEqual(mock_openai_client.chat.completions.create.call_count, 2)
+
+    @patch("autopr.ai_service.client")
+    def test_cache_hit_does_not_need_client(self, mock_openai_client):
+        mock_completion = MagicMock()
+        mock_completion.message.content = "Cached Title\nCached Body"
+        mock_openai_client.chat.completions.create.return_value = MagicMock(
+            choices=[mock_completion]
+        )
+        get_pr_description_suggestion(["feat: one"])
+
+        with patch("autopr.ai_service.client", None):
+            title, body = get_pr_description_suggestion(["feat: one"])
+        self.assertEqual((title, body), ("Cached Title", "Cached Body"))
+
+    @patch("autopr.ai_service.client")
+    def test_errors_are_not_cached(self, mock_openai_client):
+        mock_openai_client.chat.completions.create.side_effect = openai.APIError(
+            "API connection error", request=None, body=None
+        )
+        with patch("builtins.print"):
+            get_pr_review_suggestions("some diff")
+
+        mock_openai_client.chat.completions.create.side_effect = None
+        mock_completion = MagicMock(
+            message=MagicMock(
+                content='[{"path": "file.py", "line": 1, "suggestion": "Fix"}]'
+            )
+        )
+        mock_openai_client.chat.completions.create.return_value = MagicMock(
+            choices=[mock_completion]
+        )
+        suggestions = get_pr_review_suggestions("some diff")
+        self.assertEqual(suggestions[0]["path"], "file.py")
+
+        # Now a successful answer is cached
+        get_pr_review_suggestions("some diff")
+        self.assertEqual(mock_openai_client.chat.completions.create.call_count, 2)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+from unittest.mock import patch, AsyncMock, MagicMock
+import asyncio
+import os
+
+import openai
+
+from autopr.scheduler import RequestScheduler
+from autopr.async_ai_service import (
+    BoundedExecutor,
+    get_commit_message_suggestion_async,
+    get_pr_description_suggestion_async,
+    get_pr_review_suggestions_async,
+    run_bounded,
+)
+
+_cache_env_patcher = patch.dict(os.environ, {"AUTOPR_NO_CACHE": "1"})
+# Keep the shared rate limiter from slowing down tests that make many calls.
+_scheduler_patcher = patch(
+    "autopr.ai_service._scheduler",
+    RequestScheduler(requests_per_minute=10**9, tokens_per_minute=10**12),
+)
+
+
+def setUpModule():
+    _cache_env_patcher.start()
+    _scheduler_patcher.start()
+
+
+def tearDownModule():
+    _cache_env_patcher.stop()
+    _scheduler_patcher.stop()
+
+
+def _mock_async_client(content: str):
+    async_client = MagicMock()
+    async_client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+    )
+    return async_client
+
+
+class TestAsyncSuggestions(unittest.IsolatedAsyncioTestCase):
+    async def test_commit_message_cleaned(self):
+        async_client = _mock_async_client("```feat: async message```")
+        with patch(
+            "autopr.async_ai_service._get_async_client", return_value=async_client
+        ):
+            suggestion = await get_commit_message_suggestion_async("some diff")
+        self.assertEqual(suggestion, "feat: async message")
+        async_client.chat.completions.create.assert_awaited_once()
+        kwargs = async_client.chat.completions.create.call_args[1]
+        self.assertIn("some diff", kwargs["messages"][1]["content"])
+
+    async def test_commit_message_no_diff(self):
+        suggestion = await get_commit_message_suggestion_async("")
+        self.assertEqual(suggestion, "[No diff provided to generate commit message.]")
+
+    async def test_commit_message_client_not_initialized(self):
+        with patch("autopr.async_ai_service._get_async_client", return_value=None):
+            suggestion = await get_commit_message_suggestion_async("some diff")
+        self.assertEqual(suggestion, "[OpenAI client not initialized. Check API key.]")
+
+    @patch("builtins.print")
+    async def test_commit_message_api_error(self, mock_print):
+        async_client = MagicMock()
+        async_client.chat.completions.create = AsyncMock(
+            side_effect=openai.APIError("API connection error", request=None, body=None)
+        )
+        with patch(
+            "autopr.async_ai_service._get_async_client", return_value=async_client
+        ):
+            suggestion = await get_commit_message_suggestion_async("some diff")
+        self.assertEqual(suggestion, "[Error communicating with OpenAI API]")
+
+    async def test_pr_description(self):
+        async_client = _mock_async_client('"Title"\n```\nBody text\n```')
+        with patch(
+            "autopr.async_ai_service._get_async_client", return_value=async_client
+        ):
+            title, body = await get_pr_description_suggestion_async(["feat: one"])
+        self.assertEqual((title, body), ("Title", "Body text"))
+
+    async def test_pr_review(self):
+        async_client = _mock_async_client(
+            '{"suggestions": [{"path": "a.py", "line": "3", "suggestion": "Check None."}]}'
+        )
+        with patch(
+            "autopr.async_ai_service._get_async_client", return_value=async_client
+        ):
+            suggestions = await get_pr_review_suggestions_async("some diff")
+        self.assertEqual(
+            suggestions, [{"path": "a.py", "line": 3, "suggestion": "Check None."}]
+        )
+
+    @patch("builtins.print")
+    async def test_pr_review_json_error(self, mock_print):
+        async_client = _mock_async_client("not json")
+        with patch(
+            "autopr.async_ai_service._get_async_client", return_value=async_client
+        ):
+            suggestions = await get_pr_review_suggestions_async("some diff")
+        self.assertEqual(suggestions[0]["suggestion"], "[AI JSON parsing error]")
+        mock_print.assert_any_call("Raw response was: not json")
+
+
+class TestBoundedExecutor(unittest.IsolatedAsyncioTestCase):
+    async def test_limits_concurrency_and_keeps_order(self):
+        in_flight = 0
+        peak = 0
+
+        async def work(item):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return item * 2
+
+        results = await BoundedExecutor(3).map(work, range(10))
+
+        self.assertEqual(results, [i * 2 for i in range(10)])
+        self.assertEqual(peak, 3)
+
+    def test_rejects_zero_concurrency(self):
+        with self.assertRaises(ValueError):
+            BoundedExecutor(0)
+
+
+class TestRunBounded(unittest.TestCase):
+    def test_runs_on_fresh_loop(self):
+        async def square(item):
+            await asyncio.sleep(0)
+            return item * item
+
+        self.assertEqual(run_bounded(square, [1, 2, 3], max_concurrency=2), [1, 4, 9])
+
+
+if __name__ == "__main__":
+    unittest.main()
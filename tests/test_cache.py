@@ -0,0 +1,178 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+import threading
+import time
+
+from autopr import cache
+from autopr.cache import (
+    clear_cache,
+    get_cache_stats,
+    get_cached,
+    make_cache_key,
+    prune_cache,
+    set_cached,
+)
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        env_patcher = patch.dict(
+            os.environ,
+            {
+                "AUTOPR_CACHE_DIR": self.tmp_dir.name,
+                "AUTOPR_NO_CACHE": "",
+                "AUTOPR_CACHE_MAX_BYTES": "",
+            },
+        )
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+
+class TestMakeCacheKey(unittest.TestCase):
+    def test_same_input_same_key(self):
+        self.assertEqual(
+            make_cache_key("commit_message", "diff", "model", "1"),
+            make_cache_key("commit_message", "diff", "model", "1"),
+        )
+
+    def test_key_depends_on_every_component(self):
+        base = make_cache_key("commit_message", "diff", "model", "1")
+        self.assertNotEqual(base, make_cache_key("pr_review", "diff", "model", "1"))
+        self.assertNotEqual(
+            base, make_cache_key("commit_message", "diff2", "model", "1")
+        )
+        self.assertNotEqual(
+            base, make_cache_key("commit_message", "diff", "model2", "1")
+        )
+        self.assertNotEqual(
+            base, make_cache_key("commit_message", "diff", "model", "2")
+        )
+
+    def test_list_payload(self):
+        key = make_cache_key("pr_description", ["feat: a", "fix: b"], "model", "1")
+        self.assertEqual(len(key), 64)
+
+
+class TestGetSetCached(CacheTestCase):
+    def test_round_trip(self):
+        key = make_cache_key("commit_message", "diff", "model", "1")
+        self.assertIsNone(get_cached(key))
+        set_cached(key, "feat: something")
+        self.assertEqual(get_cached(key), "feat: something")
+
+    def test_round_trip_structured_value(self):
+        key = make_cache_key("pr_review", "diff", "model", "1")
+        value = [{"path": "a.py", "line": 3, "suggestion": "Rename this."}]
+        set_cached(key, value)
+        self.assertEqual(get_cached(key), value)
+
+    def test_disabled_cache_never_hits(self):
+        key = make_cache_key("commit_message", "diff", "model", "1")
+        set_cached(key, "feat: something")
+        with patch.dict(os.environ, {"AUTOPR_NO_CACHE": "1"}):
+            self.assertIsNone(get_cached(key))
+
+    def test_corrupt_entry_is_dropped(self):
+        key = make_cache_key("commit_message", "diff", "model", "1")
+        set_cached(key, "feat: something")
+        entry_path = os.path.join(self.tmp_dir.name, key[:2], f"{key}.json")
+        with open(entry_path, "w") as f:
+            f.write("{not json")
+        self.assertIsNone(get_cached(key))
+        self.assertFalse(os.path.exists(entry_path))
+
+
+class TestPruneAndClear(CacheTestCase):
+    def _entry_path(self, key):
+        return os.path.join(self.tmp_dir.name, key[:2], f"{key}.json")
+
+    def test_prune_evicts_least_recently_used(self):
+        keys = [
+            make_cache_key("commit_message", f"diff {i}", "model", "1")
+            for i in range(3)
+        ]
+        now = time.time()
+        for i, key in enumerate(keys):
+            set_cached(key, "x" * 100)
+            os.utime(self._entry_path(key), (now - 100 + i, now - 100 + i))
+
+        # Reading the oldest entry makes it the most recently used one.
+        get_cached(keys[0])
+        sizes = [os.path.getsize(self._entry_path(key)) for key in keys]
+
+        removed, freed = prune_cache(max_bytes=sizes[0] + sizes[2])
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(freed, sizes[1])
+        self.assertIsNotNone(get_cached(keys[0]))
+        self.assertIsNone(get_cached(keys[1]))
+        self.assertIsNotNone(get_cached(keys[2]))
+
+    def test_set_cached_enforces_size_cap(self):
+        with patch.dict(os.environ, {"AUTOPR_CACHE_MAX_BYTES": "1"}):
+            set_cached(make_cache_key("commit_message", "diff", "model", "1"), "value")
+        self.assertEqual(get_cache_stats()["entries"], 0)
+
+    def test_set_cached_prunes_on_first_write_then_now_and_then(self):
+        with patch("autopr.cache.prune_cache", wraps=prune_cache) as mock_prune:
+            for i in range(cache.PRUNE_EVERY_WRITES + 1):
+                set_cached(
+                    make_cache_key("commit_message", f"diff {i}", "model", "1"), "value"
+                )
+        # The first write, then the PRUNE_EVERY_WRITES-th one after it.
+        self.assertEqual(mock_prune.call_count, 2)
+
+    def test_set_cached_prunes_once_enough_bytes_are_written(self):
+        with patch.dict(os.environ, {"AUTOPR_CACHE_MAX_BYTES": "2000"}), patch(
+            "autopr.cache.prune_cache", wraps=prune_cache
+        ) as mock_prune:
+            set_cached(make_cache_key("commit_message", "a", "model", "1"), "x")
+            set_cached(make_cache_key("commit_message", "b", "model", "1"), "x")
+            self.assertEqual(mock_prune.call_count, 1)
+            set_cached(make_cache_key("commit_message", "c", "model", "1"), "x" * 300)
+            self.assertEqual(mock_prune.call_count, 2)
+
+    def test_concurrent_writes_of_one_key(self):
+        key = make_cache_key("pr_review", "diff", "model", "1")
+        threads = [
+            threading.Thread(target=set_cached, args=(key, f"value {i}"))
+            for i in range(8)
+        ]
+        with patch("builtins.print") as mock_print:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        mock_print.assert_not_called()
+        self.assertTrue(get_cached(key).startswith("value "))
+        bucket = os.path.join(self.tmp_dir.name, key[:2])
+        self.assertEqual(os.listdir(bucket), [f"{key}.json"])
+
+    def test_clear_and_stats(self):
+        set_cached(make_cache_key("commit_message", "a", "model", "1"), "one")
+        set_cached(make_cache_key("commit_message", "b", "model", "1"), "two")
+
+        stats = get_cache_stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertGreater(stats["size_bytes"], 0)
+        self.assertEqual(stats["path"], self.tmp_dir.name)
+
+        self.assertEqual(clear_cache(), 2)
+        self.assertEqual(get_cache_stats()["entries"], 0)
+
+    def test_stats_on_missing_directory(self):
+        with patch.dict(
+            os.environ, {"AUTOPR_CACHE_DIR": os.path.join(self.tmp_dir.name, "missing")}
+        ):
+            stats = get_cache_stats()
+        self.assertEqual(stats["entries"], 0)
+        self.assertIsNone(stats["oldest"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,28 +1,46 @@
 import unittest
 from unittest.mock import patch, MagicMock, call
 import argparse
+import io
 import sys
+import threading
 
 from autopr.cli import (
     main as autopr_main,
     handle_commit_command,
     handle_pr_create_command,
+    handle_cache_command,
+    handle_review_command,
+    handle_batch_review_command,
+    ReviewResult,
+)
+from autopr.commit_log import CommitRecord
+from autopr.diff_spool import DiffSpool
+from autopr.diff_utils import DiffLineIndex, FileStat
+from autopr.github_service import PrContext, RepoContext
+from autopr.runner import record_timing
+
+
+NO_LS_FILTERS = dict(
+    labels=None, assignee=None, author=None, search=None, limit=None, as_json=False
 )
 
 
 class TestMainCLI(unittest.TestCase):
 
-    @patch("autopr.cli.list_issues")
-    @patch("autopr.cli.get_repo_from_git_config")
+    @patch("autopr.github_service.list_issues")
+    @patch("autopr.git_utils.get_repo_from_git_config")
     def test_ls_command_calls_list_issues(self, mock_get_repo, mock_list_issues):
         with patch.object(sys, "argv", ["autopr_cli", "ls"]):
             mock_get_repo.return_value = "owner/repo"
             autopr_main()
             mock_get_repo.assert_called_once()
-            mock_list_issues.assert_called_once_with(show_all_issues=False)
+            mock_list_issues.assert_called_once_with(
+                show_all_issues=False, offline=False, refresh=False, **NO_LS_FILTERS
+            )
 
-    @patch("autopr.cli.list_issues")
-    @patch("autopr.cli.get_repo_from_git_config")
+    @patch("autopr.github_service.list_issues")
+    @patch("autopr.git_utils.get_repo_from_git_config")
     def test_ls_command_all_calls_list_issues_all(
         self, mock_get_repo, mock_list_issues
     ):
@@ -30,10 +48,12 @@ class TestMainCLI(unittest.TestCase):
             mock_get_repo.return_value = "owner/repo"
             autopr_main()
             mock_get_repo.assert_called_once()
-            mock_list_issues.assert_called_once_with(show_all_issues=True)
+            mock_list_issues.assert_called_once_with(
+                show_all_issues=True, offline=False, refresh=False, **NO_LS_FILTERS
+            )
 
     @patch("builtins.print")
-    @patch("autopr.cli.get_repo_from_git_config")
+    @patch("autopr.git_utils.get_repo_from_git_config")
     def test_repo_detection_failure(self, mock_get_repo, mock_print):
         with patch.object(sys, "argv", ["autopr_cli", "ls"]):
             mock_get_repo.side_effect = FileNotFoundError(
@@ -42,11 +62,21 @@ class TestMainCLI(unittest.TestCase):
             autopr_main()
             mock_get_repo.assert_called_once()
             mock_print.assert_any_call(
-                "Error detecting repository: Mocked .git/config not found"
+                "Error detecting repository: Mocked .git/config not found", file=None
             )
 
-    @patch("autopr.cli.start_work_on_issue")
-    @patch("autopr.cli.get_repo_from_git_config")
+    @patch("autopr.git_utils.get_repo_from_git_config")
+    def test_repo_detection_failure_with_json(self, mock_get_repo):
+        mock_get_repo.side_effect = FileNotFoundError("Mocked .git/config not found")
+        with patch.object(sys, "argv", ["autopr_cli", "ls", "--json"]), \
+                patch("sys.stdout", new_callable=io.StringIO) as stdout, \
+                patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            autopr_main()
+        self.assertEqual(stdout.getvalue(), "[]\n")
+        self.assertIn("Error detecting repository", stderr.getvalue())
+
+    @patch("autopr.github_service.start_work_on_issue")
+    @patch("autopr.git_utils.get_repo_from_git_config")
     def test_workon_command_calls_start_work_on_issue_updated(
         self, mock_get_repo, mock_start_work_on_issue
     ):
@@ -54,7 +84,56 @@ class TestMainCLI(unittest.TestCase):
         mock_get_repo.return_value = "owner/repo"
         with patch.object(sys, "argv", ["autopr_cli", "workon", str(issue_number)]):
             autopr_main()
-        mock_start_work_on_issue.assert_called_once_with(issue_number, repo_path=".")
+        mock_start_work_on_issue.assert_called_once_with(
+            issue_number, repo_path=".", offline=False, refresh=False
+        )
+
+    @patch("autopr.github_service.list_issues")
+    @patch("autopr.git_utils.get_repo_from_git_config", return_value="owner/repo")
+    def test_ls_offline(self, mock_get_repo, mock_list_issues):
+        with patch.object(sys, "argv", ["autopr_cli", "ls", "--offline"]):
+            autopr_main()
+        mock_list_issues.assert_called_once_with(
+            show_all_issues=False, offline=True, refresh=False, **NO_LS_FILTERS
+        )
+
+    @patch("autopr.github_service.list_issues")
+    @patch("autopr.git_utils.get_repo_from_git_config", return_value="owner/repo")
+    def test_ls_filters(self, mock_get_repo, mock_list_issues):
+        argv = [
+            "autopr_cli", "ls", "-l", "bug", "--label", "p1", "--assignee", "ana",
+            "--author", "bo", "-S", "crash on start", "-L", "20", "--json",
+        ]
+        with patch.object(sys, "argv", argv), patch("builtins.print") as mock_print:
+            autopr_main()
+        mock_list_issues.assert_called_once_with(
+            show_all_issues=False, offline=False, refresh=False, labels=["bug", "p1"],
+            assignee="ana", author="bo", search="crash on start", limit=20, as_json=True,
+        )
+        mock_print.assert_not_called()  # Nothing but JSON on stdout
+
+    @patch("sys.stderr")
+    def test_ls_limit_must_be_positive(self, mock_stderr):
+        with patch.object(sys, "argv", ["autopr_cli", "ls", "--limit", "0"]):
+            with self.assertRaises(SystemExit):
+                autopr_main()
+
+    @patch("sys.stderr")
+    def test_offline_and_refresh_are_exclusive(self, mock_stderr):
+        with patch.object(sys, "argv", ["autopr_cli", "ls", "--offline", "--refresh"]):
+            with self.assertRaises(SystemExit):
+                autopr_main()
+
+    @patch("autopr.cli.handle_cache_command")
+    def test_timings_report_printed_to_stderr(self, mock_cache):
+        mock_cache.side_effect = lambda *args, **kwargs: record_timing("git status", 0.25, "exit 0")
+        stderr = io.StringIO()
+        with patch.object(sys, "argv", ["autopr_cli", "--timings", "cache", "stats"]), \
+                patch.object(sys, "stderr", stderr):
+            autopr_main()
+        report = stderr.getvalue()
+        self.assertIn("Timings (wall time", report)
+        self.assertIn("0.250s  exit 0     git status", report)
 
     @patch("builtins.print")
     def test_workon_command_invalid_issue_number(self, mock_print):
@@ -62,7 +141,7 @@ class TestMainCLI(unittest.TestCase):
             with self.assertRaises(SystemExit):
                 autopr_main()
 
-    @patch("autopr.cli.get_repo_from_git_config")
+    @patch("autopr.git_utils.get_repo_from_git_config")
     @patch("autopr.cli.handle_commit_command")
     def test_commit_command_calls_handle_commit(
         self, mock_handle_commit, mock_get_repo
@@ -71,12 +150,66 @@ class TestMainCLI(unittest.TestCase):
         with patch.object(sys, "argv", ["autopr_cli", "commit"]):
             autopr_main()
         mock_get_repo.assert_called_once()
-        mock_handle_commit.assert_called_once_with()
+        mock_handle_commit.assert_called_once_with(token_budget=None, stream=False)
+
+    @patch("autopr.cli.handle_pr_create_command")
+    @patch("autopr.git_utils.get_repo_from_git_config")
+    def test_pr_command_uses_default_base(self, mock_get_repo, mock_handle_pr_create):
+        mock_get_repo.return_value = "owner/repo"
+        with patch.object(sys, "argv", ["autopr_cli", "pr"]):
+            autopr_main()
+        mock_get_repo.assert_called_once()
+        mock_handle_pr_create.assert_called_once_with(
+            base_branch="main", repo_path=".", stream=False
+        )
+
+    @patch("autopr.cli.handle_pr_create_command")
+    @patch("autopr.git_utils.get_repo_from_git_config")
+    def test_pr_command_respects_explicit_base(
+        self, mock_get_repo, mock_handle_pr_create
+    ):
+        explicit_base = "develop"
+        mock_get_repo.return_value = "owner/repo"
+        with patch.object(sys, "argv", ["autopr_cli", "pr", "--base", explicit_base]):
+            autopr_main()
+        mock_get_repo.assert_called_once()
+        mock_handle_pr_create.assert_called_once_with(
+            base_branch=explicit_base, repo_path=".", stream=False
+        )
+
+    @patch("autopr.cli.handle_pr_create_command")
+    @patch("autopr.git_utils.get_repo_from_git_config")
+    def test_pr_command_stream_flag(self, mock_get_repo, mock_handle_pr_create):
+        mock_get_repo.return_value = "owner/repo"
+        with patch.object(sys, "argv", ["autopr_cli", "pr", "--stream"]):
+            autopr_main()
+        mock_handle_pr_create.assert_called_once_with(
+            base_branch="main", repo_path=".", stream=True
+        )
+
+
+    @patch("autopr.cli.handle_cache_command")
+    @patch("autopr.git_utils.get_repo_from_git_config")
+    def test_cache_command_skips_repo_detection(
+        self, mock_get_repo, mock_handle_cache
+    ):
+        with patch.object(sys, "argv", ["autopr_cli", "cache", "prune", "--max-bytes", "1024"]):
+            autopr_main()
+        mock_get_repo.assert_not_called()
+        mock_handle_cache.assert_called_once_with("prune", max_bytes=1024)
+
+
+class TestHandleCommitCommand(unittest.TestCase):
+    def setUp(self):
+        # One small file, so the whole diff is fetched with a plain `git diff --staged`.
+        patcher = patch("autopr.github_service.get_staged_numstat", return_value=[FileStat("file.txt", 1, 1)])
+        self.mock_numstat = patcher.start()
+        self.addCleanup(patcher.stop)
 
     @patch("builtins.input", return_value="y")
-    @patch("autopr.cli.git_commit")
-    @patch("autopr.cli.get_commit_message_suggestion")
-    @patch("autopr.cli.get_staged_diff")
+    @patch("autopr.github_service.git_commit")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("autopr.github_service.get_staged_diff")
     @patch("builtins.print")
     def test_handle_commit_command_ai_suggest_confirm_yes_commit_success(
         self,
@@ -86,7 +219,7 @@ class TestMainCLI(unittest.TestCase):
         mock_git_commit,
         mock_input,
     ):
-        mock_get_staged_diff.return_value = "fake diff data"
+        mock_get_staged_diff.return_value = DiffSpool.from_text("fake diff data")
         ai_suggestion = "AI: feat: awesome new feature"
         mock_get_ai_suggestion.return_value = ai_suggestion
         mock_git_commit.return_value = (True, "Commit successful output")
@@ -105,9 +238,9 @@ class TestMainCLI(unittest.TestCase):
         mock_print.assert_any_call("Commit successful output")
 
     @patch("builtins.input", return_value="n")
-    @patch("autopr.cli.git_commit")
-    @patch("autopr.cli.get_commit_message_suggestion")
-    @patch("autopr.cli.get_staged_diff")
+    @patch("autopr.github_service.git_commit")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("autopr.github_service.get_staged_diff")
     @patch("builtins.print")
     def test_handle_commit_command_ai_suggest_confirm_no(
         self,
@@ -117,7 +250,7 @@ class TestMainCLI(unittest.TestCase):
         mock_git_commit,
         mock_input,
     ):
-        mock_get_staged_diff.return_value = "fake diff data"
+        mock_get_staged_diff.return_value = DiffSpool.from_text("fake diff data")
         ai_suggestion = "AI: feat: another feature"
         mock_get_ai_suggestion.return_value = ai_suggestion
 
@@ -132,9 +265,9 @@ class TestMainCLI(unittest.TestCase):
         )
 
     @patch("builtins.input", return_value="y")
-    @patch("autopr.cli.git_commit")
-    @patch("autopr.cli.get_commit_message_suggestion")
-    @patch("autopr.cli.get_staged_diff")
+    @patch("autopr.github_service.git_commit")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("autopr.github_service.get_staged_diff")
     @patch("builtins.print")
     def test_handle_commit_command_ai_suggest_confirm_yes_commit_fail(
         self,
@@ -144,7 +277,7 @@ class TestMainCLI(unittest.TestCase):
         mock_git_commit,
         mock_input,
     ):
-        mock_get_staged_diff.return_value = "fake diff data"
+        mock_get_staged_diff.return_value = DiffSpool.from_text("fake diff data")
         ai_suggestion = "AI: fix: a bug"
         mock_get_ai_suggestion.return_value = ai_suggestion
         mock_git_commit.return_value = (False, "Commit failed output")
@@ -155,13 +288,13 @@ class TestMainCLI(unittest.TestCase):
         mock_print.assert_any_call("Commit failed.")
         mock_print.assert_any_call("Commit failed output")
 
-    @patch("autopr.cli.get_commit_message_suggestion")
-    @patch("autopr.cli.get_staged_diff")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("autopr.github_service.get_staged_diff")
     @patch("builtins.print")
     def test_handle_commit_command_ai_returns_error(
         self, mock_print, mock_get_staged_diff, mock_get_ai_suggestion
     ):
-        mock_get_staged_diff.return_value = "fake diff data"
+        mock_get_staged_diff.return_value = DiffSpool.from_text("fake diff data")
         error_suggestion = "[Error communicating with OpenAI API]"
         mock_get_ai_suggestion.return_value = error_suggestion
 
@@ -170,17 +303,17 @@ class TestMainCLI(unittest.TestCase):
         mock_print.assert_any_call(f"\nCould not get AI suggestion: {error_suggestion}")
         mock_print.assert_any_call("Please commit manually using git.")
 
-    @patch("autopr.cli.get_staged_diff")
+    @patch("autopr.github_service.get_staged_diff")
     @patch("builtins.print")
     def test_handle_commit_command_no_staged_changes(
         self, mock_print, mock_get_staged_diff
     ):
-        mock_get_staged_diff.return_value = ""
+        self.mock_numstat.return_value = []
         handle_commit_command()
-        mock_get_staged_diff.assert_called_once()
+        mock_get_staged_diff.assert_not_called()
         mock_print.assert_any_call("No changes staged for commit.")
 
-    @patch("autopr.cli.get_staged_diff")
+    @patch("autopr.github_service.get_staged_diff")
     @patch("builtins.print")
     def test_handle_commit_command_get_diff_returns_none(
         self, mock_print, mock_get_staged_diff
@@ -191,32 +324,12 @@ class TestMainCLI(unittest.TestCase):
         mock_print.assert_any_call("Handling commit command...")
         mock_print.assert_any_call("No changes staged for commit.")
 
-    @patch("autopr.cli.get_staged_diff")
-    @patch("autopr.cli.get_commit_message_suggestion")
-    @patch("builtins.print")
-    def test_handle_commit_command_diff_exceeds_hard_limit(
-        self, mock_print, mock_get_ai_suggestion, mock_get_staged_diff
-    ):
-        large_diff = "a" * 450001
-        mock_get_staged_diff.return_value = large_diff
-        handle_commit_command()
-        mock_get_staged_diff.assert_called_once()
-        mock_print.assert_any_call(
-            f"Error: Diff is too large ({len(large_diff)} characters). Maximum allowed is 450,000 characters."
-        )
-        mock_print.assert_any_call(
-            "Please break down your changes into smaller commits."
-        )
-        mock_get_ai_suggestion.assert_not_called()  # AI should not be called
-
-    @patch("autopr.cli.get_staged_diff")
-    @patch("autopr.cli.get_commit_message_suggestion")
-    @patch("builtins.input", return_value="y")  # Assume user confirms if AI is called
-    @patch(
-        "autopr.cli.git_commit"
-    )  # Mock commit as it won't be reached if AI not called
+    @patch("autopr.github_service.get_staged_diff")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("builtins.input", return_value="y")
+    @patch("autopr.github_service.git_commit")
     @patch("builtins.print")
-    def test_handle_commit_command_diff_exceeds_warning_limit(
+    def test_handle_commit_command_large_diff_is_budgeted_not_rejected(
         self,
         mock_print,
         mock_git_commit,
@@ -224,57 +337,651 @@ class TestMainCLI(unittest.TestCase):
         mock_get_ai_suggestion,
         mock_get_staged_diff,
     ):
-        warn_diff = "b" * 400001
-        mock_get_staged_diff.return_value = warn_diff
-        # Mock AI suggestion to ensure the flow continues past the warning
-        ai_suggestion = "AI: feat: processed large diff"
-        mock_get_ai_suggestion.return_value = ai_suggestion
+        source_file = (
+            "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n"
+            "@@ -1 +1 @@\n-old\n+new"
+        )
+        big_file = (
+            "diff --git a/fixtures.py b/fixtures.py\n"
+            "--- a/fixtures.py\n+++ b/fixtures.py\n@@ -1,1 +1,50000 @@\n"
+            + "\n".join(f'+"dep-{i}": "1.0.{i}",' for i in range(50000))
+        )
+        large_diff = source_file + "\n" + big_file
+        self.assertGreater(len(large_diff), 450000)
+        mock_get_staged_diff.return_value = DiffSpool.from_text(large_diff)
+        mock_get_ai_suggestion.return_value = "feat: processed large diff"
         mock_git_commit.return_value = (True, "Committed large diff")
 
+        handle_commit_command(token_budget=1000)
+
+        mock_get_ai_suggestion.assert_called_once()
+        sent_diff = mock_get_ai_suggestion.call_args[0][0]
+        self.assertIn("+new", sent_diff)
+        self.assertNotIn('"dep-49999"', sent_diff)
+        self.assertIn("fixtures.py (source): hunk at line 1 cut short", sent_diff)
+        mock_git_commit.assert_called_once_with("feat: processed large diff")
+
+    @patch("autopr.github_service.get_staged_diff")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("builtins.input", return_value="n")
+    @patch("builtins.print")
+    def test_handle_commit_command_lockfile_replaced_by_stub(
+        self, mock_print, mock_input, mock_get_ai_suggestion, mock_get_staged_diff
+    ):
+        # The lockfile is dropped by its name, so its diff is never fetched.
+        self.mock_numstat.return_value = [FileStat("app.py", 1, 1), FileStat("poetry.lock", 1, 1)]
+        mock_get_staged_diff.return_value = DiffSpool.from_text(
+            "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n"
+            "@@ -1 +1 @@\n-old\n+new\n"
+        )
+        mock_get_ai_suggestion.return_value = "feat: something"
+
         handle_commit_command()
 
-        mock_get_staged_diff.assert_called_once()
-        mock_print.assert_any_call(
-            f"Warning: Diff is very large ({len(warn_diff)} characters). AI suggestion quality may be affected."
+        mock_get_staged_diff.assert_called_once_with(paths=["app.py"])
+        sent_diff = mock_get_ai_suggestion.call_args[0][0]
+        self.assertIn("+new", sent_diff)
+        self.assertIn(
+            "diff --git a/poetry.lock b/poetry.lock\n"
+            "# autopr: poetry.lock omitted (lockfile, +1 -1 lines)",
+            sent_diff,
+        )
+
+    @patch("autopr.github_service.get_staged_diff")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("builtins.input", return_value="n")
+    @patch("builtins.print")
+    def test_handle_commit_command_fetches_only_files_that_can_fit(
+        self, mock_print, mock_input, mock_get_ai_suggestion, mock_get_staged_diff
+    ):
+        self.mock_numstat.return_value = [
+            FileStat("app.py", 1, 1),
+            FileStat("fixtures.py", 50000, 1),
+            FileStat("yarn.lock", 300, 200),
+        ]
+        mock_get_staged_diff.return_value = DiffSpool.from_text(
+            "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n"
+            "@@ -1 +1 @@\n-old\n+new\n"
+        )
+        mock_get_ai_suggestion.return_value = "feat: something"
+
+        handle_commit_command(token_budget=1000)
+
+        mock_get_staged_diff.assert_called_once_with(paths=["app.py"])
+        sent_diff = mock_get_ai_suggestion.call_args[0][0]
+        self.assertIn("+new", sent_diff)
+        self.assertIn("# autopr: yarn.lock omitted (lockfile, +300 -200 lines)", sent_diff)
+        self.assertIn("# - fixtures.py (source): omitted, +50000 -1 lines", sent_diff)
+        # Only part of the diff was loaded, so the files are listed instead.
+        mock_print.assert_any_call("Staged changes: 3 file(s), +50301 -202 lines (diff loaded for 1 of them):\n")
+        mock_print.assert_any_call("       +50000 -1  fixtures.py")
+        self.assertNotIn(call("Staged Diffs:\n"), mock_print.call_args_list)
+
+    @patch("autopr.github_service.get_staged_diff")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("builtins.input", return_value="n")
+    @patch("builtins.print")
+    def test_handle_commit_command_nothing_worth_fetching(
+        self, mock_print, mock_input, mock_get_ai_suggestion, mock_get_staged_diff
+    ):
+        self.mock_numstat.return_value = [FileStat("yarn.lock", 3, 2), FileStat("logo.png", 0, 0, is_binary=True)]
+        mock_get_ai_suggestion.return_value = "chore: update dependencies"
+
+        handle_commit_command()
+
+        mock_get_staged_diff.assert_not_called()
+        sent_diff = mock_get_ai_suggestion.call_args[0][0]
+        self.assertIn("# autopr: yarn.lock omitted (lockfile, +3 -2 lines)", sent_diff)
+        self.assertIn("# autopr: logo.png omitted (binary, +0 -0 lines)", sent_diff)
+        mock_print.assert_any_call("          binary  logo.png")
+
+    @patch("autopr.github_service.get_staged_diff")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("builtins.input", return_value="n")
+    @patch("builtins.print")
+    def test_handle_commit_command_small_diff_sent_unchanged(
+        self, mock_print, mock_input, mock_get_ai_suggestion, mock_get_staged_diff
+    ):
+        mock_get_staged_diff.return_value = DiffSpool.from_text("b" * 400001)
+        mock_get_ai_suggestion.return_value = "feat: something"
+
+        handle_commit_command(token_budget=200000)
+
+        mock_get_ai_suggestion.assert_called_once_with("b" * 400001)
+
+    @patch("autopr.github_service.get_staged_diff")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("builtins.input", return_value="n")
+    @patch("builtins.print")
+    def test_handle_commit_command_stream(
+        self, mock_print, mock_input, mock_get_ai_suggestion, mock_get_staged_diff
+    ):
+        mock_get_staged_diff.return_value = DiffSpool.from_text("diff content")
+        mock_get_ai_suggestion.return_value = "feat: streamed"
+
+        handle_commit_command(stream=True)
+
+        mock_get_ai_suggestion.assert_called_once_with("diff content", stream=True)
+        # The message was already printed while streaming, so it is not repeated.
+        mock_print.assert_any_call("\nSuggested commit message:")
+        self.assertNotIn(
+            call("\nSuggested commit message:\nfeat: streamed"), mock_print.call_args_list
+        )
+
+    @patch("autopr.github_service.get_staged_diff")
+    @patch("autopr.ai_service.get_commit_message_suggestion")
+    @patch("builtins.input", return_value="n")
+    @patch("builtins.print")
+    def test_handle_commit_command_spilled_diff_printed_in_chunks(
+        self, mock_print, mock_input, mock_get_ai_suggestion, mock_get_staged_diff
+    ):
+        diff = (
+            "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n-old\n+new\n"
+            "diff --git a/data.py b/data.py\n--- a/data.py\n+++ b/data.py\n@@ -1,0 +1,3000 @@\n"
+            + "\n".join(f"+line {i}" for i in range(3000))
+        )
+        spool = DiffSpool.from_text(diff, memory_limit=1000)
+        self.assertTrue(spool.spilled)
+        mock_get_staged_diff.return_value = spool
+        mock_get_ai_suggestion.return_value = "feat: something"
+
+        with patch("autopr.diff_spool.TEXT_CHUNK_BYTES", 4096):
+            handle_commit_command(token_budget=500)
+
+        chunks = [c.args[0] for c in mock_print.call_args_list if c.kwargs.get("end") == ""]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), diff)
+        sent_diff = mock_get_ai_suggestion.call_args[0][0]
+        self.assertIn("+new", sent_diff)
+        self.assertNotIn("+line 2999", sent_diff)
+        self.assertIn("data.py (source): hunk at line 1 cut short", sent_diff)
+        self.assertFalse(spool.spilled)  # Closed once printed
+
+
+class TestHandleCacheCommand(unittest.TestCase):
+    @patch("autopr.cache.get_cache_stats")
+    @patch("builtins.print")
+    def test_stats(self, mock_print, mock_get_stats):
+        mock_get_stats.return_value = {
+            "path": "/tmp/autopr",
+            "entries": 3,
+            "size_bytes": 2048,
+            "max_bytes": 1024 * 1024,
+            "oldest": None,
+            "newest": None,
+            "enabled": True,
+        }
+        handle_cache_command("stats")
+        mock_print.assert_any_call("Cache directory: /tmp/autopr")
+        mock_print.assert_any_call("Entries: 3")
+        mock_print.assert_any_call("Size: 2.0 KB of 1.0 MB")
+
+    @patch("autopr.cache.prune_cache", return_value=(2, 512))
+    @patch("builtins.print")
+    def test_prune(self, mock_print, mock_prune):
+        handle_cache_command("prune", max_bytes=100)
+        mock_prune.assert_called_once_with(100)
+        mock_print.assert_any_call("Pruned 2 cache entries, freed 512 B.")
+
+    @patch("autopr.cache.clear_cache", return_value=4)
+    @patch("builtins.print")
+    def test_clear(self, mock_print, mock_clear):
+        handle_cache_command("clear")
+        mock_clear.assert_called_once_with()
+        mock_print.assert_any_call("Cleared 4 cache entries.")
+
+
+@patch("autopr.review_state.record_reviewed_sha")
+@patch("autopr.review_state.get_last_reviewed_sha")
+@patch("autopr.github_service.get_pr_head_commit_sha", return_value="new5678")
+@patch("autopr.github_service.get_pr_changes_since")
+@patch("autopr.github_service.get_pr_changes")
+@patch("autopr.review_engine.review_diff")
+@patch("autopr.github_service.post_pr_review", side_effect=lambda n, comments, commit_sha, diff_index: [True] * len(comments))
+@patch("builtins.print")
+class TestHandleReviewCommand(unittest.TestCase):
+    DIFF = "diff --git a/f.py b/f.py\n--- a/f.py\n+++ b/f.py\n@@ -1 +1 @@\n-a\n+b"
+    SUGGESTION = {"path": "f.py", "line": 1, "suggestion": "Rename b."}
+    # DIFF as restrict_diff writes it back out.
+    RESTRICTED_DIFF = "diff --git a/f.py b/f.py\n--- a/f.py\n+++ b/f.py\n@@ -1,1 +1,1 @@\n-a\n+b"
+
+    def setUp(self):
+        prefetch = patch("autopr.github_service.prefetch_pr_context", return_value=None)
+        self.mock_prefetch = prefetch.start()
+        self.addCleanup(prefetch.stop)
+        existing = patch("autopr.github_service.get_pr_review_comments", return_value=[])
+        self.mock_existing = existing.start()
+        self.addCleanup(existing.stop)
+
+    def test_prefetched_metadata_is_reported(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        self.mock_prefetch.return_value = PrContext(
+            number=5, owner="o", repo="r", title="Add caching", head_sha="new5678",
+            base_sha="base", head_ref="feature", base_ref="main",
+            additions=10, deletions=2, changed_files=3,
+        )
+        mock_last.return_value = None
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = []
+
+        handle_review_command(5)
+
+        self.mock_prefetch.assert_called_once_with(5)
+        mock_print.assert_any_call("PR #5: Add caching (3 file(s), +10 -2)")
+
+    def test_first_review_covers_whole_pr(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        mock_last.return_value = None
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = [self.SUGGESTION]
+
+        handle_review_command(5)
+
+        mock_changes.assert_called_once_with(5)
+        mock_since.assert_not_called()
+        mock_post.assert_called_once_with(
+            5,
+            [{"path": "f.py", "line": 1, "body": "Rename b."}],
+            commit_sha="new5678",
+            diff_index=DiffLineIndex({"f.py": [1]}),
+        )
+        mock_record.assert_called_once_with(5, "new5678")
+
+    def test_reviews_only_new_commits(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        mock_last.return_value = "old1234"
+        mock_since.return_value = self.DIFF
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = [self.SUGGESTION]
+
+        handle_review_command(5)
+
+        mock_since.assert_called_once_with(5, "old1234", "new5678")
+        mock_review.assert_called_once_with(self.RESTRICTED_DIFF)
+        mock_record.assert_called_once_with(5, "new5678")
+
+    def test_new_commits_are_limited_to_the_pr_diff(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        # The compare diff also has g.py, which the PR itself does not change.
+        mock_last.return_value = "old1234"
+        mock_since.return_value = (
+            self.DIFF + "\ndiff --git a/g.py b/g.py\n--- a/g.py\n+++ b/g.py\n@@ -1 +1 @@\n-c\n+d"
+        )
+        mock_changes.return_value = (
+            "diff --git a/f.py b/f.py\n--- a/f.py\n+++ b/f.py\n@@ -1 +1,2 @@\n-a\n+b\n+e"
+        )
+        mock_review.return_value = [{"path": "f.py", "line": 2, "suggestion": "Rename e."}]
+
+        handle_review_command(5)
+
+        mock_review.assert_called_once_with(self.RESTRICTED_DIFF)
+        # Comments are checked against the PR's diff, which is what GitHub accepts.
+        mock_post.assert_called_once_with(
+            5,
+            [{"path": "f.py", "line": 2, "body": "Rename e."}],
+            commit_sha="new5678",
+            diff_index=DiffLineIndex({"f.py": [1, 2]}),
+        )
+
+    def test_new_commits_outside_the_pr_diff_are_not_reviewed(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        mock_last.return_value = "old1234"
+        mock_since.return_value = "diff --git a/g.py b/g.py\n--- a/g.py\n+++ b/g.py\n@@ -1 +1 @@\n-c\n+d"
+        mock_changes.return_value = self.DIFF
+
+        result = handle_review_command(5)
+
+        mock_review.assert_not_called()
+        self.assertEqual(result.status, "up to date")
+
+    def test_nothing_new_since_last_review(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        mock_last.return_value = "new5678"
+
+        handle_review_command(5)
+
+        mock_review.assert_not_called()
+        mock_record.assert_not_called()
+
+    def test_force_push_falls_back_to_full_review(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        mock_last.return_value = "old1234"
+        mock_since.return_value = None
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = []
+
+        handle_review_command(5)
+
+        mock_changes.assert_called_once_with(5)
+        mock_print.assert_any_call("Falling back to reviewing the whole PR.")
+
+    def test_full_flag_ignores_state(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = [self.SUGGESTION]
+
+        handle_review_command(5, full=True)
+
+        mock_last.assert_not_called()
+        mock_changes.assert_called_once_with(5)
+        mock_record.assert_called_once_with(5, "new5678")
+
+    def test_failed_post_does_not_record(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        mock_last.return_value = None
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = [self.SUGGESTION]
+        mock_post.side_effect = None
+        mock_post.return_value = [False]
+
+        result = handle_review_command(5)
+
+        mock_record.assert_not_called()
+        self.assertEqual((result.status, result.posted, result.failed), ("partial", 0, 1))
+
+    def test_invalid_suggestions_not_posted(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        mock_last.return_value = None
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = [self.SUGGESTION, {"path": "f.py", "line": 0, "suggestion": "x"}]
+
+        result = handle_review_command(5)
+
+        self.assertEqual(len(mock_post.call_args[0][1]), 1)
+        self.assertEqual((result.posted, result.failed), (1, 1))
+
+    def test_suggestions_outside_diff_are_moved_or_skipped(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        mock_last.return_value = None
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = [
+            {"path": "f.py", "line": 4, "suggestion": "Near the change."},
+            {"path": "g.py", "line": 1, "suggestion": "Not in this PR."},
+        ]
+
+        result = handle_review_command(5)
+
+        mock_post.assert_called_once_with(
+            5,
+            [{"path": "f.py", "line": 1, "body": "Near the change."}],
+            commit_sha="new5678",
+            diff_index=DiffLineIndex({"f.py": [1]}),
         )
         mock_print.assert_any_call(
-            "Consider breaking down your changes into smaller commits for better results."
+            "Moved 1 suggestion(s) onto the nearest line of the diff; "
+            "skipped 1 that did not match any changed lines."
         )
-        mock_get_ai_suggestion.assert_called_once_with(warn_diff)  # AI should be called
-        mock_input.assert_called_once_with(
-            "\nDo you want to commit with this message? (y/n): "
+        self.assertEqual((result.posted, result.failed), (1, 0))
+        mock_record.assert_called_once_with(5, "new5678")
+
+    def test_nothing_posted_when_all_suggestions_are_outside_diff(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        mock_last.return_value = None
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = [{"path": "g.py", "line": 1, "suggestion": "Not in this PR."}]
+
+        handle_review_command(5)
+
+        mock_post.assert_not_called()
+
+    def test_suggestions_already_on_the_pr_are_not_posted_again(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        self.mock_prefetch.return_value = PrContext(
+            number=5, owner="o", repo="r", title="t", head_sha="new5678",
+            base_sha="base", head_ref="feature", base_ref="main",
+            additions=1, deletions=1, changed_files=1,
+            review_threads=[{"path": "f.py", "line": 1, "body": "Rename b.",
+                             "is_resolved": False, "is_outdated": False}],
         )
-        mock_git_commit.assert_called_once_with(ai_suggestion)
+        mock_last.return_value = None
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = [self.SUGGESTION]
 
-    @patch("autopr.cli.handle_pr_create_command")
-    @patch("autopr.cli.get_repo_from_git_config")
-    def test_pr_command_uses_default_base(self, mock_get_repo, mock_handle_pr_create):
-        mock_get_repo.return_value = "owner/repo"
-        with patch.object(sys, "argv", ["autopr_cli", "pr"]):
-            autopr_main()
-        mock_get_repo.assert_called_once()
-        mock_handle_pr_create.assert_called_once_with(base_branch="main", repo_path=".")
+        result = handle_review_command(5)
 
-    @patch("autopr.cli.handle_pr_create_command")
-    @patch("autopr.cli.get_repo_from_git_config")
-    def test_pr_command_respects_explicit_base(
-        self, mock_get_repo, mock_handle_pr_create
+        self.mock_existing.assert_not_called()  # The prefetch already had them
+        mock_post.assert_not_called()
+        mock_print.assert_any_call("Skipped 1 suggestion(s) already posted on the PR.")
+        self.assertEqual(result.status, "reviewed")
+        mock_record.assert_called_once_with(5, "new5678")
+
+    def test_existing_comments_fetched_without_prefetch(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
     ):
-        explicit_base = "develop"
-        mock_get_repo.return_value = "owner/repo"
-        with patch.object(sys, "argv", ["autopr_cli", "pr", "--base", explicit_base]):
+        self.mock_existing.return_value = [{"path": "f.py", "line": 1, "body": "rename  B."}]
+        mock_last.return_value = None
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = [self.SUGGESTION]
+
+        handle_review_command(5)
+
+        self.mock_existing.assert_called_once_with(5)
+        mock_post.assert_not_called()
+
+    def test_existing_comments_fetched_when_prefetch_has_too_many_threads(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        self.mock_prefetch.return_value = PrContext(
+            number=5, owner="o", repo="r", title="t", head_sha="new5678",
+            base_sha="base", head_ref="feature", base_ref="main",
+            additions=1, deletions=1, changed_files=1, review_threads=None,
+        )
+        self.mock_existing.return_value = [{"path": "f.py", "line": 1, "body": "Rename b."}]
+        mock_last.return_value = None
+        mock_changes.return_value = self.DIFF
+        mock_review.return_value = [self.SUGGESTION]
+
+        handle_review_command(5)
+
+        self.mock_existing.assert_called_once_with(5)
+        mock_post.assert_not_called()
+
+    def test_review_dispatch_passes_full_flag(
+        self, mock_print, mock_post, mock_review, mock_changes, mock_since,
+        mock_head, mock_last, mock_record
+    ):
+        with patch("autopr.git_utils.get_repo_from_git_config", return_value="owner/repo"), \
+                patch("autopr.cli.handle_review_command") as mock_handle_review, \
+                patch.object(sys, "argv", ["autopr_cli", "review", "5", "--full"]):
             autopr_main()
-        mock_get_repo.assert_called_once()
-        mock_handle_pr_create.assert_called_once_with(
-            base_branch=explicit_base, repo_path="."
+        mock_handle_review.assert_called_once_with(5, full=True)
+
+
+class TestBatchReview(unittest.TestCase):
+    @patch("autopr.cli.handle_batch_review_command")
+    @patch("autopr.git_utils.get_repo_from_git_config", return_value="owner/repo")
+    def test_several_pr_numbers_use_batch(self, mock_get_repo, mock_batch):
+        with patch.object(sys, "argv", ["autopr_cli", "review", "12", "15", "19", "--jobs", "2"]):
+            autopr_main()
+        mock_batch.assert_called_once_with([12, 15, 19], full=False, jobs=2)
+
+    @patch("autopr.cli.handle_batch_review_command")
+    @patch("autopr.github_service.list_open_prs", return_value=[3, 4])
+    @patch("autopr.git_utils.get_repo_from_git_config", return_value="owner/repo")
+    def test_all_open_with_label(self, mock_get_repo, mock_list_open, mock_batch):
+        with patch.object(sys, "argv", ["autopr_cli", "review", "--all-open", "--label", "ready"]):
+            autopr_main()
+        mock_list_open.assert_called_once_with(label="ready")
+        mock_batch.assert_called_once_with([3, 4], full=False, jobs=8)
+
+    @patch("sys.stderr")
+    def test_review_needs_pr_or_all_open(self, mock_stderr):
+        with patch.object(sys, "argv", ["autopr_cli", "review"]):
+            with self.assertRaises(SystemExit):
+                autopr_main()
+
+    @patch("sys.stderr")
+    def test_label_requires_all_open(self, mock_stderr):
+        with patch.object(sys, "argv", ["autopr_cli", "review", "5", "--label", "x"]):
+            with self.assertRaises(SystemExit):
+                autopr_main()
+
+    @patch("builtins.print")
+    @patch("autopr.cli.handle_review_command")
+    def test_batch_reviews_each_pr_and_prints_summary(self, mock_review, mock_print):
+        mock_review.side_effect = lambda pr_number, full: (
+            ReviewResult(pr_number, "reviewed", suggestions=2, posted=2)
+            if pr_number != 15
+            else ReviewResult(pr_number, "fetch failed")
         )
 
+        results = handle_batch_review_command([12, 15, 19, 12], jobs=3)
+
+        self.assertEqual([r.pr_number for r in results], [12, 15, 19])
+        self.assertEqual(mock_review.call_count, 3)
+        printed = [c.args[0] for c in mock_print.call_args_list if c.args]
+        self.assertIn("\nReview summary:", printed)
+        self.assertTrue(any(line.startswith("#15") and "fetch failed" in line for line in printed))
+        self.assertTrue(any(line.startswith("Total") for line in printed))
+
+    @patch("builtins.print")
+    @patch("autopr.cli.handle_review_command")
+    def test_batch_keeps_going_after_error(self, mock_review, mock_print):
+        mock_review.side_effect = [RuntimeError("boom"), ReviewResult(2, "reviewed")]
+
+        results = handle_batch_review_command([1, 2], jobs=1)
+
+        self.assertEqual([r.status for r in results], ["error", "reviewed"])
+
+    @patch("autopr.cli.handle_review_command")
+    def test_output_of_each_pr_is_not_interleaved(self, mock_review):
+        def review(pr_number, full):
+            print(f"start {pr_number}")
+            print(f"end {pr_number}")
+            return ReviewResult(pr_number, "reviewed")
+
+        mock_review.side_effect = review
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            handle_batch_review_command([1, 2, 3], jobs=3)
+
+        output = stdout.getvalue()
+        for pr_number in (1, 2, 3):
+            self.assertIn(
+                f"===== PR #{pr_number} =====\nstart {pr_number}\nend {pr_number}\n", output
+            )
+
 
 class TestHandlePrCreateCommand(unittest.TestCase):
-    @patch("autopr.cli.get_pr_description_suggestion")
-    @patch("autopr.cli.get_commit_messages_for_branch")
+    def setUp(self):
+        self.mocks = {}
+        for name, value in [
+            ("github_service.prefetch_repo_context", None),
+            ("git_utils.get_current_branch", "feature"),
+            ("github_service.get_current_issue_number", None),
+            ("github_service.get_branch_overview", (None, None)),
+            ("ai_service.warm_client", None),
+        ]:
+            patcher = patch(f"autopr.{name}", return_value=value)
+            self.mocks[name.split(".")[1]] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mock_prefetch = self.mocks["prefetch_repo_context"]
+
+    @patch("autopr.ai_service.get_pr_description_suggestion")
+    @patch("autopr.github_service.get_branch_commits", return_value=["feat: x"])
+    @patch("autopr.github_service.get_current_issue_number", return_value=None)
+    @patch("autopr.git_utils.get_current_branch", return_value="feature")
+    @patch("builtins.print")
+    def test_existing_pr_for_branch_stops_before_ai_call(
+        self, mock_print, mock_branch, mock_issue, mock_get_commits, mock_get_pr_desc
+    ):
+        self.mock_prefetch.return_value = RepoContext(
+            owner="o", repo="r", existing_pr={"number": 8, "url": "https://github.com/o/r/pull/8"}
+        )
+
+        handle_pr_create_command(base_branch="main", repo_path=".")
+
+        self.mock_prefetch.assert_called_once_with("feature", None)
+        mock_get_pr_desc.assert_not_called()
+        mock_print.assert_any_call(
+            "A pull request already exists for branch 'feature': #8 https://github.com/o/r/pull/8"
+        )
+
+    @patch("autopr.ai_service.get_pr_description_suggestion", return_value=("", ""))
+    @patch("autopr.github_service.get_branch_commits")
+    @patch("builtins.input", return_value="n")
+    @patch("builtins.print")
+    def test_context_gathered_concurrently_and_sent_to_ai(
+        self, mock_print, mock_input, mock_get_commits, mock_get_pr_desc
+    ):
+        issue = {"number": 3, "title": "Bug", "body": "It breaks.", "labels": []}
+        self.mocks["get_current_issue_number"].return_value = 3
+        self.mock_prefetch.return_value = RepoContext(owner="o", repo="r", issue=issue)
+        diffstat = " a.py | 2 +-\n 1 file changed, 1 insertion(+), 1 deletion(-)"
+        # Both calls wait for each other, so this only finishes if they run at the same time.
+        barrier = threading.Barrier(2, timeout=5)
+
+        def commits(base):
+            barrier.wait()
+            return ["fix: x"]
+
+        def overview(base):
+            barrier.wait()
+            return "abcdef1234", diffstat
+
+        mock_get_commits.side_effect = commits
+        self.mocks["get_branch_overview"].side_effect = overview
+
+        warmed = threading.Event()
+        self.mocks["warm_client"].side_effect = warmed.set
+
+        handle_pr_create_command(base_branch="main", repo_path=".")
+
+        self.mock_prefetch.assert_called_once_with("feature", 3)
+        self.assertTrue(warmed.wait(5))
+        mock_get_pr_desc.assert_called_once_with(["fix: x"], issue=issue, diffstat=diffstat)
+        mock_print.assert_any_call(
+            "Changes since abcdef1 on main: 1 file changed, 1 insertion(+), 1 deletion(-)"
+        )
+        mock_print.assert_any_call("Working on issue #3: Bug")
+
+    @patch("autopr.ai_service.get_pr_description_suggestion", return_value=("", ""))
+    @patch("autopr.github_service.get_branch_commits", return_value=["feat: x"])
+    @patch("autopr.github_service.get_issue_details", return_value={"number": 3, "title": "Bug"})
+    @patch("autopr.github_service.get_current_issue_number", return_value=3)
+    @patch("autopr.git_utils.get_current_branch", return_value="feature")
+    @patch("builtins.input", return_value="n")
+    @patch("builtins.print")
+    def test_issue_read_from_local_store_when_prefetch_fails(
+        self, mock_print, mock_input, mock_branch, mock_issue_number, mock_issue,
+        mock_get_commits, mock_get_pr_desc
+    ):
+        handle_pr_create_command(base_branch="main", repo_path=".")
+
+        mock_issue.assert_called_once_with(3, offline=True)
+        mock_print.assert_any_call("Working on issue #3: Bug")
+
+    @patch("autopr.ai_service.get_pr_description_suggestion")
+    @patch("autopr.github_service.get_branch_commits")
     @patch("builtins.input")
-    @patch("autopr.cli.create_pr_gh")
+    @patch("autopr.github_service.create_pr_gh")
     @patch("builtins.print")
     def test_handle_pr_create_success_user_confirms(
         self,
@@ -286,7 +993,7 @@ class TestHandlePrCreateCommand(unittest.TestCase):
     ):
         repo_path = "/fake/path"
         base_branch = "develop"
-        commit_list = ["feat: did a thing", "fix: another thing"]
+        commit_list = [CommitRecord("a" * 40, "feat: did a thing"), CommitRecord("b" * 40, "fix: another thing")]
         ai_title, ai_body = "AI PR Title", "AI PR Body which is awesome"
 
         mock_get_commits.return_value = commit_list
@@ -297,14 +1004,14 @@ class TestHandlePrCreateCommand(unittest.TestCase):
         handle_pr_create_command(base_branch=base_branch, repo_path=repo_path)
 
         mock_get_commits.assert_called_once_with(base_branch)
-        mock_get_pr_desc.assert_called_once_with(commit_list)
+        mock_get_pr_desc.assert_called_once_with(commit_list, issue=None, diffstat=None)
         mock_input.assert_called_once_with("Do you want to create this PR? (y/n): ")
         mock_create_pr_gh.assert_called_once_with(ai_title, ai_body, base_branch)
 
         mock_print.assert_any_call(
             f"Initiating PR creation process against base branch: {base_branch}"
         )
-        mock_print.assert_any_call(f"Retrieved {len(commit_list)} commit message(s).")
+        mock_print.assert_any_call(f"Retrieved {len(commit_list)} commit(s).")
         mock_print.assert_any_call(
             "\nAttempting to generate PR title and body using AI..."
         )
@@ -316,10 +1023,10 @@ class TestHandlePrCreateCommand(unittest.TestCase):
         mock_print.assert_any_call("PR created successfully!")
         mock_print.assert_any_call("PR created: URL")
 
-    @patch("autopr.cli.get_pr_description_suggestion")
-    @patch("autopr.cli.get_commit_messages_for_branch")
+    @patch("autopr.ai_service.get_pr_description_suggestion")
+    @patch("autopr.github_service.get_branch_commits")
     @patch("builtins.input")
-    @patch("autopr.cli.create_pr_gh")
+    @patch("autopr.github_service.create_pr_gh")
     @patch("builtins.print")
     def test_handle_pr_create_success_user_declines(
         self,
@@ -341,12 +1048,12 @@ class TestHandlePrCreateCommand(unittest.TestCase):
         handle_pr_create_command(base_branch=base_branch, repo_path=repo_path)
 
         mock_get_commits.assert_called_once_with(base_branch)
-        mock_get_pr_desc.assert_called_once_with(commit_list)
+        mock_get_pr_desc.assert_called_once_with(commit_list, issue=None, diffstat=None)
         mock_input.assert_called_once_with("Do you want to create this PR? (y/n): ")
         mock_create_pr_gh.assert_not_called()
         mock_print.assert_any_call("PR creation aborted by user.")
 
-    @patch("autopr.cli.get_commit_messages_for_branch", return_value=None)
+    @patch("autopr.github_service.get_branch_commits", return_value=None)
     @patch("builtins.print")
     def test_handle_pr_create_no_commits_error(self, mock_print, mock_get_commits):
         handle_pr_create_command(base_branch="main", repo_path="/path")
@@ -355,7 +1062,7 @@ class TestHandlePrCreateCommand(unittest.TestCase):
         )
         mock_get_commits.assert_called_once_with("main")
 
-    @patch("autopr.cli.get_commit_messages_for_branch", return_value=[])
+    @patch("autopr.github_service.get_branch_commits", return_value=[])
     @patch("builtins.print")
     def test_handle_pr_create_no_commits_empty(self, mock_print, mock_get_commits):
         handle_pr_create_command(base_branch="main", repo_path="/path")
@@ -364,10 +1071,10 @@ class TestHandlePrCreateCommand(unittest.TestCase):
         )
         mock_get_commits.assert_called_once_with("main")
 
-    @patch("autopr.cli.get_commit_messages_for_branch")
-    @patch("autopr.cli.get_pr_description_suggestion")
+    @patch("autopr.github_service.get_branch_commits")
+    @patch("autopr.ai_service.get_pr_description_suggestion")
     @patch("builtins.input")
-    @patch("autopr.cli.create_pr_gh")
+    @patch("autopr.github_service.create_pr_gh")
     @patch("builtins.print")
     def test_handle_pr_create_command_pr_creation_fails(
         self,
@@ -385,15 +1092,15 @@ class TestHandlePrCreateCommand(unittest.TestCase):
         handle_pr_create_command(base_branch="main", repo_path=".")
 
         mock_get_commits.assert_called_once_with("main")
-        mock_get_pr_description.assert_called_once_with(["feat: new feature"])
+        mock_get_pr_description.assert_called_once_with(["feat: new feature"], issue=None, diffstat=None)
         mock_create_pr_gh.assert_called_once_with("AI PR Title", "AI PR Body", "main")
         mock_print.assert_any_call("Failed to create PR.")
         mock_print.assert_any_call("Error from gh")
 
-    @patch("autopr.cli.get_commit_messages_for_branch")
-    @patch("autopr.cli.get_pr_description_suggestion")
+    @patch("autopr.github_service.get_branch_commits")
+    @patch("autopr.ai_service.get_pr_description_suggestion")
     @patch("builtins.input")
-    @patch("autopr.cli.create_pr_gh")
+    @patch("autopr.github_service.create_pr_gh")
     @patch("builtins.print")
     def test_handle_pr_create_command_empty_title_suggestion(
         self,
@@ -410,17 +1117,17 @@ class TestHandlePrCreateCommand(unittest.TestCase):
         handle_pr_create_command(base_branch="main", repo_path=".")
 
         mock_get_commits.assert_called_once_with("main")
-        mock_get_pr_description.assert_called_once_with(["feat: new feature"])
+        mock_get_pr_description.assert_called_once_with(["feat: new feature"], issue=None, diffstat=None)
         mock_input.assert_called_once_with("Do you want to create this PR? (y/n): ")
         mock_print.assert_any_call(
             "Error: Cannot create PR with an empty title suggestion."
         )
         mock_create_pr_gh.assert_not_called()
 
-    @patch("autopr.cli.get_commit_messages_for_branch")
-    @patch("autopr.cli.get_pr_description_suggestion")
+    @patch("autopr.github_service.get_branch_commits")
+    @patch("autopr.ai_service.get_pr_description_suggestion")
     @patch("builtins.input")
-    @patch("autopr.cli.create_pr_gh")
+    @patch("autopr.github_service.create_pr_gh")
     @patch("builtins.print")
     def test_handle_pr_create_command_empty_body_suggestion_warning(
         self,
@@ -438,7 +1145,7 @@ class TestHandlePrCreateCommand(unittest.TestCase):
         handle_pr_create_command(base_branch="main", repo_path=".")
 
         mock_get_commits.assert_called_once_with("main")
-        mock_get_pr_description.assert_called_once_with(["feat: new feature"])
+        mock_get_pr_description.assert_called_once_with(["feat: new feature"], issue=None, diffstat=None)
         mock_input.assert_called_once_with("Do you want to create this PR? (y/n): ")
         mock_print.assert_any_call(
             "Warning: PR body suggestion is empty. Proceeding with an empty body."
@@ -0,0 +1,139 @@
+import unittest
+from unittest.mock import patch
+import os
+
+from autopr import commit_log
+from autopr.commit_log import (
+    CommitLogParser,
+    CommitRecord,
+    format_commits,
+    parse_commit_log,
+)
+from autopr.diff_utils import FileStat
+
+# `git log -z --format=LOG_FORMAT --numstat` output for three commits: a rename, one
+# with a text and a binary file, and an empty commit with a body.
+LOG = (
+    b"\x1e" + b"1" * 40 + b"\0A B\0ren\0\0\0\n0\t0\t\0b\0c\0"
+    b"\x1e" + b"2" * 40 + b"\0A B\0two\0\0\0\n1\t0\tb\0-\t-\tbin\0"
+    b"\x1e" + b"3" * 40 + b"\0A B\0empty\0body line\n\0\0"
+)
+
+
+class TestCommitLogParser(unittest.TestCase):
+    def test_parses_commits_and_their_files(self):
+        commits = parse_commit_log(LOG)
+
+        self.assertEqual([c.subject for c in commits], ["ren", "two", "empty"])
+        self.assertEqual(commits[0].sha, "1" * 40)
+        self.assertEqual(commits[0].author, "A B")
+        self.assertEqual(commits[0].files, [FileStat("c", 0, 0, old_path="b")])
+        self.assertEqual(
+            commits[1].files,
+            [FileStat("b", 1, 0), FileStat("bin", 0, 0, is_binary=True)],
+        )
+        self.assertEqual(commits[2].body, "body line")
+        self.assertEqual(commits[2].files, [])
+
+    def test_chunks_can_split_anywhere(self):
+        parser = CommitLogParser()
+        for i in range(0, len(LOG), 3):
+            parser.feed(LOG[i : i + 3])
+        self.assertEqual(parser.close(), parse_commit_log(LOG))
+
+    def test_non_ascii_split_across_chunks(self):
+        log = b"\x1e" + b"1" * 40 + "\0Zoë\0café\0\0".encode("utf-8")
+        split = log.index(b"\xc3") + 1
+        parser = CommitLogParser()
+        parser.feed(log[:split])
+        parser.feed(log[split:])
+        commit = parser.close()[0]
+        self.assertEqual((commit.author, commit.subject), ("Zoë", "café"))
+
+    @patch.object(commit_log, "MAX_FILES_PER_COMMIT", 2)
+    @patch.object(commit_log, "MAX_BODY_CHARS", 10)
+    def test_commits_are_kept_compact(self):
+        files = b"".join(f"1\t2\tf{i}.py\0".encode() for i in range(5))
+        log = b"\x1e" + b"1" * 40 + b"\0A\0big\0" + b"x" * 50 + b"\0\0\n" + files
+
+        commit = parse_commit_log(log)[0]
+
+        self.assertEqual(commit.body, "x" * 10 + " [...]")
+        self.assertEqual([f.path for f in commit.files], ["f0.py", "f1.py"])
+        self.assertEqual((commit.file_count, commit.added, commit.removed), (5, 5, 10))
+
+
+class TestFormatCommits(unittest.TestCase):
+    def _commit(self, n, body="", files=0):
+        commit = CommitRecord(f"{n:07d}" + "0" * 33, f"feat: change {n}", body, "Ada")
+        for i in range(files):
+            commit.add_file(FileStat(f"src/f{i}.py", 3, 1))
+        return commit
+
+    def test_everything_fits(self):
+        text = format_commits([self._commit(1, "Why.", files=2)], 1000)
+        self.assertEqual(
+            text,
+            "- feat: change 1 (0000001, Ada)\n"
+            "  Why.\n"
+            "  Files (+6 -2): src/f0.py +3 -1, src/f1.py +3 -1",
+        )
+
+    def test_plain_strings_are_subjects(self):
+        self.assertEqual(
+            format_commits(["feat: one", "fix: two"], 1000), "- feat: one\n- fix: two"
+        )
+
+    def test_bodies_come_before_files(self):
+        commits = [
+            self._commit(1, "A" * 40, files=3),
+            self._commit(2, "B" * 40, files=3),
+        ]
+        # Room for both subjects and both bodies, but not for a file list.
+        text = format_commits(commits, 45)
+
+        self.assertIn("A" * 40, text)
+        self.assertIn("B" * 40, text)
+        self.assertNotIn("Files", text)
+
+    def test_subjects_over_budget_are_counted(self):
+        commits = [self._commit(n) for n in range(100)]
+
+        text = format_commits(commits, 100)
+
+        lines = text.splitlines()
+        self.assertEqual(lines[0], "- feat: change 0 (0000000, Ada)")
+        self.assertTrue(lines[-1].startswith("- ... and "))
+        kept = len(lines) - 1
+        self.assertEqual(lines[-1], f"- ... and {100 - kept} earlier commit(s)")
+        self.assertLess(len(text) // 4, 110)
+
+    def test_file_list_is_shortened(self):
+        text = format_commits([self._commit(1, files=12)], 1000)
+        self.assertIn("src/f7.py", text)
+        self.assertNotIn("src/f8.py", text)
+        self.assertIn("4 more", text)
+
+
+class TestPrCommitsTokenBudget(unittest.TestCase):
+    def test_default_and_override(self):
+        with patch.dict(os.environ, {"AUTOPR_PR_COMMITS_TOKEN_BUDGET": ""}):
+            self.assertEqual(
+                commit_log.get_pr_commits_token_budget(),
+                commit_log.DEFAULT_PR_COMMITS_TOKEN_BUDGET,
+            )
+        with patch.dict(os.environ, {"AUTOPR_PR_COMMITS_TOKEN_BUDGET": "500"}):
+            self.assertEqual(commit_log.get_pr_commits_token_budget(), 500)
+
+    @patch("builtins.print")
+    def test_invalid_value_is_ignored(self, mock_print):
+        with patch.dict(os.environ, {"AUTOPR_PR_COMMITS_TOKEN_BUDGET": "lots"}):
+            self.assertEqual(
+                commit_log.get_pr_commits_token_budget(),
+                commit_log.DEFAULT_PR_COMMITS_TOKEN_BUDGET,
+            )
+        mock_print.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
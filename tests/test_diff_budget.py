@@ -0,0 +1,123 @@
+import unittest
+from unittest.mock import patch
+import os
+
+from autopr.diff_budget import (
+    DEFAULT_COMMIT_TOKEN_BUDGET,
+    budget_diff,
+    classify_path,
+    get_commit_token_budget,
+)
+from autopr.diff_utils import estimate_tokens
+
+
+def _file_diff(path: str, added_lines: int, hunks: int = 1) -> str:
+    parts = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}"]
+    for h in range(hunks):
+        start = 1 + h * 1000
+        parts.append(f"@@ -{start},0 +{start},{added_lines} @@")
+        parts.extend(f"+{path} hunk {h} line {i}" for i in range(added_lines))
+    return "\n".join(parts)
+
+
+class TestClassifyPath(unittest.TestCase):
+    def test_categories(self):
+        self.assertEqual(classify_path("src/app.py"), "source")
+        self.assertEqual(classify_path("tests/test_app.py"), "test")
+        self.assertEqual(classify_path("web/app.spec.ts"), "test")
+        self.assertEqual(classify_path("README.md"), "docs")
+        self.assertEqual(classify_path("setup.cfg"), "config")
+        self.assertEqual(classify_path("package-lock.json"), "lockfile")
+        self.assertEqual(classify_path("frontend/yarn.lock"), "lockfile")
+        self.assertEqual(classify_path("static/app.min.js"), "generated")
+        self.assertEqual(classify_path("proto/service_pb2.py"), "generated")
+        self.assertEqual(classify_path("vendor/lib/thing.go"), "vendored")
+        self.assertEqual(classify_path("web/node_modules/x/index.js"), "vendored")
+
+
+class TestGetCommitTokenBudget(unittest.TestCase):
+    def test_default(self):
+        with patch.dict(os.environ, {"AUTOPR_COMMIT_TOKEN_BUDGET": ""}):
+            self.assertEqual(get_commit_token_budget(), DEFAULT_COMMIT_TOKEN_BUDGET)
+
+    def test_env_override(self):
+        with patch.dict(os.environ, {"AUTOPR_COMMIT_TOKEN_BUDGET": "500"}):
+            self.assertEqual(get_commit_token_budget(), 500)
+
+    @patch("builtins.print")
+    def test_invalid_env_value(self, mock_print):
+        with patch.dict(os.environ, {"AUTOPR_COMMIT_TOKEN_BUDGET": "lots"}):
+            self.assertEqual(get_commit_token_budget(), DEFAULT_COMMIT_TOKEN_BUDGET)
+        mock_print.assert_any_call(
+            "Warning: Ignoring invalid AUTOPR_COMMIT_TOKEN_BUDGET value: lots"
+        )
+
+
+class TestBudgetDiff(unittest.TestCase):
+    def test_diff_within_budget_unchanged(self):
+        diff = _file_diff("app.py", 5)
+        result = budget_diff(diff, max_tokens=10_000)
+        self.assertEqual(result.text, diff)
+        self.assertFalse(result.was_trimmed)
+
+    def test_source_kept_ahead_of_lockfile(self):
+        diff = "\n".join(
+            [_file_diff("package-lock.json", 2000), _file_diff("src/app.py", 10)]
+        )
+        result = budget_diff(diff, max_tokens=500)
+
+        self.assertTrue(result.was_trimmed)
+        self.assertIn("+src/app.py hunk 0 line 9", result.text)
+        self.assertNotIn("package-lock.json hunk", result.text)
+        self.assertIn(
+            "# - package-lock.json (lockfile): omitted, +2000 -0 lines", result.text
+        )
+        self.assertLessEqual(result.sent_tokens, 500)
+        self.assertEqual(result.sent_tokens, estimate_tokens(result.text))
+
+    def test_partial_file_summary_and_original_order(self):
+        diff = "\n".join(
+            [_file_diff("src/a.py", 5), _file_diff("src/b.py", 40, hunks=4)]
+        )
+        result = budget_diff(diff, max_tokens=700)
+
+        self.assertLess(result.text.index("src/a.py"), result.text.index("src/b.py"))
+        self.assertRegex(result.text, r"src/b.py \(source\): \d of 4 hunks omitted")
+
+    def test_hunk_too_large_for_the_budget_is_cut_short(self):
+        diff = "\n".join([_file_diff("src/app.py", 3), _file_diff("src/big.py", 3000)])
+        result = budget_diff(diff, max_tokens=2000)
+
+        self.assertIn("+src/app.py hunk 0 line 2", result.text)
+        self.assertIn("+src/big.py hunk 0 line 0", result.text)
+        self.assertNotIn("+src/big.py hunk 0 line 2999", result.text)
+        self.assertRegex(result.text, r"@@ -1,0 \+1,\d+ @@\n\+src/big.py hunk 0 line 0")
+        self.assertRegex(
+            result.text,
+            r"# - src/big.py \(source\): hunk at line 1 cut short, \+\d+ -0 lines",
+        )
+        self.assertTrue(result.was_trimmed)
+        self.assertGreater(result.sent_tokens, 1500)
+        self.assertLessEqual(result.sent_tokens, 2000)
+
+    def test_lockfile_is_not_cut_short(self):
+        diff = "\n".join([_file_diff("src/app.py", 3), _file_diff("yarn.lock", 3000)])
+        result = budget_diff(diff, max_tokens=2000)
+
+        self.assertNotIn("yarn.lock hunk", result.text)
+        self.assertIn("# - yarn.lock (lockfile): omitted, +3000 -0 lines", result.text)
+
+    def test_binary_file_header_kept_when_it_fits(self):
+        binary = "diff --git a/logo.png b/logo.png\nBinary files a/logo.png and b/logo.png differ"
+        diff = "\n".join([_file_diff("src/app.py", 200), binary])
+        result = budget_diff(diff, max_tokens=1500)
+        self.assertIn("Binary files a/logo.png and b/logo.png differ", result.text)
+
+    def test_unparseable_diff_truncated(self):
+        result = budget_diff("x" * 10_000, max_tokens=100)
+        self.assertEqual(len(result.text), 400)
+        self.assertTrue(result.was_trimmed)
+
+
+if __name__ == "__main__":
+    unittest.main()
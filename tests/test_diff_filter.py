@@ -0,0 +1,185 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+
+from autopr.diff_filter import (
+    FilterRules,
+    FilteredDiff,
+    filter_diff,
+    filter_files,
+    is_whitespace_only,
+    load_filter_rules,
+)
+from autopr.diff_utils import parse_diff
+
+
+def _file(path, hunks, extra_header=""):
+    header = f"diff --git a/{path} b/{path}\n{extra_header}--- a/{path}\n+++ b/{path}\n"
+    return header + "\n".join(hunks)
+
+
+SOURCE = _file(
+    "app.py", ["@@ -10,2 +10,2 @@ def main():\n-    old()\n+    new()\n     done()"]
+)
+LOCKFILE = _file("yarn.lock", ["@@ -1,2 +1,2 @@\n-a@1.0.0\n+a@1.0.1\n b@2.0.0"])
+NO_RULES = FilterRules([])
+
+
+class TestFilterDiff(unittest.TestCase):
+    def test_clean_diff_returned_unchanged(self):
+        result = filter_diff(SOURCE, NO_RULES)
+        self.assertEqual(result.text, SOURCE)
+        self.assertFalse(result.was_filtered)
+
+    def test_lockfile_replaced_by_stub(self):
+        result = filter_diff(SOURCE + "\n" + LOCKFILE, NO_RULES)
+        self.assertIn("+    new()", result.text)
+        self.assertIn("diff --git a/yarn.lock b/yarn.lock", result.text)
+        self.assertIn(
+            "# autopr: yarn.lock omitted (lockfile, +1 -1 lines)", result.text
+        )
+        self.assertNotIn("a@1.0.1", result.text)
+        self.assertEqual(result.dropped_files, 1)
+
+    def test_generated_and_vendored_paths_dropped(self):
+        diff = "\n".join(
+            [
+                _file("static/app.min.js", ["@@ -1 +1 @@\n-a\n+b"]),
+                _file("vendor/lib/x.go", ["@@ -1 +1 @@\n-a\n+b"]),
+                SOURCE,
+            ]
+        )
+        result = filter_diff(diff, NO_RULES)
+        self.assertIn("app.min.js omitted (generated", result.text)
+        self.assertIn("x.go omitted (vendored", result.text)
+        self.assertEqual(result.dropped_files, 2)
+
+    def test_binary_file_dropped(self):
+        diff = (
+            "diff --git a/logo.png b/logo.png\nindex 1..2 100644\n"
+            "GIT binary patch\nliteral 1234\nzcmV...\n"
+        )
+        result = filter_diff(SOURCE + "\n" + diff, NO_RULES)
+        self.assertIn("# autopr: logo.png omitted (binary", result.text)
+        self.assertNotIn("zcmV", result.text)
+
+    def test_generated_marker_in_new_file(self):
+        diff = _file(
+            "api/client.py",
+            [
+                "@@ -0,0 +1,3 @@\n+# Code generated by openapi-generator. DO NOT EDIT.\n+import x\n+x.run()"
+            ],
+            extra_header="new file mode 100644\n",
+        )
+        result = filter_diff(diff, NO_RULES)
+        self.assertIn("api/client.py omitted (generated", result.text)
+
+    def test_whitespace_only_hunk_replaced_by_stub(self):
+        diff = _file(
+            "app.js",
+            [
+                "@@ -1,2 +1,2 @@\n-function f( a ) {\n+function f(a) {\n   return a;",
+                "@@ -20,1 +20,1 @@\n-x = 1\n+x = 2",
+                "@@ -30,2 +30,3 @@\n a = 1\n+\n b = 2",
+            ],
+        )
+        result = filter_diff(diff, NO_RULES)
+        self.assertEqual(result.dropped_hunks, 2)
+        self.assertIn("# autopr: 2 whitespace-only hunk(s) omitted", result.text)
+        # The remaining hunk keeps its position in the file.
+        files = parse_diff(result.text)
+        self.assertEqual(len(files[0].hunks), 1)
+        self.assertEqual(files[0].hunks[0].new_start, 20)
+
+    def test_ignore_pattern_overrides_defaults(self):
+        rules = FilterRules([("*.lock", False), ("docs/", True)])
+        diff = LOCKFILE + "\n" + _file("docs/guide.md", ["@@ -1 +1 @@\n-a\n+b"])
+        result = filter_diff(diff, rules)
+        self.assertIn("a@1.0.1", result.text)
+        self.assertIn("docs/guide.md omitted (matched an ignore pattern", result.text)
+
+    def test_python_indentation_is_not_whitespace(self):
+        diff = _file(
+            "app.py",
+            [
+                "@@ -1,2 +1,2 @@\n if a:\n-    run()\n+run()",
+                "@@ -10,1 +10,2 @@\n-x = 1   \n+x = 1\n+",
+            ],
+        )
+        result = filter_diff(diff, NO_RULES)
+        self.assertEqual(result.dropped_hunks, 1)
+        self.assertIn("+run()", result.text)
+
+    def test_disabled_by_env(self):
+        with patch.dict(os.environ, {"AUTOPR_NO_DIFF_FILTER": "1"}):
+            result = filter_diff(LOCKFILE, NO_RULES)
+        self.assertEqual(result.text, LOCKFILE)
+
+    def test_unparseable_diff_unchanged(self):
+        self.assertEqual(filter_diff("not a diff", NO_RULES).text, "not a diff")
+
+    def test_filter_files_matches_filter_diff(self):
+        diff = SOURCE + "\n" + LOCKFILE
+        totals = FilteredDiff("")
+        files = list(filter_files(parse_diff(diff), totals, NO_RULES))
+        expected = filter_diff(diff, NO_RULES)
+
+        self.assertEqual("\n".join(f.text for f in files), expected.text)
+        self.assertEqual(totals.dropped_files, expected.dropped_files)
+        # Estimated per file, so rounding may differ by a token per dropped file.
+        self.assertAlmostEqual(totals.saved_tokens, expected.saved_tokens, delta=1)
+        self.assertEqual(totals.text, "")
+
+
+class TestWhitespaceOnly(unittest.TestCase):
+    def test_detection(self):
+        reindented = parse_diff(_file("a.py", ["@@ -1 +1 @@\n-\tx = 1\n+    x = 1"]))[
+            0
+        ].hunks[0]
+        changed = parse_diff(_file("a.py", ["@@ -1 +1 @@\n-x = 1\n+x = 2"]))[0].hunks[0]
+        self.assertTrue(is_whitespace_only(reindented))
+        self.assertFalse(is_whitespace_only(reindented, keep_indentation=True))
+        self.assertFalse(is_whitespace_only(changed))
+
+
+class TestLoadFilterRules(unittest.TestCase):
+    def test_reads_gitattributes_and_autoprignore(self):
+        with tempfile.TemporaryDirectory() as repo:
+            with open(os.path.join(repo, ".gitattributes"), "w") as f:
+                f.write(
+                    "# comment\napi/*.py linguist-generated=true\n*.lock -linguist-generated\nthird/ linguist-vendored text\n"
+                )
+            with open(os.path.join(repo, ".autoprignore"), "w") as f:
+                f.write("fixtures/*.json\n!api/keep.py\n")
+            rules = load_filter_rules(repo)
+
+        self.assertTrue(rules.decision("api/models.py"))
+        self.assertFalse(rules.decision("api/keep.py"))
+        self.assertFalse(rules.decision("poetry.lock"))
+        self.assertTrue(rules.decision("third/lib.c"))
+        self.assertTrue(rules.decision("fixtures/data.json"))
+        self.assertIsNone(rules.decision("app.py"))
+
+    def test_defaults_to_the_top_of_the_worktree(self):
+        with tempfile.TemporaryDirectory() as repo:
+            os.mkdir(os.path.join(repo, ".git"))
+            os.makedirs(os.path.join(repo, "src", "app"))
+            with open(os.path.join(repo, ".autoprignore"), "w") as f:
+                f.write("fixtures/*.json\n")
+            cwd = os.getcwd()
+            os.chdir(os.path.join(repo, "src", "app"))
+            try:
+                rules = load_filter_rules()
+            finally:
+                os.chdir(cwd)
+
+        self.assertTrue(rules.decision("fixtures/data.json"))
+
+    def test_missing_files(self):
+        with tempfile.TemporaryDirectory() as repo:
+            self.assertEqual(load_filter_rules(repo).patterns, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import unittest
+from unittest.mock import patch
+import os
+
+from autopr.diff_budget import budget_diff
+from autopr.diff_filter import FilterRules, filter_diff
+from autopr.diff_spool import DiffSpool, get_memory_limit, prepare_diff
+from autopr.diff_triage import plan_diff
+from autopr.diff_utils import FileStat, parse_diff
+
+
+def _file(path: str, added_lines: int) -> str:
+    parts = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}"]
+    parts.append(f"@@ -1,0 +1,{added_lines} @@")
+    parts.extend(f"+{path} line {i}" for i in range(added_lines))
+    return "\n".join(parts)
+
+
+DIFF = "\n".join(
+    [
+        _file("src/app.py", 3),
+        _file("yarn.lock", 200),
+        _file("src/big.py", 400),
+        _file("README.md", 5),
+    ]
+)
+
+
+class TestDiffSpool(unittest.TestCase):
+    def test_small_diff_stays_in_memory(self):
+        with DiffSpool.from_text("\n  " + DIFF + "\n\n") as spool:
+            self.assertFalse(spool.spilled)
+            self.assertTrue(spool)
+            self.assertEqual(spool.text(), DIFF)
+            self.assertEqual(spool.content_size, len(DIFF))
+
+    def test_large_diff_spills_to_disk(self):
+        spool = DiffSpool(memory_limit=1000)
+        encoded = (DIFF + "\n").encode()
+        for i in range(0, len(encoded), 333):
+            spool.write(encoded[i : i + 333])
+        spool.finish()
+
+        self.assertTrue(spool.spilled)
+        self.assertEqual(spool.size, len(encoded))
+        self.assertEqual(list(spool.iter_lines()), DIFF.split("\n"))
+        self.assertEqual(spool.iter_files().__next__().path, "src/app.py")
+        self.assertEqual(
+            [(f.path, f.text) for f in spool.iter_files()],
+            [(f.path, f.text) for f in parse_diff(DIFF)],
+        )
+        self.assertEqual(spool.text(max_bytes=10), DIFF[:10])
+        spool.close()
+        self.assertFalse(spool)
+
+    def test_blank_diff_is_false(self):
+        with DiffSpool.from_text("") as spool:
+            self.assertFalse(spool)
+        with DiffSpool.from_text(" \n\n", memory_limit=0) as spool:
+            self.assertFalse(spool)
+
+    def test_trailing_whitespace_longer_than_a_block(self):
+        with DiffSpool.from_text("diff" + "\n" * 10000, memory_limit=0) as spool:
+            self.assertEqual(spool.text(), "diff")
+
+    def test_iter_text_keeps_characters_split_across_chunks(self):
+        text = "+café ☃ " * 100
+        with DiffSpool.from_text(text, memory_limit=0) as spool:
+            pieces = list(spool.iter_text(chunk_bytes=7))
+        self.assertEqual("".join(pieces), text.strip())
+        self.assertGreater(len(pieces), 1)
+
+    def test_crlf_line_endings(self):
+        with DiffSpool.from_text("a\r\nb\r\n") as spool:
+            self.assertEqual(list(spool.iter_lines()), ["a", "b"])
+
+    def test_memory_limit_from_environment(self):
+        with patch.dict(os.environ, {"AUTOPR_DIFF_MEMORY_LIMIT": "1024"}):
+            self.assertEqual(get_memory_limit(), 1024)
+            self.assertEqual(DiffSpool().memory_limit, 1024)
+        with patch.dict(os.environ, {"AUTOPR_DIFF_MEMORY_LIMIT": "lots"}), patch(
+            "builtins.print"
+        ):
+            self.assertEqual(get_memory_limit(), 8 * 1024 * 1024)
+
+
+@patch("autopr.diff_spool.load_filter_rules", return_value=FilterRules([]))
+class TestPrepareDiff(unittest.TestCase):
+    def test_matches_filtering_and_budgeting_the_whole_text(self, _):
+        for max_tokens in (100000, 1500, 300):
+            with self.subTest(max_tokens=max_tokens):
+                expected_filtered = filter_diff(DIFF, FilterRules([]))
+                expected = budget_diff(expected_filtered.text, max_tokens)
+                with DiffSpool.from_text(DIFF, memory_limit=0) as spool:
+                    filtered, budgeted = prepare_diff(spool, max_tokens)
+
+                self.assertEqual(budgeted.text, expected.text)
+                self.assertEqual(budgeted.total_tokens, expected.total_tokens)
+                self.assertEqual(budgeted.omitted_hunks, expected.omitted_hunks)
+                self.assertEqual(filtered.dropped_files, 1)
+                self.assertAlmostEqual(
+                    filtered.saved_tokens, expected_filtered.saved_tokens, delta=1
+                )
+
+    def test_not_a_diff(self, _):
+        with DiffSpool.from_text("b" * 4001) as spool:
+            filtered, budgeted = prepare_diff(spool, 2000)
+            self.assertEqual(budgeted.text, "b" * 4001)
+            self.assertFalse(filtered.was_filtered)
+
+            _, budgeted = prepare_diff(spool, 100)
+            self.assertEqual(budgeted.text, "b" * 400)
+            self.assertTrue(budgeted.was_trimmed)
+
+    def test_filter_disabled(self, mock_rules):
+        with patch.dict(os.environ, {"AUTOPR_NO_DIFF_FILTER": "1"}):
+            with DiffSpool.from_text(DIFF) as spool:
+                filtered, budgeted = prepare_diff(spool, 100000)
+        self.assertEqual(budgeted.text, DIFF)
+        self.assertFalse(filtered.was_filtered)
+        mock_rules.assert_not_called()
+
+    def test_plan_stubs_and_deferred_files(self, _):
+        stats = [
+            FileStat("src/app.py", 3, 0),
+            FileStat("yarn.lock", 200, 0),
+            FileStat("src/big.py", 40000, 0),
+            FileStat("README.md", 5, 0),
+        ]
+        plan = plan_diff(stats, 1000, FilterRules([]))
+        self.assertEqual([s.path for s in plan.fetch], ["src/app.py", "README.md"])
+        fetched = _file("src/app.py", 3) + "\n" + _file("README.md", 5)
+
+        with DiffSpool.from_text(fetched) as spool:
+            filtered, budgeted = prepare_diff(spool, 1000, plan)
+
+        self.assertEqual(filtered.dropped_files, 1)
+        self.assertGreater(filtered.saved_tokens, 0)
+        self.assertTrue(budgeted.was_trimmed)
+        # The stub sits where the lockfile is in the diff.
+        self.assertLess(
+            budgeted.text.index("+src/app.py line 2"),
+            budgeted.text.index("# autopr: yarn.lock omitted"),
+        )
+        self.assertLess(
+            budgeted.text.index("# autopr: yarn.lock omitted"),
+            budgeted.text.index("+README.md line 0"),
+        )
+        self.assertTrue(
+            budgeted.text.endswith("# - src/big.py (source): omitted, +40000 -0 lines")
+        )
+        self.assertGreater(budgeted.total_tokens, 1000)
+
+    def test_plan_with_one_oversized_file(self, _):
+        # One file changed in many places, far more than the budget holds.
+        parts = [
+            "diff --git a/src/big.py b/src/big.py",
+            "--- a/src/big.py",
+            "+++ b/src/big.py",
+        ]
+        for hunk in range(400):
+            parts.append(f"@@ -{hunk * 20 + 1},0 +{hunk * 20 + 1},10 @@")
+            parts.extend(f"+hunk {hunk} line {i}" for i in range(10))
+        plan = plan_diff([FileStat("src/big.py", 4000, 0)], 1000, FilterRules([]))
+        self.assertEqual([s.path for s in plan.fetch], ["src/big.py"])
+
+        with DiffSpool.from_text("\n".join(parts)) as spool:
+            _, budgeted = prepare_diff(spool, 1000, plan)
+
+        self.assertIn("+hunk 0 line 0", budgeted.text)
+        self.assertTrue(budgeted.was_trimmed)
+        self.assertGreater(budgeted.sent_tokens, 500)
+        self.assertLessEqual(budgeted.sent_tokens, 1000)
+
+    def test_plan_without_fetched_files(self, _):
+        plan = plan_diff([FileStat("yarn.lock", 2, 1)], 1000, FilterRules([]))
+        filtered, budgeted = prepare_diff(None, 1000, plan)
+        self.assertEqual(
+            budgeted.text,
+            "diff --git a/yarn.lock b/yarn.lock\n# autopr: yarn.lock omitted (lockfile, +2 -1 lines)",
+        )
+        self.assertEqual(filtered.dropped_files, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import patch
+import os
+
+from autopr.diff_filter import FilterRules
+from autopr.diff_triage import FETCH_HEADROOM, estimate_file_tokens, plan_diff
+from autopr.diff_utils import FileStat
+
+NO_RULES = FilterRules([])
+
+
+class TestPlanDiff(unittest.TestCase):
+    def test_small_diff_is_fetched_in_full(self):
+        stats = [FileStat("src/app.py", 10, 2), FileStat("README.md", 3, 0)]
+        plan = plan_diff(stats, 16000, NO_RULES)
+        self.assertTrue(plan.complete)
+        self.assertEqual(plan.fetch, stats)
+        self.assertEqual((plan.added, plan.removed), (13, 2))
+
+    def test_files_dropped_by_path_are_not_fetched(self):
+        stats = [
+            FileStat("src/app.py", 1, 1),
+            FileStat("package-lock.json", 900, 800),
+            FileStat("vendor/lib.js", 50, 0),
+            FileStat("logo.png", 0, 0, is_binary=True),
+            FileStat("data/keep.csv", 1, 0),
+        ]
+        rules = FilterRules([("*.csv", True), ("vendor/", False)])
+        plan = plan_diff(stats, 16000, rules)
+
+        self.assertFalse(plan.complete)
+        self.assertEqual([s.path for s in plan.fetch], ["src/app.py", "vendor/lib.js"])
+        self.assertEqual(
+            [(s.path, reason) for s, reason in plan.dropped],
+            [
+                ("package-lock.json", "lockfile"),
+                ("logo.png", "binary"),
+                ("data/keep.csv", "matched an ignore pattern"),
+            ],
+        )
+        self.assertEqual(
+            [(position, stub.header) for position, stub in plan.stub_files()][0],
+            (
+                1,
+                "diff --git a/package-lock.json b/package-lock.json\n"
+                "# autopr: package-lock.json omitted (lockfile, +900 -800 lines)",
+            ),
+        )
+
+    def test_source_and_small_files_fetched_first(self):
+        stats = [
+            FileStat("docs/guide.md", 100, 0),
+            FileStat("src/huge.py", 5000, 0),
+            FileStat("src/a.py", 100, 0),
+            FileStat("tests/test_a.py", 100, 0),
+        ]
+        # With the fetch headroom, room for two 100-line files
+        budget = estimate_file_tokens(stats[0])
+        plan = plan_diff(stats, budget, NO_RULES)
+
+        self.assertEqual([s.path for s in plan.fetch], ["src/a.py", "tests/test_a.py"])
+        self.assertEqual(
+            [s.path for s in plan.deferred], ["docs/guide.md", "src/huge.py"]
+        )
+        self.assertEqual(
+            plan.deferred_summary(),
+            [
+                "docs/guide.md (docs): omitted, +100 -0 lines",
+                "src/huge.py (source): omitted, +5000 -0 lines",
+            ],
+        )
+        self.assertEqual(
+            plan.deferred_tokens,
+            estimate_file_tokens(stats[0]) + estimate_file_tokens(stats[1]),
+        )
+
+    def test_oversized_file_is_still_fetched(self):
+        stats = [FileStat("src/big.py", 4000, 0)]
+        self.assertGreater(estimate_file_tokens(stats[0]), 16000 * FETCH_HEADROOM)
+
+        plan = plan_diff(stats, 16000, NO_RULES)
+
+        self.assertTrue(plan.complete)
+        self.assertEqual(plan.fetch, stats)
+
+    def test_top_ranked_file_fetched_when_all_are_oversized(self):
+        stats = [FileStat("docs/big.md", 5000, 0), FileStat("src/big.py", 6000, 0)]
+
+        plan = plan_diff(stats, 1000, NO_RULES)
+
+        self.assertEqual([s.path for s in plan.fetch], ["src/big.py"])
+        self.assertEqual([s.path for s in plan.deferred], ["docs/big.md"])
+
+    def test_renames_fetch_both_paths(self):
+        plan = plan_diff([FileStat("new.py", 1, 0, old_path="old.py")], 16000, NO_RULES)
+        self.assertEqual(plan.paths, ["old.py", "new.py"])
+
+    def test_filter_disabled(self):
+        stats = [FileStat("yarn.lock", 1, 1)]
+        with patch.dict(os.environ, {"AUTOPR_NO_DIFF_FILTER": "1"}):
+            plan = plan_diff(stats, 16000)
+        self.assertTrue(plan.complete)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,216 @@
+import unittest
+
+from autopr.diff_utils import (
+    DiffLineIndex,
+    FileStat,
+    Hunk,
+    estimate_tokens,
+    hunk_head,
+    index_diff_lines,
+    iter_file_diffs,
+    parse_diff,
+    parse_numstat,
+    restrict_diff,
+    split_hunk,
+)
+
+SAMPLE_DIFF = """diff --git a/src/app.py b/src/app.py
+index 1111111..2222222 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -1,3 +1,4 @@ def main():
+ import os
+-import sys
++import sys, re
++import json
+ print("hi")
+@@ -10,2 +11,2 @@
+-old = 1
++new = 1
+ keep = 2
+diff --git a/logo.png b/logo.png
+new file mode 100644
+index 0000000..3333333
+Binary files /dev/null and b/logo.png differ
+diff --git a/old_name.txt b/old_name.txt
+deleted file mode 100644
+index 4444444..0000000
+--- a/old_name.txt
++++ /dev/null
+@@ -1 +0,0 @@
+-gone"""
+
+
+class TestEstimateTokens(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(estimate_tokens(""), 0)
+
+    def test_rounds_up(self):
+        self.assertEqual(estimate_tokens("abc"), 1)
+        self.assertEqual(estimate_tokens("abcde"), 2)
+
+
+class TestParseDiff(unittest.TestCase):
+    def test_parses_files_and_hunks(self):
+        files = parse_diff(SAMPLE_DIFF)
+        self.assertEqual(
+            [f.path for f in files], ["src/app.py", "logo.png", "old_name.txt"]
+        )
+
+        app = files[0]
+        self.assertEqual(len(app.hunks), 2)
+        self.assertEqual(app.hunks[0].new_start, 1)
+        self.assertEqual(app.hunks[0].new_count, 4)
+        self.assertEqual(app.hunks[0].section, " def main():")
+        self.assertEqual(app.hunks[1].old_start, 10)
+        self.assertEqual(app.added, 3)
+        self.assertEqual(app.removed, 2)
+        self.assertIn("+++ b/src/app.py", app.header_lines)
+
+    def test_binary_file(self):
+        files = parse_diff(SAMPLE_DIFF)
+        self.assertTrue(files[1].is_binary)
+        self.assertEqual(files[1].hunks, [])
+
+    def test_deleted_file_keeps_old_path(self):
+        deleted = parse_diff(SAMPLE_DIFF)[2]
+        self.assertEqual(deleted.path, "old_name.txt")
+        self.assertEqual(deleted.old_path, "old_name.txt")
+        self.assertEqual(deleted.hunks[0].new_count, 0)
+
+    def test_text_round_trips_hunks(self):
+        app = parse_diff(SAMPLE_DIFF)[0]
+        self.assertIn("@@ -1,3 +1,4 @@ def main():\n import os\n-import sys", app.text)
+
+    def test_ignores_preamble_and_empty_input(self):
+        self.assertEqual(parse_diff(""), [])
+        self.assertEqual(parse_diff("not a diff at all"), [])
+
+    def test_iter_file_diffs_yields_each_file_once_it_ends(self):
+        read = []
+
+        def lines():
+            for line in SAMPLE_DIFF.splitlines():
+                read.append(line)
+                yield line
+
+        files = iter_file_diffs(lines())
+        first = next(files)
+        self.assertEqual(first.path, "src/app.py")
+        # Only the lines up to the next file's header have been read.
+        self.assertEqual(read[-1], "diff --git a/logo.png b/logo.png")
+        self.assertEqual([f.path for f in files], ["logo.png", "old_name.txt"])
+
+    def test_iter_file_diffs_truncates_large_hunks(self):
+        big = (
+            "diff --git a/data.csv b/data.csv\n@@ -1,2 +1,500 @@\n-a\n-b\n"
+            + "\n".join(f"+row {i}" for i in range(500))
+        )
+        full = parse_diff(big)[0].hunks[0]
+        [file_diff] = list(iter_file_diffs(big.splitlines(), max_hunk_chars=100))
+        hunk = file_diff.hunks[0]
+
+        self.assertTrue(hunk.is_truncated)
+        # The lines that fit in max_hunk_chars are kept.
+        self.assertEqual(hunk.lines, ["-a", "-b"] + [f"+row {i}" for i in range(10)])
+        self.assertLessEqual(len(hunk.text), 100)
+        self.assertEqual((hunk.added, hunk.removed), (500, 2))
+        self.assertEqual(hunk.size, len(full.text))
+        self.assertEqual(file_diff.size, len(parse_diff(big)[0].text))
+        self.assertFalse(full.is_truncated)
+
+
+class TestParseNumstat(unittest.TestCase):
+    def test_files_renames_and_binaries(self):
+        output = (
+            "3\t1\tsrc/app.py\0"
+            "-\t-\tlogo.png\0"
+            "1\t0\t\0old name.txt\0new name.txt\0"
+        )
+        self.assertEqual(
+            parse_numstat(output),
+            [
+                FileStat("src/app.py", 3, 1),
+                FileStat("logo.png", 0, 0, is_binary=True),
+                FileStat("new name.txt", 1, 0, old_path="old name.txt"),
+            ],
+        )
+
+    def test_empty(self):
+        self.assertEqual(parse_numstat(""), [])
+
+
+class TestDiffLineIndex(unittest.TestCase):
+    def test_commentable_lines(self):
+        index = index_diff_lines(SAMPLE_DIFF)
+        # Added and context lines on the right side; removed lines have no right-side number.
+        self.assertEqual(index.lines["src/app.py"], [1, 2, 3, 4, 11, 12])
+        self.assertEqual(index.lines["logo.png"], [])
+        self.assertEqual(index.lines["old_name.txt"], [])
+
+    def test_resolve_path(self):
+        index = index_diff_lines(SAMPLE_DIFF)
+        self.assertEqual(index.resolve_path("src/app.py"), "src/app.py")
+        self.assertEqual(index.resolve_path("b/src/app.py"), "src/app.py")
+        self.assertEqual(index.resolve_path("./src/app.py"), "src/app.py")
+        self.assertEqual(index.resolve_path("app.py"), "src/app.py")
+        self.assertIsNone(index.resolve_path("other.py"))
+
+    def test_nearest_line(self):
+        index = index_diff_lines(SAMPLE_DIFF)
+        self.assertEqual(index.nearest_line("src/app.py", 3, 10), 3)
+        self.assertEqual(index.nearest_line("src/app.py", 7, 10), 4)
+        self.assertEqual(index.nearest_line("src/app.py", 9, 10), 11)
+        self.assertIsNone(index.nearest_line("src/app.py", 40, 10))
+        self.assertIsNone(index.nearest_line("logo.png", 1, 10))
+
+
+class TestRestrictDiff(unittest.TestCase):
+    def test_keeps_hunks_on_lines_of_the_index(self):
+        index = DiffLineIndex({"src/app.py": [11, 12], "logo.png": []})
+        restricted = restrict_diff(SAMPLE_DIFF, index)
+
+        files = parse_diff(restricted)
+        self.assertEqual([f.path for f in files], ["src/app.py", "logo.png"])
+        self.assertEqual([hunk.new_start for hunk in files[0].hunks], [11])
+        self.assertTrue(
+            restricted.startswith("diff --git a/src/app.py b/src/app.py\nindex")
+        )
+
+    def test_drops_files_outside_the_index(self):
+        self.assertEqual(
+            restrict_diff(SAMPLE_DIFF, DiffLineIndex({"src/app.py": [40]})), ""
+        )
+
+
+class TestSplitHunk(unittest.TestCase):
+    def test_small_hunk_untouched(self):
+        hunk = Hunk(1, 1, 1, 1, lines=["-a", "+b"])
+        self.assertEqual(split_hunk(hunk, 1000), [hunk])
+
+    def test_split_keeps_line_numbers(self):
+        lines = [" context"] * 4 + ["-removed"] * 2 + ["+added"] * 3 + [" tail"] * 4
+        hunk = Hunk(10, 10, 20, 11, lines=lines)
+        pieces = split_hunk(hunk, 12)
+
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual(sum(len(p.lines) for p in pieces), len(lines))
+        self.assertEqual(sum(p.old_count for p in pieces), 10)
+        self.assertEqual(sum(p.new_count for p in pieces), 11)
+        for previous, current in zip(pieces, pieces[1:]):
+            self.assertEqual(current.old_start, previous.old_start + previous.old_count)
+            self.assertEqual(current.new_start, previous.new_start + previous.new_count)
+
+    def test_hunk_head(self):
+        lines = [" context"] * 2 + ["+added"] * 40
+        head = hunk_head(Hunk(5, 2, 5, 42, lines=lines), 30)
+
+        self.assertEqual(head.lines, lines[: len(head.lines)])
+        self.assertLess(len(head.lines), len(lines))
+        self.assertLessEqual(estimate_tokens(head.text), 30)
+        self.assertEqual((head.old_start, head.old_count), (5, 2))
+        self.assertEqual((head.new_start, head.new_count), (5, len(head.lines)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+import unittest
+from unittest.mock import patch
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from autopr import git_reader, runner
+from autopr.git_reader import GitObjectReader, GitReadError, close_readers, get_reader
+from autopr.runner import get_timings, reset_timings
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "Ana",
+    "GIT_AUTHOR_EMAIL": "ana@example.com",
+    "GIT_COMMITTER_NAME": "Ana",
+    "GIT_COMMITTER_EMAIL": "ana@example.com",
+}
+
+
+def _git(repo, *args):
+    return subprocess.run(
+        ["git", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+        text=True,
+        env={**os.environ, **GIT_ENV},
+    ).stdout.strip()
+
+
+class _RepoTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.repo = self._tmp.name
+        _git(self.repo, "init", "-q")
+        os.mkdir(os.path.join(self.repo, "src"))
+        with open(os.path.join(self.repo, "src", "app.py"), "w") as f:
+            f.write("print('v1')\n")
+        with open(os.path.join(self.repo, "README"), "wb") as f:
+            f.write(b"binary\0data\n")
+        _git(self.repo, "add", ".")
+        _git(self.repo, "commit", "-q", "-m", "First\n\nWith a body.")
+        self.first = _git(self.repo, "rev-parse", "HEAD")
+        with open(os.path.join(self.repo, "src", "app.py"), "w") as f:
+            f.write("print('v2')\n")
+        _git(self.repo, "commit", "-q", "-am", "Second")
+        self.second = _git(self.repo, "rev-parse", "HEAD")
+
+        self.reader = GitObjectReader(self.repo)
+        self.addCleanup(self.reader.close)
+        reset_timings()
+        self.addCleanup(reset_timings)
+
+
+class TestGitObjectReader(_RepoTestCase):
+    def test_read_file_at_revisions(self):
+        self.assertEqual(
+            self.reader.read_file(self.first, "src/app.py"), b"print('v1')\n"
+        )
+        self.assertEqual(self.reader.read_file("HEAD", "src/app.py"), b"print('v2')\n")
+        self.assertEqual(self.reader.read_file("HEAD", "README"), b"binary\0data\n")
+        self.assertIsNone(self.reader.read_file("HEAD", "missing.py"))
+        self.assertIsNone(self.reader.read_blob("HEAD"))  # A commit, not a blob
+
+    def test_many_lookups_start_each_process_once(self):
+        for _ in range(50):
+            self.reader.read_file("HEAD~1", "src/app.py")
+            self.reader.read_file("HEAD", "src/app.py")
+            self.reader.info("HEAD")
+        self.assertEqual(
+            sorted((t.label, t.outcome) for t in get_timings()),
+            [
+                ("git cat-file --batch", "started"),
+                ("git cat-file --batch-check", "started"),
+            ],
+        )
+
+    def test_info(self):
+        info = self.reader.info("HEAD:src/app.py")
+        self.assertEqual((info.type, info.size), ("blob", 12))
+        self.assertEqual(self.reader.info("HEAD").oid, self.second)
+        self.assertIsNone(self.reader.info("no-such-branch"))
+
+    def test_read_tree(self):
+        entries = {e.name: e for e in self.reader.read_tree("HEAD")}
+        self.assertEqual(sorted(entries), ["README", "src"])
+        self.assertEqual((entries["src"].type, entries["src"].mode), ("tree", "40000"))
+        self.assertEqual(entries["README"].type, "blob")
+        self.assertEqual(
+            entries["README"].oid, _git(self.repo, "rev-parse", "HEAD:README")
+        )
+        self.assertEqual(
+            [e.name for e in self.reader.read_tree("HEAD:src")], ["app.py"]
+        )
+
+    def test_read_commit(self):
+        commit = self.reader.read_commit(self.second)
+        self.assertEqual(commit.parents, [self.first])
+        self.assertEqual(commit.tree, _git(self.repo, "rev-parse", "HEAD^{tree}"))
+        self.assertTrue(commit.author.startswith("Ana <ana@example.com>"))
+        self.assertEqual(
+            self.reader.read_commit(self.first).message, "First\n\nWith a body.\n"
+        )
+        self.assertIsNone(self.reader.read_commit("HEAD:README"))
+        _git(self.repo, "tag", "-a", "v1", "-m", "Release", self.first)
+        self.assertEqual(self.reader.read_commit("v1").oid, self.first)
+        self.assertEqual(
+            [e.name for e in self.reader.read_tree("v1")], ["README", "src"]
+        )
+
+    def test_blob_cache(self):
+        oid = _git(self.repo, "rev-parse", "HEAD:src/app.py")
+        self.reader.read_blob(oid)
+        with patch.object(self.reader, "read") as mock_read:
+            self.assertEqual(self.reader.read_blob(oid), b"print('v2')\n")
+            self.assertEqual(
+                self.reader.read_file("HEAD", "src/app.py"), b"print('v2')\n"
+            )
+        mock_read.assert_not_called()
+
+    def test_blob_cache_evicts_least_recently_used(self):
+        reader = GitObjectReader(
+            self.repo, blob_cache_bytes=30
+        )  # Room for two 12-byte blobs
+        self.addCleanup(reader.close)
+        v1 = _git(self.repo, "rev-parse", f"{self.first}:src/app.py")
+        v2 = _git(self.repo, "rev-parse", "HEAD:src/app.py")
+        readme = _git(self.repo, "rev-parse", "HEAD:README")
+        with patch.object(git_reader, "MAX_CACHED_BLOB_SHARE", 1):
+            for oid in (v1, v2, v1, readme, v2):
+                reader.read_blob(oid)
+        self.assertEqual(list(reader._blob_cache), [readme, v2])
+        self.assertEqual(reader._blob_cache_bytes, 24)
+
+    def test_large_blobs_not_cached(self):
+        reader = GitObjectReader(self.repo, blob_cache_bytes=40)
+        self.addCleanup(reader.close)
+        self.assertEqual(reader.read_file("HEAD", "README"), b"binary\0data\n")
+        self.assertEqual(reader._blob_cache_bytes, 0)
+
+    def test_restarts_after_process_exits(self):
+        self.reader.read_file("HEAD", "src/app.py")
+        self.reader._batch._process.kill()
+        self.reader._batch._process.wait()
+        self.assertEqual(
+            self.reader.read_file(self.first, "src/app.py"), b"print('v1')\n"
+        )
+
+    def test_lookup_that_hangs_times_out(self):
+        reader = GitObjectReader(self.repo, timeout=0.2)
+        self.addCleanup(reader.close)
+        hang = [
+            sys.executable,
+            "-c",
+            "import sys, time; sys.stdin.readline(); time.sleep(30)",
+        ]
+
+        def start():
+            reader._check._process = subprocess.Popen(
+                hang, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+
+        started = time.perf_counter()
+        with patch.object(reader._check, "_start", start):
+            with self.assertRaisesRegex(GitReadError, "timed out after 0.2s"):
+                reader.info("HEAD")
+        self.assertLess(time.perf_counter() - started, 10)
+        self.assertIsNone(reader._check._process)
+
+    def test_lookups_wait_for_a_process_slot(self):
+        slots = threading.BoundedSemaphore(1)
+        results = []
+        with patch.object(runner, "_slots", slots):
+            slots.acquire()  # Another process is running
+            lookup = threading.Thread(
+                target=lambda: results.append(
+                    self.reader.read_file("HEAD", "src/app.py")
+                )
+            )
+            lookup.start()
+            lookup.join(0.2)
+            self.assertTrue(lookup.is_alive())
+            self.assertEqual(get_timings(), [])
+            slots.release()
+            lookup.join()
+        self.assertEqual(results, [b"print('v2')\n"])
+
+    def test_rejects_names_with_newlines(self):
+        with self.assertRaises(ValueError):
+            self.reader.info("HEAD\nHEAD")
+
+
+class TestGetReader(_RepoTestCase):
+    def test_shared_per_repository(self):
+        self.addCleanup(close_readers)
+        self.assertIs(get_reader(self.repo), get_reader(self.repo))
+        self.assertEqual(
+            get_reader(self.repo).read_file("HEAD", "src/app.py"), b"print('v2')\n"
+        )
+        close_readers()
+        self.assertEqual(git_reader._readers, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,102 +1,119 @@
 import unittest
-from unittest.mock import patch, mock_open
-import configparser
 import os  # Keep os for os.path.join
+import tempfile
 
 # Import the function to be tested directly
-from autopr.git_utils import get_repo_from_git_config
+from autopr.git_utils import get_current_branch, get_repo_from_git_config
+from autopr.repo_discovery import clear_cache
 
 
 class TestGetRepoFromGitConfig(unittest.TestCase):
-
-    @patch("os.path.exists")
-    @patch("builtins.open", new_callable=mock_open)
-    # @patch('configparser.ConfigParser.read') # This mock might be too broad if ConfigParser is instantiated inside the func
-    def test_get_repo_ssh_url(self, mock_file_open, mock_exists):
-        mock_exists.return_value = True
-
-        config_content = """
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.repo = self._tmp.name
+        os.mkdir(os.path.join(self.repo, ".git"))
+        clear_cache()
+        self.addCleanup(clear_cache)
+
+    def write_config(self, content):
+        with open(os.path.join(self.repo, ".git", "config"), "w") as f:
+            f.write(content)
+
+    def test_get_repo_ssh_url(self):
+        self.write_config("""
 [remote "origin"]
     url = git@github.com:owner/repo.git
     fetch = +refs/heads/*:refs/remotes/origin/*
-"""
-        config_parser_instance = configparser.ConfigParser()
-        config_parser_instance.read_string(config_content)
-
-        # Patch the ConfigParser class to return our instance
-        with patch("configparser.ConfigParser") as MockConfigParser:
-            MockConfigParser.return_value = config_parser_instance
-            # Also, we need to ensure that config_parser_instance.read() is called as expected
-            with patch.object(config_parser_instance, "read") as mock_read_method:
-
-                repo_name = get_repo_from_git_config()
-                self.assertEqual(repo_name, "owner/repo")
-                mock_exists.assert_called_once_with(os.path.join(".git", "config"))
-                # Check that the read method of our instance was called
-                mock_read_method.assert_called_once_with(os.path.join(".git", "config"))
-
-    @patch("os.path.exists")
-    @patch("builtins.open", new_callable=mock_open)
-    def test_get_repo_https_url(self, mock_file_open, mock_exists):
-        mock_exists.return_value = True
-        config_content = """
+""")
+        self.assertEqual(get_repo_from_git_config(self.repo), "owner/repo")
+
+    def test_get_repo_https_url(self):
+        self.write_config("""
 [remote "origin"]
     url = https://github.com/owner/another-repo.git
-"""
-        config_parser_instance = configparser.ConfigParser()
-        config_parser_instance.read_string(config_content)
-
-        with patch("configparser.ConfigParser") as MockConfigParser:
-            MockConfigParser.return_value = config_parser_instance
-            with patch.object(config_parser_instance, "read") as mock_read_method:
-                repo_name = get_repo_from_git_config()
-                self.assertEqual(repo_name, "owner/another-repo")
-                mock_read_method.assert_called_once_with(os.path.join(".git", "config"))
-
-    @patch("os.path.exists")
-    def test_git_config_not_found(self, mock_exists):
-        mock_exists.return_value = False
-        with self.assertRaisesRegex(FileNotFoundError, "No .git/config found"):
-            get_repo_from_git_config()
-
-    @patch("os.path.exists")
-    @patch("builtins.open", new_callable=mock_open)
-    def test_no_origin_remote(self, mock_file_open, mock_exists):
-        mock_exists.return_value = True
-        config_content = """
+""")
+        self.assertEqual(get_repo_from_git_config(self.repo), "owner/another-repo")
+
+    def test_names_ending_in_git_letters_are_kept(self):
+        self.write_config("""
+[remote "origin"]
+    url = git@github.com:owner/digit.git
+""")
+        self.assertEqual(get_repo_from_git_config(self.repo), "owner/digit")
+
+    def test_git_config_not_found(self):
+        with tempfile.TemporaryDirectory() as not_a_repo:
+            with self.assertRaisesRegex(FileNotFoundError, "No git repository found"):
+                get_repo_from_git_config(not_a_repo)
+
+    def test_no_origin_remote_uses_first_remote(self):
+        self.write_config("""
 [remote "upstream"]
     url = https://github.com/other/repo.git
-"""
-        config_parser_instance = configparser.ConfigParser()
-        config_parser_instance.read_string(config_content)
-
-        with patch("configparser.ConfigParser") as MockConfigParser:
-            MockConfigParser.return_value = config_parser_instance
-            with patch.object(config_parser_instance, "read") as mock_read_method:
-                with self.assertRaisesRegex(ValueError, "No 'origin' remote found"):
-                    get_repo_from_git_config()
-                mock_read_method.assert_called_once_with(os.path.join(".git", "config"))
-
-    @patch("os.path.exists")
-    @patch("builtins.open", new_callable=mock_open)
-    def test_unsupported_url_format(self, mock_file_open, mock_exists):
-        mock_exists.return_value = True
-        config_content = """
+[remote "fork"]
+    url = https://github.com/me/repo.git
+""")
+        self.assertEqual(get_repo_from_git_config(self.repo), "other/repo")
+
+    def test_no_remote(self):
+        self.write_config("[core]\n    bare = false\n")
+        with self.assertRaisesRegex(ValueError, "No remote found"):
+            get_repo_from_git_config(self.repo)
+
+    def test_unsupported_url_format(self):
+        self.write_config("""
 [remote "origin"]
     url = file:///path/to/repo.git
-"""
-        config_parser_instance = configparser.ConfigParser()
-        config_parser_instance.read_string(config_content)
-
-        with patch("configparser.ConfigParser") as MockConfigParser:
-            MockConfigParser.return_value = config_parser_instance
-            with patch.object(config_parser_instance, "read") as mock_read_method:
-                with self.assertRaisesRegex(ValueError, "Unsupported URL format"):
-                    get_repo_from_git_config()
-                mock_read_method.assert_called_once_with(os.path.join(".git", "config"))
+""")
+        with self.assertRaisesRegex(ValueError, "Unsupported URL format"):
+            get_repo_from_git_config(self.repo)
 
 
 # Removed TestListIssues and TestCreatePr as they belong to CLI tests
 
+
+class TestGetCurrentBranch(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.repo = self._tmp.name
+        os.mkdir(os.path.join(self.repo, ".git"))
+
+    def write_head(self, git_dir, content):
+        with open(os.path.join(git_dir, "HEAD"), "w") as f:
+            f.write(content)
+
+    def test_branch(self):
+        self.write_head(os.path.join(self.repo, ".git"), "ref: refs/heads/feature/x\n")
+        self.assertEqual(get_current_branch(self.repo), "feature/x")
+
+    def test_from_subdirectory(self):
+        self.write_head(os.path.join(self.repo, ".git"), "ref: refs/heads/feature/x\n")
+        subdir = os.path.join(self.repo, "src")
+        os.mkdir(subdir)
+        self.assertEqual(get_current_branch(subdir), "feature/x")
+
+    def test_linked_worktree(self):
+        self.write_head(os.path.join(self.repo, ".git"), "ref: refs/heads/main\n")
+        worktree_git_dir = os.path.join(self.repo, ".git", "worktrees", "wt")
+        os.makedirs(worktree_git_dir)
+        self.write_head(worktree_git_dir, "ref: refs/heads/feature/wt\n")
+        worktree = os.path.join(self.repo, "wt")
+        os.mkdir(worktree)
+        with open(os.path.join(worktree, ".git"), "w") as f:
+            f.write(f"gitdir: {worktree_git_dir}\n")
+
+        self.assertEqual(get_current_branch(worktree), "feature/wt")
+
+    def test_detached_head(self):
+        self.write_head(os.path.join(self.repo, ".git"), "3f2a9c1e\n")
+        self.assertIsNone(get_current_branch(self.repo))
+
+    def test_not_a_repository(self):
+        with tempfile.TemporaryDirectory() as not_a_repo:
+            self.assertIsNone(get_current_branch(not_a_repo))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,406 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from autopr import github_backend
+from autopr.github_backend import (
+    GhCliBackend,
+    GitHubAPIError,
+    HttpBackend,
+    TOKEN_LOOKUP_TIMEOUT_SECONDS,
+    get_backend,
+    get_github_token,
+    set_backend,
+)
+from autopr.github_service import _submit_review, get_pr_changes
+from autopr.runner import DEFAULT_COMMAND_TIMEOUT, get_timings, reset_timings
+
+
+class _FakeGitHub(ThreadingHTTPServer):
+    """A local stand-in for api.github.com that records requests and connections."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _FakeGitHubHandler)
+        self.routes = {}  # (method, path) -> (status, body, content_type)
+        self.requests = []
+        self.connections = 0
+
+    def get_request(self):
+        self.connections += 1
+        return super().get_request()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        self.server.requests.append(
+            {
+                "method": self.command,
+                "path": self.path,
+                "headers": dict(self.headers),
+                "body": body,
+            }
+        )
+        status, payload, content_type = self.server.routes.get(
+            (self.command, self.path),
+            (404, {"message": "Not Found"}, "application/json"),
+        )
+        data = (
+            payload.encode()
+            if isinstance(payload, str)
+            else json.dumps(payload).encode()
+        )
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class _FakeServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = _FakeGitHub()
+        thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.01,), daemon=True
+        )
+        thread.start()
+        self.backend = HttpBackend(base_url=self.server.url, token="t0ken")
+        self.backend._repo = ("octo", "repo")
+
+    def tearDown(self):
+        self.backend.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def route(self, method, path, payload, status=200, content_type="application/json"):
+        self.server.routes[(method, path)] = (status, payload, content_type)
+
+
+class TestHttpBackend(_FakeServerTestCase):
+    def test_pr_head_sha_and_diff(self):
+        self.route("GET", "/repos/octo/repo/pulls/7", {"head": {"sha": "abc123"}})
+        self.assertEqual(self.backend.pr_head_sha(7), "abc123")
+        self.assertEqual(
+            self.server.requests[0]["headers"]["Authorization"], "Bearer t0ken"
+        )
+        self.assertEqual(
+            self.server.requests[0]["headers"]["X-GitHub-Api-Version"], "2022-11-28"
+        )
+
+        self.server.routes[("GET", "/repos/octo/repo/pulls/7")] = (
+            200,
+            "diff --git a/x b/x\n",
+            "text/plain",
+        )
+        self.assertEqual(self.backend.pr_diff(7), "diff --git a/x b/x\n")
+        self.assertEqual(
+            self.server.requests[1]["headers"]["Accept"],
+            "application/vnd.github.v3.diff",
+        )
+
+    def test_requests_share_one_connection(self):
+        self.route("GET", "/repos/octo/repo/pulls/1", {"head": {"sha": "a"}})
+        for _ in range(5):
+            self.backend.pr_head_sha(1)
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_requests_are_timed(self):
+        self.route("GET", "/repos/octo/repo/pulls/1", {"head": {"sha": "a"}})
+        reset_timings()
+        self.addCleanup(reset_timings)
+        self.backend.pr_head_sha(1)
+        self.assertEqual(
+            [(t.label, t.outcome) for t in get_timings()],
+            [("GET /repos/octo/repo/pulls/1", "HTTP 200")],
+        )
+
+    def test_list_open_prs_pages_and_skips_issues(self):
+        with patch.object(github_backend, "PAGE_SIZE", 2):
+            self.route(
+                "GET",
+                "/repos/octo/repo/issues?state=open&per_page=2&labels=needs%20review&page=1",
+                [{"number": 9, "pull_request": {}}, {"number": 8}],
+            )
+            self.route(
+                "GET",
+                "/repos/octo/repo/issues?state=open&per_page=2&labels=needs%20review&page=2",
+                [{"number": 3, "pull_request": {}}],
+            )
+            self.assertEqual(self.backend.list_open_prs("needs review"), [9, 3])
+
+    def test_compare(self):
+        path = "/repos/octo/repo/compare/aaa...bbb"
+        self.route(
+            "GET",
+            path,
+            {
+                "status": "ahead",
+                "commits": [
+                    {"parents": [{"sha": "aaa"}]},
+                    {"parents": [{"sha": "c1"}, {"sha": "c2"}]},
+                ],
+            },
+        )
+        self.assertEqual(
+            self.backend.compare_status("octo", "repo", "aaa", "bbb"), ("ahead", 1)
+        )
+
+    def test_submit_review_posts_json(self):
+        self.route("POST", "/repos/octo/repo/pulls/4/reviews", {"id": 1})
+        self.backend.submit_review(
+            "octo", "repo", 4, {"event": "COMMENT", "comments": []}
+        )
+        request = self.server.requests[0]
+        self.assertEqual(
+            json.loads(request["body"]), {"event": "COMMENT", "comments": []}
+        )
+        self.assertEqual(request["headers"]["Content-Type"], "application/json")
+
+    def test_error_status_raises_with_message(self):
+        self.route(
+            "POST",
+            "/repos/octo/repo/pulls/4/reviews",
+            {"message": "Unprocessable Entity"},
+            status=422,
+        )
+        with self.assertRaises(GitHubAPIError) as ctx:
+            self.backend.submit_review("octo", "repo", 4, {})
+        self.assertEqual(ctx.exception.status, 422)
+        self.assertIn("Unprocessable Entity", str(ctx.exception))
+
+    def test_graphql_fills_in_repository_and_reports_errors(self):
+        self.route("POST", "/graphql", {"data": {"repository": {"name": "repo"}}})
+        data = self.backend.graphql(
+            "query { x }", {"owner": "{owner}", "name": "{repo}", "n": 1}
+        )
+        self.assertEqual(data, {"repository": {"name": "repo"}})
+        self.assertEqual(
+            json.loads(self.server.requests[0]["body"])["variables"],
+            {"owner": "octo", "name": "repo", "n": 1},
+        )
+
+        self.route(
+            "POST", "/graphql", {"errors": [{"message": "Could not resolve to a PR"}]}
+        )
+        with self.assertRaises(GitHubAPIError) as ctx:
+            self.backend.graphql("query { x }", {})
+        self.assertIn("Could not resolve to a PR", str(ctx.exception))
+
+    def test_get_page_follows_link_and_honours_etag(self):
+        self.route("GET", "/repos/octo/repo/issues?per_page=1", [{"number": 1}])
+        page = self.backend.get_page("repos/octo/repo/issues?per_page=1", etag='"abc"')
+        self.assertEqual(self.server.requests[0]["headers"]["If-None-Match"], '"abc"')
+        self.assertEqual(page.data, [{"number": 1}])
+        self.assertIsNone(page.next_path)
+
+        self.route("GET", "/repos/octo/repo/issues?per_page=1", "", status=304)
+        self.assertTrue(
+            self.backend.get_page(
+                "repos/octo/repo/issues?per_page=1", '"abc"'
+            ).not_modified
+        )
+
+    def test_unreachable_server(self):
+        self.server.shutdown()
+        self.server.server_close()
+        backend = HttpBackend(base_url=self.server.url, token="t")
+        backend._repo = ("octo", "repo")
+        with self.assertRaises(GitHubAPIError) as ctx:
+            backend.pr_head_sha(1)
+        self.assertIsNone(ctx.exception.status)
+
+
+class TestGhCliGetPage(unittest.TestCase):
+    INCLUDED = (
+        'HTTP/2.0 200 OK\r\nEtag: W/"e1"\r\n'
+        'Link: <https://api.github.com/repositories/9/issues?page=2>; rel="next", '
+        '<https://api.github.com/repositories/9/issues?page=5>; rel="last"\r\n\r\n'
+        '[{"number": 3}]'
+    )
+
+    @patch("subprocess.run")
+    def test_parses_included_headers(self, mock_run):
+        mock_run.return_value = MagicMock(stdout=self.INCLUDED)
+
+        page = GhCliBackend().get_page("repos/o/r/issues", etag='"e0"')
+
+        mock_run.assert_called_once_with(
+            ["gh", "api", "--include", "repos/o/r/issues", "-H", 'If-None-Match: "e0"'],
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=DEFAULT_COMMAND_TIMEOUT,
+            stdin=subprocess.DEVNULL,
+        )
+        self.assertEqual(page.status, 200)
+        self.assertEqual(page.etag, 'W/"e1"')
+        self.assertEqual(page.next_path, "repositories/9/issues?page=2")
+        self.assertEqual(page.data, [{"number": 3}])
+
+    @patch("subprocess.run")
+    def test_not_modified(self, mock_run):
+        mock_run.side_effect = subprocess.CalledProcessError(
+            1, "gh", output='HTTP/2.0 304 Not Modified\r\nEtag: "e0"\r\n\r\n'
+        )
+        self.assertTrue(
+            GhCliBackend().get_page("repos/o/r/issues", etag='"e0"').not_modified
+        )
+
+
+class TestServiceWithHttpBackend(_FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+        set_backend(self.backend)
+
+    def tearDown(self):
+        set_backend(None)
+        super().tearDown()
+
+    @patch("builtins.print")
+    def test_rejected_review_reported_as_422(self, mock_print):
+        self.route(
+            "POST",
+            "/repos/octo/repo/pulls/4/reviews",
+            {"message": "Validation Failed"},
+            status=422,
+        )
+        comments = [{"path": "a.py", "line": 1, "body": "x"}]
+        self.assertFalse(_submit_review(4, "octo", "repo", "sha", comments))
+        self.assertIn("422", mock_print.call_args[0][0])
+
+    @patch("subprocess.run")
+    @patch("builtins.print")
+    def test_pr_diff_does_not_spawn_gh(self, mock_print, mock_run):
+        self.route(
+            "GET",
+            "/repos/octo/repo/pulls/2",
+            "diff --git a/y b/y\n",
+            content_type="text/plain",
+        )
+        self.assertEqual(get_pr_changes(2), "diff --git a/y b/y")
+        mock_run.assert_not_called()
+
+
+class TestGetBackend(unittest.TestCase):
+    def tearDown(self):
+        set_backend(None)
+
+    def test_default_is_gh(self):
+        set_backend(None)
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("AUTOPR_GITHUB_BACKEND", None)
+            self.assertIsInstance(get_backend(), GhCliBackend)
+
+    def test_http_selected_by_env(self):
+        set_backend(None)
+        with patch.dict(os.environ, {"AUTOPR_GITHUB_BACKEND": "http"}):
+            self.assertIsInstance(get_backend(), HttpBackend)
+
+    @patch("builtins.print")
+    def test_unknown_name_falls_back_to_gh(self, mock_print):
+        set_backend(None)
+        with patch.dict(os.environ, {"AUTOPR_GITHUB_BACKEND": "carrier-pigeon"}):
+            self.assertIsInstance(get_backend(), GhCliBackend)
+        mock_print.assert_called_once()
+
+    def test_threads_share_one_backend(self):
+        set_backend(None)
+
+        class SlowBackend(GhCliBackend):
+            def __init__(self):
+                threading.Event().wait(0.05)  # Give the other threads time to ask too
+
+        backends = []
+        with patch.dict(github_backend.BACKENDS, {"gh": SlowBackend}), patch.dict(
+            os.environ, {"AUTOPR_GITHUB_BACKEND": "gh"}
+        ):
+            threads = [
+                threading.Thread(target=lambda: backends.append(get_backend()))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(backends), 4)
+        self.assertEqual(len({id(backend) for backend in backends}), 1)
+
+
+class TestGetGithubToken(unittest.TestCase):
+    def setUp(self):
+        self.config_dir = tempfile.TemporaryDirectory()
+        self.env = patch.dict(
+            os.environ, {"GH_CONFIG_DIR": self.config_dir.name}, clear=False
+        )
+        self.env.start()
+        for name in (
+            "GH_TOKEN",
+            "GITHUB_TOKEN",
+            "GH_ENTERPRISE_TOKEN",
+            "GITHUB_ENTERPRISE_TOKEN",
+        ):
+            os.environ.pop(name, None)
+
+    def tearDown(self):
+        self.env.stop()
+        self.config_dir.cleanup()
+
+    def _write_hosts(self, text):
+        with open(os.path.join(self.config_dir.name, "hosts.yml"), "w") as f:
+            f.write(text)
+
+    def test_environment_wins(self):
+        self._write_hosts("github.com:\n    oauth_token: from-file\n")
+        with patch.dict(os.environ, {"GITHUB_TOKEN": "second", "GH_TOKEN": "first"}):
+            self.assertEqual(get_github_token(), "first")
+
+    def test_reads_hosts_file(self):
+        self._write_hosts(
+            "ghe.example.com:\n    oauth_token: enterprise\n"
+            "github.com:\n    user: octo\n    oauth_token: gho_abc\n    git_protocol: https\n"
+        )
+        self.assertEqual(get_github_token(), "gho_abc")
+        self.assertEqual(get_github_token("ghe.example.com"), "enterprise")
+
+    @patch("subprocess.run")
+    def test_falls_back_to_gh_auth_token(self, mock_run):
+        mock_run.return_value = MagicMock(stdout="gho_keyring\n")
+        self.assertEqual(get_github_token(), "gho_keyring")
+        mock_run.assert_called_once_with(
+            ["gh", "auth", "token", "--hostname", "github.com"],
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=TOKEN_LOOKUP_TIMEOUT_SECONDS,
+            stdin=subprocess.DEVNULL,
+        )
+
+    @patch("subprocess.run", side_effect=FileNotFoundError)
+    def test_no_token_anywhere(self, mock_run):
+        self.assertIsNone(get_github_token())
+
+
+if __name__ == "__main__":
+    unittest.main()
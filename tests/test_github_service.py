@@ -2,7 +2,9 @@ import unittest
 import subprocess
 from unittest.mock import patch, Mock, mock_open, MagicMock
 import os
+import io
 import json
+import tempfile
 
 from autopr.github_service import (
     list_issues,
@@ -10,89 +12,175 @@ from autopr.github_service import (
     start_work_on_issue,
     _sanitize_branch_name,
     get_staged_diff,
+    get_staged_numstat,
     git_commit,
     get_current_issue_number,
     get_issue_details,
-    get_commit_messages_for_branch,
+    get_branch_commits,
+    get_branch_overview,
     create_pr_gh,
     get_pr_changes,
+    get_pr_changes_since,
+    get_pr_review_comments,
+    list_open_prs,
+    COMMIT_TIMEOUT_SECONDS,
+    PR_CREATE_TIMEOUT_SECONDS,
     _get_repo_details,
-    _get_pr_head_commit_sha,
-    post_pr_review_comment
+    get_pr_head_commit_sha,
+    post_pr_review,
+    clear_lookup_caches,
+    invalidate_pr_head_sha,
+    prefetch_pr_context,
+    prefetch_repo_context,
 )
+from autopr import github_service
+from autopr.diff_utils import DiffLineIndex
+from autopr.github_backend import ApiPage, GitHubAPIError
+from autopr.issue_store import open_store
+from autopr.runner import DEFAULT_COMMAND_TIMEOUT
+
+
+class _LookupCacheTestCase(unittest.TestCase):
+    """Starts every test with empty lookup caches and a throwaway disk cache."""
+
+    def setUp(self):
+        clear_lookup_caches()
+        self._tmp = tempfile.TemporaryDirectory()
+        patcher = patch(
+            "autopr.github_service._repo_details_cache_path",
+            return_value=os.path.join(self._tmp.name, "repo_details.json"),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self._tmp.cleanup)
+        self.addCleanup(clear_lookup_caches)
+
+
+def _api_issue(number, title="", state="open", **extra):
+    return {
+        "number": number, "title": title or f"Issue {number}", "body": "", "state": state,
+        "labels": [], "user": {"login": "a"}, "assignees": [],
+        "updated_at": "2024-05-01T00:00:00Z", **extra,
+    }
 
 
 class TestListIssues(unittest.TestCase):
-    @patch("subprocess.run")
+    def setUp(self):
+        # Without a local issue store, issues are streamed from GitHub.
+        for target, value in (
+            ("autopr.github_service.open_issue_store", None),
+            ("autopr.github_service._get_repo_details", ("o", "r")),
+        ):
+            patcher = patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.backend = MagicMock()
+        patcher = patch("autopr.github_service.get_backend", return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @patch("builtins.print")
-    def test_list_issues_default_open(self, mock_print, mock_subprocess_run):
-        mock_process = Mock()
-        mock_process.stdout = "Issue 1\nIssue 2"
-        mock_subprocess_run.return_value = mock_process
+    def test_prints_each_page_as_it_arrives(self, mock_print):
+        self.backend.get_page.side_effect = [
+            ApiPage(200, None, "repositories/1/issues?page=2", [_api_issue(9), _api_issue(8, pull_request={})]),
+            ApiPage(200, None, None, [_api_issue(7)]),
+        ]
 
-        list_issues(show_all_issues=False)
+        list_issues()
 
-        mock_subprocess_run.assert_called_once_with(
-            ["gh", "issue", "list"], capture_output=True, text=True, check=True
+        self.assertEqual(
+            self.backend.get_page.call_args_list[0][0][0],
+            "repos/o/r/issues?state=open&per_page=100",
+        )
+        self.backend.get_page.assert_called_with("repositories/1/issues?page=2")
+        printed = [c.args[0] for c in mock_print.call_args_list]
+        self.assertEqual(
+            printed,
+            [
+                "Listing Issues...",
+                "Issues:",
+                "9\tOPEN\tIssue 9\t\t2024-05-01T00:00:00Z",
+                "7\tOPEN\tIssue 7\t\t2024-05-01T00:00:00Z",
+            ],
         )
-        mock_print.assert_any_call("Issues:")
-        mock_print.assert_any_call("Issue 1\nIssue 2")
 
-    @patch("subprocess.run")
     @patch("builtins.print")
-    def test_list_issues_all(self, mock_print, mock_subprocess_run):
-        mock_process = Mock()
-        mock_process.stdout = "Issue 1 (open)\nIssue 3 (closed)"
-        mock_subprocess_run.return_value = mock_process
+    def test_filters_sent_to_api_and_limit_stops_paging(self, mock_print):
+        self.backend.get_page.return_value = ApiPage(
+            200, None, "next", [_api_issue(9), _api_issue(8)]
+        )
 
-        list_issues(show_all_issues=True)
+        list_issues(show_all_issues=True, labels=["bug", "good first issue"], assignee="ana", author="bo", limit=2)
 
-        mock_subprocess_run.assert_called_once_with(
-            ["gh", "issue", "list", "--state", "all"],
-            capture_output=True,
-            text=True,
-            check=True,
+        self.backend.get_page.assert_called_once_with(
+            "repos/o/r/issues?state=all&per_page=2&labels=bug%2Cgood%20first%20issue&assignee=ana&creator=bo"
         )
-        mock_print.assert_any_call("Issues:")
-        mock_print.assert_any_call("Issue 1 (open)\nIssue 3 (closed)")
 
-    @patch("subprocess.run")
     @patch("builtins.print")
-    def test_list_issues_no_issues_found(self, mock_print, mock_subprocess_run):
-        mock_process = Mock()
-        mock_process.stdout = ""  # Empty output
-        mock_subprocess_run.return_value = mock_process
+    def test_search_uses_search_api(self, mock_print):
+        self.backend.get_page.return_value = ApiPage(200, None, None, {"items": [_api_issue(3)]})
 
-        list_issues(show_all_issues=False)
+        list_issues(labels=["bug"], search="crash")
 
-        mock_subprocess_run.assert_called_once_with(
-            ["gh", "issue", "list"], capture_output=True, text=True, check=True
+        self.backend.get_page.assert_called_once_with(
+            "search/issues?q=repo%3Ao%2Fr%20is%3Aissue%20state%3Aopen%20label%3A%22bug%22%20crash&per_page=100"
         )
+        mock_print.assert_any_call("3\tOPEN\tIssue 3\t\t2024-05-01T00:00:00Z", flush=True)
+
+    def test_json_output(self):
+        self.backend.get_page.return_value = ApiPage(200, None, None, [_api_issue(2), _api_issue(1)])
+
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            list_issues(as_json=True)
+
+        issues = json.loads(stdout.getvalue())
+        self.assertEqual([issue["number"] for issue in issues], [2, 1])
+        self.assertEqual(issues[0]["author"], "a")
+
+    @patch("builtins.print")
+    def test_no_issues_found(self, mock_print):
+        self.backend.get_page.return_value = ApiPage(200, None, None, [])
+
+        list_issues()
+
         mock_print.assert_any_call("No issues found for the current filters.")
-        issues_header_called = False
-        for call_args in mock_print.call_args_list:
-            if call_args[0][0] == "Issues:":
-                issues_header_called = True
-                break
-        self.assertFalse(
-            issues_header_called,
-            msg="'Issues:' should not be printed when no issues are found.",
-        )
+        self.assertNotIn(unittest.mock.call("Issues:"), mock_print.call_args_list)
 
-    @patch("subprocess.run")
     @patch("builtins.print")
-    def test_list_issues_subprocess_error(self, mock_print, mock_subprocess_run):
-        mock_subprocess_run.side_effect = subprocess.CalledProcessError(
-            returncode=1, cmd=["gh", "issue", "list"], output="Error fetching issues"
+    def test_fetch_error(self, mock_print):
+        self.backend.get_page.side_effect = subprocess.CalledProcessError(
+            returncode=1, cmd=["gh", "api"], stderr="HTTP 404: Not Found"
         )
 
-        list_issues(show_all_issues=False)
+        list_issues()
 
-        mock_subprocess_run.assert_called_once_with(
-            ["gh", "issue", "list"], capture_output=True, text=True, check=True
+        mock_print.assert_any_call("Failed to fetch issues.", file=None)
+        mock_print.assert_any_call("HTTP 404: Not Found", file=None)
+
+    def test_json_output_stays_valid_when_a_page_fails(self):
+        self.backend.get_page.side_effect = [
+            ApiPage(200, None, "next", [_api_issue(2)]),
+            GitHubAPIError(502, "Bad Gateway"),
+        ]
+
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout, \
+                patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            list_issues(as_json=True)
+
+        self.assertEqual([issue["number"] for issue in json.loads(stdout.getvalue())], [2])
+        self.assertIn("Failed to fetch issues", stderr.getvalue())
+
+    def test_json_output_when_nothing_can_be_fetched(self):
+        self.backend.get_page.side_effect = subprocess.CalledProcessError(
+            returncode=1, cmd=["gh", "api"], stderr="HTTP 404: Not Found"
         )
-        mock_print.assert_any_call("Failed to fetch issues.")
-        mock_print.assert_any_call("Error fetching issues")
+
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout, \
+                patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            list_issues(as_json=True)
+
+        self.assertEqual(json.loads(stdout.getvalue()), [])
+        self.assertIn("HTTP 404: Not Found", stderr.getvalue())
 
 
 class TestSanitizeBranchName(unittest.TestCase):
@@ -137,23 +225,24 @@ class TestSanitizeBranchName(unittest.TestCase):
 
 
 class TestStartWorkOnIssue(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.repo = self._tmp.name
+        os.mkdir(os.path.join(self.repo, ".git"))
+
     @patch(
         "autopr.github_service.get_issue_details"
     )  # Mock the call to the new get_issue_details
     @patch("subprocess.run")  # For git checkout
-    @patch("builtins.open", new_callable=mock_open)
-    @patch("os.path.isdir")
     @patch("autopr.github_service._sanitize_branch_name")
     def test_start_work_on_issue_success_updated(
         self,
         mock_sanitize,
-        mock_isdir,
-        mock_file_open,
         mock_git_checkout_run,
         mock_get_details,
     ):
         issue_number = 123
-        repo_path = "/test/repo"
         issue_title_from_details = "Detailed Test Issue"
         mock_get_details.return_value = {
             "number": issue_number,
@@ -164,23 +253,24 @@ class TestStartWorkOnIssue(unittest.TestCase):
         sanitized_title = "detailed-test-issue"
         mock_sanitize.return_value = sanitized_title
         expected_branch_name = f"feature/{issue_number}-{sanitized_title}"
-        mock_isdir.return_value = True  # .git dir exists
 
-        start_work_on_issue(issue_number, repo_path=repo_path)
+        # Run from a subdirectory: the repository is found by walking up.
+        subdir = os.path.join(self.repo, "src", "pkg")
+        os.makedirs(subdir)
+        start_work_on_issue(issue_number, repo_path=subdir)
 
-        mock_get_details.assert_called_once_with(issue_number)
+        mock_get_details.assert_called_once_with(issue_number, offline=False, refresh=False)
         mock_sanitize.assert_called_once_with(issue_title_from_details)
         mock_git_checkout_run.assert_called_once_with(
             ["git", "checkout", "-b", expected_branch_name],
             check=True,
+            timeout=DEFAULT_COMMAND_TIMEOUT,
+            stdin=subprocess.DEVNULL,
             capture_output=True,
             text=True,
         )
-        mock_isdir.assert_called_once_with(os.path.join(repo_path, ".git"))
-        mock_file_open.assert_called_once_with(
-            os.path.join(repo_path, ".git", ".autopr_current_issue"), "w"
-        )
-        mock_file_open().write.assert_called_once_with(str(issue_number))
+        with open(os.path.join(self.repo, ".git", ".autopr_current_issue")) as f:
+            self.assertEqual(f.read(), str(issue_number))
 
     @patch("autopr.github_service.get_issue_details")
     @patch("builtins.print")
@@ -190,102 +280,84 @@ class TestStartWorkOnIssue(unittest.TestCase):
 
         start_work_on_issue(issue_number)
         # get_issue_details prints its own errors, check it was called
-        mock_get_details.assert_called_once_with(issue_number)
+        mock_get_details.assert_called_once_with(issue_number, offline=False, refresh=False)
         # Check that a higher-level error message from start_work_on_issue is NOT printed,
         # as the error should be handled and printed within get_issue_details.
         # This assertion might need refinement based on exact print statements.
         # For now, we are mostly ensuring it doesn't proceed if get_issue_details fails.
 
-    # test_start_work_on_issue_no_git_dir needs to be adapted for repo_path
     @patch("autopr.github_service.get_issue_details")
-    @patch(
-        "subprocess.run"
-    )  # for git checkout, assume it doesn't run if .git is not found before file write
-    @patch("os.path.isdir")
+    @patch("subprocess.run")  # git checkout runs before the context file is written
     @patch("builtins.print")
     def test_start_work_on_issue_no_git_dir_updated(
-        self, mock_print, mock_isdir, mock_git_checkout_run, mock_get_details
+        self, mock_print, mock_git_checkout_run, mock_get_details
     ):
         issue_number = 789
-        repo_path = "/no/git/here"
         mock_get_details.return_value = {
             "number": issue_number,
             "title": "Issue Title",
             "body": "...",
             "labels": [],
         }
-        mock_isdir.return_value = False  # .git dir does NOT exist at repo_path/.git
 
-        start_work_on_issue(issue_number, repo_path=repo_path)
+        with tempfile.TemporaryDirectory() as not_a_repo:
+            start_work_on_issue(issue_number, repo_path=not_a_repo)
 
-        mock_get_details.assert_called_once_with(issue_number)
-        mock_isdir.assert_called_once_with(os.path.join(repo_path, ".git"))
+        mock_get_details.assert_called_once_with(issue_number, offline=False, refresh=False)
         mock_print.assert_any_call(
-            f"Error: .git directory not found at {os.path.join(repo_path, '.git')}. Are you in a git repository?"
+            f"Error: No git repository found at {os.path.abspath(not_a_repo)} or its parents."
         )
-        mock_git_checkout_run.assert_called()  # In the current logic, checkout happens before .git dir check for write
-        # This might be an area for future refinement in start_work_on_issue order of ops.
-        # For now, testing current behavior.
-        # Actually, no, checkout is called, then .git dir is checked. So this is fine.
+        mock_git_checkout_run.assert_called()
 
 
 class TestGetStagedDiff(unittest.TestCase):
-    @patch("subprocess.run")
-    def test_get_staged_diff_success_with_diff(self, mock_subprocess_run):
-        mock_process = Mock()
-        mock_process.stdout = "diff --git a/file.txt b/file.txt\n--- a/file.txt\n+++ b/file.txt\n@@ -1 +1 @@\n-old\n+new"
-        mock_process.stderr = ""
-        mock_process.returncode = (
-            0  # or 1, as git diff can return 1 if there are changes
-        )
-        mock_subprocess_run.return_value = mock_process
+    DIFF = b"diff --git a/file.txt b/file.txt\n--- a/file.txt\n+++ b/file.txt\n@@ -1 +1 @@\n-old\n+new\n"
 
-        diff = get_staged_diff()
-        self.assertEqual(diff, mock_process.stdout.strip())
-        mock_subprocess_run.assert_called_once_with(
-            ["git", "diff", "--staged"], capture_output=True, text=True, check=False
-        )
+    def _git_diff(self, chunks, stderr=""):
+        def stream(cmd, on_chunk):
+            for chunk in chunks:
+                on_chunk(chunk)
+            return subprocess.CompletedProcess(cmd, 0, None, stderr)
 
-    @patch("subprocess.run")
-    def test_get_staged_diff_success_no_diff(self, mock_subprocess_run):
-        mock_process = Mock()
-        mock_process.stdout = ""  # Empty string for no diff
-        mock_process.stderr = ""
-        mock_process.returncode = 0
-        mock_subprocess_run.return_value = mock_process
+        return stream
 
-        diff = get_staged_diff()
-        self.assertEqual(diff, "")
-        mock_subprocess_run.assert_called_once_with(
-            ["git", "diff", "--staged"], capture_output=True, text=True, check=False
-        )
+    @patch("autopr.github_service.runner.stream")
+    def test_get_staged_diff_success_with_diff(self, mock_stream):
+        mock_stream.side_effect = self._git_diff([self.DIFF])
 
-    @patch("subprocess.run")
+        with get_staged_diff() as diff:
+            self.assertEqual(diff.text(), self.DIFF.decode().strip())
+            self.assertFalse(diff.spilled)
+        self.assertEqual(mock_stream.call_args[0][0], ["git", "diff", "--staged"])
+
+    @patch("autopr.github_service.runner.stream")
+    def test_get_staged_diff_large_diff_spills_to_disk(self, mock_stream):
+        mock_stream.side_effect = self._git_diff([self.DIFF[:40], self.DIFF[40:]])
+
+        with get_staged_diff(memory_limit=50) as diff:
+            self.assertTrue(diff.spilled)
+            self.assertEqual(diff.text(), self.DIFF.decode().strip())
+            self.assertEqual([f.path for f in diff.iter_files()], ["file.txt"])
+
+    @patch("autopr.github_service.runner.stream")
+    def test_get_staged_diff_success_no_diff(self, mock_stream):
+        mock_stream.side_effect = self._git_diff([b"\n"])
+        self.assertIsNone(get_staged_diff())
+
+    @patch("autopr.github_service.runner.stream")
     @patch("builtins.print")
-    def test_get_staged_diff_git_error(self, mock_print, mock_subprocess_run):
-        mock_process = Mock()
-        mock_process.stdout = ""
-        mock_process.stderr = (
-            "fatal: not a git repository (or any of the parent directories): .git"
-        )
-        mock_process.returncode = 128
-        mock_subprocess_run.return_value = mock_process
+    def test_get_staged_diff_git_error(self, mock_print, mock_stream):
+        stderr = "fatal: not a git repository (or any of the parent directories): .git\n"
+        mock_stream.side_effect = self._git_diff([], stderr=stderr)
 
         diff = get_staged_diff()
         self.assertIsNone(diff)
-        mock_print.assert_any_call(
-            f"Error getting staged diff: {mock_process.stderr.strip()}"
-        )
-        mock_subprocess_run.assert_called_once_with(
-            ["git", "diff", "--staged"], capture_output=True, text=True, check=False
-        )
+        mock_print.assert_any_call(f"Error getting staged diff: {stderr.strip()}")
 
-    @patch("subprocess.run")
+    @patch("autopr.github_service.runner.stream")
     @patch("builtins.print")
-    def test_get_staged_diff_file_not_found_error(
-        self, mock_print, mock_subprocess_run
-    ):
-        mock_subprocess_run.side_effect = FileNotFoundError("git not found")
+    def test_get_staged_diff_file_not_found_error(self, mock_print, mock_stream):
+        mock_stream.side_effect = FileNotFoundError("git not found")
 
         diff = get_staged_diff()
         self.assertIsNone(diff)
@@ -294,6 +366,59 @@ class TestGetStagedDiff(unittest.TestCase):
         )
 
 
+    @patch("autopr.github_service.runner.stream")
+    def test_get_staged_diff_of_paths_in_batches(self, mock_stream):
+        mock_stream.side_effect = self._git_diff([self.DIFF])
+        paths = [f"f{i}*.txt" for i in range(5)]
+
+        with patch.object(github_service, "PATHS_PER_DIFF_CALL", 2):
+            with get_staged_diff(paths=paths) as diff:
+                self.assertEqual(len(list(diff.iter_files())), 3)
+
+        self.assertEqual(
+            [call[0][0] for call in mock_stream.call_args_list],
+            [
+                ["git", "diff", "--staged", "--", ":(top,literal)f0*.txt", ":(top,literal)f1*.txt"],
+                ["git", "diff", "--staged", "--", ":(top,literal)f2*.txt", ":(top,literal)f3*.txt"],
+                ["git", "diff", "--staged", "--", ":(top,literal)f4*.txt"],
+            ],
+        )
+
+    def test_paths_are_relative_to_the_worktree_from_a_subdirectory(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        os.makedirs(os.path.join(tmp.name, "src"))
+        for name in ("src/app.py", "package-lock.json"):
+            with open(os.path.join(tmp.name, name), "w") as f:
+                f.write("new\n")
+        for args in (["init", "-q"], ["add", "."]):
+            subprocess.run(["git", *args], cwd=tmp.name, check=True, capture_output=True)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(os.path.join(tmp.name, "src"))
+
+        with get_staged_diff(paths=["src/app.py"]) as diff:
+            self.assertEqual([f.path for f in diff.iter_files()], ["src/app.py"])
+
+
+class TestGetStagedNumstat(unittest.TestCase):
+    @patch("subprocess.run")
+    def test_parses_output(self, mock_run):
+        mock_run.return_value = Mock(stdout="2\t1\tsrc/app.py\0-\t-\tlogo.png\0", stderr="", returncode=0)
+
+        stats = get_staged_numstat()
+
+        self.assertEqual([(s.path, s.added, s.removed, s.is_binary) for s in stats],
+                         [("src/app.py", 2, 1, False), ("logo.png", 0, 0, True)])
+        self.assertEqual(mock_run.call_args[0][0], ["git", "diff", "--staged", "--numstat", "-z"])
+
+    @patch("subprocess.run")
+    @patch("builtins.print")
+    def test_git_error(self, mock_print, mock_run):
+        mock_run.return_value = Mock(stdout="", stderr="fatal: not a git repository\n", returncode=128)
+        self.assertIsNone(get_staged_numstat())
+        mock_print.assert_any_call("Error getting staged changes: fatal: not a git repository")
+
+
 class TestGitCommit(unittest.TestCase):
     @patch("subprocess.run")
     def test_git_commit_success(self, mock_subprocess_run):
@@ -313,6 +438,8 @@ class TestGitCommit(unittest.TestCase):
             capture_output=True,
             text=True,
             check=False,
+            timeout=COMMIT_TIMEOUT_SECONDS,
+            stdin=subprocess.DEVNULL,
         )
 
     @patch("subprocess.run")
@@ -333,6 +460,8 @@ class TestGitCommit(unittest.TestCase):
             capture_output=True,
             text=True,
             check=False,
+            timeout=COMMIT_TIMEOUT_SECONDS,
+            stdin=subprocess.DEVNULL,
         )
 
     @patch("subprocess.run")
@@ -376,50 +505,67 @@ class TestGitCommit(unittest.TestCase):
 
 
 class TestGetCurrentIssueNumber(unittest.TestCase):
-    @patch("os.path.exists", return_value=True)
-    @patch("builtins.open", new_callable=mock_open, read_data="123\n")
-    def test_get_current_issue_number_success(self, mock_file, mock_exists):
-        repo_path = "/fake/repo"
-        expected_issue_number = 123
-        issue_number = get_current_issue_number(repo_path)
-        self.assertEqual(issue_number, expected_issue_number)
-        mock_exists.assert_called_once_with(
-            os.path.join(repo_path, ".git", ".autopr_current_issue")
-        )
-        mock_file.assert_called_once_with(
-            os.path.join(repo_path, ".git", ".autopr_current_issue"), "r"
-        )
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.repo = self._tmp.name
+        os.mkdir(os.path.join(self.repo, ".git"))
+        self.context_file = os.path.join(self.repo, ".git", ".autopr_current_issue")
+
+    def write_context(self, content):
+        with open(self.context_file, "w") as f:
+            f.write(content)
+
+    def test_get_current_issue_number_success(self):
+        self.write_context("123\n")
+        self.assertEqual(get_current_issue_number(self.repo), 123)
+
+    def test_found_from_subdirectory(self):
+        self.write_context("123\n")
+        subdir = os.path.join(self.repo, "src")
+        os.mkdir(subdir)
+        self.assertEqual(get_current_issue_number(subdir), 123)
+
+    def test_linked_worktree_has_its_own(self):
+        # A linked worktree's .git is a file pointing at its own git directory.
+        worktree_git_dir = os.path.join(self.repo, ".git", "worktrees", "wt")
+        os.makedirs(worktree_git_dir)
+        with open(os.path.join(worktree_git_dir, ".autopr_current_issue"), "w") as f:
+            f.write("7")
+        worktree = os.path.join(self.repo, "wt")
+        os.mkdir(worktree)
+        with open(os.path.join(worktree, ".git"), "w") as f:
+            f.write(f"gitdir: {worktree_git_dir}\n")
+        self.write_context("123")
+
+        self.assertEqual(get_current_issue_number(worktree), 7)
 
-    @patch("os.path.exists", return_value=False)
     @patch("builtins.print")
-    def test_get_current_issue_number_file_not_found(self, mock_print, mock_exists):
-        repo_path = "/fake/repo"
-        issue_number = get_current_issue_number(repo_path)
+    def test_get_current_issue_number_file_not_found(self, mock_print):
+        issue_number = get_current_issue_number(self.repo)
         self.assertIsNone(issue_number)
-        mock_exists.assert_called_once_with(
-            os.path.join(repo_path, ".git", ".autopr_current_issue")
-        )
-        mock_print.assert_any_call(
-            f"Context file not found: {os.path.join(repo_path, '.git', '.autopr_current_issue')}"
-        )
+        mock_print.assert_any_call(f"Context file not found: {self.context_file}")
 
-    @patch("os.path.exists", return_value=True)
-    @patch("builtins.open", new_callable=mock_open, read_data="not_an_int")
     @patch("builtins.print")
-    def test_get_current_issue_number_invalid_content(
-        self, mock_print, mock_file, mock_exists
-    ):
-        repo_path = "/fake/repo"
-        issue_number = get_current_issue_number(repo_path)
+    def test_get_current_issue_number_invalid_content(self, mock_print):
+        self.write_context("not_an_int")
+        issue_number = get_current_issue_number(self.repo)
         self.assertIsNone(issue_number)
         mock_print.assert_any_call(
-            f"Error: Invalid content in {os.path.join(repo_path, '.git', '.autopr_current_issue')}. Expected an integer."
+            f"Error: Invalid content in {self.context_file}. Expected an integer."
         )
 
+    @patch("builtins.print")
+    def test_not_in_a_repository(self, mock_print):
+        with tempfile.TemporaryDirectory() as not_a_repo:
+            self.assertIsNone(get_current_issue_number(not_a_repo))
+            self.assertIsNone(get_current_issue_number(not_a_repo, quiet=True))
+        mock_print.assert_called_once()
+
     @patch("os.path.exists", side_effect=Exception("FS error"))
     @patch("builtins.print")
     def test_get_current_issue_number_os_error(self, mock_print, mock_exists):
-        issue_number = get_current_issue_number()
+        issue_number = get_current_issue_number(self.repo)
         self.assertIsNone(issue_number)
         mock_print.assert_any_call("Error reading current issue number: FS error")
 
@@ -448,6 +594,8 @@ class TestGetIssueDetails(unittest.TestCase):
             capture_output=True,
             text=True,
             check=True,
+            timeout=DEFAULT_COMMAND_TIMEOUT,
+            stdin=subprocess.DEVNULL,
         )
 
     @patch("subprocess.run")
@@ -477,59 +625,97 @@ class TestGetIssueDetails(unittest.TestCase):
         )
 
 
-class TestGetCommitMessagesForBranch(unittest.TestCase):
-    @patch("subprocess.run")
-    def test_get_commit_messages_success(self, mock_subprocess_run):
-        base_branch = "main"
-        mock_response_stdout = "feat: Add feature A\nfix: Bug B\nchore: Update docs"
-        mock_process = Mock(stdout=mock_response_stdout, returncode=0, stderr="")
-        mock_subprocess_run.return_value = mock_process
-
-        messages = get_commit_messages_for_branch(base_branch)
+class TestGetBranchCommits(unittest.TestCase):
+    LOG = (
+        b"\x1eaaaa111\0Ada\0feat: Add feature A\0Why it is needed.\n\0\0\n"
+        b"3\t1\tapp.py\0"
+        b"\x1ebbbb222\0Bob\0fix: Bug B\0\0\0"
+    )
 
-        expected_messages = ["feat: Add feature A", "fix: Bug B", "chore: Update docs"]
-        self.assertEqual(messages, expected_messages)
-        mock_subprocess_run.assert_called_once_with(
-            ["git", "log", f"{base_branch}..HEAD", "--pretty=format:%s"],
-            capture_output=True,
-            text=True,
-            check=True,
+    def _git_log(self, chunks, returncode=0, stderr=""):
+        def stream(cmd, on_chunk):
+            for chunk in chunks:
+                on_chunk(chunk)
+            return subprocess.CompletedProcess(cmd, returncode, None, stderr)
+
+        return stream
+
+    @patch("autopr.github_service.runner.stream")
+    def test_get_branch_commits_success(self, mock_stream):
+        # Fields may be split across chunks.
+        mock_stream.side_effect = self._git_log([self.LOG[:20], self.LOG[20:51], self.LOG[51:]])
+
+        commits = get_branch_commits("main")
+
+        self.assertEqual([c.subject for c in commits], ["feat: Add feature A", "fix: Bug B"])
+        self.assertEqual(commits[0].body, "Why it is needed.")
+        self.assertEqual(commits[0].author, "Ada")
+        self.assertEqual([(f.path, f.added, f.removed) for f in commits[0].files], [("app.py", 3, 1)])
+        self.assertEqual(commits[1].files, [])
+        cmd = mock_stream.call_args[0][0]
+        self.assertEqual(cmd[:3], ["git", "log", "-z"])
+        self.assertIn("--numstat", cmd)
+        self.assertEqual(cmd[-1], "main..HEAD")
+        self.assertEqual(mock_stream.call_count, 1)
+
+    @patch("autopr.github_service.runner.stream")
+    def test_get_branch_commits_no_commits(self, mock_stream):
+        mock_stream.side_effect = self._git_log([])
+        self.assertEqual(get_branch_commits("main"), [])
+
+    @patch("autopr.github_service.runner.stream")
+    @patch("builtins.print")
+    def test_get_branch_commits_git_log_error(self, mock_print, mock_stream):
+        mock_stream.side_effect = self._git_log(
+            [], returncode=128, stderr="fatal: unknown revision or path not in the working tree."
         )
+        commits = get_branch_commits("nonexistent_base")
+        self.assertIsNone(commits)
+        mock_print.assert_any_call("Error getting commit messages:")
+        mock_print.assert_any_call(
+            "Hint: Ensure 'nonexistent_base' is a valid branch and an ancestor of the current branch."
+        )
+
+    @patch("autopr.github_service.runner.stream", side_effect=FileNotFoundError())
+    @patch("builtins.print")
+    def test_get_branch_commits_file_not_found(self, mock_print, mock_stream):
+        self.assertIsNone(get_branch_commits("main"))
+        mock_print.assert_any_call("Error: git command not found.")
 
+
+class TestBranchContext(unittest.TestCase):
     @patch("subprocess.run")
-    def test_get_commit_messages_no_commits(self, mock_subprocess_run):
-        base_branch = "main"
-        mock_process = Mock(
-            stdout="", returncode=0, stderr=""
-        )  # Empty stdout means no commits
-        mock_subprocess_run.return_value = mock_process
-        messages = get_commit_messages_for_branch(base_branch)
-        self.assertEqual(messages, [])
+    def test_merge_base_and_diffstat(self, mock_run):
+        outputs = {
+            "merge-base": Mock(stdout="abc123\n", returncode=0),
+            "diff": Mock(stdout=" a.py | 2 +-\n 1 file changed\n", returncode=0),
+        }
+        mock_run.side_effect = lambda cmd, **kwargs: outputs[cmd[1]]
+
+        self.assertEqual(get_branch_overview("main"), ("abc123", " a.py | 2 +-\n 1 file changed"))
+
+        commands = sorted(call.args[0] for call in mock_run.call_args_list)
+        self.assertEqual(commands, [["git", "diff", "--stat", "main...HEAD"], ["git", "merge-base", "main", "HEAD"]])
 
     @patch("subprocess.run")
     @patch("builtins.print")
-    def test_get_commit_messages_git_log_error(self, mock_print, mock_subprocess_run):
-        base_branch = "nonexistent_base"
-        mock_subprocess_run.side_effect = subprocess.CalledProcessError(
-            cmd=["git", "log"],
-            returncode=128,
-            stderr="fatal: unknown revision or path not in the working tree.",
+    def test_unknown_base(self, mock_print, mock_run):
+        mock_run.side_effect = subprocess.CalledProcessError(
+            128, ["git"], stderr="fatal: Not a valid object name nope\n"
         )
-        messages = get_commit_messages_for_branch(base_branch)
-        self.assertIsNone(messages)
-        mock_print.assert_any_call("Error getting commit messages:")
+        self.assertEqual(get_branch_overview("nope"), (None, None))
         mock_print.assert_any_call(
-            "Hint: Ensure 'nonexistent_base' is a valid branch and an ancestor of the current branch."
+            "Could not find where the branch left 'nope': fatal: Not a valid object name nope"
+        )
+        mock_print.assert_any_call(
+            "Could not get the changed files against 'nope': fatal: Not a valid object name nope"
         )
 
-    @patch("subprocess.run")
+    @patch("subprocess.run", side_effect=FileNotFoundError())
     @patch("builtins.print")
-    def test_get_commit_messages_file_not_found(self, mock_print, mock_subprocess_run):
-        base_branch = "main"
-        mock_subprocess_run.side_effect = FileNotFoundError()
-        messages = get_commit_messages_for_branch(base_branch)
-        self.assertIsNone(messages)
-        mock_print.assert_any_call("Error: git command not found.")
+    def test_git_not_found(self, mock_print, mock_run):
+        self.assertEqual(get_branch_overview("main"), (None, None))
+        mock_print.assert_called_once_with("Error: git command not found.")
 
 
 # --- Tests for create_pr_gh ---
@@ -565,6 +751,8 @@ class TestCreatePrGh(unittest.TestCase):
             capture_output=True,
             text=True,
             check=False,
+            timeout=PR_CREATE_TIMEOUT_SECONDS,
+            stdin=subprocess.DEVNULL,
         )
 
     @patch("autopr.github_service.subprocess.run")
@@ -601,6 +789,8 @@ class TestCreatePrGh(unittest.TestCase):
             capture_output=True,
             text=True,
             check=False,
+            timeout=PR_CREATE_TIMEOUT_SECONDS,
+            stdin=subprocess.DEVNULL,
         )
 
     @patch("autopr.github_service.subprocess.run")
@@ -634,6 +824,8 @@ class TestCreatePrGh(unittest.TestCase):
             capture_output=True,
             text=True,
             check=False,
+            timeout=PR_CREATE_TIMEOUT_SECONDS,
+            stdin=subprocess.DEVNULL,
         )
 
     @patch(
@@ -669,6 +861,8 @@ class TestCreatePrGh(unittest.TestCase):
             capture_output=True,
             text=True,
             check=False,
+            timeout=PR_CREATE_TIMEOUT_SECONDS,
+            stdin=subprocess.DEVNULL,
         )
 
     @patch("autopr.github_service.subprocess.run")
@@ -701,6 +895,8 @@ class TestCreatePrGh(unittest.TestCase):
             capture_output=True,
             text=True,
             check=False,
+            timeout=PR_CREATE_TIMEOUT_SECONDS,
+            stdin=subprocess.DEVNULL,
         )
 
 
@@ -717,7 +913,7 @@ class TestGetPrChanges(unittest.TestCase):
         self.assertEqual(diff, expected_diff)
         mock_subprocess_run.assert_called_once_with(
             ["gh", "pr", "diff", str(mock_pr_number)],
-            capture_output=True, text=True, check=True
+            capture_output=True, text=True, check=True, timeout=DEFAULT_COMMAND_TIMEOUT, stdin=subprocess.DEVNULL
         )
 
     @patch("subprocess.run")
@@ -751,7 +947,112 @@ class TestGetPrChanges(unittest.TestCase):
         mock_print.assert_any_call(f"An unexpected error occurred while fetching PR changes: Something went wrong")
 
 
-class TestGetRepoDetails(unittest.TestCase):
+class TestListOpenPrs(unittest.TestCase):
+    @patch("subprocess.run")
+    def test_with_label(self, mock_subprocess_run):
+        mock_subprocess_run.return_value = MagicMock(
+            stdout='[{"number": 19}, {"number": 12}]', returncode=0
+        )
+        self.assertEqual(list_open_prs(label="ready"), [12, 19])
+        mock_subprocess_run.assert_called_once_with(
+            ["gh", "pr", "list", "--state", "open", "--json", "number", "--limit", "1000",
+             "--label", "ready"],
+            capture_output=True, text=True, check=True, timeout=DEFAULT_COMMAND_TIMEOUT, stdin=subprocess.DEVNULL
+        )
+
+    @patch("subprocess.run")
+    @patch("builtins.print")
+    def test_gh_error(self, mock_print, mock_subprocess_run):
+        mock_subprocess_run.side_effect = subprocess.CalledProcessError(
+            cmd=["gh"], returncode=1, stderr="not logged in"
+        )
+        self.assertIsNone(list_open_prs())
+        mock_print.assert_any_call("Error listing open PRs: not logged in")
+
+
+@patch("autopr.github_service._get_repo_details", return_value=("owner", "repo"))
+class TestGetPrChangesSince(unittest.TestCase):
+    COMPARE_PATH = "repos/owner/repo/compare/old1234...new5678"
+
+    @patch("subprocess.run")
+    def test_ahead_returns_compare_diff(self, mock_subprocess_run, mock_get_repo):
+        mock_subprocess_run.side_effect = [
+            MagicMock(stdout="ahead 0\n", returncode=0),
+            MagicMock(stdout="diff --git a/f.py b/f.py\n", returncode=0),
+        ]
+
+        diff = get_pr_changes_since(5, "old1234", "new5678")
+
+        self.assertEqual(diff, "diff --git a/f.py b/f.py")
+        mock_subprocess_run.assert_any_call(
+            ["gh", "api", self.COMPARE_PATH, "--jq",
+             '.status + " " + ([.commits[] | select(.parents | length > 1)] | length | tostring)'],
+            capture_output=True, text=True, check=True, timeout=DEFAULT_COMMAND_TIMEOUT, stdin=subprocess.DEVNULL
+        )
+        mock_subprocess_run.assert_any_call(
+            ["gh", "api", self.COMPARE_PATH, "-H", "Accept: application/vnd.github.v3.diff"],
+            capture_output=True, text=True, check=True, timeout=DEFAULT_COMMAND_TIMEOUT, stdin=subprocess.DEVNULL
+        )
+
+    @patch("subprocess.run")
+    def test_identical_returns_empty(self, mock_subprocess_run, mock_get_repo):
+        mock_subprocess_run.return_value = MagicMock(stdout="identical 0\n", returncode=0)
+        self.assertEqual(get_pr_changes_since(5, "old1234", "new5678"), "")
+        mock_subprocess_run.assert_called_once()
+
+    @patch("subprocess.run")
+    @patch("builtins.print")
+    def test_force_push_returns_none(self, mock_print, mock_subprocess_run, mock_get_repo):
+        mock_subprocess_run.return_value = MagicMock(stdout="diverged 0\n", returncode=0)
+        self.assertIsNone(get_pr_changes_since(5, "old1234", "new5678"))
+        mock_print.assert_any_call("PR #5 was rewritten since its last review (diverged).")
+
+    @patch("subprocess.run")
+    @patch("builtins.print")
+    def test_merge_commit_returns_none(self, mock_print, mock_subprocess_run, mock_get_repo):
+        mock_subprocess_run.return_value = MagicMock(stdout="ahead 1\n", returncode=0)
+        self.assertIsNone(get_pr_changes_since(5, "old1234", "new5678"))
+        mock_subprocess_run.assert_called_once()
+        mock_print.assert_any_call("PR #5 has 1 merge commit(s) since its last review.")
+
+    @patch("subprocess.run")
+    @patch("builtins.print")
+    def test_missing_commit_returns_none(self, mock_print, mock_subprocess_run, mock_get_repo):
+        mock_subprocess_run.side_effect = subprocess.CalledProcessError(
+            cmd=["gh"], returncode=1, stderr="No commit found"
+        )
+        self.assertIsNone(get_pr_changes_since(5, "old1234", "new5678"))
+
+
+@patch("autopr.github_service._get_repo_details", return_value=("o", "r"))
+class TestGetPrReviewComments(unittest.TestCase):
+    @patch("autopr.github_service.get_backend")
+    def test_pages_through_comments(self, mock_get_backend, mock_get_repo):
+        backend = mock_get_backend.return_value
+        backend.get_page.side_effect = [
+            ApiPage(200, None, "repositories/1/pulls/5/comments?page=2", [
+                {"path": "a.py", "line": 3, "body": "First", "id": 1},
+            ]),
+            ApiPage(200, None, None, [{"path": "b.py", "line": None, "body": None}]),
+        ]
+
+        comments = get_pr_review_comments(5)
+
+        self.assertEqual(
+            comments,
+            [{"path": "a.py", "line": 3, "body": "First"}, {"path": "b.py", "line": None, "body": ""}],
+        )
+        backend.get_page.assert_any_call("repos/o/r/pulls/5/comments?per_page=100")
+
+    @patch("subprocess.run")
+    @patch("builtins.print")
+    def test_failure_returns_none(self, mock_print, mock_run, mock_get_repo):
+        mock_run.side_effect = subprocess.CalledProcessError(1, "gh", stderr="HTTP 404")
+        self.assertIsNone(get_pr_review_comments(5))
+        mock_print.assert_called_once_with("Could not fetch existing review comments of PR #5: HTTP 404")
+
+
+class TestGetRepoDetails(_LookupCacheTestCase):
     @patch("subprocess.run")
     def test_success_user_owner(self, mock_subprocess_run):
         mock_response_stdout = '{"name": "my-repo", "owner": {"login": "testuser"}}'
@@ -761,7 +1062,7 @@ class TestGetRepoDetails(unittest.TestCase):
         self.assertEqual(details, ("testuser", "my-repo"))
         mock_subprocess_run.assert_called_once_with(
             ["gh", "repo", "view", "--json", "owner,name"], 
-            capture_output=True, text=True, check=True
+            capture_output=True, text=True, check=True, timeout=DEFAULT_COMMAND_TIMEOUT, stdin=subprocess.DEVNULL
         )
 
     @patch("subprocess.run")
@@ -798,7 +1099,7 @@ class TestGetRepoDetails(unittest.TestCase):
         mock_print.assert_any_call("Error: 'gh' command not found for _get_repo_details.")
 
 
-class TestGetPrHeadCommitSha(unittest.TestCase):
+class TestGetPrHeadCommitSha(_LookupCacheTestCase):
     @patch("subprocess.run")
     def test_success(self, mock_subprocess_run):
         mock_pr_number = 789
@@ -806,11 +1107,11 @@ class TestGetPrHeadCommitSha(unittest.TestCase):
         mock_response_stdout = f'{{"headRefOid": "{expected_sha}"}}'
         mock_process = MagicMock(stdout=mock_response_stdout, returncode=0, stderr="")
         mock_subprocess_run.return_value = mock_process
-        sha = _get_pr_head_commit_sha(mock_pr_number)
+        sha = get_pr_head_commit_sha(mock_pr_number)
         self.assertEqual(sha, expected_sha)
         mock_subprocess_run.assert_called_once_with(
             ["gh", "pr", "view", str(mock_pr_number), "--json", "headRefOid"],
-            capture_output=True, text=True, check=True
+            capture_output=True, text=True, check=True, timeout=DEFAULT_COMMAND_TIMEOUT, stdin=subprocess.DEVNULL
         )
 
     @patch("subprocess.run")
@@ -818,7 +1119,7 @@ class TestGetPrHeadCommitSha(unittest.TestCase):
     def test_called_process_error(self, mock_print, mock_subprocess_run):
         mock_pr_number = 789
         mock_subprocess_run.side_effect = subprocess.CalledProcessError(cmd=["gh"], returncode=1, stderr="gh error")
-        sha = _get_pr_head_commit_sha(mock_pr_number)
+        sha = get_pr_head_commit_sha(mock_pr_number)
         self.assertIsNone(sha)
         mock_print.assert_any_call(f"Error fetching PR head commit SHA for PR #{mock_pr_number}: gh error")
 
@@ -828,7 +1129,7 @@ class TestGetPrHeadCommitSha(unittest.TestCase):
         mock_pr_number = 789
         mock_process = MagicMock(stdout="invalid json", returncode=0, stderr="")
         mock_subprocess_run.return_value = mock_process
-        sha = _get_pr_head_commit_sha(mock_pr_number)
+        sha = get_pr_head_commit_sha(mock_pr_number)
         self.assertIsNone(sha)
         mock_print.assert_any_call(f"Error parsing PR head commit SHA for PR #{mock_pr_number}.")
 
@@ -839,7 +1140,7 @@ class TestGetPrHeadCommitSha(unittest.TestCase):
         mock_response_stdout = '{"someOtherKey": "value"}' # headRefOid is missing
         mock_process = MagicMock(stdout=mock_response_stdout, returncode=0, stderr="")
         mock_subprocess_run.return_value = mock_process
-        sha = _get_pr_head_commit_sha(mock_pr_number)
+        sha = get_pr_head_commit_sha(mock_pr_number)
         self.assertIsNone(sha) # .get("headRefOid") returns None
 
     @patch("subprocess.run")
@@ -847,85 +1148,349 @@ class TestGetPrHeadCommitSha(unittest.TestCase):
     def test_file_not_found_error(self, mock_print, mock_subprocess_run):
         mock_pr_number = 789
         mock_subprocess_run.side_effect = FileNotFoundError
-        sha = _get_pr_head_commit_sha(mock_pr_number)
+        sha = get_pr_head_commit_sha(mock_pr_number)
         self.assertIsNone(sha)
-        mock_print.assert_any_call("Error: 'gh' command not found for _get_pr_head_commit_sha.")
+        mock_print.assert_any_call("Error: 'gh' command not found for get_pr_head_commit_sha.")
+
 
+class TestLookupMemoization(_LookupCacheTestCase):
+    REPO_JSON = '{"name": "my-repo", "owner": {"login": "testuser"}}'
 
-class TestPostPrReviewComment(unittest.TestCase):
-    @patch("autopr.github_service._get_repo_details")
-    @patch("autopr.github_service._get_pr_head_commit_sha")
     @patch("subprocess.run")
-    @patch("builtins.print")
-    def test_success(self, mock_print, mock_subprocess_run, mock_get_sha, mock_get_repo):
-        mock_pr_number = 1
-        mock_body = "This is a test comment."
-        mock_path = "test_file.py"
-        mock_line = 10
-        mock_owner = "testowner"
-        mock_repo = "testrepo"
-        mock_sha = "headcommitsha"
+    def test_repo_details_fetched_once_per_process(self, mock_subprocess_run):
+        mock_subprocess_run.return_value = MagicMock(stdout=self.REPO_JSON, returncode=0)
+        with patch("autopr.github_service._file_stamp", return_value=(1, 10)):
+            self.assertEqual(github_service._get_repo_details(), ("testuser", "my-repo"))
+            self.assertEqual(github_service._get_repo_details(), ("testuser", "my-repo"))
+        mock_subprocess_run.assert_called_once()
 
-        mock_get_repo.return_value = (mock_owner, mock_repo)
-        mock_get_sha.return_value = mock_sha
-        mock_api_response = MagicMock(stdout="Comment JSON data", returncode=0, stderr="")
-        mock_subprocess_run.return_value = mock_api_response
+    @patch("subprocess.run")
+    def test_repo_details_read_back_from_disk(self, mock_subprocess_run):
+        mock_subprocess_run.return_value = MagicMock(stdout=self.REPO_JSON, returncode=0)
+        with patch("autopr.github_service._file_stamp", return_value=(1, 10)):
+            github_service._get_repo_details()
+            clear_lookup_caches()  # As in a new process
+            self.assertEqual(github_service._get_repo_details(), ("testuser", "my-repo"))
+        mock_subprocess_run.assert_called_once()
 
-        success = post_pr_review_comment(mock_pr_number, mock_body, mock_path, mock_line)
+    @patch("subprocess.run")
+    def test_repo_details_refetched_when_git_config_changes(self, mock_subprocess_run):
+        mock_subprocess_run.return_value = MagicMock(stdout=self.REPO_JSON, returncode=0)
+        with patch("autopr.github_service._file_stamp", return_value=(1, 10)):
+            github_service._get_repo_details()
+        with patch("autopr.github_service._file_stamp", return_value=(2, 12)):
+            github_service._get_repo_details()
+        self.assertEqual(mock_subprocess_run.call_count, 2)
 
-        self.assertTrue(success)
-        mock_get_repo.assert_called_once()
-        mock_get_sha.assert_called_once_with(mock_pr_number)
-        expected_api_path = f"repos/{mock_owner}/{mock_repo}/pulls/{mock_pr_number}/comments"
-        expected_fields = [
-            "-f", f"body={mock_body}",
-            "-f", f"commit_id={mock_sha}",
-            "-f", f"path={mock_path}",
-            "-F", f"line={mock_line}"
+    @patch("subprocess.run")
+    @patch("builtins.print")
+    def test_repo_details_failure_not_cached(self, mock_print, mock_subprocess_run):
+        mock_subprocess_run.side_effect = [
+            subprocess.CalledProcessError(cmd=["gh"], returncode=1, stderr="gh error"),
+            MagicMock(stdout=self.REPO_JSON, returncode=0),
         ]
-        mock_subprocess_run.assert_called_once_with(
-            ["gh", "api", expected_api_path, "-X", "POST"] + expected_fields,
-            capture_output=True, text=True, check=True
+        with patch("autopr.github_service._file_stamp", return_value=(1, 10)):
+            self.assertIsNone(github_service._get_repo_details())
+            self.assertEqual(github_service._get_repo_details(), ("testuser", "my-repo"))
+
+    @patch("autopr.github_service._remote_refs_stamp", return_value=(5, None))
+    @patch("subprocess.run")
+    def test_head_sha_memoized_until_invalidated(self, mock_subprocess_run, mock_stamp):
+        mock_subprocess_run.return_value = MagicMock(stdout='{"headRefOid": "abc"}', returncode=0)
+
+        self.assertEqual(get_pr_head_commit_sha(3), "abc")
+        self.assertEqual(get_pr_head_commit_sha(3), "abc")
+        self.assertEqual(mock_subprocess_run.call_count, 1)
+
+        invalidate_pr_head_sha(3)
+        get_pr_head_commit_sha(3)
+        self.assertEqual(mock_subprocess_run.call_count, 2)
+
+    @patch("subprocess.run")
+    def test_head_sha_refetched_after_push(self, mock_subprocess_run):
+        mock_subprocess_run.return_value = MagicMock(stdout='{"headRefOid": "abc"}', returncode=0)
+        with patch("autopr.github_service._remote_refs_stamp", return_value=(5, None)):
+            get_pr_head_commit_sha(3)
+        with patch("autopr.github_service._remote_refs_stamp", return_value=(6, None)):
+            get_pr_head_commit_sha(3)
+        self.assertEqual(mock_subprocess_run.call_count, 2)
+
+    @patch("autopr.github_service._remote_refs_stamp", return_value=(5, None))
+    @patch("autopr.github_service.time.monotonic")
+    @patch("subprocess.run")
+    def test_head_sha_expires(self, mock_subprocess_run, mock_monotonic, mock_stamp):
+        mock_subprocess_run.return_value = MagicMock(stdout='{"headRefOid": "abc"}', returncode=0)
+        mock_monotonic.return_value = 100.0
+        get_pr_head_commit_sha(3)
+        mock_monotonic.return_value = 100.0 + github_service.PR_HEAD_SHA_TTL_SECONDS + 1
+        get_pr_head_commit_sha(3)
+        self.assertEqual(mock_subprocess_run.call_count, 2)
+
+
+@patch("autopr.github_service._get_repo_details", return_value=("owner", "repo"))
+@patch("autopr.github_service.get_pr_head_commit_sha")
+@patch("builtins.print")
+class TestPostPrReview(unittest.TestCase):
+    COMMENTS = [
+        {"path": "a.py", "line": 1, "body": "One"},
+        {"path": "a.py", "line": 99, "body": "Two"},
+        {"path": "b.py", "line": 3, "body": "Three"},
+    ]
+
+    @patch("subprocess.run")
+    def test_single_review_request(self, mock_subprocess_run, mock_print, mock_get_sha, mock_get_repo):
+        mock_subprocess_run.return_value = MagicMock(stdout="{}", returncode=0)
+
+        results = post_pr_review(7, self.COMMENTS, commit_sha="headsha")
+
+        self.assertEqual(results, [True, True, True])
+        mock_get_sha.assert_not_called()
+        mock_subprocess_run.assert_called_once()
+        args, kwargs = mock_subprocess_run.call_args
+        self.assertEqual(
+            args[0], ["gh", "api", "repos/owner/repo/pulls/7/reviews", "-X", "POST", "--input", "-"]
+        )
+        payload = json.loads(kwargs["input"])
+        self.assertEqual(payload["commit_id"], "headsha")
+        self.assertEqual(payload["event"], "COMMENT")
+        self.assertEqual(
+            payload["comments"][1], {"path": "a.py", "line": 99, "side": "RIGHT", "body": "Two"}
+        )
+
+    @patch("subprocess.run")
+    def test_rejected_review_is_not_split_or_retried(
+        self, mock_subprocess_run, mock_print, mock_get_sha, mock_get_repo
+    ):
+        for stderr in ("gh: Unprocessable Entity (HTTP 422)", "gh: Not Found (HTTP 404)"):
+            with self.subTest(stderr=stderr):
+                mock_subprocess_run.reset_mock()
+                mock_subprocess_run.side_effect = subprocess.CalledProcessError(1, ["gh"], stderr=stderr)
+
+                results = post_pr_review(7, self.COMMENTS, commit_sha="headsha")
+
+                self.assertEqual(results, [False, False, False])
+                mock_subprocess_run.assert_called_once()
+
+    @patch("subprocess.run")
+    def test_comments_outside_the_diff_are_left_out(
+        self, mock_subprocess_run, mock_print, mock_get_sha, mock_get_repo
+    ):
+        mock_subprocess_run.return_value = MagicMock(stdout="{}", returncode=0)
+        diff_index = DiffLineIndex({"a.py": [1, 2, 3], "b.py": [3]})
+
+        results = post_pr_review(7, self.COMMENTS, commit_sha="headsha", diff_index=diff_index)
+
+        self.assertEqual(results, [True, False, True])
+        mock_subprocess_run.assert_called_once()
+        payload = json.loads(mock_subprocess_run.call_args.kwargs["input"])
+        self.assertEqual([c["body"] for c in payload["comments"]], ["One", "Three"])
+
+    def test_nothing_in_the_diff(self, mock_print, mock_get_sha, mock_get_repo):
+        results = post_pr_review(7, self.COMMENTS, diff_index=DiffLineIndex({}))
+        self.assertEqual(results, [False, False, False])
+        mock_get_repo.assert_not_called()
+
+    def test_missing_head_sha(self, mock_print, mock_get_sha, mock_get_repo):
+        mock_get_sha.return_value = None
+        self.assertEqual(post_pr_review(7, self.COMMENTS), [False, False, False])
+
+    def test_no_comments(self, mock_print, mock_get_sha, mock_get_repo):
+        self.assertEqual(post_pr_review(7, []), [])
+        mock_get_repo.assert_not_called()
+
+
+class TestPrefetch(_LookupCacheTestCase):
+    PR_DATA = {
+        "data": {
+            "repository": {
+                "owner": {"login": "octo"},
+                "name": "repo",
+                "pullRequest": {
+                    "title": "Add caching",
+                    "headRefName": "feature",
+                    "headRefOid": "head123",
+                    "baseRefName": "main",
+                    "baseRefOid": "base456",
+                    "additions": 12,
+                    "deletions": 3,
+                    "changedFiles": 2,
+                    "files": {"nodes": [
+                        {"path": "a.py", "additions": 10, "deletions": 3},
+                        {"path": "b.py", "additions": 2, "deletions": 0},
+                    ]},
+                    "closingIssuesReferences": {"nodes": [
+                        {"number": 4, "title": "Slow", "body": "It is slow", "labels": {"nodes": [{"name": "perf"}]}},
+                    ]},
+                    "reviewThreads": {"nodes": [
+                        {"path": "a.py", "line": 7, "isResolved": False, "isOutdated": False,
+                         "comments": {"nodes": [{"body": "Rename this."}]}},
+                    ]},
+                },
+            }
+        }
+    }
+
+    @patch("subprocess.run")
+    def test_pr_context_in_one_call_feeds_lookups(self, mock_run):
+        mock_run.return_value = Mock(stdout=json.dumps(self.PR_DATA))
+
+        context = prefetch_pr_context(9)
+
+        cmd = mock_run.call_args[0][0]
+        self.assertEqual(cmd[:3], ["gh", "api", "graphql"])
+        self.assertIn("owner={owner}", cmd)
+        self.assertIn("number=9", cmd)
+        self.assertEqual((context.head_sha, context.base_sha, context.base_ref), ("head123", "base456", "main"))
+        self.assertEqual(context.files[0], {"path": "a.py", "additions": 10, "deletions": 3})
+        self.assertEqual(context.review_threads[0]["body"], "Rename this.")
+
+        # Repository, head SHA and the linked issue are now answered without gh.
+        self.assertEqual(_get_repo_details(), ("octo", "repo"))
+        self.assertEqual(get_pr_head_commit_sha(9), "head123")
+        self.assertEqual(
+            get_issue_details(4),
+            {"number": 4, "title": "Slow", "body": "It is slow", "labels": [{"name": "perf"}]},
         )
-        mock_print.assert_any_call(f"Successfully posted comment on PR #{mock_pr_number} to {mock_path}:{mock_line}. Response: Comment JSON data...")
+        self.assertEqual(mock_run.call_count, 1)
+
+    @patch("subprocess.run")
+    def test_review_threads_left_out_when_there_are_more_pages(self, mock_run):
+        data = json.loads(json.dumps(self.PR_DATA))
+        data["data"]["repository"]["pullRequest"]["reviewThreads"]["pageInfo"] = {"hasNextPage": True}
+        mock_run.return_value = Mock(stdout=json.dumps(data))
+
+        context = prefetch_pr_context(9)
 
-    @patch("autopr.github_service._get_repo_details")
+        self.assertIn("pageInfo", " ".join(mock_run.call_args[0][0]))
+        self.assertIsNone(context.review_threads)
+        self.assertEqual(context.head_sha, "head123")
+
+    @patch("subprocess.run")
     @patch("builtins.print")
-    def test_failure_get_repo_details_fails(self, mock_print, mock_get_repo):
-        mock_get_repo.return_value = None
-        success = post_pr_review_comment(1, "body", "path", 1)
-        self.assertFalse(success)
-        mock_print.assert_any_call("Failed to post comment: Could not retrieve repository details.")
+    def test_pr_context_failure_returns_none(self, mock_print, mock_run):
+        mock_run.side_effect = subprocess.CalledProcessError(1, "gh", stderr="GraphQL: Could not resolve")
+        self.assertIsNone(prefetch_pr_context(9))
+        mock_print.assert_called_once_with("Could not prefetch details of PR #9: GraphQL: Could not resolve")
+
+    @staticmethod
+    def _open_pr(number, owner, repo="repo"):
+        return {
+            "number": number,
+            "url": f"https://github.com/octo/repo/pull/{number}",
+            "headRepositoryOwner": {"login": owner},
+            "headRepository": {"name": repo},
+        }
 
-    @patch("autopr.github_service._get_repo_details", return_value=("owner", "repo"))
-    @patch("autopr.github_service._get_pr_head_commit_sha")
+    @patch("autopr.github_service.get_push_remote_repo", return_value="octo/repo")
+    @patch("subprocess.run")
+    def test_repo_context_with_issue_and_open_pr(self, mock_run, mock_push_repo):
+        mock_run.return_value = Mock(stdout=json.dumps({"data": {"repository": {
+            "owner": {"login": "octo"},
+            "name": "repo",
+            "pullRequests": {"nodes": [self._open_pr(8, "octo")]},
+            "issue": {"number": 3, "title": "Bug", "body": None, "labels": {"nodes": []}},
+        }}}))
+
+        context = prefetch_repo_context("feature", 3)
+
+        cmd = mock_run.call_args[0][0]
+        self.assertIn("branch=feature", cmd)
+        self.assertIn("withIssue=true", cmd)
+        self.assertEqual(context.existing_pr, {"number": 8, "url": "https://github.com/octo/repo/pull/8"})
+        self.assertEqual(context.issue["body"], "")
+        self.assertEqual(get_issue_details(3)["title"], "Bug")
+        mock_push_repo.assert_called_once_with("feature")
+
+    @patch("autopr.github_service.get_push_remote_repo", return_value="me/repo")
+    @patch("subprocess.run")
+    def test_repo_context_only_counts_prs_from_the_push_remote(self, mock_run, mock_push_repo):
+        def respond(*nodes):
+            return Mock(stdout=json.dumps({"data": {"repository": {
+                "owner": {"login": "octo"}, "name": "repo", "pullRequests": {"nodes": list(nodes)},
+            }}}))
+
+        # Someone else's fork has a branch of the same name.
+        mock_run.return_value = respond(self._open_pr(8, "octo"), self._open_pr(9, "other"))
+        self.assertIsNone(prefetch_repo_context("feature").existing_pr)
+
+        mock_run.return_value = respond(self._open_pr(9, "other"), self._open_pr(10, "Me"))
+        self.assertEqual(prefetch_repo_context("feature").existing_pr["number"], 10)
+
+
+class TestIssueStoreLookups(_LookupCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        repo = os.path.join(self._tmp.name, "repo")
+        os.makedirs(os.path.join(repo, ".git"))
+        patcher = patch(
+            "autopr.github_service.open_issue_store",
+            side_effect=lambda create=True: open_store(repo, create=create),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend = MagicMock()
+        self.backend.get_page.return_value = ApiPage(200, '"etag"', None, [
+            {"number": 7, "title": "Fix login", "body": "Steps", "state": "open",
+             "labels": [], "user": {"login": "a"}, "assignees": [], "updated_at": "2024-05-01T00:00:00Z"},
+            {"number": 5, "title": "Old bug", "body": "", "state": "closed",
+             "labels": [{"name": "bug"}], "user": {"login": "b"}, "assignees": [], "updated_at": "2024-04-01T00:00:00Z"},
+        ])
+        for target in ("autopr.issue_store.get_backend", "autopr.github_service.get_backend"):
+            backend_patcher = patch(target, return_value=self.backend)
+            backend_patcher.start()
+            self.addCleanup(backend_patcher.stop)
+        github_service._remember_repo_details(("o", "r"))
+
+    @patch("subprocess.run")
     @patch("builtins.print")
-    def test_failure_get_pr_head_commit_sha_fails(self, mock_print, mock_get_sha, mock_get_repo_unused):
-        mock_get_sha.return_value = None
-        success = post_pr_review_comment(1, "body", "path", 1)
-        self.assertFalse(success)
-        mock_print.assert_any_call(f"Failed to post comment: Could not retrieve head commit SHA for PR #1.")
+    def test_first_ls_streams_and_builds_store_then_reads_it(self, mock_print, mock_run):
+        lines = "7\tOPEN\tFix login\t\t2024-05-01T00:00:00Z\n5\tCLOSED\tOld bug\tbug\t2024-04-01T00:00:00Z"
+        list_issues(show_all_issues=True)
+
+        # One request to list, one to build the store.
+        self.assertEqual(self.backend.get_page.call_count, 2)
+        mock_print.assert_any_call(lines, flush=True)
+
+        self.backend.get_page.reset_mock()
+        self.backend.get_page.return_value = ApiPage(304, '"etag"', None)
+        mock_print.reset_mock()
+
+        list_issues(show_all_issues=True, labels=["bug"])
+
+        # Only the issues updated since the newest stored one are asked for.
+        self.backend.get_page.assert_called_once()
+        self.assertIn("since=2024-05-01T00:00:00Z", self.backend.get_page.call_args[0][0])
+        mock_print.assert_any_call("5\tCLOSED\tOld bug\tbug\t2024-04-01T00:00:00Z", flush=True)
+        mock_run.assert_not_called()
 
-    @patch("autopr.github_service._get_repo_details", return_value=("owner", "repo"))
-    @patch("autopr.github_service._get_pr_head_commit_sha", return_value="sha")
     @patch("subprocess.run")
     @patch("builtins.print")
-    def test_failure_gh_api_called_process_error(self, mock_print, mock_subprocess_run, mock_get_sha_unused, mock_get_repo_unused):
-        mock_subprocess_run.side_effect = subprocess.CalledProcessError(cmd=["gh", "api"], returncode=1, stderr="API Error")
-        success = post_pr_review_comment(1, "body", "path", 1)
-        self.assertFalse(success)
-        mock_print.assert_any_call("Error posting review comment via gh api for PR #1:")
-        mock_print.assert_any_call("Stderr:\nAPI Error")
+    def test_offline_needs_a_synced_store(self, mock_print, mock_run):
+        list_issues(offline=True)
+        mock_print.assert_any_call(
+            "The local issue store is empty. Run `autopr ls` without --offline first.", file=None
+        )
+        self.backend.get_page.assert_not_called()
 
-    @patch("autopr.github_service._get_repo_details", return_value=("owner", "repo"))
-    @patch("autopr.github_service._get_pr_head_commit_sha", return_value="sha")
     @patch("subprocess.run")
     @patch("builtins.print")
-    def test_failure_gh_api_file_not_found(self, mock_print, mock_subprocess_run, mock_get_sha_unused, mock_get_repo_unused):
-        mock_subprocess_run.side_effect = FileNotFoundError
-        success = post_pr_review_comment(1, "body", "path", 1)
-        self.assertFalse(success)
-        mock_print.assert_any_call("Error: 'gh' command not found. Please ensure it is installed and in your PATH.")
+    def test_issue_details_read_from_store(self, mock_print, mock_run):
+        list_issues()
+        self.backend.get_page.reset_mock()
+
+        self.assertEqual(get_issue_details(7, offline=True)["title"], "Fix login")
+        self.backend.get_page.assert_not_called()
+        self.assertEqual(get_issue_details(5)["labels"], [{"name": "bug"}])
+        self.backend.get_page.assert_called_once()  # Conditional update only
+        mock_run.assert_not_called()
+
+    @patch("subprocess.run")
+    @patch("builtins.print")
+    def test_refresh_bypasses_store(self, mock_print, mock_run):
+        list_issues()
+        mock_run.return_value = Mock(stdout='{"number": 7, "title": "Fix login (edited)"}')
+
+        self.assertEqual(get_issue_details(7, refresh=True)["title"], "Fix login (edited)")
 
 
 if __name__ == "__main__":
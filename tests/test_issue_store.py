@@ -0,0 +1,194 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import tempfile
+
+from autopr.github_backend import ApiPage
+from autopr.issue_store import (
+    get_issue,
+    iter_stored_issues,
+    last_synced_at,
+    open_store,
+    sync_issues,
+)
+
+
+def _stored_numbers(conn, state="open"):
+    return [
+        issue["number"] for page in iter_stored_issues(conn, state) for issue in page
+    ]
+
+
+def _issue(number, updated_at, state="open", **extra):
+    return {
+        "number": number,
+        "title": f"Issue {number}",
+        "body": None,
+        "state": state,
+        "labels": [{"name": "bug", "color": "red"}],
+        "user": {"login": "octo"},
+        "assignees": [],
+        "updated_at": updated_at,
+        **extra,
+    }
+
+
+class _StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        os.mkdir(os.path.join(self._tmp.name, ".git"))
+        self.conn = open_store(self._tmp.name)
+        self.addCleanup(self.conn.close)
+        self.backend = MagicMock()
+        patcher = patch("autopr.issue_store.get_backend", return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestSyncIssues(_StoreTestCase):
+    def test_first_sync_pages_through_everything(self):
+        self.backend.get_page.side_effect = [
+            ApiPage(
+                200,
+                '"e1"',
+                "repositories/1/issues?page=2",
+                [
+                    _issue(1, "2024-01-01T00:00:00Z"),
+                    _issue(2, "2024-01-02T00:00:00Z", pull_request={}),
+                ],
+            ),
+            ApiPage(
+                200, None, None, [_issue(3, "2024-01-03T00:00:00Z", state="closed")]
+            ),
+        ]
+
+        self.assertEqual(sync_issues(self.conn, "o", "r"), 2)
+
+        first_path, etag = self.backend.get_page.call_args_list[0][0]
+        self.assertNotIn("since=", first_path)
+        self.assertIsNone(etag)
+        self.assertEqual(last_synced_at(self.conn), "2024-01-03T00:00:00Z")
+        self.assertEqual(_stored_numbers(self.conn), [1])
+        self.assertEqual(_stored_numbers(self.conn, None), [3, 1])
+        self.assertEqual(
+            get_issue(self.conn, 1),
+            {
+                "number": 1,
+                "title": "Issue 1",
+                "body": "",
+                "state": "open",
+                "labels": [{"name": "bug"}],
+                "author": "octo",
+                "assignees": [],
+                "updated_at": "2024-01-01T00:00:00Z",
+            },
+        )
+        self.assertIsNone(get_issue(self.conn, 2))  # A pull request
+
+    def test_incremental_sync_is_conditional(self):
+        self.backend.get_page.return_value = ApiPage(
+            200, '"e1"', None, [_issue(1, "2024-01-01T00:00:00Z")]
+        )
+        sync_issues(self.conn, "o", "r")
+        self.backend.get_page.return_value = ApiPage(
+            200, '"e2"', None, [_issue(1, "2024-01-01T00:00:00Z")]
+        )
+        sync_issues(self.conn, "o", "r")
+        self.backend.get_page.return_value = ApiPage(304, '"e2"', None)
+
+        self.assertEqual(sync_issues(self.conn, "o", "r"), 0)
+
+        path, etag = self.backend.get_page.call_args[0]
+        self.assertIn("since=2024-01-01T00:00:00Z", path)
+        self.assertEqual(etag, '"e2"')
+
+    def test_full_sync_forgets_deleted_issues(self):
+        self.backend.get_page.return_value = ApiPage(
+            200,
+            None,
+            None,
+            [
+                _issue(1, "2024-01-01T00:00:00Z"),
+                _issue(2, "2024-01-02T00:00:00Z"),
+            ],
+        )
+        sync_issues(self.conn, "o", "r")
+        self.backend.get_page.return_value = ApiPage(
+            200, None, None, [_issue(2, "2024-01-02T00:00:00Z")]
+        )
+
+        sync_issues(self.conn, "o", "r", full=True)
+
+        self.assertNotIn("since=", self.backend.get_page.call_args[0][0])
+        self.assertEqual(_stored_numbers(self.conn), [2])
+
+    def test_failed_sync_leaves_store_unchanged(self):
+        self.backend.get_page.side_effect = [
+            ApiPage(200, None, "next", [_issue(1, "2024-01-01T00:00:00Z")]),
+            RuntimeError("connection lost"),
+        ]
+        with self.assertRaises(RuntimeError):
+            sync_issues(self.conn, "o", "r")
+        self.assertIsNone(last_synced_at(self.conn))
+        self.assertEqual(_stored_numbers(self.conn), [])
+
+
+class TestIterStoredIssues(_StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend.get_page.return_value = ApiPage(
+            200,
+            None,
+            None,
+            [
+                _issue(1, "2024-01-01T00:00:00Z", title="Crash on start"),
+                _issue(
+                    2,
+                    "2024-01-02T00:00:00Z",
+                    labels=[{"name": "bug"}, {"name": "p1"}],
+                    assignees=[{"login": "ana"}],
+                ),
+                _issue(3, "2024-01-03T00:00:00Z", state="closed", user={"login": "bo"}),
+                _issue(
+                    4, "2024-01-04T00:00:00Z", labels=[], body="It crashes when started"
+                ),
+            ],
+        )
+        sync_issues(self.conn, "o", "r")
+
+    def numbers(self, **filters):
+        return [
+            i["number"]
+            for page in iter_stored_issues(self.conn, **filters)
+            for i in page
+        ]
+
+    def test_filters(self):
+        self.assertEqual(self.numbers(), [4, 2, 1])
+        self.assertEqual(self.numbers(labels=["bug", "p1"]), [2])
+        self.assertEqual(self.numbers(labels=["bug", "docs"]), [])
+        self.assertEqual(self.numbers(assignee="ana"), [2])
+        self.assertEqual(self.numbers(state=None, author="bo"), [3])
+        self.assertEqual(self.numbers(search="crash"), [4, 1])
+        self.assertEqual(self.numbers(state=None, limit=2), [4, 3])
+
+    def test_pages(self):
+        pages = list(iter_stored_issues(self.conn, state=None, page_size=3))
+        self.assertEqual([len(page) for page in pages], [3, 1])
+
+
+class TestOpenStore(unittest.TestCase):
+    def test_needs_git_directory(self):
+        with tempfile.TemporaryDirectory() as repo:
+            self.assertIsNone(open_store(repo))
+
+    def test_create_false_does_not_create(self):
+        with tempfile.TemporaryDirectory() as repo:
+            os.mkdir(os.path.join(repo, ".git"))
+            self.assertIsNone(open_store(repo, create=False))
+            self.assertFalse(os.listdir(os.path.join(repo, ".git")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from autopr.diff_utils import estimate_tokens, index_diff_lines, parse_diff
+from autopr.review_engine import (
+    anchor_suggestions,
+    drop_existing_comments,
+    merge_suggestions,
+    review_diff,
+    split_diff_into_chunks,
+)
+
+
+def _file_diff(path: str, hunk_count: int = 1, lines_per_hunk: int = 3) -> str:
+    parts = [
+        f"diff --git a/{path} b/{path}",
+        f"--- a/{path}",
+        f"+++ b/{path}",
+    ]
+    for i in range(hunk_count):
+        start = 1 + i * 100
+        parts.append(f"@@ -{start},{lines_per_hunk} +{start},{lines_per_hunk} @@")
+        parts.extend(f"+line {j} of {path}" for j in range(lines_per_hunk))
+    return "\n".join(parts)
+
+
+class TestSplitDiffIntoChunks(unittest.TestCase):
+    def test_small_files_are_packed_together(self):
+        diff = "\n".join(_file_diff(f"f{i}.py") for i in range(3))
+        chunks = split_diff_into_chunks(diff, max_tokens=10_000)
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(len(parse_diff(chunks[0])), 3)
+
+    def test_files_split_across_chunks_with_headers(self):
+        diff = "\n".join(_file_diff(f"f{i}.py", lines_per_hunk=20) for i in range(4))
+        chunks = split_diff_into_chunks(diff, max_tokens=200)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith("diff --git "))
+
+    def test_large_file_split_by_hunk_and_header_repeated(self):
+        diff = _file_diff("big.py", hunk_count=6, lines_per_hunk=20)
+        chunks = split_diff_into_chunks(diff, max_tokens=300)
+        self.assertGreater(len(chunks), 1)
+        hunks_seen = 0
+        for chunk in chunks:
+            files = parse_diff(chunk)
+            self.assertEqual([f.path for f in files], ["big.py"])
+            hunks_seen += len(files[0].hunks)
+            self.assertLessEqual(estimate_tokens(chunk), 300)
+        self.assertEqual(hunks_seen, 6)
+
+    def test_oversized_hunk_is_split(self):
+        diff = _file_diff("huge.py", hunk_count=1, lines_per_hunk=200)
+        chunks = split_diff_into_chunks(diff, max_tokens=500)
+        self.assertGreater(len(chunks), 1)
+        added = sum(parse_diff(chunk)[0].added for chunk in chunks)
+        self.assertEqual(added, 200)
+
+
+class TestMergeSuggestions(unittest.TestCase):
+    def test_dedupes_and_keeps_order(self):
+        merged = merge_suggestions(
+            [
+                [
+                    {"path": "a.py", "line": 1, "suggestion": "Use a constant."},
+                    {"path": "a.py", "line": 2, "suggestion": "Add a docstring."},
+                ],
+                [
+                    {"path": "a.py", "line": 1, "suggestion": "use a   constant. "},
+                    {"path": "b.py", "line": 1, "suggestion": "Handle None."},
+                ],
+                [],
+            ]
+        )
+        self.assertEqual(
+            [(s["path"], s["line"]) for s in merged],
+            [("a.py", 1), ("a.py", 2), ("b.py", 1)],
+        )
+
+
+class TestAnchorSuggestions(unittest.TestCase):
+    def test_valid_moved_and_dropped(self):
+        index = index_diff_lines(
+            _file_diff("src/a.py", hunk_count=2)
+        )  # lines 1-3 and 101-103
+        comments = [
+            {"path": "src/a.py", "line": 2, "body": "ok"},
+            {"path": "a.py", "line": 5, "body": "near the first hunk"},
+            {"path": "src/a.py", "line": 50, "body": "far from any hunk"},
+            {"path": "src/b.py", "line": 1, "body": "not in the diff"},
+        ]
+
+        anchored, corrected, dropped = anchor_suggestions(comments, index)
+
+        self.assertEqual(
+            anchored,
+            [
+                {"path": "src/a.py", "line": 2, "body": "ok"},
+                {"path": "src/a.py", "line": 3, "body": "near the first hunk"},
+            ],
+        )
+        self.assertEqual((corrected, dropped), (1, 2))
+        self.assertEqual(comments[1]["line"], 5)  # Input left untouched
+
+
+class TestDropExistingComments(unittest.TestCase):
+    EXISTING = [
+        {"path": "a.py", "line": 3, "body": "Consider using a context manager here."},
+        {"path": "a.py", "line": None, "body": "Outdated comment."},
+    ]
+
+    def test_exact_and_similar_duplicates_dropped(self):
+        comments = [
+            {
+                "path": "a.py",
+                "line": 3,
+                "body": "consider using a  context manager here.",
+            },
+            {
+                "path": "a.py",
+                "line": 3,
+                "body": "Consider using a context manager here!",
+            },
+            {"path": "a.py", "line": 3, "body": "This variable name is misleading."},
+            {
+                "path": "a.py",
+                "line": 4,
+                "body": "Consider using a context manager here.",
+            },
+            {"path": "a.py", "line": 7, "body": "Outdated comment."},
+        ]
+
+        kept, dropped = drop_existing_comments(comments, self.EXISTING)
+
+        self.assertEqual(kept, comments[2:])
+        self.assertEqual(dropped, 2)
+
+    def test_no_existing_comments(self):
+        comments = [{"path": "a.py", "line": 1, "body": "x"}]
+        self.assertEqual(drop_existing_comments(comments, []), (comments, 0))
+
+
+class TestReviewDiff(unittest.TestCase):
+    @patch("autopr.review_engine.get_pr_review_suggestions")
+    def test_small_diff_single_request(self, mock_get_suggestions):
+        diff = _file_diff("a.py")
+        mock_get_suggestions.return_value = [
+            {"path": "a.py", "line": 1, "suggestion": "x"}
+        ]
+
+        result = review_diff(diff)
+
+        mock_get_suggestions.assert_called_once_with(diff)
+        self.assertEqual(result, mock_get_suggestions.return_value)
+
+    @patch(
+        "autopr.async_ai_service.get_pr_review_suggestions_async",
+        new_callable=AsyncMock,
+    )
+    @patch("autopr.review_engine.get_pr_review_suggestions")
+    @patch("builtins.print")
+    def test_large_diff_reviewed_in_chunks(
+        self, mock_print, mock_get_sync, mock_get_suggestions
+    ):
+        diff = "\n".join(_file_diff(f"f{i}.py", lines_per_hunk=20) for i in range(4))
+
+        def fake_review(chunk):
+            path = parse_diff(chunk)[0].path
+            return [
+                {"path": path, "line": 1, "suggestion": "Per-chunk note."},
+                {"path": "error", "line": 0, "suggestion": "[AI JSON parsing error]"},
+            ]
+
+        mock_get_suggestions.side_effect = fake_review
+
+        result = review_diff(diff, max_chunk_tokens=200, max_workers=2)
+
+        chunk_count = mock_get_suggestions.await_count
+        self.assertGreater(chunk_count, 1)
+        mock_get_sync.assert_not_called()
+        self.assertEqual(len([s for s in result if s["path"] == "error"]), 1)
+        self.assertEqual(len([s for s in result if s["path"] != "error"]), chunk_count)
+
+    @patch("autopr.review_engine.get_pr_review_suggestions")
+    def test_empty_diff_passed_through(self, mock_get_suggestions):
+        review_diff("")
+        mock_get_suggestions.assert_called_once_with("")
+
+
+if __name__ == "__main__":
+    unittest.main()
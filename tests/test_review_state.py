@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+
+from autopr.review_state import (
+    get_last_reviewed_sha,
+    load_review_state,
+    record_reviewed_sha,
+)
+
+
+class TestReviewState(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.repo = self._tmp.name
+        os.mkdir(os.path.join(self.repo, ".git"))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_never_reviewed(self):
+        self.assertIsNone(get_last_reviewed_sha(7, self.repo))
+
+    def test_record_and_read_back(self):
+        self.assertTrue(record_reviewed_sha(7, "abc123", self.repo))
+        self.assertTrue(record_reviewed_sha(8, "def456", self.repo))
+        self.assertTrue(record_reviewed_sha(7, "fff999", self.repo))
+
+        self.assertEqual(get_last_reviewed_sha(7, self.repo), "fff999")
+        self.assertEqual(get_last_reviewed_sha(8, self.repo), "def456")
+        self.assertEqual(set(load_review_state(self.repo)), {"7", "8"})
+
+    def test_corrupt_state_is_ignored(self):
+        with open(
+            os.path.join(self.repo, ".git", ".autopr_review_state.json"), "w"
+        ) as f:
+            f.write("not json")
+        self.assertIsNone(get_last_reviewed_sha(7, self.repo))
+        self.assertTrue(record_reviewed_sha(7, "abc123", self.repo))
+        self.assertEqual(get_last_reviewed_sha(7, self.repo), "abc123")
+
+    def test_shared_with_subdirectories(self):
+        subdir = os.path.join(self.repo, "src")
+        os.mkdir(subdir)
+        self.assertTrue(record_reviewed_sha(7, "abc123", subdir))
+        self.assertEqual(get_last_reviewed_sha(7, self.repo), "abc123")
+        self.assertTrue(
+            os.path.exists(os.path.join(self.repo, ".git", ".autopr_review_state.json"))
+        )
+
+    def test_no_git_dir(self):
+        with tempfile.TemporaryDirectory() as not_a_repo:
+            self.assertFalse(record_reviewed_sha(7, "abc123", not_a_repo))
+
+
+if __name__ == "__main__":
+    unittest.main()
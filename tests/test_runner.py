@@ -0,0 +1,188 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from autopr import runner
+from autopr.runner import (
+    CommandTimeout,
+    format_timings,
+    get_timings,
+    record_timing,
+    reset_timings,
+    run,
+    run_concurrently,
+    stream,
+)
+
+
+class _RunnerTestCase(unittest.TestCase):
+    def setUp(self):
+        reset_timings()
+        self.addCleanup(reset_timings)
+
+
+class TestRun(_RunnerTestCase):
+    @patch("subprocess.run")
+    def test_stdin_closed_and_timeout_applied(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0, stdout="ok")
+
+        run(["git", "status"])
+
+        mock_run.assert_called_once_with(
+            ["git", "status"],
+            capture_output=True,
+            text=True,
+            check=False,
+            timeout=runner.DEFAULT_COMMAND_TIMEOUT,
+            stdin=subprocess.DEVNULL,
+        )
+
+    @patch("subprocess.run")
+    def test_input_keeps_stdin_open(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0)
+        run(["gh", "api", "x", "--input", "-"], input="{}", timeout=5)
+        self.assertNotIn("stdin", mock_run.call_args.kwargs)
+        self.assertEqual(mock_run.call_args.kwargs["timeout"], 5)
+
+    @patch("subprocess.run")
+    def test_timeout_from_environment(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0)
+        with patch.dict(os.environ, {"AUTOPR_COMMAND_TIMEOUT": "7.5"}):
+            run(["git", "status"])
+        self.assertEqual(mock_run.call_args.kwargs["timeout"], 7.5)
+
+    def test_records_exit_codes(self):
+        run([sys.executable, "-c", "import sys; sys.exit(3)"])
+        with self.assertRaises(subprocess.CalledProcessError):
+            run([sys.executable, "-c", "import sys; sys.exit(1)"], check=True)
+        with self.assertRaises(FileNotFoundError):
+            run(["autopr-no-such-command"])
+
+        self.assertEqual(
+            [t.outcome for t in get_timings()], ["exit 3", "exit 1", "not found"]
+        )
+        self.assertTrue(get_timings()[0].label.endswith("import sys; sys.exit(3)"))
+
+    def test_timeout_kills_command(self):
+        started = time.perf_counter()
+        with self.assertRaises(CommandTimeout) as ctx:
+            run([sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.2)
+        self.assertLess(time.perf_counter() - started, 10)
+        self.assertIsInstance(ctx.exception, subprocess.CalledProcessError)
+        self.assertEqual(ctx.exception.stderr, "Timed out after 0.2s")
+        self.assertIn("timed out after 0.2 seconds", str(ctx.exception))
+        self.assertEqual(get_timings()[0].outcome, "timeout")
+
+    def test_long_labels_are_shortened(self):
+        record_timing("git commit -m " + "word\n" * 40, 0.1, "exit 0")
+        label = get_timings()[0].label
+        self.assertEqual(len(label), runner.MAX_LABEL_LENGTH)
+        self.assertNotIn("\n", label)
+
+
+class TestStream(_RunnerTestCase):
+    def test_output_arrives_in_chunks(self):
+        chunks = []
+        code = "import sys; sys.stdout.write('x' * 2500); sys.stderr.write('warning')"
+        with patch.object(runner, "STREAM_CHUNK_BYTES", 1000):
+            result = stream([sys.executable, "-c", code], chunks.append)
+
+        self.assertEqual(b"".join(chunks), b"x" * 2500)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 1000)
+        self.assertEqual(result.returncode, 0)
+        self.assertIsNone(result.stdout)
+        self.assertEqual(result.stderr, "warning")
+        self.assertEqual(get_timings()[0].outcome, "exit 0")
+
+    def test_timeout_kills_command(self):
+        chunks = []
+        code = "import sys, time; print('start', flush=True); time.sleep(30)"
+        with self.assertRaises(CommandTimeout):
+            stream([sys.executable, "-c", code], chunks.append, timeout=0.3)
+        self.assertEqual(b"".join(chunks).strip(), b"start")
+        self.assertEqual(get_timings()[0].outcome, "timeout")
+
+    def test_failing_consumer_stops_command(self):
+        def on_chunk(chunk):
+            raise OSError("No space left on device")
+
+        code = "import time; print('x', flush=True); time.sleep(30)"
+        started = time.perf_counter()
+        with self.assertRaises(OSError):
+            stream([sys.executable, "-c", code], on_chunk)
+        self.assertLess(time.perf_counter() - started, 10)
+
+    def test_command_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            stream(["autopr-no-such-command"], lambda chunk: None)
+        self.assertEqual(get_timings()[0].outcome, "not found")
+
+
+class TestConcurrency(_RunnerTestCase):
+    def test_run_concurrently_keeps_order_and_errors(self):
+        results = run_concurrently(
+            [
+                [sys.executable, "-c", "print('a')"],
+                ["autopr-no-such-command"],
+                [sys.executable, "-c", "print('c')"],
+            ]
+        )
+        self.assertEqual(results[0].stdout, "a\n")
+        self.assertIsInstance(results[1], FileNotFoundError)
+        self.assertEqual(results[2].stdout, "c\n")
+
+    @patch("subprocess.run")
+    def test_process_cap(self, mock_run):
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def fake_run(*args, **kwargs):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+            return MagicMock(returncode=0)
+
+        mock_run.side_effect = fake_run
+        with patch.object(runner, "_slots", threading.BoundedSemaphore(2)):
+            threads = [
+                threading.Thread(target=run, args=(["git", "status"],))
+                for _ in range(6)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(peak, 2)
+        self.assertEqual(len(get_timings()), 6)
+
+
+class TestFormatTimings(_RunnerTestCase):
+    def test_report(self):
+        record_timing("gh pr view 5", 0.5, "exit 0")
+        record_timing("GET /repos/o/r/pulls/5", 0.25, "HTTP 200")
+
+        report = format_timings(2.0)
+
+        self.assertEqual(
+            report.splitlines(),
+            [
+                "Timings (wall time 2.00s):",
+                "    0.500s  exit 0     gh pr view 5",
+                "    0.250s  HTTP 200   GET /repos/o/r/pulls/5",
+                "    0.750s  in 2 git/GitHub call(s)",
+                "    1.250s  elsewhere (AI requests, local work)",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,257 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+
+import openai
+
+from autopr.scheduler import (
+    DeadlineExceeded,
+    RequestScheduler,
+    TokenBucket,
+    estimate_request_tokens,
+    get_retry_after,
+    is_retryable,
+)
+
+
+class FakeClock:
+    """Monotonic clock that only moves when sleep() is called."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _status_error(status_code, headers=None, cls=openai.APIStatusError):
+    response = MagicMock(status_code=status_code, headers=headers or {})
+    return cls(f"Error code: {status_code}", response=response, body=None)
+
+
+def _scheduler(clock, **kwargs):
+    return RequestScheduler(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_waits_once_empty_and_refills_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)  # One token per second
+
+        self.assertEqual(bucket.reserve(60), 0.0)
+        self.assertAlmostEqual(bucket.reserve(2), 2.0)
+        clock.now += 10
+        self.assertEqual(bucket.reserve(5), 0.0)
+
+    def test_refund_returns_tokens(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)
+        bucket.reserve(60)
+        bucket.refund(30)
+        self.assertEqual(bucket.reserve(30), 0.0)
+
+    def test_oversized_reservation_is_capped_at_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)
+        self.assertEqual(bucket.reserve(1000), 0.0)
+        self.assertAlmostEqual(bucket.reserve(1), 1.0)
+
+
+class TestRetryClassification(unittest.TestCase):
+    def test_retryable_errors(self):
+        self.assertTrue(is_retryable(_status_error(429, cls=openai.RateLimitError)))
+        self.assertTrue(
+            is_retryable(_status_error(503, cls=openai.InternalServerError))
+        )
+        self.assertTrue(is_retryable(openai.APITimeoutError(request=MagicMock())))
+
+    def test_non_retryable_errors(self):
+        self.assertFalse(is_retryable(_status_error(400, cls=openai.BadRequestError)))
+        self.assertFalse(is_retryable(openai.APIError("boom", request=None, body=None)))
+        self.assertFalse(is_retryable(ValueError("not an API error")))
+        quota_error = _status_error(429, cls=openai.RateLimitError)
+        quota_error.code = "insufficient_quota"
+        self.assertFalse(is_retryable(quota_error))
+
+    def test_retry_after_headers(self):
+        self.assertEqual(get_retry_after(_status_error(429, {"retry-after": "7"})), 7.0)
+        self.assertEqual(
+            get_retry_after(_status_error(429, {"retry-after-ms": "1500"})), 1.5
+        )
+        self.assertIsNone(get_retry_after(_status_error(429)))
+        self.assertIsNone(get_retry_after(ValueError("no response")))
+
+    def test_estimate_request_tokens_includes_max_tokens(self):
+        request = {
+            "messages": [{"role": "user", "content": "x" * 400}],
+            "max_tokens": 100,
+        }
+        self.assertGreater(estimate_request_tokens(request), 200)
+
+
+@patch("builtins.print")
+class TestRequestScheduler(unittest.TestCase):
+    def test_retries_rate_limit_honouring_retry_after(self, mock_print):
+        clock = FakeClock()
+        scheduler = _scheduler(clock)
+        func = MagicMock(
+            side_effect=[
+                _status_error(429, {"retry-after": "3"}, openai.RateLimitError),
+                "ok",
+            ]
+        )
+
+        self.assertEqual(scheduler.call(func), "ok")
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(clock.sleeps, [3.0])
+
+    @patch("autopr.scheduler.random.uniform", side_effect=lambda low, high: high)
+    def test_exponential_backoff_for_server_errors(self, mock_uniform, mock_print):
+        clock = FakeClock()
+        scheduler = _scheduler(clock)
+        error = _status_error(500, cls=openai.InternalServerError)
+        func = MagicMock(side_effect=[error, error, error, "ok"])
+
+        self.assertEqual(scheduler.call(func), "ok")
+        self.assertEqual(clock.sleeps, [1.0, 2.0, 4.0])
+
+    def test_non_retryable_error_raised_immediately(self, mock_print):
+        clock = FakeClock()
+        scheduler = _scheduler(clock)
+        error = openai.APIError("boom", request=None, body=None)
+        func = MagicMock(side_effect=error)
+
+        with self.assertRaises(openai.APIError):
+            scheduler.call(func)
+        func.assert_called_once()
+
+    def test_gives_up_after_max_retries(self, mock_print):
+        clock = FakeClock()
+        scheduler = _scheduler(clock, max_retries=2)
+        func = MagicMock(side_effect=_status_error(503, cls=openai.InternalServerError))
+
+        with self.assertRaises(openai.InternalServerError):
+            scheduler.call(func)
+        self.assertEqual(func.call_count, 3)
+
+    def test_stops_retrying_at_deadline(self, mock_print):
+        clock = FakeClock()
+        scheduler = _scheduler(clock, deadline_seconds=10)
+        func = MagicMock(
+            side_effect=_status_error(429, {"retry-after": "30"}, openai.RateLimitError)
+        )
+
+        with self.assertRaises(openai.RateLimitError):
+            scheduler.call(func)
+        func.assert_called_once()
+        self.assertEqual(clock.sleeps, [])
+
+    def test_rate_limit_smooths_bursts(self, mock_print):
+        clock = FakeClock()
+        scheduler = _scheduler(clock, requests_per_minute=60)
+        func = MagicMock(return_value="ok")
+
+        for _ in range(62):
+            scheduler.call(func)
+
+        self.assertEqual(func.call_count, 62)
+        self.assertAlmostEqual(sum(clock.sleeps), 2.0)
+
+    def test_rate_limit_wait_past_deadline(self, mock_print):
+        clock = FakeClock()
+        scheduler = _scheduler(clock, tokens_per_minute=600, deadline_seconds=5)
+        func = MagicMock(return_value="ok")
+
+        scheduler.call(func, estimated_tokens=600)
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.call(func, estimated_tokens=600)
+        func.assert_called_once()
+
+    def test_calls_without_wait_are_allowed_after_deadline(self, mock_print):
+        clock = FakeClock()
+        scheduler = _scheduler(clock, deadline_seconds=120)
+        func = MagicMock(return_value="ok")
+
+        scheduler.call(func)
+        clock.now = 121.0
+        self.assertEqual(scheduler.call(func), "ok")
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(clock.sleeps, [])
+
+    def test_reset_deadline_allows_waiting_again(self, mock_print):
+        clock = FakeClock()
+        scheduler = _scheduler(clock, tokens_per_minute=600, deadline_seconds=40)
+        func = MagicMock(return_value="ok")
+
+        scheduler.call(func, estimated_tokens=600)
+        clock.now = 200.0  # The bucket has refilled, but the deadline has passed
+        scheduler.call(func, estimated_tokens=600)
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.call(func, estimated_tokens=300)
+
+        clock.now = 220.0
+        scheduler.reset_deadline()
+        self.assertEqual(scheduler.call(func, estimated_tokens=300), "ok")
+        # The refused call gave its tokens back, so only the refill since 200 is owed.
+        self.assertEqual(clock.sleeps, [10.0])
+
+    def test_each_thread_has_its_own_deadline(self, mock_print):
+        import threading
+
+        clock = FakeClock()
+        scheduler = _scheduler(clock, tokens_per_minute=600, deadline_seconds=40)
+        scheduler.reset_deadline()
+        scheduler.remaining()  # Starts this thread's deadline at 0
+        clock.now = 30.0
+
+        def other_command():
+            scheduler.reset_deadline()
+            scheduler.remaining()
+
+        worker = threading.Thread(target=other_command)
+        worker.start()
+        worker.join()
+        # The other thread's reset did not move this thread's deadline.
+        self.assertEqual(scheduler.remaining(), 10.0)
+
+    def test_from_env(self, mock_print):
+        env = {
+            "AUTOPR_OPENAI_RPM": "10",
+            "AUTOPR_OPENAI_TPM": "bad",
+            "AUTOPR_AI_DEADLINE": "30",
+        }
+        with patch.dict(os.environ, env):
+            scheduler = RequestScheduler.from_env()
+        self.assertEqual(scheduler.request_bucket.capacity, 10)
+        self.assertEqual(scheduler.token_bucket.capacity, 30000)
+        self.assertEqual(scheduler.deadline_seconds, 30.0)
+        mock_print.assert_any_call(
+            "Warning: Ignoring invalid AUTOPR_OPENAI_TPM value: bad"
+        )
+
+
+class TestRequestSchedulerAsync(unittest.IsolatedAsyncioTestCase):
+    @patch("builtins.print")
+    @patch("asyncio.sleep")
+    async def test_call_async_retries(self, mock_sleep, mock_print):
+        scheduler = RequestScheduler()
+        attempts = []
+
+        async def create():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise _status_error(429, {"retry-after": "2"}, openai.RateLimitError)
+            return "ok"
+
+        self.assertEqual(await scheduler.call_async(create), "ok")
+        self.assertEqual(len(attempts), 2)
+        mock_sleep.assert_awaited_once_with(2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+
+# Modules that are expensive to import and must only be loaded once an AI call is made.
+HEAVY_MODULES = ("openai", "httpx", "pydantic", "anyio")
+
+# Generous upper bound on the cumulative import time of autopr.cli, in microseconds.
+# Loading the OpenAI SDK alone takes several times longer than this.
+STARTUP_BUDGET_US = 250_000
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_with_importtime(code: str, cwd: str = REPO_ROOT) -> tuple[dict[str, int], str]:
+    """Runs code in a fresh interpreter and returns ({module: cumulative_us}, stdout)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+        env={**os.environ, "OPENAI_API_KEY": "", "PYTHONPATH": REPO_ROOT},
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = [part.strip() for part in line.split("|")]
+        if cumulative.isdigit():
+            timings[module] = int(cumulative)
+    return timings, result.stdout
+
+
+# Runs `autopr ls --json` to the end, with GitHub answered by a stub backend.
+LS_WITH_STUB_BACKEND = """
+import sys
+from autopr.cli import main
+from autopr.github_backend import ApiPage, GitHubBackend, set_backend
+
+class StubBackend(GitHubBackend):
+    def repo_details(self):
+        return ("octo", "repo")
+
+    def get_page(self, path, etag=None):
+        return ApiPage(200, None, None, [])
+
+set_backend(StubBackend())
+sys.argv = ["autopr", "ls", "--json"]
+main()
+"""
+
+
+class TestStartupImportBudget(unittest.TestCase):
+    def test_ls_does_not_import_openai_sdk(self):
+        with tempfile.TemporaryDirectory() as repo:
+            os.mkdir(os.path.join(repo, ".git"))
+            with open(os.path.join(repo, ".git", "HEAD"), "w") as f:
+                f.write("ref: refs/heads/main\n")
+            with open(os.path.join(repo, ".git", "config"), "w") as f:
+                f.write('[remote "origin"]\n    url = git@github.com:octo/repo.git\n')
+            timings, stdout = _run_with_importtime(LS_WITH_STUB_BACKEND, cwd=repo)
+
+        # The handler ran all the way: it read the (empty) issue list and printed it.
+        self.assertEqual(stdout.strip(), "[]")
+        self.assertIn("autopr.github_service", timings)
+        loaded_heavy = [
+            module for module in timings if module.split(".")[0] in HEAVY_MODULES
+        ]
+        self.assertEqual(loaded_heavy, [])
+
+    def test_cli_import_within_budget(self):
+        timings, _ = _run_with_importtime("import autopr.cli")
+        self.assertIn("autopr.cli", timings)
+        self.assertLess(timings["autopr.cli"], STARTUP_BUDGET_US)
+
+
+if __name__ == "__main__":
+    unittest.main()